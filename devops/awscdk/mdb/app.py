@@ -41,6 +41,7 @@ if __name__=="__main__":
 
   stack = Stack(
     app,
+    config=config,
     stack_name="{}-{}".format(config['main']['resource_prefix'], config['main']['tier']),
     synthesizer=synthesizer,
     env=cdk.Environment(
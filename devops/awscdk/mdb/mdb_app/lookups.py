@@ -0,0 +1,131 @@
+import json
+import os
+
+### Lookups ###################################################################
+# Values the stack needs from the AWS account are looked up once and kept in
+# cdk.context.json, next to the VPC lookups CDK itself caches there, so a
+# synth with a filled cache makes no AWS calls:
+#   acm-certificate:...   ARN of the issued *.<domain> certificate for the ALB
+#   vpc-provider:...      the VPC, written by the CDK CLI on its first lookup
+#   neo4j-live-color:...  with [neo4j] blue_green, the color the NLB's bolt
+#                         listener forwards to
+# [main] certificate_arn in config.ini skips the certificate lookup.
+#
+# The live color changes with every scripts/blue_green_switch.py run, so an
+# online synth always reads it from the listener and refreshes the cached
+# value; the cache only serves offline synths. Before the NLB exists it is
+# [neo4j] live.
+#
+# Refresh a value with `cdk context --reset <key>` (or `cdk context --clear`)
+# and synth again. With -c offline=true a missing value fails the synth
+# instead of calling AWS, e.g. on a disconnected machine or in tests.
+
+CONTEXT_FILE = "cdk.context.json"
+
+
+def isOffline(scope):
+    return str(scope.node.try_get_context('offline')).lower() in ("true", "1", "yes")
+
+
+def certificateContextKey(config):
+    return "acm-certificate:account={}:domain=*.{}:region={}".format(
+        config['main']['account_id'], config['main']['domain'], config['main']['region'])
+
+
+def vpcContextKey(config):
+    # the key Vpc.from_lookup(vpc_id=...) reads
+    return "vpc-provider:account={}:filter.vpc-id={}:region={}:returnAsymmetricSubnets=true".format(
+        config['main']['account_id'], config['main']['vpc_id'], config['main']['region'])
+
+
+def liveColorContextKey(config):
+    return "neo4j-live-color:account={}:nlb={}-{}-nlb:region={}".format(
+        config['main']['account_id'], config['main']['resource_prefix'], config['main']['tier'],
+        config['main']['region'])
+
+
+def saveContext(key, value, file_name=CONTEXT_FILE):
+    context = {}
+    if os.path.exists(file_name):
+        with open(file_name) as fp:
+            context = json.load(fp)
+    context[key] = value
+    with open(file_name, "w") as fp:
+        json.dump(context, fp, indent=2)
+        fp.write("\n")
+
+
+def findCertificate(client, domain):
+    """ARN of the first issued certificate for domain (name or alternative name), or None."""
+    paginator = client.get_paginator('list_certificates')
+    for page in paginator.paginate(CertificateStatuses=['ISSUED']):
+        for cert in page["CertificateSummaryList"]:
+            if domain == cert.get("DomainName") or domain in cert.get("SubjectAlternativeNameSummaries", []):
+                return cert['CertificateArn']
+    return None
+
+
+def findLiveColor(client, nlb_name, port, group_names):
+    """
+    The color whose target group ({color: target group name}) the NLB's
+    listener on port forwards to, or None if there is no such NLB or listener.
+    """
+    try:
+        nlb = client.describe_load_balancers(Names=[nlb_name])["LoadBalancers"][0]
+    except client.exceptions.LoadBalancerNotFoundException:
+        return None
+    names = {tg["TargetGroupArn"]: tg["TargetGroupName"]
+             for tg in client.describe_target_groups(LoadBalancerArn=nlb["LoadBalancerArn"])["TargetGroups"]}
+    colors = {name: color for color, name in group_names.items()}
+    for listener in client.describe_listeners(LoadBalancerArn=nlb["LoadBalancerArn"])["Listeners"]:
+        if listener["Port"] == port:
+            for action in listener["DefaultActions"]:
+                if action["Type"] == "forward":
+                    return colors.get(names.get(action["TargetGroupArn"]))
+    return None
+
+
+def liveColor(scope, config, group_names, default, client=None):
+    key = liveColorContextKey(config)
+    if isOffline(scope):
+        cached = scope.node.try_get_context(key)
+        if cached is None:
+            raise ValueError("offline synth: no {} in {}; synth once online".format(key, CONTEXT_FILE))
+        return cached
+
+    if client is None:
+        import boto3
+        client = boto3.client('elbv2', region_name=config['main']['region'])
+    nlb_name = "{}-{}-nlb".format(config['main']['resource_prefix'], config['main']['tier'])
+    color = findLiveColor(client, nlb_name, config.getint('neo4j', 'bolt_port'), group_names)
+    if color is None:
+        return default
+    if color != scope.node.try_get_context(key):
+        saveContext(key, color)
+    return color
+
+
+def certificateArn(scope, config):
+    if config.has_option('main', 'certificate_arn'):
+        return config['main']['certificate_arn']
+    key = certificateContextKey(config)
+    cached = scope.node.try_get_context(key)
+    if cached:
+        return cached
+    if isOffline(scope):
+        raise ValueError("offline synth: no {} in {}; synth once online or set [main] certificate_arn".format(
+            key, CONTEXT_FILE))
+
+    import boto3
+    domain = '*.{}'.format(config['main']['domain'])
+    arn = findCertificate(boto3.client('acm', region_name=config['main']['region']), domain)
+    if arn is None:
+        raise ValueError("no issued ACM certificate for {} in {}".format(domain, config['main']['region']))
+    saveContext(key, arn)
+    return arn
+
+
+def checkVpcContext(scope, config):
+    """Fail an offline synth early when the VPC lookup is not cached."""
+    if isOffline(scope) and scope.node.try_get_context(vpcContextKey(config)) is None:
+        raise ValueError("offline synth: no {} in {}; synth once online".format(vpcContextKey(config), CONTEXT_FILE))
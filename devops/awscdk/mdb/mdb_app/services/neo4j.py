@@ -1,19 +1,401 @@
+import os
+
 import aws_cdk
 
+from aws_cdk import Duration
+from aws_cdk import Size
 from aws_cdk import aws_elasticloadbalancingv2 as elbv2
 from aws_cdk import aws_ecs as ecs
 from aws_cdk import aws_ec2 as ec2
+from aws_cdk import aws_ecr as ecr
+from aws_cdk import aws_efs as efs
+from aws_cdk import aws_logs as logs
 from aws_cdk import aws_secretsmanager as secretsmanager
+from aws_cdk import aws_servicediscovery as servicediscovery
 #from aws_cdk import CfnOutput
 
-class neo4jService:
-  def createService(self, config):
+import lookups
 
-    ### Neo4j Service ###############################################################################################################
+### Memory ####################################################################
+# Unless [neo4j] sets heap_size and pagecache_size (MiB), they are computed
+# from the neo4j container's memory, which is the task memory less the
+# readiness and metrics containers (see Warmup and Query log and metrics):
+# memory_reserve (default 10%, at least 512 MiB) is left to the OS and the
+# JVM's native memory, heap_ratio (default 0.35) of the rest goes to the
+# heap (512 MiB to 31 GiB, to keep compressed oops) and the remainder to
+# the page cache, which holds the store files.
+
+def containerMemory(config):
+    """MiB for the neo4j container: the task memory less its sidecars'."""
+    return config.getint('neo4j', 'memory') - (READINESS_MEMORY if warmupEnabled(config) else 0) \
+        - (METRICS_MEMORY if metricsEnabled(config) else 0)
+
+
+def memoryReserve(config):
+    if config.has_option('neo4j', 'memory_reserve'):
+        return config.getint('neo4j', 'memory_reserve')
+    return max(512, containerMemory(config) // 10)
+
+
+def memorySettings(config):
+    """(heap MiB, page cache MiB) for the neo4j container."""
+    memory = containerMemory(config)
+    reserve = memoryReserve(config)
+    if config.has_option('neo4j', 'heap_ratio'):
+        heap_ratio = config.getfloat('neo4j', 'heap_ratio')
+    else:
+        heap_ratio = 0.35
+    available = memory - reserve
+    if config.has_option('neo4j', 'heap_size'):
+        heap = config.getint('neo4j', 'heap_size')
+    else:
+        heap = min(max(int(available * heap_ratio), 512), 31 * 1024)
+    if config.has_option('neo4j', 'pagecache_size'):
+        pagecache = config.getint('neo4j', 'pagecache_size')
+    else:
+        pagecache = available - heap
+    if heap + pagecache > memory or pagecache < 128:
+        raise ValueError("neo4j container memory {} MiB is too small for heap {} MiB and page cache {} MiB".format(
+            memory, heap, pagecache))
+    return heap, pagecache
+
+
+def memoryEnvironment(config):
+    """Heap and page cache settings as NEO4J_* variables for the image's Neo4j version."""
+    heap, pagecache = memorySettings(config)
+    version = config['neo4j']['image'].split('.')[0]
+    # 4.x: dbms.memory.*; 5.x renamed them server.memory.*
+    prefix = "NEO4J_dbms_memory" if version.isdigit() and int(version) < 5 else "NEO4J_server_memory"
+    return {
+        "{}_heap_initial__size".format(prefix): "{}m".format(heap),
+        "{}_heap_max__size".format(prefix): "{}m".format(heap),
+        "{}_pagecache_size".format(prefix): "{}m".format(pagecache),
+    }
+
+
+### Storage ###################################################################
+# [neo4j] storage = efs (default) keeps the data directory on the stack's
+# EFS file system, with efs_throughput_mode bursting (default), elastic or
+# provisioned (efs_provisioned_mibps). Bursting throughput scales with the
+# stored size and runs out of credits under sustained random reads; elastic
+# or provisioned does not.
+# storage = ebs gives each task an ECS-managed gp3 volume (ebs_size_gib,
+# ebs_iops, ebs_throughput) instead. The volume lives as long as the task:
+# set ebs_snapshot_id to start tasks from a snapshot of a loaded store.
+
+def storageType(config):
+    storage = config['neo4j']['storage'] if config.has_option('neo4j', 'storage') else "efs"
+    if storage not in ("efs", "ebs"):
+        raise ValueError("[neo4j] storage must be efs or ebs, not {}".format(storage))
+    return storage
+
+
+def efsThroughput(config):
+    """Throughput settings for the EFS file system, as efs.FileSystem arguments."""
+    mode = config['neo4j']['efs_throughput_mode'] if config.has_option('neo4j', 'efs_throughput_mode') else "bursting"
+    if mode == "bursting":
+        return {}
+    if mode == "elastic":
+        return {"throughput_mode": efs.ThroughputMode.ELASTIC}
+    if mode == "provisioned":
+        return {
+            "throughput_mode": efs.ThroughputMode.PROVISIONED,
+            "provisioned_throughput_per_second": Size.mebibytes(config.getint('neo4j', 'efs_provisioned_mibps')),
+        }
+    raise ValueError("[neo4j] efs_throughput_mode must be bursting, elastic or provisioned, not {}".format(mode))
+
+
+### Discovery #################################################################
+# How STS finds bolt, [neo4j] discovery:
+#   cloudmap         (default) an A record per task in the cluster's private
+#                    Cloud Map namespace, neo4j.<namespace>; STS connects to
+#                    the task directly, inside the VPC
+#   service_connect  ECS Service Connect; STS connects to neo4j:<bolt port>
+#                    through its Service Connect proxy
+#   nlb              through the NLB DNS name, as before (and the only
+#                    choice with blue_green: the NLB listener is the switch)
+# The NLB is still created for access from outside the cluster (people,
+# ETL) unless [nlb] enabled = false; discovery = nlb needs it.
+
+def discoveryType(config):
+    default = "nlb" if blueGreen(config) else "cloudmap"
+    discovery = config['neo4j']['discovery'] if config.has_option('neo4j', 'discovery') else default
+    if discovery not in ("cloudmap", "service_connect", "nlb"):
+        raise ValueError("[neo4j] discovery must be cloudmap, service_connect or nlb, not {}".format(discovery))
+    if blueGreen(config) and discovery != "nlb":
+        raise ValueError("[neo4j] blue_green needs discovery = nlb, not {}".format(discovery))
+    return discovery
+
+
+def namespaceName(config):
+    if config.has_option('neo4j', 'discovery_namespace'):
+        return config['neo4j']['discovery_namespace']
+    return "{}-{}.local".format(config['main']['resource_prefix'], config['main']['tier'])
+
+
+def nlbEnabled(config):
+    if config.has_option('nlb', 'enabled') and not config.getboolean('nlb', 'enabled'):
+        if discoveryType(config) == "nlb":
+            raise ValueError("[neo4j] discovery = nlb needs the NLB, but [nlb] enabled = false")
+        return False
+    return True
+
+
+### Blue/green ################################################################
+# With [neo4j] blue_green = true there are two Neo4j services, blue and
+# green, each with its own store (EFS access point or EBS volume) and NLB
+# target group. The bolt_port listener forwards to the live color ([neo4j]
+# live, default blue) and the standby_bolt_port listener (default 7688) to
+# the other one, which is loaded and checked there while the live one
+# serves. scripts/blue_green_switch.py swaps the two listeners. A synth
+# reads the live color back from the bolt listener (lookups.liveColor), so a
+# deploy after a switch keeps it; [neo4j] live only picks the color of the
+# first deploy.
+
+COLORS = ("blue", "green")
+
+
+def blueGreen(config):
+    return config.has_option('neo4j', 'blue_green') and config.getboolean('neo4j', 'blue_green')
+
+
+def liveColor(config):
+    live = config['neo4j']['live'] if config.has_option('neo4j', 'live') else "blue"
+    if live not in COLORS:
+        raise ValueError("[neo4j] live must be blue or green, not {}".format(live))
+    return live
+
+
+def standbyColor(live):
+    return COLORS[1 - COLORS.index(live)]
+
+
+def targetGroupName(prefix, color):
+    return "{}-{}".format(prefix, color)[-32:]
+
+
+def standbyPort(config):
+    return config.getint('neo4j', 'standby_bolt_port') if config.has_option('neo4j', 'standby_bolt_port') else 7688
+
+
+def ebsVolume(scope, config, color=None):
+    settings = {"volume_type": ec2.EbsDeviceVolumeType.GP3, "file_system_type": ecs.FileSystemType.EXT4}
+    if config.has_option('neo4j', 'ebs_size_gib'):
+        settings["size"] = Size.gibibytes(config.getint('neo4j', 'ebs_size_gib'))
+    if config.has_option('neo4j', 'ebs_iops'):
+        settings["iops"] = config.getint('neo4j', 'ebs_iops')
+    if config.has_option('neo4j', 'ebs_throughput'):
+        settings["throughput"] = config.getint('neo4j', 'ebs_throughput')
+    # a color can start from its own pre-loaded snapshot, ebs_snapshot_id_<color>
+    if color and config.has_option('neo4j', 'ebs_snapshot_id_{}'.format(color)):
+        settings["snap_shot_id"] = config['neo4j']['ebs_snapshot_id_{}'.format(color)]
+    elif config.has_option('neo4j', 'ebs_snapshot_id'):
+        settings["snap_shot_id"] = config['neo4j']['ebs_snapshot_id']
+    return ecs.ServiceManagedVolume(scope, "neo4j-data-ebs" if color is None else "neo4j-{}-data-ebs".format(color),
+        name="neo4j-data",
+        managed_ebs_volume=ecs.ServiceManagedEBSVolumeConfiguration(**settings)
+    )
+
+
+### Warmup ####################################################################
+# With [neo4j] warmup = true the container starts through neo4j_warmup.sh,
+# next to this file: it preloads the store and indexes into the page cache
+# and creates /ready/warm once warmup_query (default: the property counts
+# of all nodes) runs in at most warmup_max_ms (default 1000). Until then
+#   - the container health check fails; it allows warmup_timeout seconds
+#     (default 600) before ECS replaces the task,
+#   - a readiness container in the task answers the NLB's HTTP health check
+#     on readiness_port (default 7475) with 404, so the NLB only sends bolt
+#     connections to a warm task (and blue_green_switch.py only switches to
+#     a warm standby).
+# ECS reports the container health to Cloud Map, so neo4j.<namespace> also
+# only resolves to the task once it is warm.
+# The script replaces the image's entry point, so it cannot be combined
+# with entry_point.
+
+WARMUP_SCRIPT = os.path.join(os.path.dirname(__file__), "neo4j_warmup.sh")
+READY_DIR = "/ready"
+READINESS_IMAGE = "public.ecr.aws/docker/library/busybox:stable"
+READINESS_MEMORY = 32
+
+
+def warmupEnabled(config):
+    enabled = config.has_option('neo4j', 'warmup') and config.getboolean('neo4j', 'warmup')
+    if enabled and config.has_option('neo4j', 'entry_point'):
+        raise ValueError("[neo4j] warmup replaces the container entry point; drop entry_point or set warmup = false")
+    return enabled
+
+
+def readinessPort(config):
+    return config.getint('neo4j', 'readiness_port') if config.has_option('neo4j', 'readiness_port') else 7475
+
+
+def warmupTimeout(config):
+    return config.getint('neo4j', 'warmup_timeout') if config.has_option('neo4j', 'warmup_timeout') else 600
+
+
+def warmupEnvironment(config):
+    environment = {
+        "MDB_READY_FILE": "{}/warm".format(READY_DIR),
+        "MDB_BOLT_PORT": config['neo4j']['bolt_port'],
+        "MDB_WARMUP_MAX_MS": config['neo4j']['warmup_max_ms'] if config.has_option('neo4j', 'warmup_max_ms') else "1000",
+    }
+    if config.has_option('neo4j', 'warmup_query'):
+        environment["MDB_WARMUP_QUERY"] = config['neo4j']['warmup_query']
+    return environment
+
+
+def healthCheck(config):
+    """Container health check: warm and bolt accepting connections, within warmup_timeout of the start."""
+    timeout = warmupTimeout(config)
+    # ECS allows a start period of at most 300 s and 10 retries; failures
+    # after the start period count, so the retries cover the rest
+    start = min(timeout, 300)
+    retries = 3 if timeout - start <= 90 else 10
+    interval = max(30, -(-(timeout - start) // retries))
+    if interval > 300:
+        raise ValueError("[neo4j] warmup_timeout can be at most 3300 seconds, not {}".format(timeout))
+    return ecs.HealthCheck(
+        command=["CMD-SHELL", "test -f {}/warm && bash -c '</dev/tcp/127.0.0.1/{}' || exit 1".format(
+            READY_DIR, config.getint('neo4j', 'bolt_port'))],
+        start_period=Duration.seconds(start),
+        interval=Duration.seconds(interval),
+        retries=retries,
+        timeout=Duration.seconds(5)
+    )
+
+
+def nlbHealthCheck(config):
+    """NLB target group health check: the readiness container's /warm."""
+    if not warmupEnabled(config):
+        return None
+    return elbv2.HealthCheck(
+        protocol=elbv2.Protocol.HTTP,
+        port=str(readinessPort(config)),
+        path="/warm",
+        interval=Duration.seconds(10),
+        healthy_threshold_count=2,
+        unhealthy_threshold_count=2
+    )
+
+
+### Query log and metrics #####################################################
+# With [neo4j] metrics = true a metrics container runs next to Neo4j in the
+# task, from the STS image ([stsapi] repo and image): neo4j_metrics.py
+# samples page cache, transaction and bolt connection counts and the running
+# queries over bolt, and logs metrics and slow queries (slow_query_ms,
+# default 1000; with their parameters unless query_parameters = false) as
+# JSON lines. Metric filters on its log group publish the metrics in
+# CloudWatch under metrics_namespace (default MDB/Neo4j), by task.
+# The query log and the CSV/Prometheus metrics endpoint are Enterprise
+# settings: with an enterprise image Neo4j also writes queries slower than
+# slow_query_ms to logs/query.log with their parameters, and serves
+# Prometheus metrics on metrics_port (default 2004).
+
+METRICS_MEMORY = 128
+METRICS_FIELDS = ("page_cache_hit_ratio", "page_cache_faults", "page_cache_evictions", "page_cache_usage_ratio",
+                  "transactions_open", "transactions_committed", "transactions_rolled_back",
+                  "bolt_connections", "queries_running", "slow_queries")
+
+
+def metricsEnabled(config):
+    return config.has_option('neo4j', 'metrics') and config.getboolean('neo4j', 'metrics')
+
+
+def slowQueryMs(config):
+    return config.getint('neo4j', 'slow_query_ms') if config.has_option('neo4j', 'slow_query_ms') else 1000
+
+
+def queryParameters(config):
+    return not config.has_option('neo4j', 'query_parameters') or config.getboolean('neo4j', 'query_parameters')
+
+
+def metricsNamespace(config):
+    return config['neo4j']['metrics_namespace'] if config.has_option('neo4j', 'metrics_namespace') else "MDB/Neo4j"
+
+
+def instrumentationEnvironment(config):
+    """Query log and metrics settings as NEO4J_* variables for the image's Neo4j version and edition."""
+    version = config['neo4j']['image'].split('.')[0]
+    v4 = version.isdigit() and int(version) < 5
+    # CPU time in dbms.listQueries and the query log
+    environment = {"NEO4J_dbms_track__query__cpu__time" if v4 else "NEO4J_db_track__query__cpu__time": "true"}
+    if "enterprise" not in config['neo4j']['image']:
+        return environment
+    # 4.x: dbms.logs.query.*, metrics.*; 5.x: db.logs.query.*, server.metrics.*
+    query_log = "NEO4J_dbms_logs_query" if v4 else "NEO4J_db_logs_query"
+    metrics = "NEO4J_metrics" if v4 else "NEO4J_server_metrics"
+    port = config['neo4j']['metrics_port'] if config.has_option('neo4j', 'metrics_port') else "2004"
+    environment.update({
+        "{}_enabled".format(query_log): "INFO",
+        "{}_threshold".format(query_log): "{}ms".format(slowQueryMs(config)),
+        "{}_parameter__logging__enabled".format(query_log): str(queryParameters(config)).lower(),
+        "{}_enabled".format(metrics): "true",
+        "{}_filter".format(metrics): "*page_cache*,*transaction*,*bolt*",
+        "{}_csv_enabled".format(metrics): "false",
+        "{}_prometheus_enabled".format(metrics): "true",
+        "{}_prometheus_endpoint".format(metrics): "0.0.0.0:{}".format(port),
+    })
+    if v4:
+        # 5.x always logs planning, CPU and wait time and page hits and faults
+        environment.update({
+            "NEO4J_dbms_logs_query_time__logging__enabled": "true",
+            "NEO4J_dbms_logs_query_page__logging__enabled": "true",
+        })
+    return environment
+
+
+def metricsContainer(self, config, taskDefinition, name):
+    """The metrics container, its log group and the metric filters that publish its fields."""
+    logGroup = logs.LogGroup(self, "{}-{}-metrics-logs".format(self.namingPrefix, name),
+        retention=logs.RetentionDays.ONE_MONTH,
+        removal_policy=aws_cdk.RemovalPolicy.DESTROY
+    )
+    for field in METRICS_FIELDS:
+        logGroup.add_metric_filter("{}-{}".format(name, field.replace("_", "-")),
+            # all fields are numbers; exists() would match strings only
+            filter_pattern=logs.FilterPattern.number_value("$.{}".format(field), ">=", 0),
+            metric_namespace=metricsNamespace(config),
+            metric_name=field,
+            metric_value="$.{}".format(field),
+            dimensions={"Service": "$.service"}
+        )
+    repo = ecr.Repository.from_repository_arn(self, "{}-{}-metrics-repo".format(self.namingPrefix, name),
+                                              repository_arn=config['stsapi']['repo'])
+    return taskDefinition.add_container(
+        "metrics",
+        image=ecs.ContainerImage.from_ecr_repository(repository=repo, tag=config['stsapi']['image']),
+        memory_limit_mib=METRICS_MEMORY,
+        entry_point=["python", "neo4j_metrics.py"],
+        # losing the metrics must not stop Neo4j
+        essential=False,
+        environment={
+            "NEO4J_MDB_URI": "bolt://localhost:{}".format(config.getint('neo4j', 'bolt_port')),
+            "NEO4J_MDB_USER": config['db']['neo4j_user'],
+            "NEO4J_MDB_PASS": config['db']['neo4j_password'],
+            "NEO4J_METRICS_SERVICE": "{}-{}".format(self.namingPrefix, name),
+            "NEO4J_SLOW_QUERY_MS": str(slowQueryMs(config)),
+            "NEO4J_QUERY_PARAMETERS": "1" if queryParameters(config) else "0",
+            "NEO4J_METRICS_INTERVAL": config['neo4j']['metrics_interval'] if config.has_option('neo4j', 'metrics_interval') else "60",
+        },
+        logging=ecs.LogDrivers.aws_logs(
+            stream_prefix="{}-{}-metrics".format(self.namingPrefix, name),
+            log_group=logGroup
+        )
+    )
+
+
+def fargateService(self, config, color=None):
+    """The Neo4j task definition and service; with a color, one of the blue/green pair."""
     service = "neo4j"
+    name = service if color is None else "{}-{}".format(service, color)
 
     # Set container configs
-    if config.has_option(service, 'entry_point'):
+    warmup = warmupEnabled(config)
+    if warmup:
+        with open(WARMUP_SCRIPT) as fp:
+            entry_point = ["tini", "-g", "--", "/bin/sh", "-c", fp.read()]
+    elif config.has_option(service, 'entry_point'):
         entry_point = ["/bin/sh", "-c", config[service]['entry_point']]
     else:
         entry_point = None
@@ -26,41 +408,59 @@ class neo4jService:
         "NEO4JLABS_PLUGINS":config['db']['neo4j_labs_plugins'],
         "dbms.security.procedures.unrestricted":config['db']['dbms_sec_proc_unrestricted'],
     }
+    environment.update(memoryEnvironment(config))
+    if warmup:
+        environment.update(warmupEnvironment(config))
+    metrics = metricsEnabled(config)
+    if metrics:
+        environment.update(instrumentationEnvironment(config))
 
     # secrets={
     # }
 
-    dbVolume = ecs.Volume(
-        name="neo4j-data",
-        efs_volume_configuration=ecs.EfsVolumeConfiguration(
-            file_system_id=self.fileSystem.file_system_id,
-            authorization_config=ecs.AuthorizationConfig(
-                access_point_id=self.EFSAccessPoint.access_point_id,
-                iam="ENABLED"
-            ),
-            transit_encryption="ENABLED"
+    storage = storageType(config)
+    if storage == "efs":
+        accessPoint = self.EFSAccessPoint if color is None else self.EFSAccessPoints[color]
+        dbVolume = ecs.Volume(
+            name="neo4j-data",
+            efs_volume_configuration=ecs.EfsVolumeConfiguration(
+                file_system_id=self.fileSystem.file_system_id,
+                authorization_config=ecs.AuthorizationConfig(
+                    access_point_id=accessPoint.access_point_id,
+                    iam="ENABLED"
+                ),
+                transit_encryption="ENABLED"
+            )
         )
-    )
+    else:
+        # attached by the service when it launches a task
+        dataVolume = ebsVolume(self, config, color)
+        dbVolume = ecs.Volume(name=dataVolume.name, configured_at_launch=True)
+
+    # task scoped, shared with the readiness container
+    readyVolume = ecs.Volume(name="neo4j-ready")
 
     taskDefinition = ecs.FargateTaskDefinition(self,
-        "{}-{}-taskDef".format(self.namingPrefix, service),
+        "{}-{}-taskDef".format(self.namingPrefix, name),
         cpu=config.getint(service, 'cpu'),
         memory_limit_mib=config.getint(service, 'memory'),
-        volumes=[dbVolume]
+        volumes=[dbVolume] + ([readyVolume] if warmup else [])
     )
 
     dbContainer = taskDefinition.add_container(
         service,
         image=ecs.ContainerImage.from_registry("{}:{}".format(config[service]['repo'], config[service]['image'])),
         cpu=config.getint(service, 'cpu'),
-        memory_limit_mib=config.getint(service, 'memory'),
+        # the readiness and metrics containers' memory comes out of the task's
+        memory_limit_mib=containerMemory(config),
         port_mappings=[ecs.PortMapping(container_port=config.getint(service, 'bolt_port'), name="bolt-{}".format(service))],
         user="root",
         entry_point=entry_point,
+        health_check=healthCheck(config) if warmup else None,
         # secrets=secrets,
         environment=environment,
         logging=ecs.LogDrivers.aws_logs(
-            stream_prefix="{}-{}".format(self.namingPrefix, service)
+            stream_prefix="{}-{}".format(self.namingPrefix, name)
         )
     )
     containerVolumeMountPoint = ecs.MountPoint(
@@ -69,22 +469,91 @@ class neo4jService:
         source_volume=dbVolume.name
     )
     dbContainer.add_mount_points(containerVolumeMountPoint)
-    self.fileSystem.grant_root_access(taskDefinition.task_role)
+    if warmup:
+        dbContainer.add_mount_points(ecs.MountPoint(
+            read_only=False, container_path=READY_DIR, source_volume=readyVolume.name))
+        # serves READY_DIR: /warm is 404 until the warmup script creates it
+        readinessImage = config[service]['readiness_image'] if config.has_option(service, 'readiness_image') else READINESS_IMAGE
+        readinessContainer = taskDefinition.add_container(
+            "readiness",
+            image=ecs.ContainerImage.from_registry(readinessImage),
+            memory_limit_mib=READINESS_MEMORY,
+            command=["httpd", "-f", "-p", str(readinessPort(config)), "-h", READY_DIR],
+            port_mappings=[ecs.PortMapping(container_port=readinessPort(config))],
+            logging=ecs.LogDrivers.aws_logs(
+                stream_prefix="{}-{}-readiness".format(self.namingPrefix, name)
+            )
+        )
+        readinessContainer.add_mount_points(ecs.MountPoint(
+            read_only=True, container_path=READY_DIR, source_volume=readyVolume.name))
+    if metrics:
+        metricsContainer(self, config, taskDefinition, name)
+    if storage == "efs":
+        self.fileSystem.grant_root_access(taskDefinition.task_role)
+
+    discovery = discoveryType(config)
+    cloudMapOptions = None
+    serviceConnect = None
+    if discovery == "cloudmap":
+        cloudMapOptions = ecs.CloudMapOptions(
+            name=service,
+            dns_record_type=servicediscovery.DnsRecordType.A,
+            dns_ttl=Duration.seconds(10)
+        )
+    elif discovery == "service_connect":
+        serviceConnect = ecs.ServiceConnectProps(
+            services=[ecs.ServiceConnectService(port_mapping_name="bolt-{}".format(service), dns_name=service,
+                                                port=config.getint(service, 'bolt_port'))]
+        )
 
     ecsService = ecs.FargateService(self,
-        "{}-{}-service".format(self.namingPrefix, service),
+        "{}-{}-service".format(self.namingPrefix, name),
         cluster=self.ECSCluster,
         task_definition=taskDefinition,
         enable_execute_command=True,
         min_healthy_percent=0,
         max_healthy_percent=100,
+        # NLB health checks fail while the task warms up
+        health_check_grace_period=Duration.seconds(warmupTimeout(config)) if warmup and nlbEnabled(config) else None,
+        cloud_map_options=cloudMapOptions,
+        service_connect_configuration=serviceConnect,
         circuit_breaker=ecs.DeploymentCircuitBreaker(
             enable=True,
             rollback=True
         )
     )
+    if storage == "ebs":
+        ecsService.add_volume(dataVolume)
+    return ecsService
+
+
+class neo4jService:
+  def createService(self, config):
+
+    ### Neo4j Service ###############################################################################################################
+    service = "neo4j"
+    discovery = discoveryType(config)
+    bolt_port = config.getint(service, 'bolt_port')
+
+    if blueGreen(config):
+        self.neo4jServices = {color: fargateService(self, config, color) for color in COLORS}
+        self.neo4jLive = lookups.liveColor(self, config, {c: targetGroupName(self.namingPrefix, c) for c in COLORS},
+                                           liveColor(config))
+        ecsService = self.neo4jServices[self.neo4jLive]
+    else:
+        ecsService = fargateService(self, config)
+
+    # for the STS service
+    self.neo4jService = ecsService
+    if discovery == "cloudmap":
+        self.neo4jURI = "bolt://{}.{}:{}".format(service, namespaceName(config), bolt_port)
+    elif discovery == "service_connect":
+        self.neo4jURI = "bolt://{}:{}".format(service, bolt_port)
 
     ### NLB - Neo4j ###############################################################################################################
+    if not nlbEnabled(config):
+        return
+
     if config.getboolean('nlb', 'internet_facing'):
         subnets=ec2.SubnetSelection(
             subnets=self.VPC.select_subnets(one_per_az=True,subnet_type=ec2.SubnetType.PUBLIC).subnets
@@ -106,21 +575,57 @@ class neo4jService:
         connection=ec2.Port.tcp(config.getint(service, 'bolt_port')),
     )
     self.NLB.add_security_group(NLBSecurityGroup)
-    ecsService.connections.security_groups[0].add_ingress_rule(
-        NLBSecurityGroup,
-        ec2.Port.tcp(config.getint(service, 'bolt_port'))
-    )
 
-    nlbTargetGroup = elbv2.NetworkTargetGroup(self,
-        id="nlbTargetGroup",
-        target_type=elbv2.TargetType.IP,
-        protocol=elbv2.Protocol.TCP,
-        port=config.getint(service, 'bolt_port'),
-        vpc=self.VPC
-    )
-    nlbListenerBolt = self.NLB.add_listener("ListenerBolt", port=config.getint(service, 'bolt_port'),)
-    nlbListenerBolt.add_target_groups("targetBolt", nlbTargetGroup)
-    nlbTargetGroup.add_target(ecsService)
+    if warmupEnabled(config):
+        for colorService in (self.neo4jServices.values() if blueGreen(config) else [ecsService]):
+            colorService.connections.security_groups[0].add_ingress_rule(
+                NLBSecurityGroup,
+                ec2.Port.tcp(readinessPort(config))
+            )
+
+    if not blueGreen(config):
+        ecsService.connections.security_groups[0].add_ingress_rule(
+            NLBSecurityGroup,
+            ec2.Port.tcp(config.getint(service, 'bolt_port'))
+        )
+
+        nlbTargetGroup = elbv2.NetworkTargetGroup(self,
+            id="nlbTargetGroup",
+            target_type=elbv2.TargetType.IP,
+            protocol=elbv2.Protocol.TCP,
+            port=config.getint(service, 'bolt_port'),
+            health_check=nlbHealthCheck(config),
+            vpc=self.VPC
+        )
+        nlbListenerBolt = self.NLB.add_listener("ListenerBolt", port=config.getint(service, 'bolt_port'),)
+        nlbListenerBolt.add_target_groups("targetBolt", nlbTargetGroup)
+        nlbTargetGroup.add_target(ecsService)
+    else:
+        # one target group per color, named for scripts/blue_green_switch.py
+        NLBSecurityGroup.add_ingress_rule(peer=ec2.Peer.any_ipv4(), connection=ec2.Port.tcp(standbyPort(config)))
+        targetGroups = {}
+        for color, colorService in self.neo4jServices.items():
+            colorService.connections.security_groups[0].add_ingress_rule(
+                NLBSecurityGroup,
+                ec2.Port.tcp(bolt_port)
+            )
+            targetGroups[color] = elbv2.NetworkTargetGroup(self,
+                id="nlbTargetGroup-{}".format(color),
+                target_group_name=targetGroupName(self.namingPrefix, color),
+                target_type=elbv2.TargetType.IP,
+                protocol=elbv2.Protocol.TCP,
+                port=bolt_port,
+                health_check=nlbHealthCheck(config),
+                vpc=self.VPC
+            )
+            targetGroups[color].add_target(colorService)
+        nlbListenerBolt = self.NLB.add_listener("ListenerBolt", port=bolt_port,
+            default_target_groups=[targetGroups[self.neo4jLive]])
+        self.NLB.add_listener("ListenerStandby", port=standbyPort(config),
+            default_target_groups=[targetGroups[standbyColor(self.neo4jLive)]])
+
+    if discovery == "nlb":
+        self.neo4jURI = "bolt://{}:{}".format(self.NLB.load_balancer_dns_name, bolt_port)
 
     #CfnOutput(self, "Neo4jNlbDnsName",
     #    value=self.NLB.load_balancer_dns_name,
@@ -0,0 +1,67 @@
+#!/bin/sh
+# Entry point of the neo4j container with [neo4j] warmup = true (see
+# neo4j.py, "Warmup"); scripts/docker-compose.yml runs it for the local
+# neo4j-warmup service.
+#
+# Starts Neo4j through the image's own entry point, waits for bolt, loads
+# the store and indexes into the page cache (apoc.warmup.run, or a sweep
+# over all nodes, relationships and their properties without APOC), then
+# runs MDB_WARMUP_QUERY until it takes at most MDB_WARMUP_MAX_MS. Only then
+# does it create MDB_READY_FILE, which the container health check and the
+# readiness endpoint the NLB checks both look for. Progress goes to the
+# container log as "warmup: ... (<seconds since start>s)".
+
+READY_FILE=${MDB_READY_FILE:-/ready/warm}
+MAX_MS=${MDB_WARMUP_MAX_MS:-1000}
+BOLT=bolt://localhost:${MDB_BOLT_PORT:-7687}
+[ -n "$MDB_WARMUP_QUERY" ] || MDB_WARMUP_QUERY='MATCH (n:node)-[:has_property]->(p:property) RETURN n.model, count(p)'
+DB_USER=${NEO4J_AUTH%%/*}
+DB_PASS=${NEO4J_AUTH#*/}
+
+START=$(date +%s)
+log() { echo "warmup: $* ($(( $(date +%s) - START ))s)"; }
+cypher() { cypher-shell -a "$BOLT" -u "$DB_USER" -p "$DB_PASS" "$@"; }
+running() { kill -0 "$NEO4J_PID" 2>/dev/null; }
+
+rm -f "$READY_FILE"
+mkdir -p "$(dirname "$READY_FILE")"
+/startup/docker-entrypoint.sh neo4j &
+NEO4J_PID=$!
+trap 'kill -TERM $NEO4J_PID' TERM INT
+
+until cypher 'RETURN 1' >/dev/null 2>&1; do
+    running || { wait "$NEO4J_PID"; exit $?; }
+    sleep 5
+done
+log "bolt is up"
+
+if cypher --format plain 'CALL apoc.warmup.run(true, true, true)'; then
+    log "apoc.warmup.run loaded the store and indexes"
+elif running; then
+    log "no apoc.warmup.run, sweeping nodes and relationships"
+    cypher --format plain 'MATCH (n) RETURN count(n) AS nodes, sum(size(keys(n))) AS properties'
+    cypher --format plain 'MATCH ()-[r]->() RETURN count(r) AS relationships, sum(size(keys(r))) AS properties'
+    log "sweep done"
+fi
+
+# cypher-shell --format verbose reports the server's times as "<n> ms"
+while running; do
+    MS=$(cypher --format verbose "$MDB_WARMUP_QUERY" 2>&1) &&
+        MS=$(echo "$MS" | grep -o '[0-9][0-9]* ms' | awk '{ms += $1} END {print ms + 0}') || MS=
+    if [ -n "$MS" ] && [ "$MS" -le "$MAX_MS" ]; then
+        touch "$READY_FILE"
+        log "sample query took ${MS} ms, ready"
+        break
+    fi
+    log "sample query took ${MS:-?} ms, more than ${MAX_MS} ms"
+    sleep 10
+done
+
+# wait returns early when the trap runs; wait again for Neo4j to stop
+wait "$NEO4J_PID"
+STATUS=$?
+if running; then
+    wait "$NEO4J_PID"
+    STATUS=$?
+fi
+exit $STATUS
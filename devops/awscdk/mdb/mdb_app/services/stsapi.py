@@ -1,12 +1,43 @@
 import aws_cdk
 from aws_cdk import Duration
 
+from aws_cdk import aws_applicationautoscaling as appscaling
+from aws_cdk import aws_ec2 as ec2
 from aws_cdk import aws_elasticloadbalancingv2 as elbv2
 from aws_cdk import aws_ecs as ecs
 from aws_cdk import aws_ecr as ecr
 #from datetime import date
 from aws_cdk import aws_secretsmanager as secretsmanager
 
+from services import neo4j
+
+### Auto scaling ##############################################################
+# Off unless [stsapi] sets max_tasks. Then the task count moves between
+# min_tasks (default 1) and max_tasks, tracking scale_requests_per_target
+# (ALB RequestCountPerTarget) and/or scale_cpu_percent (CPU utilization).
+# Scale-out reacts after scale_out_cooldown seconds (default 60), scale-in
+# after scale_in_cooldown (default 300). scheduled_capacity raises the
+# bounds for known batch windows, one "<schedule>, <min>, <max>" per line
+# (schedule_time_zone applies to cron schedules):
+#
+#   scheduled_capacity =
+#       cron(0 1 * * ? *), 4, 8
+#       cron(0 5 * * ? *), 1, 4
+
+def scheduledCapacity(config):
+    """[(schedule expression, min tasks, max tasks)] from [stsapi] scheduled_capacity."""
+    if not config.has_option('stsapi', 'scheduled_capacity'):
+        return []
+    windows = []
+    for line in config['stsapi']['scheduled_capacity'].strip().splitlines():
+        expression, min_tasks, max_tasks = line.rsplit(",", 2)
+        windows.append((expression.strip(), int(min_tasks), int(max_tasks)))
+    return windows
+
+
+def optionInt(config, option, default):
+    return config.getint('stsapi', option) if config.has_option('stsapi', option) else default
+
 class stsapiService:
   def createService(self, config):
 
@@ -21,7 +52,8 @@ class stsapiService:
 
     bolt_port = config.getint('neo4j', 'bolt_port') 
     environment={
-        "NEO4J_MDB_URI":f"bolt://{self.NLB.load_balancer_dns_name}:{bolt_port}",
+        # set by the neo4j service for its [neo4j] discovery
+        "NEO4J_MDB_URI":self.neo4jURI,
 #        "NEO4J_MDB_URI":"bolt://{}:{}".format(self.NLB.load_balancer_dns_name, config.getint('neo4j', 'bolt_port)),
         "NEO4J_MDB_USER":config['db']['neo4j_user'],
         "NEO4J_MDB_PASS":config['db']['neo4j_password'],
@@ -65,6 +97,9 @@ class stsapiService:
         enable_execute_command=True,
         min_healthy_percent=50,
         max_healthy_percent=200,
+        health_check_grace_period=Duration.seconds(optionInt(config, 'health_check_grace_period', 30)),
+        # a Service Connect client, so neo4j:<bolt port> resolves to the neo4j service
+        service_connect_configuration=ecs.ServiceConnectProps() if neo4j.discoveryType(config) == "service_connect" else None,
         circuit_breaker=ecs.DeploymentCircuitBreaker(
             enable=True,
             rollback=True
@@ -72,6 +107,8 @@ class stsapiService:
     )
 
 
+    self.neo4jService.connections.allow_from(ecsService, ec2.Port.tcp(bolt_port))
+
     ecsTarget = self.listener.add_targets("ECS-{}-Target".format(service),
         port=int(config[service]['port']),
         protocol=elbv2.ApplicationProtocol.HTTP,
@@ -79,7 +116,11 @@ class stsapiService:
         health_check = elbv2.HealthCheck(
             path=config[service]['health_check_path'],
             timeout=Duration.seconds(config.getint(service, 'health_check_timeout')),
-            interval=Duration.seconds(config.getint(service, 'health_check_interval')),),
+            interval=Duration.seconds(config.getint(service, 'health_check_interval')),
+            # new tasks take traffic after two passing checks
+            healthy_threshold_count=optionInt(config, 'healthy_threshold', 2),
+            unhealthy_threshold_count=optionInt(config, 'unhealthy_threshold', 3),),
+        deregistration_delay=Duration.seconds(optionInt(config, 'deregistration_delay', 30)),
         targets=[ecsService],)
 
     elbv2.ApplicationListenerRule(self, id="alb-{}-rule".format(service),
@@ -90,3 +131,35 @@ class stsapiService:
         priority=int(config[service]['priority_rule_number']),
         listener=self.listener,
         target_groups=[ecsTarget])
+
+    ### Auto scaling ##############################################################################################################
+    if config.has_option(service, 'max_tasks'):
+        scaling = ecsService.auto_scale_task_count(
+            min_capacity=optionInt(config, 'min_tasks', 1),
+            max_capacity=config.getint(service, 'max_tasks')
+        )
+        cooldowns = {
+            "scale_in_cooldown": Duration.seconds(optionInt(config, 'scale_in_cooldown', 300)),
+            "scale_out_cooldown": Duration.seconds(optionInt(config, 'scale_out_cooldown', 60)),
+        }
+        if config.has_option(service, 'scale_requests_per_target'):
+            scaling.scale_on_request_count("{}-request-scaling".format(service),
+                requests_per_target=config.getint(service, 'scale_requests_per_target'),
+                target_group=ecsTarget,
+                **cooldowns
+            )
+        if config.has_option(service, 'scale_cpu_percent'):
+            scaling.scale_on_cpu_utilization("{}-cpu-scaling".format(service),
+                target_utilization_percent=config.getint(service, 'scale_cpu_percent'),
+                **cooldowns
+            )
+        time_zone = None
+        if config.has_option(service, 'schedule_time_zone'):
+            time_zone = aws_cdk.TimeZone.of(config[service]['schedule_time_zone'])
+        for n, (expression, min_tasks, max_tasks) in enumerate(scheduledCapacity(config)):
+            scaling.scale_on_schedule("{}-schedule-{}".format(service, n),
+                schedule=appscaling.Schedule.expression(expression),
+                min_capacity=min_tasks,
+                max_capacity=max_tasks,
+                time_zone=time_zone
+            )
@@ -1,4 +1,3 @@
-import boto3
 from configparser import ConfigParser
 from constructs import Construct
 
@@ -16,18 +15,21 @@ from aws_cdk import aws_s3 as s3
 #from aws_cdk import Fn
 
 from services import neo4j, stsapi
+from lookups import certificateArn, checkVpcContext
 
 class Stack(Stack):
-    def __init__(self, scope: Construct, **kwargs) -> None:
+    def __init__(self, scope: Construct, config: ConfigParser = None, **kwargs) -> None:
         super().__init__(scope, **kwargs)
 
         ### Read config
-        config = ConfigParser()
-        config.read('config.ini')
+        if config is None:
+            config = ConfigParser()
+            config.read('config.ini')
         
         self.namingPrefix = "{}-{}".format(config['main']['resource_prefix'], config['main']['tier'])
 
-        ### Import VPC
+        ### Import VPC (cached in cdk.context.json, see lookups.py)
+        checkVpcContext(self, config)
         self.VPC = ec2.Vpc.from_lookup(self, "VPC",
             vpc_id = config['main']['vpc_id']
         )
@@ -41,30 +43,44 @@ class Stack(Stack):
             }
         )
 
-        ### EFS - Neo4j
-        EFSSecurityGroup = ec2.SecurityGroup(self, "EFSSecurityGroup", vpc=self.VPC, allow_all_outbound=True,)
-        EFSSecurityGroup.add_ingress_rule(peer=ec2.Peer.ipv4(self.VPC.vpc_cidr_block),
-            connection=ec2.Port.tcp(2049),
-        )
-        self.fileSystem = efs.FileSystem(self, "EfsFileSystem",
-            vpc=self.VPC,
-            encrypted=True,
-            enable_automatic_backups=True,
-            security_group=EFSSecurityGroup,
-            removal_policy=RemovalPolicy.DESTROY
-        )
-        self.EFSAccessPoint = self.fileSystem.add_access_point("EFSAccessPoint",
-            path="/{}".format(config['main']['tier']),
-            create_acl=efs.Acl(
-                owner_uid="7474",
-                owner_gid="7474",
-                permissions="755"
-            ),
-            posix_user=efs.PosixUser(
-                uid="7474",
-                gid="7474"
+        ### EFS - Neo4j (unless the neo4j data directory is on EBS)
+        if neo4j.storageType(config) == "efs":
+            EFSSecurityGroup = ec2.SecurityGroup(self, "EFSSecurityGroup", vpc=self.VPC, allow_all_outbound=True,)
+            EFSSecurityGroup.add_ingress_rule(peer=ec2.Peer.ipv4(self.VPC.vpc_cidr_block),
+                connection=ec2.Port.tcp(2049),
+            )
+            self.fileSystem = efs.FileSystem(self, "EfsFileSystem",
+                vpc=self.VPC,
+                encrypted=True,
+                enable_automatic_backups=True,
+                security_group=EFSSecurityGroup,
+                removal_policy=RemovalPolicy.DESTROY,
+                **neo4j.efsThroughput(config)
+            )
+            accessPointSettings = dict(
+                create_acl=efs.Acl(
+                    owner_uid="7474",
+                    owner_gid="7474",
+                    permissions="755"
+                ),
+                posix_user=efs.PosixUser(
+                    uid="7474",
+                    gid="7474"
+                )
             )
-        ) 
+            self.EFSAccessPoint = self.fileSystem.add_access_point("EFSAccessPoint",
+                path="/{}".format(config['main']['tier']),
+                **accessPointSettings
+            )
+            # blue/green: blue keeps the store above, green gets its own
+            if neo4j.blueGreen(config):
+                self.EFSAccessPoints = {
+                    "blue": self.EFSAccessPoint,
+                    "green": self.fileSystem.add_access_point("EFSAccessPointGreen",
+                        path="/{}-green".format(config['main']['tier']),
+                        **accessPointSettings
+                    ),
+                }
 
         ### ALB
         # Extract subnet IDs
@@ -91,17 +107,8 @@ class Stack(Stack):
             target_protocol=elbv2.ApplicationProtocol.HTTPS,
             target_port=443)
 
-        # Get certificate ARN for specified domain name
-        client = boto3.client('acm')
-        response = client.list_certificates(
-            CertificateStatuses=[
-                'ISSUED',
-            ],
-        )
-
-        for cert in response["CertificateSummaryList"]:
-            if ('*.{}'.format(config['main']['domain']) in cert.values()):
-                certARN = cert['CertificateArn']
+        # Get certificate ARN for specified domain name (cached in cdk.context.json)
+        certARN = certificateArn(self, config)
 
         alb_cert = cfm.Certificate.from_certificate_arn(self, "alb-cert",
             certificate_arn=certARN)
@@ -134,6 +141,12 @@ class Stack(Stack):
                 kms_key=self.kmsKey
             ),
         )
+        # private namespace the neo4j service registers bolt in (see services/neo4j.py)
+        if neo4j.discoveryType(config) != "nlb":
+            self.ECSCluster.add_default_cloud_map_namespace(
+                name=neo4j.namespaceName(config),
+                use_for_service_connect=neo4j.discoveryType(config) == "service_connect"
+            )
 
         ### Fargate
 
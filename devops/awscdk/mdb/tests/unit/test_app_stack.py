@@ -1,15 +1,467 @@
+import json
+from configparser import ConfigParser
+
 import aws_cdk as core
 import aws_cdk.assertions as assertions
+import pytest
+from aws_cdk import aws_ec2 as ec2
+from aws_cdk import aws_ecs as ecs
+from aws_cdk import aws_efs as efs
+from aws_cdk import aws_elasticloadbalancingv2 as elbv2
 
+import lookups
 from mdb_app.stack import Stack
+from services import neo4j, stsapi
+
+CONFIG = """
+[main]
+resource_prefix = mdb
+tier = test
+program = crdc
+account_id = 123456789012
+region = us-east-1
+vpc_id = vpc-12345678
+domain = example.org
+alb_log_bucket_name = alb-logs
+
+[Subnets]
+subnet1 = subnet-0000000a
+subnet2 = subnet-0000000b
+
+[alb]
+internet_facing = false
+
+[db]
+neo4j_user = neo4j
+neo4j_password = secret
+apoc_trigger_enabled = true
+neo4j_labs_plugins = ["apoc"]
+dbms_sec_proc_unrestricted = apoc.*
+
+[neo4j]
+cpu = 2048
+memory = 8192
+repo = neo4j
+image = 4.4.43-community
+bolt_port = 7687
+data_directory = /data
+
+[nlb]
+internet_facing = false
+
+[stsapi]
+cpu = 512
+memory = 1024
+repo = arn:aws:ecr:us-east-1:123456789012:repository/sts
+image = 1.0.0
+port = 5000
+health_check_path = /v1/models
+health_check_timeout = 5
+health_check_interval = 10
+path = /v1/*
+priority_rule_number = 1
+"""
+
+
+class ServiceStack(core.Stack):
+    """The parts of mdb_app.stack.Stack the services build on, without the lookups."""
+    def __init__(self, scope, config):
+        super().__init__(scope, "test", env=core.Environment(account="123456789012", region="us-east-1"))
+        self.namingPrefix = "mdb-test"
+        self.VPC = ec2.Vpc(self, "VPC")
+        if neo4j.storageType(config) == "efs":
+            self.fileSystem = efs.FileSystem(self, "EfsFileSystem", vpc=self.VPC, **neo4j.efsThroughput(config))
+            self.EFSAccessPoint = self.fileSystem.add_access_point("EFSAccessPoint", path="/test")
+            if neo4j.blueGreen(config):
+                self.EFSAccessPoints = {"blue": self.EFSAccessPoint,
+                                        "green": self.fileSystem.add_access_point("EFSAccessPointGreen", path="/test-green")}
+        self.ECSCluster = ecs.Cluster(self, "ecs", vpc=self.VPC)
+        if neo4j.discoveryType(config) != "nlb":
+            self.ECSCluster.add_default_cloud_map_namespace(
+                name=neo4j.namespaceName(config),
+                use_for_service_connect=neo4j.discoveryType(config) == "service_connect")
+        self.ALB = elbv2.ApplicationLoadBalancer(self, "alb", vpc=self.VPC)
+        self.listener = self.ALB.add_listener("PublicListener", port=80,
+            default_action=elbv2.ListenerAction.fixed_response(200, message_body="not available"))
+
+
+def makeConfig(section="neo4j", **options):
+    config = ConfigParser()
+    config.read_string(CONFIG)
+    config[section].update({k: str(v) for k, v in options.items()})
+    return config
+
+
+def neo4jTemplate(context=None, **neo4j_options):
+    config = makeConfig(**neo4j_options)
+    stack = ServiceStack(core.App(context=context), config)
+    neo4j.neo4jService.createService(stack, config)
+    return assertions.Template.from_stack(stack)
+
+
+def stsTemplate(**stsapi_options):
+    config = makeConfig("stsapi", **stsapi_options)
+    stack = ServiceStack(core.App(), config)
+    neo4j.neo4jService.createService(stack, config)
+    stsapi.stsapiService.createService(stack, config)
+    return assertions.Template.from_stack(stack)
+
+
+def containerEnvironment(template, family=None):
+    tasks = template.find_resources("AWS::ECS::TaskDefinition").values()
+    task = next(t for t in tasks if family is None or t["Properties"].get("Family") == family)
+    container = task["Properties"]["ContainerDefinitions"][0]
+    return {e["Name"]: e["Value"] for e in container["Environment"]}
+
+
+def test_memory_sized_from_task_memory():
+    env = containerEnvironment(neo4jTemplate())
+    # 8192 MiB: 819 reserved, 35% of the rest to the heap, the remainder to the page cache
+    assert env["NEO4J_dbms_memory_heap_initial__size"] == "2580m"
+    assert env["NEO4J_dbms_memory_heap_max__size"] == "2580m"
+    assert env["NEO4J_dbms_memory_pagecache_size"] == "4793m"
+
+
+def test_memory_settings_follow_neo4j_version_and_config():
+    env = containerEnvironment(neo4jTemplate(image="5.26.0-community", heap_size=2048, pagecache_size=4096))
+    assert env["NEO4J_server_memory_heap_max__size"] == "2048m"
+    assert env["NEO4J_server_memory_pagecache_size"] == "4096m"
+    assert not any(k.startswith("NEO4J_dbms_memory") for k in env)
+    with pytest.raises(ValueError):
+        neo4j.memorySettings(makeConfig(memory=1024))
+
+
+def test_memory_fits_the_container_next_to_its_sidecars():
+    for options in ({}, {"warmup": "true"}, {"metrics": "true"}, {"warmup": "true", "metrics": "true"}):
+        config = makeConfig(memory=4096, **options)
+        template = neo4jTemplate(memory=4096, **options)
+        task = next(iter(template.find_resources("AWS::ECS::TaskDefinition").values()))["Properties"]
+        db = task["ContainerDefinitions"][0]
+        assert sum(c["Memory"] for c in task["ContainerDefinitions"]) == 4096
+        heap, pagecache = neo4j.memorySettings(config)
+        assert neo4j.memoryReserve(config) == 512
+        assert heap + pagecache + 512 <= db["Memory"]
+        env = {e["Name"]: e["Value"] for e in db["Environment"]}
+        assert env["NEO4J_dbms_memory_pagecache_size"] == "{}m".format(pagecache)
+
+
+def test_efs_throughput_modes():
+    template = neo4jTemplate()
+    template.has_resource_properties("AWS::EFS::FileSystem", {"ThroughputMode": assertions.Match.absent()})
+    neo4jTemplate(efs_throughput_mode="elastic").has_resource_properties(
+        "AWS::EFS::FileSystem", {"ThroughputMode": "elastic"})
+    neo4jTemplate(efs_throughput_mode="provisioned", efs_provisioned_mibps=128).has_resource_properties(
+        "AWS::EFS::FileSystem", {"ThroughputMode": "provisioned", "ProvisionedThroughputInMibps": 128})
+    with pytest.raises(ValueError):
+        neo4j.efsThroughput(makeConfig(efs_throughput_mode="fast"))
+
+
+def test_ebs_storage():
+    template = neo4jTemplate(storage="ebs", ebs_size_gib=50, ebs_iops=6000, ebs_throughput=250)
+    template.resource_count_is("AWS::EFS::FileSystem", 0)
+    template.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "Volumes": [{"Name": "neo4j-data", "ConfiguredAtLaunch": True}],
+        "ContainerDefinitions": [assertions.Match.object_like({
+            "MountPoints": [{"ContainerPath": "/data", "ReadOnly": False, "SourceVolume": "neo4j-data"}]})],
+    })
+    template.has_resource_properties("AWS::ECS::Service", {
+        "VolumeConfigurations": [{"Name": "neo4j-data", "ManagedEBSVolume": assertions.Match.object_like({
+            "SizeInGiB": 50, "VolumeType": "gp3", "Iops": 6000, "Throughput": 250, "FilesystemType": "ext4"})}],
+    })
+
+
+def test_sts_fixed_task_count_by_default():
+    template = stsTemplate()
+    template.resource_count_is("AWS::ApplicationAutoScaling::ScalableTarget", 0)
+    template.has_resource_properties("AWS::ElasticLoadBalancingV2::TargetGroup", {
+        "HealthCheckPath": "/v1/models",
+        "HealthyThresholdCount": 2,
+        "UnhealthyThresholdCount": 3,
+        "TargetGroupAttributes": assertions.Match.array_with([
+            {"Key": "deregistration_delay.timeout_seconds", "Value": "30"}]),
+    })
+    template.has_resource_properties("AWS::ECS::Service", {
+        "ServiceName": "mdb-test-sts-api", "HealthCheckGracePeriodSeconds": 30})
+
+
+def test_sts_autoscaling():
+    template = stsTemplate(min_tasks=2, max_tasks=10, scale_requests_per_target=500, scale_cpu_percent=60,
+                           scale_in_cooldown=600, schedule_time_zone="America/New_York",
+                           scheduled_capacity="\ncron(0 1 * * ? *), 4, 10\ncron(0 5 * * ? *), 2, 10")
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalableTarget", {
+        "MinCapacity": 2,
+        "MaxCapacity": 10,
+        "ScalableDimension": "ecs:service:DesiredCount",
+        "ScheduledActions": [
+            {"ScalableTargetAction": {"MinCapacity": 4, "MaxCapacity": 10}, "Schedule": "cron(0 1 * * ? *)",
+             "ScheduledActionName": assertions.Match.any_value(), "Timezone": "America/New_York"},
+            {"ScalableTargetAction": {"MinCapacity": 2, "MaxCapacity": 10}, "Schedule": "cron(0 5 * * ? *)",
+             "ScheduledActionName": assertions.Match.any_value(), "Timezone": "America/New_York"},
+        ],
+    })
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "TargetTrackingScalingPolicyConfiguration": assertions.Match.object_like({
+            "TargetValue": 500, "ScaleInCooldown": 600, "ScaleOutCooldown": 60,
+            "PredefinedMetricSpecification": assertions.Match.object_like({
+                "PredefinedMetricType": "ALBRequestCountPerTarget"}),
+        }),
+    })
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "TargetTrackingScalingPolicyConfiguration": assertions.Match.object_like({
+            "TargetValue": 60,
+            "PredefinedMetricSpecification": {"PredefinedMetricType": "ECSServiceAverageCPUUtilization"},
+        }),
+    })
+    assert stsapi.scheduledCapacity(makeConfig("stsapi", scheduled_capacity="rate(1 day), 1, 2")) == [
+        ("rate(1 day)", 1, 2)]
+
+
+def stsTemplateWith(context=None, **sections):
+    config = makeConfig()
+    for section, options in sections.items():
+        config[section].update({k: str(v) for k, v in options.items()})
+    stack = ServiceStack(core.App(context=context), config)
+    neo4j.neo4jService.createService(stack, config)
+    stsapi.stsapiService.createService(stack, config)
+    return assertions.Template.from_stack(stack)
+
+
+def test_sts_finds_neo4j_in_cloud_map():
+    template = stsTemplateWith()
+    template.has_resource_properties("AWS::ServiceDiscovery::PrivateDnsNamespace", {"Name": "mdb-test.local"})
+    template.has_resource_properties("AWS::ServiceDiscovery::Service", {
+        "Name": "neo4j",
+        "DnsConfig": assertions.Match.object_like({"DnsRecords": [{"TTL": 10, "Type": "A"}]}),
+    })
+    assert containerEnvironment(template, "mdb-test-sts-api")["NEO4J_MDB_URI"] == "bolt://neo4j.mdb-test.local:7687"
+    # bolt is open to the STS tasks directly, not only to the NLB
+    template.has_resource_properties("AWS::EC2::SecurityGroupIngress", {
+        "FromPort": 7687, "ToPort": 7687,
+        "SourceSecurityGroupId": {"Fn::GetAtt": [assertions.Match.string_like_regexp("stsapi"), "GroupId"]},
+    })
+    template.resource_count_is("AWS::ElasticLoadBalancingV2::LoadBalancer", 2)
+
+
+def test_sts_finds_neo4j_with_service_connect_and_no_nlb():
+    template = stsTemplateWith(neo4j={"discovery": "service_connect"}, nlb={"enabled": "false"})
+    template.has_resource_properties("AWS::ECS::Service", {
+        "ServiceConnectConfiguration": {
+            "Enabled": True,
+            "Namespace": assertions.Match.any_value(),
+            "Services": [{"PortName": "bolt-neo4j", "ClientAliases": [{"DnsName": "neo4j", "Port": 7687}]}],
+        },
+    })
+    template.has_resource_properties("AWS::ECS::Service", {
+        "ServiceName": "mdb-test-sts-api",
+        "ServiceConnectConfiguration": {"Enabled": True, "Namespace": assertions.Match.any_value()},
+    })
+    assert containerEnvironment(template, "mdb-test-sts-api")["NEO4J_MDB_URI"] == "bolt://neo4j:7687"
+    template.resource_count_is("AWS::ElasticLoadBalancingV2::LoadBalancer", 1)
+
+
+def test_sts_through_the_nlb():
+    template = stsTemplateWith(neo4j={"discovery": "nlb"})
+    template.resource_count_is("AWS::ServiceDiscovery::PrivateDnsNamespace", 0)
+    uri = containerEnvironment(template, "mdb-test-sts-api")["NEO4J_MDB_URI"]
+    assert "Fn::Join" in uri
+    config = makeConfig(discovery="nlb")
+    config["nlb"]["enabled"] = "false"
+    with pytest.raises(ValueError):
+        neo4j.nlbEnabled(config)
+
+
+# what the CDK CLI caches for Vpc.from_lookup, and lookups.py for the certificate
+VPC_CONTEXT = {
+    "vpcId": "vpc-12345678", "vpcCidrBlock": "10.0.0.0/16", "ownerAccountId": "123456789012",
+    "availabilityZones": [], "subnetGroups": [{"name": "Private", "type": "Private", "subnets": [
+        {"subnetId": "subnet-0000000a", "cidr": "10.0.1.0/24", "availabilityZone": "us-east-1a",
+         "routeTableId": "rtb-0000000a"},
+        {"subnetId": "subnet-0000000b", "cidr": "10.0.2.0/24", "availabilityZone": "us-east-1b",
+         "routeTableId": "rtb-0000000b"}]}],
+}
+CERTIFICATE_ARN = "arn:aws:acm:us-east-1:123456789012:certificate/abc"
+
+
+def offlineStack(context):
+    config = makeConfig()
+    app = core.App(context={"offline": "true", **context})
+    return Stack(app, config=config, stack_name="mdb-test",
+                 env=core.Environment(account="123456789012", region="us-east-1"))
+
+
+def test_offline_synth_from_cached_lookups():
+    config = makeConfig()
+    stack = offlineStack({lookups.vpcContextKey(config): VPC_CONTEXT,
+                          lookups.certificateContextKey(config): CERTIFICATE_ARN})
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties("AWS::ElasticLoadBalancingV2::Listener", {
+        "Port": 443, "Certificates": [{"CertificateArn": CERTIFICATE_ARN}]})
+    template.has_resource_properties("AWS::ECS::Cluster", {"ClusterName": "mdb-test-ecs"})
+    with pytest.raises(ValueError, match="acm-certificate"):
+        offlineStack({lookups.vpcContextKey(config): VPC_CONTEXT})
+    with pytest.raises(ValueError, match="vpc-provider"):
+        offlineStack({lookups.certificateContextKey(config): CERTIFICATE_ARN})
+
+
+class Paginator:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, **kwargs):
+        assert kwargs == {"CertificateStatuses": ["ISSUED"]}
+        return iter(self.pages)
+
+
+class AcmClient:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def get_paginator(self, name):
+        assert name == "list_certificates"
+        return Paginator(self.pages)
+
+
+def test_find_certificate_across_pages():
+    client = AcmClient([
+        {"CertificateSummaryList": [{"CertificateArn": "arn:1", "DomainName": "*.other.org"}]},
+        {"CertificateSummaryList": [
+            {"CertificateArn": "arn:2", "DomainName": "example.org",
+             "SubjectAlternativeNameSummaries": ["example.org", "*.example.org"]}]},
+    ])
+    assert lookups.findCertificate(client, "*.example.org") == "arn:2"
+    assert lookups.findCertificate(client, "*.missing.org") is None
+
+
+def listenerTargets(template):
+    """{listener port: logical id of its default target group}"""
+    return {l["Properties"]["Port"]: l["Properties"]["DefaultActions"][0]["TargetGroupArn"]["Ref"]
+            for l in template.find_resources("AWS::ElasticLoadBalancingV2::Listener").values()
+            if l["Properties"]["Protocol"] == "TCP"}
+
+
+def liveContext(color):
+    """An offline synth with the bolt listener cached as forwarding to color."""
+    return {"offline": "true", lookups.liveColorContextKey(makeConfig()): color}
+
+
+def test_blue_green_services_behind_switchable_listeners():
+    # the listener forwards to green after a switch; config.ini still says blue
+    template = stsTemplateWith(liveContext("green"), neo4j={"blue_green": "true", "live": "blue"})
+    for color, path in (("blue", "/test"), ("green", "/test-green")):
+        template.has_resource_properties("AWS::EFS::AccessPoint", {"RootDirectory": {"Path": path}})
+        template.has_resource_properties("AWS::ElasticLoadBalancingV2::TargetGroup", {
+            "Name": "mdb-test-{}".format(color), "Port": 7687, "Protocol": "TCP", "TargetType": "ip"})
+    template.resource_count_is("AWS::ECS::Service", 3)
+    template.resource_count_is("AWS::ServiceDiscovery::Service", 0)
+    groups = {r["Properties"]["Name"]: logical_id
+              for logical_id, r in template.find_resources("AWS::ElasticLoadBalancingV2::TargetGroup").items()
+              if "Name" in r["Properties"]}
+    assert listenerTargets(template) == {7687: groups["mdb-test-green"], 7688: groups["mdb-test-blue"]}
+    assert "Fn::Join" in containerEnvironment(template, "mdb-test-sts-api")["NEO4J_MDB_URI"]
+    with pytest.raises(ValueError):
+        neo4j.discoveryType(makeConfig(blue_green="true", discovery="cloudmap"))
+    with pytest.raises(ValueError):
+        neo4j.liveColor(makeConfig(live="red"))
+    # on EBS, green can start from a pre-loaded store snapshot
+    template = neo4jTemplate(liveContext("blue"), storage="ebs", ebs_size_gib=50, blue_green="true",
+                             ebs_snapshot_id_green="snap-0123456789abcdef0")
+    template.has_resource_properties("AWS::ECS::Service", {
+        "VolumeConfigurations": [{"Name": "neo4j-data", "ManagedEBSVolume": assertions.Match.object_like({
+            "SnapshotId": "snap-0123456789abcdef0"})}]})
+
+
+
+class ElbClient:
+    class exceptions:
+        class LoadBalancerNotFoundException(Exception):
+            pass
+
+    def __init__(self, live_group=None):
+        self.live_group = live_group
+
+    def describe_load_balancers(self, Names):
+        if self.live_group is None:
+            raise self.exceptions.LoadBalancerNotFoundException(Names[0])
+        assert Names == ["mdb-test-nlb"]
+        return {"LoadBalancers": [{"LoadBalancerArn": "arn:nlb"}]}
+
+    def describe_target_groups(self, LoadBalancerArn):
+        return {"TargetGroups": [{"TargetGroupArn": "arn:tg/" + c, "TargetGroupName": "mdb-test-" + c}
+                                 for c in neo4j.COLORS]}
+
+    def describe_listeners(self, LoadBalancerArn):
+        return {"Listeners": [
+            {"Port": 7688, "DefaultActions": [{"Type": "forward", "TargetGroupArn": "arn:tg/blue"}]},
+            {"Port": 7687, "DefaultActions": [{"Type": "forward", "TargetGroupArn": "arn:tg/" + self.live_group}]}]}
+
+
+def test_live_color_read_from_the_listener(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = makeConfig(blue_green="true", live="blue")
+    groups = {c: neo4j.targetGroupName("mdb-test", c) for c in neo4j.COLORS}
+    stack = core.Stack(core.App())
+    # before the first deploy there is no NLB: [neo4j] live
+    assert lookups.liveColor(stack, config, groups, "blue", ElbClient()) == "blue"
+    # after a switch the listener decides, and offline synths get it from the cache
+    assert lookups.liveColor(stack, config, groups, "blue", ElbClient("green")) == "green"
+    with open(tmp_path / lookups.CONTEXT_FILE) as fp:
+        assert json.load(fp) == {lookups.liveColorContextKey(config): "green"}
+    with pytest.raises(ValueError, match="neo4j-live-color"):
+        neo4jTemplate({"offline": "true"}, blue_green="true")
+
+
+def test_warmup_gates_health_checks():
+    template = neo4jTemplate(warmup="true", warmup_timeout=900, warmup_max_ms=500)
+    task = next(iter(template.find_resources("AWS::ECS::TaskDefinition").values()))["Properties"]
+    db, readiness = task["ContainerDefinitions"]
+    assert db["EntryPoint"][:5] == ["tini", "-g", "--", "/bin/sh", "-c"]
+    assert "apoc.warmup.run" in db["EntryPoint"][5]
+    assert db["HealthCheck"] == {
+        "Command": ["CMD-SHELL", "test -f /ready/warm && bash -c '</dev/tcp/127.0.0.1/7687' || exit 1"],
+        "StartPeriod": 300, "Interval": 60, "Retries": 10, "Timeout": 5}
+    assert {e["Name"]: e["Value"] for e in db["Environment"]}["MDB_WARMUP_MAX_MS"] == "500"
+    assert readiness["Command"] == ["httpd", "-f", "-p", "7475", "-h", "/ready"]
+    assert readiness["MountPoints"] == [{"ContainerPath": "/ready", "ReadOnly": True, "SourceVolume": "neo4j-ready"}]
+    assert db["Memory"] + readiness["Memory"] == 8192
+    template.has_resource_properties("AWS::ElasticLoadBalancingV2::TargetGroup", {
+        "Port": 7687, "Protocol": "TCP",
+        "HealthCheckProtocol": "HTTP", "HealthCheckPort": "7475", "HealthCheckPath": "/warm"})
+    template.has_resource_properties("AWS::ECS::Service", {"HealthCheckGracePeriodSeconds": 900})
+    template.has_resource_properties("AWS::EC2::SecurityGroupIngress", {"FromPort": 7475, "ToPort": 7475})
+    # without warmup, the NLB checks TCP on bolt as before
+    template = neo4jTemplate()
+    template.has_resource_properties("AWS::ElasticLoadBalancingV2::TargetGroup", {
+        "HealthCheckProtocol": assertions.Match.absent()})
+    assert len(next(iter(template.find_resources("AWS::ECS::TaskDefinition").values()))[
+        "Properties"]["ContainerDefinitions"]) == 1
+    with pytest.raises(ValueError):
+        neo4j.warmupEnabled(makeConfig(warmup="true", entry_point="neo4j"))
 
-# example tests. To run these tests, uncomment this file along with the example
-# resource in app/app_stack.py
-# def test_sqs_queue_created():
-#     app = core.App()
-#     stack = AppStack(app, "app")
-#     template = assertions.Template.from_stack(stack)
 
-#     template.has_resource_properties("AWS::SQS::Queue", {
-#         "VisibilityTimeout": 300
-#     })
+def test_metrics_container_and_query_log_settings():
+    template = neo4jTemplate(metrics="true", slow_query_ms=500, query_parameters="false")
+    task = next(iter(template.find_resources("AWS::ECS::TaskDefinition").values()))["Properties"]
+    db, metrics = task["ContainerDefinitions"]
+    assert metrics["EntryPoint"] == ["python", "neo4j_metrics.py"] and metrics["Essential"] is False
+    assert db["Memory"] + metrics["Memory"] == 8192
+    env = {e["Name"]: e["Value"] for e in metrics["Environment"]}
+    assert env["NEO4J_MDB_URI"] == "bolt://localhost:7687"
+    assert (env["NEO4J_SLOW_QUERY_MS"], env["NEO4J_QUERY_PARAMETERS"]) == ("500", "0")
+    template.resource_count_is("AWS::Logs::MetricFilter", len(neo4j.METRICS_FIELDS))
+    template.has_resource_properties("AWS::Logs::MetricFilter", {
+        "FilterPattern": "{ $.slow_queries >= 0 }",
+        "MetricTransformations": [{"MetricNamespace": "MDB/Neo4j", "MetricName": "slow_queries",
+                                   "MetricValue": "$.slow_queries", "Dimensions": [{"Key": "Service", "Value": "$.service"}]}]})
+    # community Neo4j has no query log or metrics endpoint
+    dbEnv = {e["Name"]: e["Value"] for e in db["Environment"]}
+    assert dbEnv["NEO4J_dbms_track__query__cpu__time"] == "true"
+    assert not any(name.startswith(("NEO4J_dbms_logs_query", "NEO4J_metrics")) for name in dbEnv)
+    enterprise = neo4j.instrumentationEnvironment(makeConfig(metrics="true", image="5.26.0-enterprise", slow_query_ms=250))
+    assert enterprise["NEO4J_db_logs_query_threshold"] == "250ms"
+    assert enterprise["NEO4J_db_logs_query_parameter__logging__enabled"] == "true"
+    assert enterprise["NEO4J_server_metrics_prometheus_endpoint"] == "0.0.0.0:2004"
+    enterprise = neo4j.instrumentationEnvironment(makeConfig(image="4.4.43-enterprise"))
+    assert enterprise["NEO4J_dbms_logs_query_enabled"] == "INFO" and enterprise["NEO4J_metrics_prometheus_enabled"] == "true"
+    # off by default
+    template = neo4jTemplate()
+    template.resource_count_is("AWS::Logs::MetricFilter", 0)
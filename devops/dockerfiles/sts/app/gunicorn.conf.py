@@ -1,9 +1,83 @@
 import os
+
 PORT = os.environ.get('STS_PORT') or 5000
 bind = f"0.0.0.0:{PORT}"
-wsgi_app = "bento_sts.sts:create_app()"
+wsgi_app = "sts_app:create_app()"
 pidfile = "/app/sts.pid"
 errorlog = os.environ.get('STS_ERR_LOG') and f"/app/{os.environ['STS_ERR_LOG']}" or "-"
 accesslog = os.environ.get('STS_ACC_LOG') and f"/app/{os.environ['STS_ACC_LOG']}" or "-"
 loglevel = os.environ.get('STS_LOGLEVEL') or "info"
-workers = os.environ.get('STS_WORKERS') or 2
+
+
+def container_cpus():
+    """CPUs allotted to the container (cgroup quota), else the CPUs the process may run on."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as fp:        # cgroup v2
+            quota, period = fp.read().split()[:2]
+        if quota != "max":
+            return max(1, round(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as fp:  # cgroup v1
+            quota = int(fp.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as fp:
+            period = int(fp.read())
+        if quota > 0:
+            return max(1, round(quota / period))
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0))
+
+
+### Worker profiles ###########################################################
+# Every STS request waits on a bolt round trip to Neo4j.
+#   sync     one request per worker process: 2 x CPUs + 1 workers
+#   gthread  STS_THREADS (default 8) requests per worker: CPUs + 1 workers
+#   gevent   STS_WORKER_CONNECTIONS (default 100) greenlets per worker: one worker per CPU
+# STS_WORKERS overrides the worker count. Each worker gets its own Neo4j
+# driver (see sts_app.py), with a connection pool sized to the requests
+# the worker serves at once.
+
+profile = os.environ.get('STS_WORKER_PROFILE') or "gthread"
+cpus = container_cpus()
+if profile == "sync":
+    worker_class = "sync"
+    workers = 2 * cpus + 1
+    concurrency = 1
+elif profile == "gthread":
+    worker_class = "gthread"
+    workers = cpus + 1
+    threads = int(os.environ.get('STS_THREADS') or 8)
+    concurrency = threads
+elif profile == "gevent":
+    worker_class = "gevent"
+    workers = cpus
+    worker_connections = int(os.environ.get('STS_WORKER_CONNECTIONS') or 100)
+    concurrency = worker_connections
+else:
+    raise ValueError(f"unknown STS_WORKER_PROFILE {profile!r} (sync, gthread or gevent)")
+workers = int(os.environ.get('STS_WORKERS') or workers)
+
+# read by sts_app.py in each worker
+os.environ.setdefault('STS_NEO4J_POOL_SIZE', str(concurrency + 2))
+
+# Longer than the ALB idle timeout (60s), so the ALB closes idle connections, not gunicorn
+keepalive = int(os.environ.get('STS_KEEPALIVE') or 75)
+timeout = int(os.environ.get('STS_TIMEOUT') or 60)
+graceful_timeout = int(os.environ.get('STS_GRACEFUL_TIMEOUT') or 30)
+# recycle workers now and then, staggered so they don't restart together
+max_requests = int(os.environ.get('STS_MAX_REQUESTS') or 5000)
+max_requests_jitter = max_requests // 10
+# bento_sts keeps its MDB connection in a class attribute; loading the app
+# before forking would share one driver's sockets between workers
+preload_app = False
+# STS_PRELOAD=1 imports the app's modules (Flask, bento_sts, bento_meta, the
+# neo4j driver) here in the master instead, without creating the app or a
+# driver, so workers fork with them loaded and only have to connect. Not
+# with gevent: its workers monkey-patch ssl and threading, which has to
+# happen before those are imported.
+preload_imports = os.environ.get('STS_PRELOAD', '').lower() in ("1", "true") and worker_class != "gevent"
+if preload_imports:
+    import sts_app  # noqa: F401
+    import bento_sts.sts  # noqa: F401
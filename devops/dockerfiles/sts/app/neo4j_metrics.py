@@ -0,0 +1,220 @@
+"""
+Neo4j metrics and slow-query sampler. It runs from this image as the
+metrics container of the Neo4j task ([neo4j] metrics in devops/awscdk), or
+locally against any Neo4j:
+
+  NEO4J_MDB_URI=bolt://localhost:7687 python neo4j_metrics.py
+
+Every NEO4J_METRICS_INTERVAL seconds (default 60) it writes one JSON line
+of type "metrics" to stdout:
+  page cache    hit ratio, faults and evictions since the last sample
+                (JMX bean "Page cache", via dbms.queryJmx)
+  transactions  open and peak, committed and rolled back since the last
+                sample (JMX bean "Transactions")
+  bolt          open bolt connections (dbms.listConnections)
+  queries       queries running, and how many of them have run for
+                NEO4J_SLOW_QUERY_MS (default 1000) or more
+The CDK stack turns these fields into CloudWatch metrics with metric
+filters on the container's log group.
+
+Community Neo4j has no query log, so slow queries are sampled instead:
+every NEO4J_QUERY_SAMPLE_INTERVAL seconds (default 5) dbms.listQueries
+lists the running queries. A query seen running for NEO4J_SLOW_QUERY_MS or
+more is written as a "slow_query" line once it is gone, with the longest
+elapsed, CPU and wait time seen, its page hits and faults, the statuses it
+was seen in (planning, running, waiting) and, unless
+NEO4J_QUERY_PARAMETERS=0, its parameters. Queries that finish between two
+samples are missed, so the times are lower bounds.
+scripts/query_log_top.py aggregates these lines into statement shapes.
+
+A source that the edition or version does not have (a procedure or JMX
+bean) is reported once as an "error" line and then left out.
+"""
+import os
+import json
+import time
+import signal
+from datetime import datetime, timezone
+
+JMX_QUERY = "CALL dbms.queryJmx('org.neo4j:*') YIELD name, attributes RETURN name, attributes"
+CONNECTIONS_QUERY = "CALL dbms.listConnections() YIELD connector WHERE connector = 'bolt' RETURN count(*) AS bolt"
+QUERIES_QUERY = "CALL dbms.listQueries()"
+# cumulative counters, reported as the change since the last sample
+COUNTERS = {
+    "page_cache_hits": ("Page cache", "Hits"),
+    "page_cache_faults": ("Page cache", "Faults"),
+    "page_cache_evictions": ("Page cache", "Evictions"),
+    "transactions_committed": ("Transactions", "NumberOfCommittedTransactions"),
+    "transactions_rolled_back": ("Transactions", "NumberOfRolledBackTransactions"),
+}
+GAUGES = {
+    "page_cache_usage_ratio": ("Page cache", "UsageRatio"),
+    "transactions_open": ("Transactions", "NumberOfOpenTransactions"),
+    "transactions_peak": ("Transactions", "PeakNumberOfConcurrentTransactions"),
+}
+
+
+def emit(record):
+    record = dict(record, time=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                  service=os.environ.get("NEO4J_METRICS_SERVICE", "neo4j"))
+    print(json.dumps(record, default=str), flush=True)
+
+
+### Metrics ###################################################################
+
+def jmxAttributes(rows, database="neo4j"):
+    """{bean name: {attribute: value}} from dbms.queryJmx rows, for one database's per-database beans."""
+    beans = {}
+    for row in rows:
+        keys = dict(part.split("=", 1) for part in row["name"].split(":", 1)[-1].split(",") if "=" in part)
+        if keys.get("database", database) != database or "name" not in keys:
+            continue
+        beans.setdefault(keys["name"], {}).update(
+            {k: v.get("value") if isinstance(v, dict) else v for k, v in row["attributes"].items()})
+    return beans
+
+
+def sampleMetrics(beans, previous, bolt=None, running=(), slow_ms=1000):
+    """
+    (metrics, counters): gauges and the change of each counter since previous,
+    the counters of the last sample ({} on the first). The page cache hit
+    ratio is that of the interval, not since startup.
+    """
+    counters = {name: beans.get(bean, {}).get(attr) for name, (bean, attr) in COUNTERS.items()}
+    counters = {name: value for name, value in counters.items() if value is not None}
+    metrics = {name: beans.get(bean, {}).get(attr) for name, (bean, attr) in GAUGES.items()}
+    for name, value in counters.items():
+        if name in previous:
+            metrics[name] = value - previous[name]
+    accesses = metrics.get("page_cache_hits", 0) + metrics.get("page_cache_faults", 0)
+    if "page_cache_hits" in metrics and accesses:
+        metrics["page_cache_hit_ratio"] = round(metrics["page_cache_hits"] / accesses, 4)
+    metrics["bolt_connections"] = bolt
+    metrics["queries_running"] = len(running)
+    metrics["slow_queries"] = sum(1 for q in running if (q.get("elapsedTimeMillis") or 0) >= slow_ms)
+    return {k: v for k, v in metrics.items() if v is not None}, counters
+
+
+### Slow queries ##############################################################
+
+class SlowQueries:
+    """Running queries past slow_ms, kept until they are gone from dbms.listQueries."""
+    def __init__(self, slow_ms=1000, parameters=True):
+        self.slow_ms = slow_ms
+        self.parameters = parameters
+        self.running = {}
+
+    def update(self, rows):
+        """Record one sample of dbms.listQueries; returns the slow_query records of queries that finished."""
+        seen = set()
+        for row in rows:
+            if "dbms.listQueries" in (row.get("query") or ""):
+                continue
+            qid = row.get("queryId")
+            seen.add(qid)
+            if qid in self.running:
+                self.merge(self.running[qid], row)
+            elif (row.get("elapsedTimeMillis") or 0) >= self.slow_ms:
+                self.running[qid] = self.record(row)
+        finished = [self.running.pop(qid) for qid in list(self.running) if qid not in seen]
+        return finished
+
+    def flush(self):
+        finished, self.running = list(self.running.values()), {}
+        return finished
+
+    def record(self, row):
+        record = {
+            "type": "slow_query", "query_id": row.get("queryId"), "query": row.get("query"),
+            "database": row.get("database"), "username": row.get("username"),
+            "client": row.get("clientAddress"), "planner": row.get("planner"), "runtime": row.get("runtime"),
+            "statuses": [], "elapsed_ms": 0, "cpu_ms": None, "wait_ms": None, "page_hits": None, "page_faults": None,
+        }
+        if self.parameters:
+            record["parameters"] = row.get("parameters")
+        self.merge(record, row)
+        return record
+
+    @staticmethod
+    def merge(record, row):
+        """Keep the latest counters and the longest times seen."""
+        for field, column in (("elapsed_ms", "elapsedTimeMillis"), ("cpu_ms", "cpuTimeMillis"),
+                              ("wait_ms", "waitTimeMillis"), ("page_hits", "pageHits"), ("page_faults", "pageFaults")):
+            if row.get(column) is not None:
+                record[field] = max(record[field] or 0, row[column])
+        status = row.get("status")
+        if isinstance(status, dict):
+            status = status.get("state")
+        if status and status not in record["statuses"]:
+            record["statuses"].append(status)
+
+
+### Sampling ##################################################################
+
+class Sampler:
+    def __init__(self, driver, slow_ms=1000, parameters=True, database="neo4j"):
+        self.driver = driver
+        self.database = database
+        self.slow = SlowQueries(slow_ms, parameters)
+        self.counters = {}
+        self.running = []
+        self.missing = set()
+
+    def query(self, source, cypher):
+        """Rows of cypher, or None once the source turned out to be missing."""
+        if source in self.missing:
+            return None
+        try:
+            with self.driver.session() as session:
+                return [r.data() for r in session.run(cypher)]
+        except Exception as e:
+            if (getattr(e, "code", None) or "").startswith("Neo.ClientError"):
+                self.missing.add(source)
+                emit({"type": "error", "source": source, "error": "{}, not sampled again".format(e)})
+            else:
+                emit({"type": "error", "source": source, "error": str(e)})
+            return None
+
+    def sampleQueries(self):
+        rows = self.query("queries", QUERIES_QUERY)
+        if rows is not None:
+            self.running = [r for r in rows if "dbms.listQueries" not in (r.get("query") or "")]
+            for record in self.slow.update(rows):
+                emit(record)
+
+    def sampleMetrics(self):
+        beans = jmxAttributes(self.query("jmx", JMX_QUERY) or [], self.database)
+        bolt = self.query("connections", CONNECTIONS_QUERY)
+        metrics, self.counters = sampleMetrics(beans, self.counters, bolt[0]["bolt"] if bolt else None,
+                                               self.running, self.slow.slow_ms)
+        emit(dict(metrics, type="metrics"))
+
+
+def run(sampler, metrics_interval, query_interval):
+    stop = []
+    signal.signal(signal.SIGTERM, lambda *_: stop.append(True))
+    next_metrics = time.monotonic()
+    try:
+        while not stop:
+            sampler.sampleQueries()
+            if time.monotonic() >= next_metrics:
+                sampler.sampleMetrics()
+                next_metrics += metrics_interval
+            time.sleep(query_interval)
+    except KeyboardInterrupt:
+        pass
+    for record in sampler.slow.flush():
+        emit(record)
+
+
+if __name__ == "__main__":
+    from neo4j import GraphDatabase
+    driver = GraphDatabase.driver(os.environ.get("NEO4J_MDB_URI", "bolt://localhost:7687"),
+                                  auth=(os.environ.get("NEO4J_MDB_USER", "neo4j"), os.environ.get("NEO4J_MDB_PASS", "neo4j1")))
+    sampler = Sampler(driver,
+                      slow_ms=int(os.environ.get("NEO4J_SLOW_QUERY_MS", "1000")),
+                      parameters=os.environ.get("NEO4J_QUERY_PARAMETERS", "1") not in ("0", "false", "False"),
+                      database=os.environ.get("NEO4J_METRICS_DATABASE", "neo4j"))
+    with driver:
+        run(sampler, int(os.environ.get("NEO4J_METRICS_INTERVAL", "60")),
+            float(os.environ.get("NEO4J_QUERY_SAMPLE_INTERVAL", "5")))
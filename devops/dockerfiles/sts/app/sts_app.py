@@ -0,0 +1,40 @@
+"""
+WSGI entry point for the STS container: bento_sts.sts:create_app with a
+Neo4j connection pool sized for the gunicorn worker it runs in.
+
+bento_meta's MDB opens its driver with the driver defaults (a pool of up
+to 100 connections per process). gunicorn.conf.py works out how many
+requests one worker serves at once for the chosen worker profile and
+exports STS_NEO4J_POOL_SIZE; the driver of each worker is opened with that
+pool size and an acquisition timeout below the gunicorn request timeout.
+
+The app is wrapped in the snapshot lookups from sts_snapshot.py and the
+response cache from sts_cache.py, which share one reader of the MDB version.
+"""
+import os
+
+import bento_meta.mdb.mdb as bento_mdb
+from neo4j import GraphDatabase
+
+from sts_cache import cached, changelogVersion
+from sts_snapshot import snapshots
+
+POOL_SIZE = int(os.environ.get("STS_NEO4J_POOL_SIZE") or 10)
+ACQUISITION_TIMEOUT = float(os.environ.get("STS_NEO4J_ACQUISITION_TIMEOUT") or 30)
+
+
+class _SizedGraphDatabase:
+    """GraphDatabase, with pool settings added to every driver it opens."""
+    @staticmethod
+    def driver(uri, **config):
+        config.setdefault("max_connection_pool_size", POOL_SIZE)
+        config.setdefault("connection_acquisition_timeout", ACQUISITION_TIMEOUT)
+        config.setdefault("keep_alive", True)
+        return GraphDatabase.driver(uri, **config)
+
+
+def create_app():
+    bento_mdb.GraphDatabase = _SizedGraphDatabase
+    from bento_sts.sts import create_app as create_sts_app
+    version = changelogVersion()
+    return cached(snapshots(create_sts_app(), version), version)
@@ -0,0 +1,238 @@
+"""
+Response cache for STS, as WSGI middleware around the bento_sts app.
+
+MDB content only changes when changelogs are deployed, so successful GET
+responses under STS_CACHE_PATHS (default /v1/, the API) are cached, keyed
+on the MDB version plus the request path and query string. The version is
+read from the Liquibase history in the database (count of the
+__LiquibaseChangeSet nodes and latest dateExecuted of their IN_CHANGELOG
+relationships) at most every
+STS_CACHE_VERSION_TTL seconds. A deployment changes the version, so every
+cached response is dropped at once, on every task.
+
+Two levels:
+  local   an in-process LRU per worker, bounded to STS_CACHE_MAX_BYTES of
+          response bodies (default 64 MiB)
+  shared  optional Redis at STS_CACHE_REDIS_URL, shared by all workers and
+          tasks; entries expire after STS_CACHE_TTL seconds (default 1 day)
+If the version can't be read or Redis is unreachable, requests go to the
+app as usual.
+
+GET /cache/metrics returns hit/miss counts per level, evictions and the
+current version as JSON. Responses carry X-Cache: HIT or MISS.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+VERSION_QUERY = """
+MATCH (c:__LiquibaseChangeSet)-[r:IN_CHANGELOG]->()
+RETURN count(c) AS changesets, toString(max(r.dateExecuted)) AS last_executed
+"""
+
+
+class LRUCache:
+    """Thread-safe LRU bounded by the total size of the cached bodies."""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        size = len(entry[2])
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old[2])
+            self.entries[key] = entry
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= len(evicted[2])
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+
+class RedisCache:
+    """Entries in Redis as JSON, under sts:<key>."""
+    def __init__(self, url, ttl):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.ttl = ttl
+
+    def get(self, key):
+        data = self.client.get("sts:" + key)
+        if data is None:
+            return None
+        status, headers, body = json.loads(data)
+        return status, [tuple(h) for h in headers], body.encode("latin-1")
+
+    def put(self, key, entry):
+        status, headers, body = entry
+        self.client.set("sts:" + key, json.dumps([status, headers, body.decode("latin-1")]), ex=self.ttl)
+
+
+class ChangelogVersion:
+    """The MDB version from the Liquibase history, re-read at most every ttl seconds."""
+    def __init__(self, ttl=60, read=None):
+        self.ttl = ttl
+        self.read = read or self.readHistory
+        self.value = None
+        self.checked = float("-inf")
+        self.lock = threading.Lock()
+        self.driver = None
+
+    def readHistory(self):
+        if self.driver is None:
+            from neo4j import GraphDatabase
+            self.driver = GraphDatabase.driver(
+                os.environ.get("NEO4J_MDB_URI"),
+                auth=(os.environ.get("NEO4J_MDB_USER"), os.environ.get("NEO4J_MDB_PASS")),
+                max_connection_pool_size=1)
+        with self.driver.session() as session:
+            record = session.run(VERSION_QUERY).single()
+        return "{}-{}".format(record["changesets"], record["last_executed"])
+
+    def __call__(self):
+        now = time.monotonic()
+        if now - self.checked < self.ttl:
+            return self.value
+        with self.lock:
+            if now - self.checked >= self.ttl:
+                try:
+                    self.value = self.read()
+                except Exception as e:
+                    logger.warning("MDB version unavailable, not caching: %s", e)
+                    self.value = None
+                self.checked = now
+        return self.value
+
+
+class CacheMiddleware:
+    def __init__(self, app, version, local, shared=None, paths=("/v1/",), metrics_path="/cache/metrics"):
+        self.app = app
+        self.version = version
+        self.local = local
+        self.shared = shared
+        self.paths = tuple(paths)
+        self.metrics_path = metrics_path
+        self.seen_version = None
+        self.version_lock = threading.Lock()
+        self.counts = {"local_hits": 0, "shared_hits": 0, "misses": 0, "bypassed": 0, "shared_errors": 0}
+        self.counts_lock = threading.Lock()
+
+    def count(self, name):
+        with self.counts_lock:
+            self.counts[name] += 1
+
+    def metrics(self):
+        requests = self.counts["local_hits"] + self.counts["shared_hits"] + self.counts["misses"]
+        hits = self.counts["local_hits"] + self.counts["shared_hits"]
+        return dict(self.counts, version=self.seen_version, hit_ratio=round(hits / requests, 3) if requests else None,
+                    local_entries=len(self.local.entries), local_bytes=self.local.bytes,
+                    local_evictions=self.local.evictions, shared=self.shared is not None)
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path == self.metrics_path:
+            body = json.dumps(self.metrics()).encode("utf-8")
+            start_response("200 OK", [("Content-Type", "application/json"), ("Content-Length", str(len(body)))])
+            return [body]
+        if environ.get("REQUEST_METHOD") != "GET" or not path.startswith(self.paths):
+            return self.app(environ, start_response)
+        version = self.version()
+        if version is None:
+            self.count("bypassed")
+            return self.app(environ, start_response)
+        if version != self.seen_version:
+            with self.version_lock:
+                # a deployment: nothing cached for the old version is reachable any more
+                if version != self.seen_version:
+                    self.local.clear()
+                    self.seen_version = version
+        key = "{}:{}?{}".format(version, path, environ.get("QUERY_STRING", ""))
+
+        entry = self.local.get(key)
+        if entry is not None:
+            self.count("local_hits")
+            return self.respond(entry, "HIT", start_response)
+        if self.shared is not None:
+            try:
+                entry = self.shared.get(key)
+            except Exception as e:
+                self.count("shared_errors")
+                logger.warning("shared cache get failed: %s", e)
+            if entry is not None:
+                self.count("shared_hits")
+                self.local.put(key, entry)
+                return self.respond(entry, "HIT", start_response)
+
+        self.count("misses")
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured["status"], captured["headers"] = status, headers
+            return start_response(status, headers + [("X-Cache", "MISS")], exc_info)
+
+        result = self.app(environ, capture)
+        try:
+            body = b"".join(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        headers = captured.get("headers", [])
+        if captured.get("status", "").startswith("200") and not any(k.lower() == "set-cookie" for k, _ in headers):
+            entry = (captured["status"], [(k, v) for k, v in headers], body)
+            self.local.put(key, entry)
+            if self.shared is not None:
+                try:
+                    self.shared.put(key, entry)
+                except Exception as e:
+                    self.count("shared_errors")
+                    logger.warning("shared cache put failed: %s", e)
+        return [body]
+
+    def respond(self, entry, state, start_response):
+        status, headers, body = entry
+        start_response(status, headers + [("X-Cache", state)])
+        return [body]
+
+
+def changelogVersion():
+    return ChangelogVersion(float(os.environ.get("STS_CACHE_VERSION_TTL") or 60))
+
+
+def cached(app, version=None):
+    """Wrap app with the cache configured from the environment (STS_CACHE=0 turns it off)."""
+    if os.environ.get("STS_CACHE", "1") == "0":
+        return app
+    shared = None
+    if os.environ.get("STS_CACHE_REDIS_URL"):
+        shared = RedisCache(os.environ["STS_CACHE_REDIS_URL"], int(os.environ.get("STS_CACHE_TTL") or 86400))
+    return CacheMiddleware(
+        app,
+        version or changelogVersion(),
+        LRUCache(int(os.environ.get("STS_CACHE_MAX_BYTES") or 64 * 1024 * 1024)),
+        shared,
+        paths=(os.environ.get("STS_CACHE_PATHS") or "/v1/").split(","),
+    )
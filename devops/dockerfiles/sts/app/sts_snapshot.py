@@ -0,0 +1,180 @@
+"""
+Serve the hot STS read endpoints from per-model SQLite snapshots, as WSGI
+middleware around the bento_sts app.
+
+scripts/export_snapshots.py writes <model>.sqlite files; put them in
+STS_SNAPSHOT_DIR (default /app/snapshots). Each file is opened read-only
+and immutable, with its pages memory-mapped (up to STS_SNAPSHOT_MMAP_BYTES,
+default 256 MiB), so all workers in a task share the page cache and a
+lookup costs no round trip to Neo4j. These paths are answered from a
+snapshot, in the same JSON shape bento_sts gives them:
+
+  /v1/model/<model>/nodes
+  /v1/model/<model>/node/<handle>
+  /v1/model/<model>/node/<handle>/properties
+  /v1/model/<model>/node/<handle>/property/<handle>
+  /v1/model/<model>/node/<handle>/property/<handle>/terms
+
+Everything else, a model without a snapshot, an empty result, and every
+request while the snapshot's MDB version differs from the deployed one
+(read as sts_cache.py does) goes to the app and so to Neo4j. A snapshot
+without a version (exported from the changelogs without --mdb-version)
+could be from any deployment, so it is only served with
+STS_SNAPSHOT_UNVERSIONED=1, e.g. for a local container with no history.
+Responses carry X-Snapshot: <model>.
+"""
+import os
+import re
+import json
+import glob
+import sqlite3
+import logging
+import threading
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTS_PER_REQ = 500  # bento_sts config.MAX_ENTS_PER_REQ
+
+NODES = "SELECT props FROM entity WHERE label = 'node' ORDER BY id"
+NODE = "SELECT props FROM entity WHERE label = 'node' AND handle = ? ORDER BY id"
+PROPERTIES = """
+SELECT p.props FROM entity n
+JOIN edge e ON e.src = n.id AND e.type = 'has_property'
+JOIN entity p ON p.id = e.dst
+WHERE n.label = 'node' AND n.handle = ? {} ORDER BY p.id"""
+TERMS = """
+SELECT DISTINCT t.id, t.props FROM entity n
+JOIN edge e ON e.src = n.id AND e.type = 'has_property'
+JOIN entity p ON p.id = e.dst
+JOIN edge ev ON ev.src = p.id AND ev.type = 'has_value_set'
+JOIN edge et ON et.src = ev.dst AND et.type = 'has_term'
+JOIN entity t ON t.id = et.dst
+WHERE n.label = 'node' AND n.handle = ? AND p.handle = ? ORDER BY t.id"""
+
+# path -> (return alias, query, has a /count path)
+ROUTES = [
+    (re.compile(r"^/v1/model/([^/]+)/nodes/?$"), "nodes", NODES, True),
+    (re.compile(r"^/v1/model/([^/]+)/node/([^/]+)/?$"), "node", NODE, False),
+    (re.compile(r"^/v1/model/([^/]+)/node/([^/]+)/properties/?$"), "properties", PROPERTIES.format(""), True),
+    (re.compile(r"^/v1/model/([^/]+)/node/([^/]+)/property/([^/]+)/?$"), "property",
+     PROPERTIES.format("AND p.handle = ?"), False),
+    (re.compile(r"^/v1/model/([^/]+)/node/([^/]+)/property/([^/]+)/terms/?$"), "terms", TERMS, True),
+]
+
+
+class Snapshot:
+    """One <model>.sqlite, with a connection per thread."""
+    def __init__(self, file_name, mmap_bytes):
+        self.file_name = file_name
+        self.mmap_bytes = mmap_bytes
+        self.local = threading.local()
+        meta = dict(self.connection().execute("SELECT key, value FROM meta"))
+        self.model = meta["model"]
+        self.version = meta.get("mdb_version")
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            uri = "file:{}?mode=ro&immutable=1".format(os.path.abspath(self.file_name))
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            conn.execute("PRAGMA mmap_size = {}".format(int(self.mmap_bytes)))
+            self.local.conn = conn
+        return conn
+
+    def rows(self, query, args):
+        return [json.loads(r[-1]) for r in self.connection().execute(query, args)]
+
+
+def loadSnapshots(snapshot_dir, mmap_bytes, unversioned=False):
+    snapshots = {}
+    for file_name in sorted(glob.glob(os.path.join(snapshot_dir, "*.sqlite"))):
+        try:
+            snapshot = Snapshot(file_name, mmap_bytes)
+        except sqlite3.Error as e:
+            logger.warning("skipping snapshot %s: %s", file_name, e)
+            continue
+        snapshots[snapshot.model] = snapshot
+        logger.info("snapshot for %s (version %s) from %s", snapshot.model, snapshot.version, file_name)
+        if snapshot.version is None and not unversioned:
+            logger.warning("snapshot %s has no MDB version and is not served (STS_SNAPSHOT_UNVERSIONED=1 serves it)",
+                           file_name)
+    return snapshots
+
+
+def stsResult(alias, items, skip, limit, with_count):
+    """items shaped as bento_sts shapes a query result (see bento_sts api/routes.py)."""
+    page = items[skip:skip + limit]
+    if not page:
+        return None
+    ret = {alias: page[0]} if len(page) == 1 else {alias: page}
+    if with_count:
+        ret["count"] = len(items)
+    return ret
+
+
+class SnapshotMiddleware:
+    def __init__(self, app, snapshots, version=None, max_ents=MAX_ENTS_PER_REQ, unversioned=False):
+        self.app = app
+        self.snapshots = snapshots
+        self.version = version
+        self.max_ents = max_ents
+        self.unversioned = unversioned
+
+    def current(self, model):
+        snapshot = self.snapshots.get(model)
+        if snapshot is None or snapshot.version is None:
+            return snapshot if self.unversioned else None
+        version = self.version() if self.version is not None else None
+        return snapshot if version == snapshot.version else None
+
+    def answer(self, environ):
+        path = environ.get("PATH_INFO", "")
+        for pattern, alias, query, with_count in ROUTES:
+            match = pattern.match(path)
+            if match:
+                break
+        else:
+            return None
+        model, *args = match.groups()
+        snapshot = self.current(model)
+        if snapshot is None:
+            return None
+        params = parse_qs(environ.get("QUERY_STRING", ""))
+        try:
+            skip = int(params.get("skip", [0])[0] or 0)
+            limit = int(params.get("limit", [0])[0] or 0)
+        except ValueError:
+            return None
+        if not limit or limit > self.max_ents:
+            limit = self.max_ents
+        ret = stsResult(alias, snapshot.rows(query, args), skip, limit, with_count)
+        return snapshot.model, ret
+
+    def __call__(self, environ, start_response):
+        if environ.get("REQUEST_METHOD") != "GET":
+            return self.app(environ, start_response)
+        try:
+            answer = self.answer(environ)
+        except sqlite3.Error as e:
+            logger.warning("snapshot lookup failed: %s", e)
+            answer = None
+        if answer is None or answer[1] is None:
+            return self.app(environ, start_response)
+        model, ret = answer
+        body = (json.dumps(ret) + "\n").encode("utf-8")
+        start_response("200 OK", [
+            ("Content-Type", "application/json"), ("Content-Length", str(len(body))),
+            ("Access-Control-Allow-Origin", "*"), ("X-Snapshot", model)])
+        return [body]
+
+
+def snapshots(app, version=None):
+    """Wrap app with the snapshots in STS_SNAPSHOT_DIR, if there are any."""
+    snapshot_dir = os.environ.get("STS_SNAPSHOT_DIR") or "/app/snapshots"
+    unversioned = os.environ.get("STS_SNAPSHOT_UNVERSIONED", "0") == "1"
+    loaded = loadSnapshots(snapshot_dir, int(os.environ.get("STS_SNAPSHOT_MMAP_BYTES") or 256 * 1024 * 1024),
+                           unversioned)
+    if not loaded:
+        return app
+    return SnapshotMiddleware(app, loaded, version, unversioned=unversioned)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "app"))
+# snapshots for the sts_snapshot tests are written by scripts/export_snapshots.py
+sys.path.insert(0, os.path.join(HERE, "..", "..", "..", "..", "scripts"))
@@ -0,0 +1,37 @@
+from neo4j_metrics import SlowQueries, jmxAttributes, sampleMetrics
+
+JMX = [
+    {"name": "org.neo4j:instance=kernel#0,name=Page cache",
+     "attributes": {"Hits": {"value": 1000}, "Faults": {"value": 100}, "Evictions": {"value": 0},
+                    "UsageRatio": {"value": 0.5}}},
+    {"name": "org.neo4j:instance=kernel#0,name=Transactions,database=neo4j",
+     "attributes": {"NumberOfCommittedTransactions": {"value": 50}, "NumberOfOpenTransactions": {"value": 2}}},
+    {"name": "org.neo4j:instance=kernel#0,name=Transactions,database=system",
+     "attributes": {"NumberOfCommittedTransactions": {"value": 7}, "NumberOfOpenTransactions": {"value": 0}}},
+]
+
+
+def test_metrics_are_changes_since_the_last_sample():
+    beans = jmxAttributes(JMX)
+    assert beans["Transactions"]["NumberOfOpenTransactions"] == 2
+    running = [{"elapsedTimeMillis": 50}, {"elapsedTimeMillis": 2500}]
+    metrics, counters = sampleMetrics(beans, {}, bolt=4, running=running)
+    assert metrics == {"page_cache_usage_ratio": 0.5, "transactions_open": 2, "bolt_connections": 4,
+                       "queries_running": 2, "slow_queries": 1}
+    beans["Page cache"].update(Hits=1090, Faults=110)
+    beans["Transactions"]["NumberOfCommittedTransactions"] = 65
+    metrics, _ = sampleMetrics(beans, counters)
+    assert metrics["page_cache_hit_ratio"] == 0.9 and metrics["page_cache_faults"] == 10
+    assert metrics["transactions_committed"] == 15 and "bolt_connections" not in metrics
+
+
+def test_slow_query_reported_once_when_gone():
+    slow = SlowQueries(slow_ms=1000, parameters=False)
+    row = {"queryId": "query-7", "query": "MATCH (n) RETURN n", "parameters": {"x": 1}, "status": "planning",
+           "elapsedTimeMillis": 1200, "cpuTimeMillis": 10, "pageHits": 5, "pageFaults": 1}
+    assert slow.update([row, {"queryId": "query-8", "query": "RETURN 1", "elapsedTimeMillis": 3}]) == []
+    assert slow.update([dict(row, status="running", elapsedTimeMillis=3400, pageFaults=40)]) == []
+    [record] = slow.update([{"queryId": "query-9", "query": "CALL dbms.listQueries()", "elapsedTimeMillis": 5000}])
+    assert record["elapsed_ms"] == 3400 and record["page_faults"] == 40
+    assert record["statuses"] == ["planning", "running"] and "parameters" not in record
+    assert slow.flush() == []
@@ -0,0 +1,94 @@
+import json
+import time
+import threading
+
+from sts_cache import CacheMiddleware, ChangelogVersion, LRUCache
+
+
+class App:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, environ, start_response):
+        self.calls += 1
+        status = "404 NOT FOUND" if environ["PATH_INFO"].endswith("missing") else "200 OK"
+        start_response(status, [("Content-Type", "application/json")])
+        return [b'{"path": "', environ["PATH_INFO"].encode(), b'"}']
+
+
+def get(app, path, query=""):
+    seen = {}
+
+    def start_response(status, headers, exc_info=None):
+        seen["status"], seen["headers"] = status, dict(headers)
+    body = b"".join(app({"REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": query}, start_response))
+    return seen["status"], seen["headers"], body
+
+
+class Shared(dict):
+    put = dict.__setitem__
+
+
+def test_cache_hits_and_version_invalidation():
+    inner, version, shared = App(), ["v1"], Shared()
+    app = CacheMiddleware(inner, lambda: version[0], LRUCache(1024), shared)
+    assert get(app, "/v1/models")[1]["X-Cache"] == "MISS"
+    status, headers, body = get(app, "/v1/models")
+    assert (status, headers["X-Cache"], body) == ("200 OK", "HIT", b'{"path": "/v1/models"}')
+    assert get(app, "/v1/models", "skip=10")[1]["X-Cache"] == "MISS"
+    get(app, "/v1/missing")
+    get(app, "/v1/missing")
+    get(app, "/")
+    assert inner.calls == 5
+    # a deployment changes the version: the old entries are not served
+    version[0] = "v2"
+    assert get(app, "/v1/models")[1]["X-Cache"] == "MISS"
+    assert sorted(shared) == ["v1:/v1/models?", "v1:/v1/models?skip=10", "v2:/v1/models?"]
+    metrics = json.loads(get(app, "/cache/metrics")[2])
+    assert (metrics["local_hits"], metrics["misses"], metrics["version"]) == (1, 5, "v2")
+
+
+def test_version_change_clears_once():
+    class SlowClear(LRUCache):
+        clears = 0
+
+        def clear(self):
+            SlowClear.clears += 1
+            time.sleep(0.01)
+            super().clear()
+
+    app = CacheMiddleware(App(), lambda: "v2", SlowClear(1024))
+    start = threading.Barrier(8)
+
+    def request():
+        start.wait()
+        get(app, "/v1/models")
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert SlowClear.clears == 1 and app.seen_version == "v2"
+
+
+def test_shared_hits_and_bypass():
+    shared = Shared({"v1:/v1/tags?": ("200 OK", [("Content-Type", "application/json")], b"[]")})
+    inner = App()
+    app = CacheMiddleware(inner, lambda: "v1", LRUCache(1024), shared)
+    assert get(app, "/v1/tags")[2] == b"[]" and inner.calls == 0
+    assert app.counts["shared_hits"] == 1
+    unavailable = CacheMiddleware(inner, ChangelogVersion(read=lambda: 1 / 0), LRUCache(1024))
+    get(unavailable, "/v1/tags")
+    get(unavailable, "/v1/tags")
+    assert inner.calls == 2 and unavailable.counts["bypassed"] == 2
+
+
+def test_lru_bounded_by_bytes():
+    cache = LRUCache(10)
+    cache.put("a", ("200 OK", [], b"12345"))
+    cache.put("b", ("200 OK", [], b"12345"))
+    cache.get("a")
+    cache.put("c", ("200 OK", [], b"123"))
+    assert list(cache.entries) == ["a", "c"] and cache.bytes == 8 and cache.evictions == 1
+    cache.put("d", ("200 OK", [], b"x" * 11))
+    assert "d" not in cache.entries
@@ -0,0 +1,58 @@
+import json
+
+from export_snapshots import writeSnapshot
+from sts_snapshot import SnapshotMiddleware, loadSnapshots
+from test_sts_cache import App, get
+
+ENTITIES = [
+    (1, "node", {"handle": "case", "model": "ICDC", "nanoid": "aaaaaa"}),
+    (2, "node", {"handle": "visit", "model": "ICDC", "nanoid": "bbbbbb"}),
+    (3, "property", {"handle": "sex", "model": "ICDC", "value_domain": "value_set"}),
+    (4, "property", {"handle": "breed", "model": "ICDC", "value_domain": "value_set"}),
+    (5, "value_set", {"handle": "sex", "_id": "vs1"}),
+    (6, "term", {"value": "Male", "origin_name": "ICDC"}),
+    (7, "term", {"value": "Female", "origin_name": "ICDC"}),
+]
+EDGES = [(1, "has_property", 3), (1, "has_property", 4), (3, "has_value_set", 5),
+         (5, "has_term", 6), (5, "has_term", 7)]
+
+
+def middleware(tmp_path, version="12-2024", stamped="12-2024", unversioned=False):
+    writeSnapshot(str(tmp_path / "ICDC.sqlite"), "ICDC", ENTITIES, EDGES, stamped)
+    app = App()
+    return app, SnapshotMiddleware(app, loadSnapshots(str(tmp_path), 1 << 20), lambda: version,
+                                   unversioned=unversioned)
+
+
+def test_snapshot_answers_in_sts_shape(tmp_path):
+    app, mw = middleware(tmp_path)
+    status, headers, body = get(mw, "/v1/model/ICDC/nodes")
+    assert status == "200 OK" and headers["X-Snapshot"] == "ICDC"
+    assert json.loads(body) == {"nodes": [e[2] for e in ENTITIES[:2]], "count": 2}
+    # a single record is returned as itself, not a list
+    assert json.loads(get(mw, "/v1/model/ICDC/node/case")[2]) == {"node": ENTITIES[0][2]}
+    assert json.loads(get(mw, "/v1/model/ICDC/node/case/properties", "skip=1")[2]) == {
+        "properties": ENTITIES[3][2], "count": 2}
+    # query values are decoded as the app decodes them
+    assert json.loads(get(mw, "/v1/model/ICDC/node/case/properties", "skip=%31&limit=%2B1")[2]) == {
+        "properties": ENTITIES[3][2], "count": 2}
+    assert json.loads(get(mw, "/v1/model/ICDC/node/case/property/sex/terms")[2])["terms"] == [
+        {"value": "Male", "origin_name": "ICDC"}, {"value": "Female", "origin_name": "ICDC"}]
+    assert app.calls == 0
+
+
+def test_falls_back_to_app(tmp_path):
+    app, mw = middleware(tmp_path)
+    for path in ("/v1/models", "/v1/model/CTDC/nodes", "/v1/model/ICDC/node/sample", "/v1/id/aaaaaa"):
+        assert "X-Snapshot" not in get(mw, path)[1]
+    assert app.calls == 4
+    # a stale snapshot is never served
+    app, mw = middleware(tmp_path, version="13-2025")
+    assert "X-Snapshot" not in get(mw, "/v1/model/ICDC/nodes")[1] and app.calls == 1
+
+
+def test_unversioned_snapshot_needs_opt_in(tmp_path):
+    app, mw = middleware(tmp_path, stamped=None)
+    assert "X-Snapshot" not in get(mw, "/v1/model/ICDC/nodes")[1] and app.calls == 1
+    app, mw = middleware(tmp_path, stamped=None, unversioned=True)
+    assert get(mw, "/v1/model/ICDC/nodes")[1]["X-Snapshot"] == "ICDC" and app.calls == 0
@@ -0,0 +1,145 @@
+"""
+Write deterministic nanoids into a generated changelog.
+
+Without a nanoid in the changelog, every node a load creates is given a
+random one by the add-nanoid-property trigger, one afterAsync transaction
+per node, and the nanoid differs between tiers. This adds the nanoid from
+nanoid.deterministicNanoid to each statement that creates a node of
+NANOID_LABELS without one:
+
+  CREATE (n0:node {...})                 nanoid added to the property map
+  MERGE (n0:term {...}) ON CREATE SET    nanoid added to ON CREATE SET, so
+                                         the MERGE still matches existing nodes
+
+and keys the rollbacks on it and the node's _commit: `MATCH (n0:node
+{nanoid:'...',_commit:'...'}) DETACH DELETE n0`, and the endpoints of edge
+rollbacks whose nodes carry a nanoid, which the nanoid indexes in
+mdb_setup_changelog.xml resolve with an index seek.
+
+Nanoids already used by the changelog, and by the --existing changelogs
+(default: every changelog under changelogs/), are never handed out again. Run this on changelogs that have not been
+deployed yet: it changes their checksums. Loads of the converted changelogs
+can then run with the trigger paused (bulk_load.py).
+
+  python scripts/add_nanoids.py changelogs/models/ICDC/icdc_changelog_new.xml --in-place
+"""
+import os
+import re
+import glob
+import argparse
+
+from changelog import Changeset, iterChangesets, readChangelogId, writeChangelog
+from cypher import Entity, Statement, formatStatement, parseStatement
+from nanoid import NANOID_LABELS, deterministicNanoid
+
+CHANGELOGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "changelogs", "**", "*.xml")
+_NANOID = re.compile(r"\bnanoid\s*:\s*(['\"])(.*?)\1")
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="add deterministic nanoids to a changelog and key rollbacks on them")
+    parser.add_argument("changelog", help="changelog to convert")
+    parser.add_argument("--existing", action="append",
+                        help="glob of changelogs whose nanoids must not be reused "
+                             "(repeatable; default: every changelog under changelogs/)")
+    parser.add_argument("--output", help="write the converted changelog here")
+    parser.add_argument("--in-place", action="store_true", help="rewrite the changelog in place")
+    return parser.parse_args()
+
+
+def usedNanoids(files):
+    taken = set()
+    for file_name in files:
+        with open(file_name, encoding="utf-8") as fp:
+            taken.update(m.group(2) for m in _NANOID.finditer(fp.read()))
+    return taken
+
+
+def byNanoid(entity):
+    """
+    The entity matched on its nanoid and _commit, if it has a nanoid; the
+    _commit keeps a rollback off another model version's node.
+    """
+    if "nanoid" not in entity.props:
+        return entity
+    return Entity(entity.var, entity.label, {k: entity.props[k] for k in ("nanoid", "_commit") if k in entity.props})
+
+
+class NanoidWriter:
+    """
+    Rewrites statements of a changelog. Nodes are remembered by the
+    property map they were created with, so a later statement that matches
+    them on the same map can be keyed on the nanoid instead.
+    """
+    def __init__(self, taken=None):
+        self.taken = taken if taken is not None else set()
+        self.created = {}
+        self.merged = {}
+        self.stats = {"created": 0, "merged": 0, "rollbacks": 0}
+
+    def nanoidOf(self, entity):
+        if "nanoid" in entity.props:
+            return entity
+        nanoid = self.created.get(entity.key())
+        if nanoid is None:
+            return entity
+        return Entity(entity.var, entity.label, dict(entity.props, nanoid=nanoid))
+
+    def statement(self, text):
+        stmt = parseStatement(text)
+        if stmt is None or stmt.node is None or stmt.node.label not in NANOID_LABELS:
+            return text
+        node = stmt.node
+        if stmt.kind == "create_node":
+            if "nanoid" in node.props:
+                self.taken.add(node.props["nanoid"])
+                return text
+            nanoid = deterministicNanoid(node.label, node.props, self.taken)
+            self.created[node.key()] = nanoid
+            self.stats["created"] += 1
+            return formatStatement(Statement("create_node", node=Entity(
+                node.var, node.label, dict(node.props, nanoid=nanoid))))
+        if stmt.kind == "merge_node" and "nanoid" not in node.props and "nanoid" not in stmt.on_create:
+            # the same entity merged twice gets the same nanoid
+            identity = node.key()
+            if identity not in self.merged:
+                self.merged[identity] = deterministicNanoid(node.label, node.props, self.taken)
+            self.stats["merged"] += 1
+            return formatStatement(Statement("merge_node", node=node,
+                                             on_create=dict(stmt.on_create, nanoid=self.merged[identity])))
+        return text
+
+    def rollback(self, text):
+        stmt = parseStatement(text)
+        if stmt is None:
+            return text
+        if stmt.kind == "delete_node":
+            keyed = Statement("delete_node", node=byNanoid(self.nanoidOf(stmt.node)))
+        elif stmt.kind == "delete_edge":
+            keyed = Statement("delete_edge", src=byNanoid(self.nanoidOf(stmt.src)),
+                              dst=byNanoid(self.nanoidOf(stmt.dst)), rel_type=stmt.rel_type)
+        else:
+            return text
+        new = formatStatement(keyed)
+        if new != formatStatement(stmt):
+            self.stats["rollbacks"] += 1
+            return new
+        return text
+
+    def changesets(self, changesets):
+        for cs in changesets:
+            cypher = [self.statement(s) for s in cs.cypher]
+            rollback = [self.rollback(s) for s in cs.rollback]
+            yield Changeset(cs.id, cs.author, cypher, rollback, cs.attrs, cs.changelog)
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    if not (args.output or args.in_place):
+        raise SystemExit("one of --output or --in-place is required")
+    existing = {f for pattern in args.existing or [CHANGELOGS] for f in glob.glob(pattern, recursive=True)}
+    writer = NanoidWriter(usedNanoids(existing | {args.changelog}))
+    converted = list(writer.changesets(iterChangesets(args.changelog)))
+    writeChangelog(args.output or args.changelog, converted, readChangelogId(args.changelog))
+    print("{}: nanoids added to {} CREATE and {} MERGE statements, {} rollbacks keyed on nanoid and _commit".format(
+        args.changelog, writer.stats["created"], writer.stats["merged"], writer.stats["rollbacks"]))
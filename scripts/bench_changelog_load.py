@@ -0,0 +1,120 @@
+"""
+Time loading changelogs into a local Neo4j, e.g. an original model changelog
+against its compact_changelog.py output.
+
+Each changelog is loaded into an emptied database --repeat times with the
+same per-changeSet transaction and history bookkeeping Liquibase uses.
+After each load the graph is summarized (node counts per label,
+relationship counts per type) so runs of equivalent changelogs can be
+checked against each other.
+
+  docker compose -f scripts/docker-compose.yml up -d
+  python scripts/bench_changelog_load.py original.xml compacted.xml --setup changelogs/mdb_setup_changelog.xml
+
+This empties the target database between runs. It connects to --uri or the
+local container, never to NEO4J_MDB_URI; a --uri on another host also
+needs --i-know-this-wipes <host>.
+"""
+import json
+import argparse
+import statistics
+
+from changelog import iterChangesets
+from neo4j_db import addScratchArgs, applyChangelog, applySetup, clearDatabase, getDriver, scratchUri
+
+GRAPH_SUMMARY = """
+CALL {
+  MATCH (n) WHERE none(l IN labels(n) WHERE l STARTS WITH '__Liquibase')
+  UNWIND labels(n) AS label
+  RETURN 'node:' + label AS key, count(*) AS n
+  UNION ALL
+  MATCH (a)-[r]->(b) WHERE none(l IN labels(a) WHERE l STARTS WITH '__Liquibase')
+  RETURN 'rel:' + type(r) AS key, count(*) AS n
+}
+RETURN key, n ORDER BY key
+"""
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="benchmark changelog load times against a local Neo4j")
+    parser.add_argument("changelogs", nargs="+", help="changelogs to load, each into an empty database")
+    parser.add_argument("--setup", help="changelog applied once before benchmarking (e.g. mdb_setup_changelog.xml)")
+    parser.add_argument("--prereq", action="append", default=[],
+                        help="changelog applied before every run and not timed (repeatable)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    addScratchArgs(parser)
+    return parser.parse_args()
+
+
+def graphSummary(session):
+    return {r["key"]: r["n"] for r in session.run(GRAPH_SUMMARY)}
+
+
+def loadOnce(session, file_name, prereqs):
+    clearDatabase(session)
+    for prereq in prereqs:
+        applyChangelog(session, iterChangesets(prereq))
+    results = applyChangelog(session, iterChangesets(file_name))
+    seconds = sum(r[1] for r in results)
+    return {
+        "changesets": len(results),
+        "seconds": seconds,
+        "changesets_per_second": len(results) / seconds if seconds else None,
+        "slowest_changeset": max(((r[0].id, r[1]) for r in results), key=lambda t: t[1], default=None),
+    }, graphSummary(session)
+
+
+def runBenchmark(driver, changelogs, repeat=3, setup=None, prereqs=()):
+    report = {"runs": {}, "equivalent": None}
+    with driver.session() as session:
+        if setup:
+            clearDatabase(session)
+            applySetup(session, iterChangesets(setup))
+        summaries = []
+        for file_name in changelogs:
+            runs = []
+            for _ in range(repeat):
+                run, summary = loadOnce(session, file_name, prereqs)
+                runs.append(run)
+            times = [r["seconds"] for r in runs]
+            report["runs"][file_name] = {
+                "changesets": runs[0]["changesets"],
+                "seconds_min": min(times),
+                "seconds_median": statistics.median(times),
+                "changesets_per_second": runs[0]["changesets"] / statistics.median(times) if min(times) else None,
+                "slowest_changeset": runs[-1]["slowest_changeset"],
+                "graph": summary,
+            }
+            summaries.append(summary)
+        clearDatabase(session)
+    report["equivalent"] = all(s == summaries[0] for s in summaries)
+    return report
+
+
+def printReport(report):
+    base = None
+    print("{:60} {:>10} {:>10} {:>10} {:>8}".format("changelog", "changeSets", "median s", "cs/s", "speedup"))
+    for file_name, run in report["runs"].items():
+        base = base or run["seconds_median"]
+        print("{:60} {:>10} {:>10.2f} {:>10.1f} {:>7.1f}x".format(
+            file_name[-60:], run["changesets"], run["seconds_median"],
+            run["changesets_per_second"] or 0, base / run["seconds_median"] if run["seconds_median"] else 0))
+    print("resulting graphs equivalent: {}".format(report["equivalent"]))
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    try:
+        uri = scratchUri(args.uri, args.wipe_host)
+    except ValueError as e:
+        raise SystemExit(e)
+    driver = getDriver(uri, args.user, args.password)
+    try:
+        report = runBenchmark(driver, args.changelogs, args.repeat, args.setup, args.prereq)
+    finally:
+        driver.close()
+    printReport(report)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
@@ -0,0 +1,231 @@
+"""
+End-to-end benchmark: changelog load times and STS query latency against
+the local Neo4j of docker-compose.yml (same image and APOC settings as the
+deployed service), compared with a stored baseline.
+
+1. the neo4j service is started and emptied;
+2. the changelogs under changelog_dir are applied in load order
+   (mdb_setup_changelog.xml, the index changelogs and the model changelogs;
+   --all adds the mapping and terms changelogs), timing each changelog and
+   counting changeSets per second; with --repeat the whole load is repeated
+   on an emptied database and median times are reported;
+3. the sts service is started on the loaded graph and driven with the
+   fixed query mix of sts_locustfile.py (--skip-sts leaves this out).
+
+Results are written as JSON (--output). Given a baseline from an earlier
+run (--baseline, e.g. one saved with --save-baseline on the same machine),
+every metric is compared with it and the run fails if any is worse by more
+than --tolerance (default 20%).
+
+  python scripts/benchmark_suite.py changelogs --output bench.json --baseline bench-baseline.json
+  python scripts/benchmark_suite.py changelogs --save-baseline bench-baseline.json
+
+This empties the target database. It connects to the compose neo4j at
+bolt://localhost:7687, never to NEO4J_MDB_URI; with --no-compose, --uri
+names an already running database, and one on another host also needs
+--i-know-this-wipes <host>.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+from changelog import LOAD_ORDER, changelogFiles, iterChangesets
+from sts_loadtest import COMPOSE_FILE, runLocust, startSts, waitForSts
+
+MODEL_LOAD_ORDER = [p for p in LOAD_ORDER if not p.startswith(("mappings/", "terms/"))]
+SCHEMA_CHANGELOGS = ("mdb_setup_changelog.xml", "mdb_index_changelog_")
+
+# (metric path, whether larger values are better)
+METRICS = [
+    (("load", "seconds"), False),
+    (("load", "changesets_per_second"), True),
+    (("sts", "rps"), True),
+    (("sts", "p50_ms"), False),
+    (("sts", "p95_ms"), False),
+    (("sts", "p99_ms"), False),
+    (("sts", "failures"), False),
+]
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="benchmark changelog loads and STS against local Neo4j")
+    parser.add_argument("changelog_dir", help="directory holding the changelogs (e.g. changelogs)")
+    parser.add_argument("--all", action="store_true", help="also load the mapping and terms changelogs")
+    parser.add_argument("--repeat", type=int, default=1, help="full loads to take the median of (default 1)")
+    parser.add_argument("--skip-sts", action="store_true", help="only benchmark the changelog loads")
+    parser.add_argument("--no-compose", action="store_true", help="use an already running Neo4j (and STS)")
+    parser.add_argument("--profile", default="gthread", help="STS worker profile (default gthread)")
+    parser.add_argument("--cpus", default="1", help="CPUs for the STS container (default 1)")
+    parser.add_argument("--users", type=int, default=50, help="concurrent locust users (default 50)")
+    parser.add_argument("--duration", default="60s", help="locust run time (default 60s)")
+    parser.add_argument("--host", default="http://localhost:5000", help="STS URL (default http://localhost:5000)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="results JSON to compare with")
+    parser.add_argument("--save-baseline", metavar="FILE", help="write the results as a new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative change counted as a regression (default 0.2)")
+    parser.add_argument("--uri", help="with --no-compose, the database to empty and load (default bolt://localhost:7687)")
+    parser.add_argument("--i-know-this-wipes", metavar="HOST", dest="wipe_host",
+                        help="allow a --uri on this host other than localhost; everything in it is deleted")
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    return parser.parse_args()
+
+
+### Running ###################################################################
+
+def startNeo4j():
+    subprocess.run(["docker", "compose", "-f", COMPOSE_FILE, "up", "-d", "neo4j"], check=True)
+
+
+def waitForNeo4j(driver, timeout=180):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            driver.verify_connectivity()
+            return
+        except Exception:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Neo4j not ready after {}s".format(timeout))
+            time.sleep(2)
+
+
+def neo4jVersion(session):
+    record = session.run("CALL dbms.components() YIELD versions, edition RETURN versions[0] AS v, edition").single()
+    return "{} {}".format(record["v"], record["edition"])
+
+
+def loadChangelogs(session, files, changelog_dir):
+    """{changelog: {changesets, seconds}} for one load of files into an emptied database."""
+    from neo4j_db import ChangelogHistory, applyChangelog, applySetup, clearDatabase
+    clearDatabase(session)
+    history = ChangelogHistory(session)
+    timings = {}
+    for file_name in files:
+        path = os.path.relpath(file_name, changelog_dir)
+        start = time.perf_counter()
+        if os.path.basename(file_name).startswith(SCHEMA_CHANGELOGS):
+            changesets = list(iterChangesets(file_name))
+            applySetup(session, changesets)
+            count = len(changesets)
+        else:
+            count = len(applyChangelog(session, iterChangesets(file_name), path, history=history))
+        timings[path] = {"changesets": count, "seconds": time.perf_counter() - start}
+    return timings
+
+
+def summarizeLoads(loads):
+    """Median per-changelog and total times over repeated loads."""
+    changelogs = {}
+    for path in loads[0]:
+        seconds = statistics.median(load[path]["seconds"] for load in loads)
+        changesets = loads[0][path]["changesets"]
+        changelogs[path] = {"changesets": changesets, "seconds": round(seconds, 3),
+                            "changesets_per_second": round(changesets / seconds, 1) if seconds else None}
+    total = statistics.median(sum(t["seconds"] for t in load.values()) for load in loads)
+    changesets = sum(t["changesets"] for t in changelogs.values())
+    return changelogs, {"changesets": changesets, "seconds": round(total, 3),
+                        "changesets_per_second": round(changesets / total, 1) if total else None}
+
+
+### Comparing #################################################################
+
+def _metric(results, path):
+    for key in path:
+        results = (results or {}).get(key)
+    return results
+
+
+def compareResults(results, baseline, tolerance=0.2):
+    """
+    [(metric, baseline value, current value, relative change, regressed)]
+    for the METRICS present in both, plus each changelog's load time.
+    """
+    metrics = list(METRICS) + [(("changelogs", path, "seconds"), False) for path in results.get("changelogs", {})]
+    rows = []
+    for path, larger_is_better in metrics:
+        old, new = _metric(baseline, path), _metric(results, path)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else (0.0 if new == old else float("inf"))
+        worse = -change if larger_is_better else change
+        rows.append(("/".join(path), old, new, change, worse > tolerance))
+    return rows
+
+
+def printReport(results, comparison=None):
+    print("{:60} {:>10} {:>10} {:>10}".format("changelog", "changeSets", "seconds", "cs/s"))
+    for path, run in list(results["changelogs"].items()) + [("total", results["load"])]:
+        print("{:60} {:>10} {:>10.2f} {:>10}".format(path[-60:], run["changesets"], run["seconds"],
+                                                    run["changesets_per_second"] or "-"))
+    if results.get("sts"):
+        sts = results["sts"]
+        print("STS {}: {} req/s, p50 {:.0f} ms, p95 {:.0f} ms, p99 {:.0f} ms, {} failures".format(
+            results["environment"]["sts_profile"], sts["rps"], sts["p50_ms"], sts["p95_ms"], sts["p99_ms"],
+            sts["failures"]))
+    if comparison:
+        print("\n{:60} {:>10} {:>10} {:>8}".format("metric", "baseline", "current", "change"))
+        for metric, old, new, change, regressed in comparison:
+            print("{:60} {:>10} {:>10} {:>+7.0%}{}".format(metric[-60:], old, new, change,
+                                                           "  REGRESSION" if regressed else ""))
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    from neo4j_db import getDriver, scratchUri
+    if args.uri and not args.no_compose:
+        raise SystemExit("--uri needs --no-compose; the compose neo4j is bolt://localhost:7687")
+    try:
+        uri = scratchUri(args.uri, args.wipe_host)
+    except ValueError as e:
+        raise SystemExit(e)
+    if not args.no_compose:
+        startNeo4j()
+    patterns = LOAD_ORDER if args.all else MODEL_LOAD_ORDER
+    files = changelogFiles(args.changelog_dir, patterns)
+    driver = getDriver(uri, args.user, args.password)
+    try:
+        waitForNeo4j(driver)
+        with driver.session() as session:
+            version = neo4jVersion(session)
+            loads = [loadChangelogs(session, files, args.changelog_dir) for _ in range(args.repeat)]
+        changelogs, load = summarizeLoads(loads)
+        results = {
+            "date": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "environment": {"neo4j": version, "host": platform.node(), "cpus": os.cpu_count(),
+                            "repeat": args.repeat, "sts_profile": None if args.skip_sts else args.profile,
+                            "sts_cpus": args.cpus, "users": args.users, "duration": args.duration},
+            "changelogs": changelogs,
+            "load": load,
+            "sts": None,
+        }
+        if not args.skip_sts:
+            if not args.no_compose:
+                startSts(args.profile, args.cpus)
+            waitForSts(args.host)
+            with tempfile.TemporaryDirectory() as tmp:
+                results["sts"] = runLocust(args.host, args.users, 10, args.duration, os.path.join(tmp, "sts"))
+    finally:
+        driver.close()
+
+    comparison = None
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        if baseline.get("environment", {}).get("host") != results["environment"]["host"]:
+            print("warning: baseline was recorded on {}".format(baseline.get("environment", {}).get("host")))
+        comparison = compareResults(results, baseline, args.tolerance)
+    printReport(results, comparison)
+    for file_name in (args.output, args.save_baseline):
+        if file_name:
+            with open(file_name, "w") as fp:
+                json.dump(results, fp, indent=2)
+    if comparison and any(row[-1] for row in comparison):
+        sys.exit(1)
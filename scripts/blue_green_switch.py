@@ -0,0 +1,207 @@
+"""
+Switch the MDB NLB from the live Neo4j color to the standby one, after a
+verification gate (the blue/green services of devops/awscdk, [neo4j]
+blue_green = true).
+
+The NLB's bolt listener forwards to the live color's target group and the
+standby listener (7688 by default) to the other one. Load the standby
+store through the standby port while the live one serves, e.g.
+
+  liquibase --url jdbc:neo4j:bolt://<nlb dns>:7688 --changelog-file ... update
+
+then run this script. It checks that
+
+1. every target of the standby target group is healthy;
+2. the standby graph, read through the standby listener, has a Liquibase
+   history at least as long as the live one (--allow-older skips this;
+   --expect-version requires that exact MDB version, as STS computes it);
+3. verify_load.py, run against the standby listener, finds the standby
+   graph to match the changelogs it was loaded from (--changelogs, default
+   the changelogs directory of this repository; --skip-verify-load skips
+   it, e.g. for a switch back to an older store);
+
+optionally warms the standby page cache (--warmup, apoc.warmup.run), and
+swaps the two listeners' target groups. The NLB only sends new connections
+to the new color, and STS keeps its pooled bolt connections open
+(keep_alive, and the driver's default connection lifetime of an hour), so
+the script then forces a new deployment of the STS service
+(<prefix>-sts-api in <prefix>-ecs) and waits for it to become stable.
+Until the new tasks have replaced the old ones, requests to the old tasks
+still read, and cache, the old color. The old color stays up behind the
+standby port for a switch back. The CDK stack reads the live color
+from the bolt listener when it synthesizes, so the next cdk deploy keeps
+the switch ([neo4j] live only picks the color of the first deploy).
+
+  python scripts/blue_green_switch.py mdb-prod --dry-run
+  python scripts/blue_green_switch.py mdb-prod --warmup
+
+Needs boto3 and AWS credentials for the account, and NEO4J_MDB_USER /
+NEO4J_MDB_PASS (or --user / --password) for the bolt checks.
+"""
+import os
+import sys
+import argparse
+
+from export_snapshots import VERSION_QUERY
+
+COLORS = ("blue", "green")
+STS_CLUSTER = "{}-ecs"
+STS_SERVICE = "{}-sts-api"
+CHANGELOGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "changelogs")
+WARMUP = "CALL apoc.warmup.run(true, true, true)"
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="verify the standby Neo4j color and switch the NLB to it")
+    parser.add_argument("prefix", help="<resource_prefix>-<tier> of the stack, e.g. mdb-prod")
+    parser.add_argument("--bolt-port", type=int, default=7687, help="live listener port (default 7687)")
+    parser.add_argument("--standby-port", type=int, default=7688, help="standby listener port (default 7688)")
+    parser.add_argument("--expect-version", help="MDB version (<changesets>-<last executed>) the standby must have")
+    parser.add_argument("--allow-older", action="store_true",
+                        help="switch even if the standby history is shorter than the live one (a switch back)")
+    parser.add_argument("--changelogs", action="append",
+                        help="changelog directories or files the standby was loaded from, for verify_load.py "
+                             "(repeatable; default: the changelogs directory of this repository)")
+    parser.add_argument("--skip-verify-load", action="store_true",
+                        help="don't reconcile the standby graph with the changelogs")
+    parser.add_argument("--warmup", action="store_true", help="warm the standby page cache before switching")
+    parser.add_argument("--dry-run", action="store_true", help="check and print the switch without making it")
+    parser.add_argument("--region")
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    return parser.parse_args()
+
+
+### Reading the NLB ###########################################################
+
+def colorTargetGroups(target_groups, prefix):
+    """{color: target group ARN} from describe_target_groups output."""
+    groups = {}
+    for tg in target_groups:
+        for color in COLORS:
+            if tg["TargetGroupName"] == "{}-{}".format(prefix, color)[-32:]:
+                groups[color] = tg["TargetGroupArn"]
+    return groups
+
+
+def listenerColors(listeners, groups, ports):
+    """{port: (listener ARN, color)} for the listeners on ports."""
+    colors = {arn: color for color, arn in groups.items()}
+    out = {}
+    for listener in listeners:
+        if listener["Port"] not in ports:
+            continue
+        forward = [a for a in listener["DefaultActions"] if a["Type"] == "forward"]
+        if forward:
+            out[listener["Port"]] = (listener["ListenerArn"], colors.get(forward[0]["TargetGroupArn"]))
+    return out
+
+
+def unhealthyTargets(descriptions):
+    """Problems with a target group's targets, from describe_target_health output."""
+    if not descriptions:
+        return ["no registered targets"]
+    return ["{} is {} ({})".format(d["Target"]["Id"], d["TargetHealth"]["State"],
+                                   d["TargetHealth"].get("Reason", "-"))
+            for d in descriptions if d["TargetHealth"]["State"] != "healthy"]
+
+
+### Gate ######################################################################
+
+def graphVersion(session):
+    """(changeSets executed, MDB version string as STS computes it)"""
+    record = session.run(VERSION_QUERY).single()
+    return record["changesets"], "{}-{}".format(record["changesets"], record["last_executed"])
+
+
+def versionProblems(live, standby, expect=None, allow_older=False):
+    """Reasons not to switch, given the (changesets, version) of each side."""
+    problems = []
+    if standby[0] == 0:
+        problems.append("the standby graph has no Liquibase history")
+    if expect is not None and standby[1] != expect:
+        problems.append("the standby version is {}, not {}".format(standby[1], expect))
+    if not allow_older and live is not None and standby[0] < live[0]:
+        problems.append("the standby history ({} changeSets) is shorter than the live one ({})".format(
+            standby[0], live[0]))
+    return problems
+
+
+def loadProblems(report):
+    """Reasons not to switch, from a verify_load.verifyLoad report of the standby."""
+    if report["ok"]:
+        return []
+    problems = []
+    if report["missing"] or report["mismatched"] or report["extra"]:
+        problems.append("verify_load: {} entities missing, {} mismatched, {} extra".format(
+            report["missing"], report["mismatched"], report["extra"]))
+    for kind, rows in report["counts"].items():
+        if rows:
+            problems.append("verify_load: {} counts differ from the changelogs in {} groups".format(kind, len(rows)))
+    return problems
+
+
+def verifyStandby(uri, user, password, paths):
+    from neo4j_db import getDriver
+    from verify_load import expandPaths, printReport, verifyLoad
+    with getDriver(uri, user, password) as driver, driver.session() as session:
+        report = verifyLoad(session, expandPaths(paths))
+    printReport(report)
+    return report
+
+
+def boltVersion(uri, user, password, warmup=False):
+    from neo4j_db import getDriver
+    with getDriver(uri, user, password) as driver, driver.session() as session:
+        version = graphVersion(session)
+        if warmup:
+            session.run(WARMUP).consume()
+        return version
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    import boto3
+    elb = boto3.client("elbv2", region_name=args.region)
+    nlb = elb.describe_load_balancers(Names=["{}-nlb".format(args.prefix)])["LoadBalancers"][0]
+    groups = colorTargetGroups(elb.describe_target_groups(LoadBalancerArn=nlb["LoadBalancerArn"])["TargetGroups"],
+                               args.prefix)
+    if set(groups) != set(COLORS):
+        raise SystemExit("no blue/green target groups on {}; is [neo4j] blue_green set?".format(nlb["LoadBalancerName"]))
+    listeners = listenerColors(elb.describe_listeners(LoadBalancerArn=nlb["LoadBalancerArn"])["Listeners"],
+                               groups, (args.bolt_port, args.standby_port))
+    (live_arn, live), (standby_arn, standby) = listeners[args.bolt_port], listeners[args.standby_port]
+    print("live: {} on {}, standby: {} on {}".format(live, args.bolt_port, standby, args.standby_port))
+
+    problems = ["{} target {}".format(standby, p) for p in
+                unhealthyTargets(elb.describe_target_health(TargetGroupArn=groups[standby])["TargetHealthDescriptions"])]
+    if not problems:
+        dns = nlb["DNSName"]
+        live_version = boltVersion("bolt://{}:{}".format(dns, args.bolt_port), args.user, args.password)
+        standby_version = boltVersion("bolt://{}:{}".format(dns, args.standby_port), args.user, args.password,
+                                      warmup=args.warmup and not args.dry_run)
+        print("versions: live {}, standby {}".format(live_version[1], standby_version[1]))
+        problems = versionProblems(live_version, standby_version, args.expect_version, args.allow_older)
+    if not problems and not args.skip_verify_load:
+        report = verifyStandby("bolt://{}:{}".format(dns, args.standby_port), args.user, args.password,
+                               args.changelogs or [CHANGELOGS])
+        problems = loadProblems(report)
+    if problems:
+        print("\n".join("not switching: " + p for p in problems), file=sys.stderr)
+        sys.exit(1)
+
+    if args.dry_run:
+        print("would switch port {} to {} and port {} to {}".format(args.bolt_port, standby, args.standby_port, live))
+        print("would redeploy {}".format(STS_SERVICE.format(args.prefix)))
+        sys.exit(0)
+    elb.modify_listener(ListenerArn=live_arn, DefaultActions=[{"Type": "forward", "TargetGroupArn": groups[standby]}])
+    elb.modify_listener(ListenerArn=standby_arn, DefaultActions=[{"Type": "forward", "TargetGroupArn": groups[live]}])
+    print("switched: {} is live, {} is standby".format(standby, live))
+
+    # STS tasks hold bolt connections to the old color; replace them
+    ecs = boto3.client("ecs", region_name=args.region)
+    cluster, service = STS_CLUSTER.format(args.prefix), STS_SERVICE.format(args.prefix)
+    ecs.update_service(cluster=cluster, service=service, forceNewDeployment=True)
+    print("redeploying {}; its old tasks serve {} until they are replaced".format(service, live))
+    ecs.get_waiter("services_stable").wait(cluster=cluster, services=[service])
+    print("{} is stable: every STS task reads {}".format(service, standby))
@@ -0,0 +1,76 @@
+"""
+Compare bolt round-trip latency to Neo4j over several URIs, e.g. the NLB
+DNS name and the Cloud Map / Service Connect name STS uses (see
+devops/awscdk/README.md, "Neo4j discovery").
+
+Each URI gets its own driver; after --warmup untimed queries, --queries
+`RETURN 1` round trips are timed one after another on one session, and
+p50/p95/p99 and the connect time are reported per URI. Run it where STS
+runs to see what its tasks see; it needs only the neo4j driver the STS
+image already has, so copy it into an STS task (aws ecs execute-command
+gives a shell there) and run
+
+  python bolt_latency.py bolt://neo4j.mdb-dev.local:7687 bolt://<nlb dns>:7687
+
+User and password default to NEO4J_MDB_USER / NEO4J_MDB_PASS, as STS reads them.
+"""
+import os
+import json
+import time
+import argparse
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="compare bolt round trips over several URIs")
+    parser.add_argument("uris", nargs="+", help="bolt URIs to compare")
+    parser.add_argument("--queries", type=int, default=1000, help="timed round trips per URI (default 1000)")
+    parser.add_argument("--warmup", type=int, default=50, help="untimed round trips first (default 50)")
+    parser.add_argument("--user", default=os.environ.get("NEO4J_MDB_USER") or "neo4j")
+    parser.add_argument("--password", default=os.environ.get("NEO4J_MDB_PASS") or "neo4j1")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    return parser.parse_args()
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile p (0-100) of samples."""
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, -(-len(ordered) * p // 100) - 1))]
+
+
+def summarize(samples_ms, connect_ms):
+    return {"queries": len(samples_ms), "connect_ms": round(connect_ms, 2),
+            "p50_ms": round(percentile(samples_ms, 50), 3), "p95_ms": round(percentile(samples_ms, 95), 3),
+            "p99_ms": round(percentile(samples_ms, 99), 3), "max_ms": round(max(samples_ms), 3)}
+
+
+def measure(uri, user, password, queries, warmup):
+    from neo4j import GraphDatabase
+    start = time.perf_counter()
+    driver = GraphDatabase.driver(uri, auth=(user, password))
+    try:
+        driver.verify_connectivity()
+        connect_ms = 1000 * (time.perf_counter() - start)
+        samples = []
+        with driver.session() as session:
+            for i in range(warmup + queries):
+                start = time.perf_counter()
+                session.run("RETURN 1").consume()
+                if i >= warmup:
+                    samples.append(1000 * (time.perf_counter() - start))
+    finally:
+        driver.close()
+    return summarize(samples, connect_ms)
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    results = {uri: measure(uri, args.user, args.password, args.queries, args.warmup) for uri in args.uris}
+    print("{:50} {:>10} {:>9} {:>9} {:>9} {:>9}".format("uri", "connect ms", "p50 ms", "p95 ms", "p99 ms", "max ms"))
+    for uri, r in results.items():
+        print("{:50} {:>10} {:>9} {:>9} {:>9} {:>9}".format(
+            uri[-50:], r["connect_ms"], r["p50_ms"], r["p95_ms"], r["p99_ms"], r["max_ms"]))
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2)
@@ -0,0 +1,246 @@
+"""
+Build a fresh MDB store with neo4j-admin import instead of replaying every
+changelog through Liquibase.
+
+All changelogs under a changelog directory are streamed in load order (see
+changelog.LOAD_ORDER) and their CREATE/MERGE statements are resolved into an
+in-memory graph with the same semantics Cypher would apply. The graph is
+written as per-label node CSVs and per-type relationship CSVs, together with
+__LiquibaseChangeSet history nodes for every changeSet that was imported,
+so a later `liquibase update` only runs what was not imported.
+
+Not everything can be resolved offline:
+- schema changeSets (index/constraint creation, the APOC nanoid trigger)
+  are skipped and left to Liquibase, which creates them on the imported data;
+- the first data changeSet that is not a recognized statement shape (e.g. the
+  mapping changelogs) stops the import, and it and every later changeSet are
+  left to Liquibase so load order is preserved.
+Imported nodes that lack a nanoid get the deterministic one from
+nanoid.deterministicNanoid, as add_nanoids.py would have written it.
+
+  python scripts/bulk_import.py changelogs /tmp/mdb-import --run --neo4j-admin /var/lib/neo4j/bin/neo4j-admin
+"""
+import os
+import argparse
+import subprocess
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from changelog import changelogFiles, iterChangesets
+from cypher import isSchemaStatement, parseStatement
+from nanoid import NANOID_LABELS, deterministicNanoid
+
+HISTORY_LABELS = ("__LiquibaseChangeLog", "__LiquibaseChangeSet")
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="build MDB import CSVs from changelogs and run neo4j-admin import")
+    parser.add_argument("changelog_dir", help="directory holding the changelogs (e.g. changelogs)")
+    parser.add_argument("output_dir", help="directory for the generated CSVs and import command")
+    parser.add_argument("--search-path", default=".",
+                        help="Liquibase search path; history records changelog paths relative to it (default: .)")
+    parser.add_argument("--database", default="neo4j")
+    parser.add_argument("--neo4j-version", type=int, choices=(4, 5), default=4,
+                        help="neo4j-admin command syntax (default 4, matching the deployed 4.4 image)")
+    parser.add_argument("--neo4j-admin", default="neo4j-admin", help="path to neo4j-admin")
+    parser.add_argument("--run", action="store_true", help="run neo4j-admin import after writing the CSVs")
+    return parser.parse_args()
+
+
+class Graph:
+    def __init__(self):
+        self.labels = []
+        self.props = []
+        self.rels = {}
+        self.index = defaultdict(list)
+        self.nanoids = set()
+
+    def create(self, label, props):
+        node_id = len(self.labels)
+        self.labels.append(label)
+        self.props.append(dict(props))
+        for key, value in props.items():
+            self.index[(label, key, _hashable(value))].append(node_id)
+        if "nanoid" in props:
+            self.nanoids.add(props["nanoid"])
+        return node_id
+
+    def find(self, entity):
+        """Ids of nodes a MATCH (x:label {props}) would return."""
+        if not entity.props:
+            return [i for i, label in enumerate(self.labels) if label == entity.label]
+        key, value = next(iter(entity.props.items()))
+        return [i for i in self.index.get((entity.label, key, _hashable(value)), [])
+                if all(self.props[i].get(k) == v for k, v in entity.props.items())]
+
+    def apply(self, stmt):
+        if stmt.kind == "create_node":
+            self.create(stmt.node.label, stmt.node.props)
+        elif stmt.kind == "merge_node":
+            if not self.find(stmt.node):
+                self.create(stmt.node.label, dict(stmt.node.props, **stmt.on_create))
+        elif stmt.kind == "merge_edge":
+            for src in self.find(stmt.src):
+                for dst in self.find(stmt.dst):
+                    self.rels.setdefault((src, stmt.rel_type, dst), {})
+        else:
+            raise ValueError("cannot apply {}".format(stmt.kind))
+
+    def addNanoids(self):
+        """Deterministic nanoids for the nodes the trigger would have given one."""
+        added = 0
+        for node_id, label in enumerate(self.labels):
+            if label in NANOID_LABELS and "nanoid" not in self.props[node_id]:
+                self.props[node_id]["nanoid"] = deterministicNanoid(label, self.props[node_id], self.nanoids)
+                added += 1
+        return added
+
+
+def _hashable(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+def classify(changeset):
+    """'import', 'schema' or 'defer' for one changeSet."""
+    if changeset.cypher and all(isSchemaStatement(s) for s in changeset.cypher):
+        return "schema"
+    if changeset.run_always or not changeset.cypher:
+        return "defer"
+    stmts = [parseStatement(s) for s in changeset.cypher]
+    if all(s is not None and s.kind in ("create_node", "merge_node", "merge_edge") for s in stmts):
+        return "import"
+    return "defer"
+
+
+def resolveChangelogs(files, graph, search_path="."):
+    """
+    Apply importable changeSets to graph. Returns (imported, deferred) where
+    imported is a list of (changelog path, changeset) for history records and
+    deferred lists (changelog path, changeSet id) left to Liquibase.
+    """
+    imported, deferred = [], []
+    stopped = False
+    for file_name in files:
+        path = os.path.relpath(file_name, search_path)
+        for changeset in iterChangesets(file_name):
+            kind = "defer" if stopped else classify(changeset)
+            if kind == "import":
+                for stmt in changeset.cypher:
+                    graph.apply(parseStatement(stmt))
+                imported.append((path, changeset))
+                continue
+            if kind == "defer":
+                stopped = True
+            deferred.append((path, changeset.id))
+    return imported, deferred
+
+
+### CSV output ################################################################
+
+def _csvValue(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, list):
+        return '"{}"'.format(";".join(str(v).replace('"', '""') for v in value))
+    return '"{}"'.format(str(value).replace('"', '""'))
+
+
+def _columnType(values):
+    kinds = {type(v) for v in values if v is not None}
+    if kinds == {bool}:
+        return "boolean"
+    if kinds == {int}:
+        return "long"
+    if kinds and kinds <= {int, float}:
+        return "double"
+    if kinds == {list}:
+        return "string[]"
+    return "string"
+
+
+def _writeCsv(file_name, header, rows):
+    with open(file_name, "w", encoding="utf-8", newline="") as fp:
+        fp.write(",".join(header) + "\n")
+        for row in rows:
+            fp.write(",".join(row) + "\n")
+
+
+def writeImportFiles(graph, imported, output_dir):
+    """Write node/relationship CSVs; returns (node files, relationship files)."""
+    os.makedirs(output_dir, exist_ok=True)
+    node_files, rel_files = [], []
+
+    by_label = defaultdict(list)
+    for node_id, label in enumerate(graph.labels):
+        by_label[label].append(node_id)
+    for label, ids in sorted(by_label.items()):
+        keys = sorted({k for i in ids for k in graph.props[i]})
+        header = [":ID"] + ["{}:{}".format(k, _columnType([graph.props[i].get(k) for i in ids])) for k in keys] + [":LABEL"]
+        file_name = os.path.join(output_dir, "nodes_{}.csv".format(label))
+        _writeCsv(file_name, header, (
+            ["n{}".format(i)] + [_csvValue(graph.props[i].get(k)) for k in keys] + [label] for i in ids))
+        node_files.append(file_name)
+
+    by_type = defaultdict(list)
+    for (src, rel_type, dst), props in graph.rels.items():
+        by_type[rel_type].append((src, dst, props))
+    for rel_type, rels in sorted(by_type.items()):
+        keys = sorted({k for _, _, p in rels for k in p})
+        header = [":START_ID", ":END_ID"] + ["{}:{}".format(k, _columnType([p.get(k) for _, _, p in rels])) for k in keys] + [":TYPE"]
+        file_name = os.path.join(output_dir, "rels_{}.csv".format(rel_type))
+        _writeCsv(file_name, header, (
+            ["n{}".format(s), "n{}".format(d)] + [_csvValue(p.get(k)) for k in keys] + [rel_type] for s, d, p in rels))
+        rel_files.append(file_name)
+
+    # Liquibase history for everything imported, so `update` skips it.
+    # checkSum is left empty; Liquibase fills in null checksums on its next run.
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    deployment_id = "import" + now[:10].replace("-", "")
+    file_name = os.path.join(output_dir, "nodes_liquibase.csv")
+    _writeCsv(file_name,
+        [":ID", "id:string", "author:string", "changeLog:string", "execType:string", "description:string",
+         "deploymentId:string", "liquibaseVersion:string", "dateCreated:datetime", ":LABEL"],
+        [["h0", "", "", "", "", "", "", "", now, HISTORY_LABELS[0]]] + [
+            ["h{}".format(n), _csvValue(cs.id), _csvValue(cs.author), _csvValue(path), '"EXECUTED"', '"cypher"',
+             _csvValue(deployment_id), '"bento-mdb-import"', "", HISTORY_LABELS[1]]
+            for n, (path, cs) in enumerate(imported, start=1)])
+    node_files.append(file_name)
+    file_name = os.path.join(output_dir, "rels_liquibase.csv")
+    _writeCsv(file_name, [":START_ID", ":END_ID", "dateExecuted:datetime", "orderExecuted:long", ":TYPE"], (
+        ["h{}".format(n), "h0", now, str(n), "IN_CHANGELOG"] for n in range(1, len(imported) + 1)))
+    rel_files.append(file_name)
+    return node_files, rel_files
+
+
+def importCommand(node_files, rel_files, database="neo4j", neo4j_version=4, neo4j_admin="neo4j-admin"):
+    if neo4j_version >= 5:
+        cmd = [neo4j_admin, "database", "import", "full", "--id-type=string"]
+    else:
+        cmd = [neo4j_admin, "import", "--database={}".format(database), "--id-type=STRING"]
+    cmd += ["--multiline-fields=true"]
+    cmd += ["--nodes={}".format(f) for f in node_files]
+    cmd += ["--relationships={}".format(f) for f in rel_files]
+    if neo4j_version >= 5:
+        cmd.append(database)
+    return cmd
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    graph = Graph()
+    imported, deferred = resolveChangelogs(changelogFiles(args.changelog_dir), graph, args.search_path)
+    added = graph.addNanoids()
+    node_files, rel_files = writeImportFiles(graph, imported, args.output_dir)
+    cmd = importCommand(node_files, rel_files, args.database, args.neo4j_version, args.neo4j_admin)
+    with open(os.path.join(args.output_dir, "import.sh"), "w") as fp:
+        fp.write("#!/bin/sh\n" + " \\\n  ".join(cmd) + "\n")
+    with open(os.path.join(args.output_dir, "deferred.txt"), "w") as fp:
+        fp.writelines("{}::{}\n".format(path, id) for path, id in deferred)
+    print("{} changeSets imported ({} nodes, {} relationships, {} nanoids added); {} left to Liquibase".format(
+        len(imported), len(graph.labels), len(graph.rels), added, len(deferred)))
+    if args.run:
+        subprocess.run(cmd, check=True)
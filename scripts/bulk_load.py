@@ -0,0 +1,152 @@
+"""
+Bulk-load mode: load with the nanoid trigger paused, then backfill once.
+
+With the add-nanoid-property trigger active, every node a load creates
+schedules its own afterAsync transaction. In bulk-load mode the trigger is
+paused for the load (apoc.trigger.pause), and afterwards one pass gives
+every node of NANOID_LABELS still without a nanoid a random one, in
+batches (apoc.periodic.iterate, one scan per label). The nanoids the pass
+sets are then checked for collisions with existing nanoids and re-drawn
+where needed. The trigger is resumed even if the load fails.
+
+Nanoids precomputed with add_nanoids.py are kept; the backfill only covers
+what changelogs left out. Pausing the trigger affects every writer of the
+database, so use this for loads into a tier that is otherwise idle.
+
+  python scripts/bulk_load.py                # backfill and verify only, e.g. after bulk_import.py
+  python scripts/parallel_load.py changelogs --bulk
+"""
+import argparse
+from contextlib import contextmanager
+
+from nanoid import NANOID_ALPHABET, NANOID_LABELS, NANOID_LENGTH, TRIGGER_NAME
+
+BACKFILL_MARK = "_nanoidBackfill"
+
+BACKFILL = """
+CALL apoc.periodic.iterate(
+  'MATCH (n:`{label}`) WHERE n.nanoid IS NULL RETURN n',
+  'SET n.nanoid = apoc.text.random($length, $alphabet), n.{mark} = true',
+  {{batchSize: $batch_size, params: {{length: $length, alphabet: $alphabet}}}})
+YIELD total, errorMessages
+RETURN total, errorMessages
+"""
+
+UNMARK = """
+CALL apoc.periodic.iterate(
+  'MATCH (n:`{label}`) WHERE n.{mark} IS NOT NULL RETURN n',
+  'REMOVE n.{mark}',
+  {{batchSize: $batch_size}})
+YIELD total
+RETURN total
+"""
+
+MISSING = "MATCH (n:`{label}`) WHERE n.nanoid IS NULL RETURN count(n) AS n"
+
+DUPLICATES = """
+MATCH (n) WHERE n.nanoid IS NOT NULL AND any(l IN labels(n) WHERE l IN $labels)
+WITH n.nanoid AS nanoid, count(*) AS c WHERE c > 1
+RETURN collect(nanoid) AS nanoids
+"""
+
+# Of each group of nodes sharing a nanoid, clear the backfilled ones, keeping
+# one if every node in the group was backfilled.
+REDRAW = """
+MATCH (n) WHERE n.nanoid IN $nanoids AND any(l IN labels(n) WHERE l IN $labels)
+WITH n.nanoid AS nanoid, collect(n) AS nodes
+WITH nodes, [x IN nodes WHERE x.{mark}] AS filled
+WITH CASE WHEN size(filled) = size(nodes) THEN filled[1..] ELSE filled END AS redraw
+UNWIND redraw AS n
+SET n.nanoid = null
+RETURN count(n) AS n
+"""
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="backfill and verify nanoids after a load with the trigger paused")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--uri")
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    return parser.parse_args()
+
+
+def pauseTrigger(session, name=TRIGGER_NAME):
+    session.run("CALL apoc.trigger.pause($name)", name=name).consume()
+
+
+def resumeTrigger(session, name=TRIGGER_NAME):
+    session.run("CALL apoc.trigger.resume($name)", name=name).consume()
+
+
+@contextmanager
+def triggerPaused(driver, name=TRIGGER_NAME):
+    with driver.session() as session:
+        pauseTrigger(session, name)
+    try:
+        yield
+    finally:
+        with driver.session() as session:
+            resumeTrigger(session, name)
+
+
+def backfillNanoids(session, batch_size=10000):
+    """Give nodes without a nanoid a random one; returns {label: nodes filled}."""
+    filled = {}
+    for label in sorted(NANOID_LABELS):
+        record = session.run(BACKFILL.format(label=label, mark=BACKFILL_MARK),
+                             length=NANOID_LENGTH, alphabet=NANOID_ALPHABET, batch_size=batch_size).single()
+        if record["errorMessages"]:
+            raise RuntimeError("nanoid backfill of {} failed: {}".format(label, record["errorMessages"]))
+        if record["total"]:
+            filled[label] = record["total"]
+    return filled
+
+
+def verifyNanoids(session, batch_size=10000, rounds=3):
+    """
+    Re-draw backfilled nanoids that collide with another node's, then
+    report what is still missing or duplicated. Returns a dict with
+    'filled', 'redrawn', 'missing' and 'duplicates'.
+    """
+    report = {"filled": backfillNanoids(session, batch_size), "redrawn": 0}
+    labels = sorted(NANOID_LABELS)
+    for _ in range(rounds):
+        nanoids = session.run(DUPLICATES, labels=labels).single()["nanoids"]
+        if not nanoids:
+            break
+        redrawn = session.run(REDRAW.format(mark=BACKFILL_MARK), nanoids=nanoids, labels=labels).single()["n"]
+        if not redrawn:
+            break
+        report["redrawn"] += redrawn
+        backfillNanoids(session, batch_size)
+    for label in labels:
+        session.run(UNMARK.format(label=label, mark=BACKFILL_MARK), batch_size=batch_size).consume()
+    report["missing"] = {}
+    for label in labels:
+        missing = session.run(MISSING.format(label=label)).single()["n"]
+        if missing:
+            report["missing"][label] = missing
+    report["duplicates"] = session.run(DUPLICATES, labels=labels).single()["nanoids"]
+    return report
+
+
+def printReport(report):
+    print("nanoids backfilled: " + (", ".join("{} {}".format(n, l) for l, n in report["filled"].items()) or "none"))
+    print("re-drawn after collisions: {}".format(report["redrawn"]))
+    print("still missing: " + (", ".join("{} {}".format(n, l) for l, n in report["missing"].items()) or "none"))
+    print("duplicate nanoids: {}".format(", ".join(report["duplicates"][:20]) or "none"))
+
+
+if __name__ == "__main__":
+    from neo4j_db import getDriver
+    args = getArgs()
+    driver = getDriver(args.uri, args.user, args.password)
+    try:
+        with driver.session() as session:
+            report = verifyNanoids(session, args.batch_size)
+    finally:
+        driver.close()
+    printReport(report)
+    if report["missing"] or report["duplicates"]:
+        raise SystemExit(1)
@@ -0,0 +1,173 @@
+"""
+Streaming read/write of Liquibase XML changelogs.
+
+Changelogs are read with iterparse and each changeSet element is released
+as soon as it is yielded, so memory stays flat on the multi-MB model files.
+"""
+import io
+import os
+import re
+import glob
+import hashlib
+from configparser import ConfigParser
+from xml.etree.ElementTree import iterparse
+from xml.sax.saxutils import escape, quoteattr
+
+LB_NS = "http://www.liquibase.org/xml/ns/dbchangelog"
+NEO4J_NS = "http://www.liquibase.org/xml/ns/dbchangelog-ext"
+XSI_NS = "http://www.w3.org/2001/XMLSchema-instance"
+SCHEMA_LOCATION = "http://www.liquibase.org/xml/ns/dbchangelog http://www.liquibase.org/xml/ns/dbchangelog/dbchangelog-latest.xsd"
+
+CHANGESET_TAG = "{%s}changeSet" % LB_NS
+CYPHER_TAG = "{%s}cypher" % NEO4J_NS
+ROLLBACK_TAG = "{%s}rollback" % LB_NS
+
+# Load order used by a full rebuild; mirrors the order changelogs were
+# first applied to the MDB tiers.
+LOAD_ORDER = [
+    "mdb_setup_changelog.xml",
+    "mdb_index_changelog_*.xml",
+    "models/create_model_node_changelog.xml",
+    "models/create_origin_node_changelog.xml",
+    "models/*/*.xml",
+    "mappings/*/*.xml",
+    "terms/*.xml",
+]
+
+
+class Changeset:
+    def __init__(self, id, author, cypher=None, rollback=None, attrs=None, changelog=None):
+        self.id = id
+        self.author = author
+        self.cypher = cypher or []
+        self.rollback = rollback or []
+        self.attrs = attrs or {}
+        self.changelog = changelog
+
+    @property
+    def run_always(self):
+        return self.attrs.get("runAlways") == "true"
+
+    @property
+    def run_on_change(self):
+        return self.attrs.get("runOnChange") == "true"
+
+    def __repr__(self):
+        return "<Changeset {}::{}::{}>".format(self.changelog, self.id, self.author)
+
+
+def iterChangesets(file_name):
+    context = iterparse(file_name, events=("start", "end"))
+    root = None
+    for event, elem in context:
+        if event == "start":
+            if root is None:
+                root = elem
+            continue
+        if elem.tag != CHANGESET_TAG:
+            continue
+        attrs = {k: v for k, v in elem.attrib.items() if k not in ("id", "author")}
+        yield Changeset(
+            id=elem.get("id"),
+            author=elem.get("author"),
+            cypher=[(c.text or "").strip() for c in elem.iter(CYPHER_TAG)],
+            rollback=[(r.text or "").strip() for r in elem.iter(ROLLBACK_TAG)],
+            attrs=attrs,
+            changelog=file_name,
+        )
+        elem.clear()
+        root.remove(elem)
+
+
+def contentChecksum(changeset):
+    """
+    md5 of a changeSet's statements and rollbacks with whitespace collapsed.
+    Like Liquibase's checkSum it ignores changeSet attributes, so flipping
+    runAlways to runOnChange does not count as a change.
+    """
+    md5 = hashlib.md5()
+    for part in (changeset.cypher, changeset.rollback):
+        for stmt in part:
+            md5.update(re.sub(r"\s+", " ", stmt.strip()).encode("utf-8"))
+            md5.update(b"\n")
+        md5.update(b"\0")
+    return md5.hexdigest()
+
+
+def readChangelogId(file_name):
+    for event, elem in iterparse(file_name, events=("start",)):
+        return elem.get("changeLogId")
+
+
+def changelogFiles(changelog_dir, patterns=LOAD_ORDER):
+    """Changelog paths under changelog_dir in load order, without duplicates."""
+    seen = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(os.path.join(changelog_dir, pattern))):
+            if path not in seen:
+                seen.append(path)
+    return seen
+
+
+class ChangelogWriter:
+    """Write changeSets one at a time in the same layout bento-meta produces."""
+    def __init__(self, file_name, changelog_id=None):
+        self.file_name = file_name
+        self.changelog_id = changelog_id
+        self.count = 0
+
+    def __enter__(self):
+        self.fp = open(self.file_name, "w", encoding="utf-8")
+        changelog_id = ' changeLogId="{}"'.format(self.changelog_id) if self.changelog_id else ""
+        self.fp.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+        self.fp.write(
+            '<databaseChangeLog xmlns="{}" xmlns:xsi="{}" xmlns:neo4j="{}" xsi:schemaLocation="{}"{}>\n'.format(
+                LB_NS, XSI_NS, NEO4J_NS, SCHEMA_LOCATION, changelog_id))
+        return self
+
+    def write(self, changeset):
+        attrs = "".join(" {}={}".format(k, quoteattr(str(v))) for k, v in changeset.attrs.items())
+        self.fp.write('  <changeSet id={} author={}{}>\n'.format(
+            quoteattr(str(changeset.id)), quoteattr(changeset.author), attrs))
+        for stmt in changeset.cypher:
+            self.fp.write("    <neo4j:cypher>{}</neo4j:cypher>\n".format(escape(stmt)))
+        for stmt in changeset.rollback:
+            self.fp.write("    <rollback>{}</rollback>\n".format(escape(stmt)))
+        self.fp.write("  </changeSet>\n")
+        self.count += 1
+
+    def __exit__(self, *exc):
+        self.fp.write("</databaseChangeLog>")
+        self.fp.close()
+
+
+def writeChangelog(file_name, changesets, changelog_id=None):
+    with ChangelogWriter(file_name, changelog_id) as writer:
+        for changeset in changesets:
+            writer.write(changeset)
+    return writer.count
+
+
+class ChangesetIds:
+    """
+    Hand out changeSet ids from the [changelog] changeset_id counter in
+    changelogs/changelog.ini, the same counter bento-meta's changelog
+    scripts advance.
+    """
+    def __init__(self, config_file):
+        self.config_file = config_file
+        self.config = ConfigParser()
+        self.config.read(config_file)
+        self.next_id = self.config.getint("changelog", "changeset_id")
+
+    def __call__(self):
+        current = self.next_id
+        self.next_id += 1
+        return str(current)
+
+    def save(self):
+        self.config["changelog"]["changeset_id"] = str(self.next_id)
+        buf = io.StringIO()
+        self.config.write(buf)
+        with open(self.config_file, "w") as fp:
+            fp.write(buf.getvalue().rstrip("\n"))
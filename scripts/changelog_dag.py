@@ -0,0 +1,96 @@
+"""
+Dependency graph between changelogs, for loading independent ones concurrently.
+
+Each changelog is summarized as the resources it writes and reads:
+- entities with a `model` property (node, relationship, property) and model
+  nodes belong to the ("model", handle) partition;
+- origins, terms, value sets, concepts and tags are keyed by the properties
+  they are looked up on;
+- MERGE edges read both endpoints; CREATE/MERGE of a node writes it;
+- statements outside the generated shapes (mappings, hand-written term maps,
+  compacted UNWIND batches) write every model they mention, or everything
+  if they mention none;
+- schema changelogs (indexes, constraints, triggers) are written before
+  anything that follows them is read.
+
+Changelog B depends on an earlier changelog A (in load order) when one
+writes a resource the other reads or writes. Everything else can run in
+parallel. The model changelogs, for example, only share the model and origin
+nodes created by create_model_node/create_origin_node_changelog.xml.
+"""
+import re
+from collections import defaultdict
+
+from changelog import iterChangesets
+from cypher import isSchemaStatement, parseStatement
+
+SCHEMA = ("schema",)
+EVERYTHING = ("*",)
+_MODEL_REF = re.compile(r"\bmodel\d*\s*:\s*(['\"])(.*?)\1")
+
+
+def entityResource(entity):
+    props = entity.props
+    if "model" in props:
+        return ("model", props["model"])
+    if entity.label == "model":
+        return ("model", props.get("handle"))
+    if entity.label == "origin":
+        return ("origin", props.get("name"))
+    if entity.label == "term":
+        return ("term", props.get("value"), props.get("origin_name"))
+    for key in ("nanoid", "_id", "handle", "name"):
+        if key in props:
+            return (entity.label, key, props[key])
+    return (entity.label,) + tuple(sorted((k, str(v)) for k, v in props.items()))
+
+
+def changelogResources(file_name):
+    """(writes, reads) resource sets of one changelog."""
+    writes, reads = set(), set()
+    for changeset in iterChangesets(file_name):
+        for stmt in changeset.cypher:
+            if isSchemaStatement(stmt):
+                writes.add(SCHEMA)
+                continue
+            reads.add(SCHEMA)
+            parsed = parseStatement(stmt)
+            if parsed is None:
+                models = {m.group(2) for m in _MODEL_REF.finditer(stmt)}
+                writes |= {("model", m) for m in models} or {EVERYTHING}
+            elif parsed.kind in ("create_node", "merge_node"):
+                writes.add(entityResource(parsed.node))
+            elif parsed.kind == "merge_edge":
+                reads.add(entityResource(parsed.src))
+                reads.add(entityResource(parsed.dst))
+            elif parsed.kind in ("delete_node", "delete_edge"):
+                writes.update(entityResource(e) for e in (parsed.node, parsed.src, parsed.dst) if e is not None)
+    return writes, reads
+
+
+def conflicts(a, b):
+    """True if two (writes, reads) summaries can't run concurrently."""
+    (wa, ra), (wb, rb) = a, b
+    if EVERYTHING in wa or EVERYTHING in wb:
+        return True
+    return bool(wa & wb or wa & rb or ra & wb)
+
+
+def buildDag(files, resources=None):
+    """{changelog: set of earlier changelogs it must wait for}, files in load order."""
+    resources = resources or {f: changelogResources(f) for f in files}
+    dag = {}
+    for i, file_name in enumerate(files):
+        dag[file_name] = {earlier for earlier in files[:i] if conflicts(resources[earlier], resources[file_name])}
+    return dag
+
+
+def levels(dag):
+    """Changelogs grouped by the earliest round they could start in."""
+    depth = {}
+    for file_name in dag:
+        depth[file_name] = 1 + max((depth[d] for d in dag[file_name]), default=-1)
+    grouped = defaultdict(list)
+    for file_name, d in depth.items():
+        grouped[d].append(file_name)
+    return [grouped[d] for d in sorted(grouped)]
@@ -0,0 +1,183 @@
+"""
+Compact a generated model changelog into a few UNWIND changeSets.
+
+bento-meta writes one changeSet per entity, so a model load is thousands of
+transactions plus thousands of DATABASECHANGELOG writes. This rewrites runs
+of recognized statements (see cypher.parseStatement) as one changeSet per
+label / relationship type and batch of rows:
+
+  UNWIND [{...}, ...] AS r CREATE (n:property {handle:r.handle,...})
+  UNWIND [{...}, ...] AS r MATCH (a:node {...}), (b:property {...}) MERGE (a)-[:has_property]->(b)
+
+liquibase-neo4j's cypher change takes no query parameters, so the rows are
+written into the statement as a list literal.
+
+Within a run, node CREATE/MERGE batches come before relationship batches so
+every MATCH sees the nodes it needs. Any changeSet that is not a recognized
+shape is copied through unchanged and ends the run, which keeps the original
+ordering around hand-written statements. Each batch carries the matching
+batched rollback (DETACH DELETE / DELETE, or "empty" for term MERGEs). Its
+rows match on index keys, chosen as rewrite_rollbacks.py chooses them
+((nanoid, _commit), else (model, handle, _commit), else (key, value,
+_commit), ...), with one statement per key set in the batch; nodes without
+a unique key set keep their whole property map.
+
+The compacted file is for fresh loads: on a tier that already ran the
+original changelog its changeSets would run again.
+"""
+import os
+import argparse
+from collections import OrderedDict
+
+from changelog import Changeset, ChangesetIds, iterChangesets, writeChangelog
+from cypher import Entity, formatProps, formatValue, parseStatement
+from rewrite_rollbacks import RollbackKeys, createdNodes
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "changelogs", "changelog.ini")
+
+ROLLBACK_KIND = {"create_node": "delete_node", "merge_node": "empty", "merge_edge": "delete_edge"}
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="compact a model changelog into UNWIND changeSets")
+    parser.add_argument("changelog", help="generated model changelog")
+    parser.add_argument("output", help="path for the compacted changelog")
+    parser.add_argument("--batch-size", type=int, default=500, help="rows per changeSet (default 500)")
+    parser.add_argument("--author", help="changeSet author (default: author of the source changeSets)")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="changelog.ini holding the changeset_id counter")
+    parser.add_argument("--no-save-config", action="store_true", help="do not advance changeset_id in --config")
+    return parser.parse_args()
+
+
+def classify(changeset):
+    """Return the parsed Statement if the changeSet can be batched, else None."""
+    if len(changeset.cypher) != 1 or len(changeset.rollback) > 1 or changeset.attrs:
+        return None
+    stmt = parseStatement(changeset.cypher[0])
+    if stmt is None or stmt.kind not in ROLLBACK_KIND:
+        return None
+    if changeset.rollback:
+        rollback = parseStatement(changeset.rollback[0])
+        if rollback is None or rollback.kind != ROLLBACK_KIND[stmt.kind]:
+            return None
+    elif stmt.kind != "merge_node":
+        return None
+    return stmt
+
+
+def groupKey(stmt):
+    if stmt.kind == "merge_edge":
+        return (stmt.kind, stmt.src.label, tuple(stmt.src.props), stmt.rel_type,
+                stmt.dst.label, tuple(stmt.dst.props))
+    return (stmt.kind, stmt.node.label, tuple(stmt.node.props), tuple(stmt.on_create))
+
+
+def rowFor(stmt):
+    if stmt.kind == "merge_edge":
+        return {"a": stmt.src.props, "b": stmt.dst.props}
+    if stmt.kind == "merge_node":
+        return {"p": stmt.node.props, "s": stmt.on_create}
+    return stmt.node.props
+
+
+def keyedProps(label, props, keys):
+    return keys.keyed(Entity("n", label, props)).props if keys is not None else props
+
+
+def renderBatch(key, rows, keys=None):
+    """
+    Return (cypher, rollbacks) for one batch of a group. keys (a
+    RollbackKeys) cuts the rollback's node maps down to index keys.
+    """
+    unwind = "UNWIND {} AS r".format(formatValue(rows))
+    kind = key[0]
+    if kind == "create_node":
+        _, label, props, _ = key
+        cypher = "{} CREATE (n:{} {})".format(unwind, label, formatProps(props, "r"))
+        groups = OrderedDict()
+        for row in rows:
+            keyed = keyedProps(label, row, keys)
+            groups.setdefault(tuple(keyed), []).append(keyed)
+        return cypher, ["UNWIND {} AS r MATCH (n:{} {}) DETACH DELETE n".format(
+            formatValue(group), label, formatProps(props, "r")) for props, group in groups.items()]
+    if kind == "merge_node":
+        _, label, props, set_keys = key
+        cypher = "{} MERGE (n:{} {})".format(unwind, label, formatProps(props, "r.p"))
+        if set_keys:
+            cypher += " ON CREATE SET " + ", ".join("n.{0} = r.s.{0}".format(k) for k in set_keys)
+        return cypher, ["empty"]
+    _, src_label, src_props, rel_type, dst_label, dst_props = key
+    src = "(a:{} {})".format(src_label, formatProps(src_props, "r.a"))
+    dst = "(b:{} {})".format(dst_label, formatProps(dst_props, "r.b"))
+    groups = OrderedDict()
+    for row in rows:
+        keyed = {"a": keyedProps(src_label, row["a"], keys), "b": keyedProps(dst_label, row["b"], keys)}
+        groups.setdefault((tuple(keyed["a"]), tuple(keyed["b"])), []).append(keyed)
+    return ("{} MATCH {}, {} MERGE (a)-[:{}]->(b)".format(unwind, src, dst, rel_type),
+            ["UNWIND {} AS r MATCH (a:{} {})-[e:{}]->(b:{} {}) DELETE e".format(
+                formatValue(group), src_label, formatProps(a, "r.a"), rel_type, dst_label, formatProps(b, "r.b"))
+             for (a, b), group in groups.items()])
+
+
+class Run:
+    """Recognized statements between two pass-through changeSets."""
+    def __init__(self):
+        self.nodes = OrderedDict()
+        self.edges = OrderedDict()
+        self.created = set()
+        self.source_ids = 0
+
+    def add(self, stmt):
+        if stmt.kind == "create_node":
+            # Hoisting nodes ahead of edges is only safe if no entity is
+            # created twice; otherwise an earlier MATCH would see both copies.
+            if stmt.node.key() in self.created:
+                raise ValueError("duplicate CREATE of {!r}; cannot compact safely".format(stmt.node))
+            self.created.add(stmt.node.key())
+        groups = self.edges if stmt.kind == "merge_edge" else self.nodes
+        groups.setdefault(groupKey(stmt), []).append(rowFor(stmt))
+        self.source_ids += 1
+
+    def __bool__(self):
+        return bool(self.source_ids)
+
+    def changesets(self, next_id, author, batch_size, keys=None):
+        for groups in (self.nodes, self.edges):
+            for key, rows in groups.items():
+                for i in range(0, len(rows), batch_size):
+                    cypher, rollback = renderBatch(key, rows[i:i + batch_size], keys)
+                    yield Changeset(next_id(), author, [cypher], rollback)
+
+
+def compactChangesets(changesets, next_id, batch_size=500, author=None, stats=None):
+    stats = stats if stats is not None else {}
+    changesets = list(changesets)
+    # rollback keys must be unique among all nodes the changelog creates
+    keys = RollbackKeys(createdNodes(changesets))
+    run = Run()
+    for changeset in changesets:
+        author = author or changeset.author
+        stmt = classify(changeset)
+        if stmt is not None:
+            run.add(stmt)
+            stats["compacted"] = stats.get("compacted", 0) + 1
+            continue
+        if run:
+            yield from run.changesets(next_id, author, batch_size, keys)
+            run = Run()
+        stats["passed"] = stats.get("passed", 0) + 1
+        yield changeset
+    if run:
+        yield from run.changesets(next_id, author, batch_size, keys)
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    ids = ChangesetIds(args.config)
+    stats = {}
+    written = writeChangelog(args.output, compactChangesets(
+        iterChangesets(args.changelog), ids, args.batch_size, args.author, stats))
+    if not args.no_save_config:
+        ids.save()
+    print("{}: {} changeSets compacted, {} passed through -> {} changeSets in {}".format(
+        args.changelog, stats.get("compacted", 0), stats.get("passed", 0), written, args.output))
@@ -0,0 +1,424 @@
+"""
+Parse and format the Cypher statements that bento-meta writes into MDB changelogs.
+
+Model changelogs are generated from a handful of fixed statement shapes
+(see parseStatement). Anything outside those shapes (mapping changelogs,
+hand-written term maps, mdb_setup) comes back as None and is treated as
+opaque by the tools in this directory.
+"""
+import re
+
+_ESCAPES = {"'": "'", '"': '"', "\\": "\\", "n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+_UNESCAPES = {v: k for k, v in _ESCAPES.items() if k not in ('"', "'")}
+_IDENT = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_NUMBER = re.compile(r"-?\d+(\.\d+)?")
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"", re.S)
+_CLAUSE = re.compile(r"\b(OPTIONAL\s+MATCH|MATCH|MERGE|CREATE|WITH|WHERE|SET|DETACH\s+DELETE|DELETE|RETURN|UNWIND|FOREACH|CALL|ON\s+CREATE|ON\s+MATCH)\b", re.I)
+_NODE_PATTERN = re.compile(r"(?<![\w.])\(\s*(\w+)?\s*((?::\s*\w+\s*)*)(\{[^{}]*\})?\s*\)")
+_MAP_KEY = re.compile(r"(\w+)\s*:")
+_WHERE_EQ = re.compile(r"\b(\w+)\.(\w+)\s*(?:=|IN\b)", re.I)
+_SCHEMA = re.compile(r"^\s*((create|drop)\s+(fulltext\s+|range\s+|text\s+|point\s+|lookup\s+)?(index|constraint)\b|call\s+apoc\.trigger\.)", re.I)
+
+
+class CypherParseError(ValueError):
+    pass
+
+
+class Entity:
+    """A node pattern: variable, label and property map."""
+    def __init__(self, var, label, props):
+        self.var = var
+        self.label = label
+        self.props = props
+
+    def key(self):
+        return (self.label, tuple(sorted(self.props.items())))
+
+    def __repr__(self):
+        return "({}:{} {})".format(self.var, self.label, formatMap(self.props))
+
+
+class Statement:
+    """
+    A recognized changelog statement.
+
+    kind is one of
+      create_node  CREATE (n0:label {...})
+      merge_node   MERGE (n0:label {...}) ON CREATE SET n0.k = '...'
+      merge_edge   MATCH (n0:l {...}), (n1:l {...}) MERGE (n0)-[r0:type]->(n1)
+      delete_node  MATCH (n0:label {...}) DETACH DELETE n0
+      delete_edge  MATCH (n0:l {...})-[r0:type]->(n1:l {...}) DELETE r0
+      empty        the literal rollback "empty"
+    """
+    def __init__(self, kind, node=None, src=None, dst=None, rel_type=None, on_create=None):
+        self.kind = kind
+        self.node = node
+        self.src = src
+        self.dst = dst
+        self.rel_type = rel_type
+        self.on_create = on_create or {}
+
+    @property
+    def labels(self):
+        if self.node:
+            return [self.node.label]
+        if self.src:
+            return [self.src.label, self.dst.label]
+        return []
+
+
+### Literals ##################################################################
+
+def formatString(value):
+    out = []
+    for ch in value:
+        if ch == "'":
+            out.append("\\'")
+        elif ch in _UNESCAPES:
+            out.append("\\" + _UNESCAPES[ch])
+        else:
+            out.append(ch)
+    return "'{}'".format("".join(out))
+
+
+def formatValue(value):
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, dict):
+        return formatMap(value)
+    if isinstance(value, (list, tuple)):
+        return "[{}]".format(", ".join(formatValue(v) for v in value))
+    return formatString(str(value))
+
+
+def formatMap(props):
+    # Same compact form bento-meta emits: {handle:'x',model:'Y'}
+    return "{" + ",".join("{}:{}".format(k, formatValue(v)) for k, v in props.items()) + "}"
+
+
+def formatProps(keys, source):
+    """Property map that reads each key from a row variable: {k:r.k,...}"""
+    return "{" + ",".join("{}:{}.{}".format(k, source, k) for k in keys) + "}"
+
+
+def formatStatement(stmt):
+    """Render a Statement in the form bento-meta writes it (inverse of parseStatement)."""
+    def node(entity):
+        return "({}:{} {})".format(entity.var or "", entity.label, formatMap(entity.props))
+    if stmt.kind == "empty":
+        return "empty"
+    if stmt.kind == "create_node":
+        return "CREATE " + node(stmt.node)
+    if stmt.kind == "merge_node":
+        text = "MERGE " + node(stmt.node)
+        if stmt.on_create:
+            text += " ON CREATE SET " + ", ".join(
+                "{}.{} = {}".format(stmt.node.var, k, formatValue(v)) for k, v in stmt.on_create.items())
+        return text
+    if stmt.kind == "delete_node":
+        return "MATCH {} DETACH DELETE {}".format(node(stmt.node), stmt.node.var)
+    if stmt.kind == "merge_edge":
+        return "MATCH {}, {} MERGE ({})-[r0:{}]->({})".format(
+            node(stmt.src), node(stmt.dst), stmt.src.var, stmt.rel_type, stmt.dst.var)
+    if stmt.kind == "delete_edge":
+        return "MATCH {}-[r0:{}]->{} DELETE r0".format(node(stmt.src), stmt.rel_type, node(stmt.dst))
+    raise ValueError("cannot format {}".format(stmt.kind))
+
+
+### Scanner ###################################################################
+
+class _Scanner:
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def error(self, msg):
+        raise CypherParseError("{} at {}: {!r}".format(msg, self.pos, self.text[self.pos:self.pos + 40]))
+
+    def ws(self):
+        while self.pos < len(self.text) and self.text[self.pos].isspace():
+            self.pos += 1
+
+    def peek(self, s):
+        self.ws()
+        return self.text.startswith(s, self.pos)
+
+    def expect(self, s):
+        if not self.peek(s):
+            self.error("expected {!r}".format(s))
+        self.pos += len(s)
+
+    def accept(self, s):
+        if self.peek(s):
+            self.pos += len(s)
+            return True
+        return False
+
+    def keyword(self, word):
+        self.ws()
+        end = self.pos + len(word)
+        if self.text[self.pos:end].upper() == word and (end >= len(self.text) or not self.text[end].isalnum()):
+            self.pos = end
+            return True
+        return False
+
+    def ident(self):
+        self.ws()
+        m = _IDENT.match(self.text, self.pos)
+        if not m:
+            self.error("expected identifier")
+        self.pos = m.end()
+        return m.group(0)
+
+    def done(self):
+        self.ws()
+        return self.pos >= len(self.text)
+
+    def string(self):
+        quote = self.text[self.pos]
+        self.pos += 1
+        out = []
+        while self.pos < len(self.text):
+            ch = self.text[self.pos]
+            if ch == "\\":
+                nxt = self.text[self.pos + 1]
+                # unknown escapes (e.g. '\-') are left as written
+                out.append(_ESCAPES.get(nxt, "\\" + nxt))
+                self.pos += 2
+            elif ch == quote:
+                self.pos += 1
+                return "".join(out)
+            else:
+                out.append(ch)
+                self.pos += 1
+        self.error("unterminated string")
+
+    def value(self):
+        self.ws()
+        ch = self.text[self.pos:self.pos + 1]
+        if ch in ("'", '"'):
+            return self.string()
+        if ch == "{":
+            return self.map()
+        if ch == "[":
+            self.pos += 1
+            items = []
+            while not self.accept("]"):
+                items.append(self.value())
+                self.accept(",")
+            return items
+        m = _NUMBER.match(self.text, self.pos)
+        if m:
+            self.pos = m.end()
+            return float(m.group(0)) if m.group(1) else int(m.group(0))
+        for word, val in (("TRUE", True), ("FALSE", False), ("NULL", None)):
+            if self.keyword(word):
+                return val
+        self.error("expected literal")
+
+    def map(self):
+        self.expect("{")
+        props = {}
+        while not self.accept("}"):
+            key = self.ident()
+            self.expect(":")
+            props[key] = self.value()
+            self.accept(",")
+        return props
+
+    def node(self):
+        self.expect("(")
+        var = self.ident() if not self.peek(":") and not self.peek("{") else None
+        label = None
+        if self.accept(":"):
+            label = self.ident()
+        props = self.map() if self.peek("{") else {}
+        self.expect(")")
+        return Entity(var, label, props)
+
+    def rel(self):
+        self.expect("-[")
+        var = self.ident() if not self.peek(":") else None
+        self.expect(":")
+        rel_type = self.ident()
+        self.expect("]->")
+        return var, rel_type
+
+
+def parseMap(text):
+    s = _Scanner(text)
+    props = s.map()
+    if not s.done():
+        s.error("trailing input")
+    return props
+
+
+def parseStatement(text):
+    """Return a Statement for a recognized changelog shape, otherwise None."""
+    text = text.strip()
+    if text == "empty":
+        return Statement("empty")
+    try:
+        return _parse(_Scanner(text))
+    except (CypherParseError, IndexError):
+        return None
+
+
+def _parse(s):
+    if s.keyword("CREATE"):
+        node = s.node()
+        if s.done() and node.label:
+            return Statement("create_node", node=node)
+        return None
+    if s.keyword("MERGE"):
+        node = s.node()
+        on_create = {}
+        if s.keyword("ON"):
+            if not (s.keyword("CREATE") and s.keyword("SET")):
+                return None
+            while True:
+                if s.ident() != node.var:
+                    return None
+                s.expect(".")
+                key = s.ident()
+                s.expect("=")
+                on_create[key] = s.value()
+                if not s.accept(","):
+                    break
+        if s.done() and node.label:
+            return Statement("merge_node", node=node, on_create=on_create)
+        return None
+    if not s.keyword("MATCH"):
+        return None
+    first = s.node()
+    if not first.label:
+        return None
+    if s.accept(","):
+        second = s.node()
+        if not (second.label and s.keyword("MERGE")):
+            return None
+        a = s.node()
+        _, rel_type = s.rel()
+        b = s.node()
+        if s.done() and a.var == first.var and b.var == second.var:
+            return Statement("merge_edge", src=first, dst=second, rel_type=rel_type)
+        return None
+    if s.peek("-["):
+        rvar, rel_type = s.rel()
+        second = s.node()
+        if second.label and s.keyword("DELETE") and s.ident() == rvar and s.done():
+            return Statement("delete_edge", src=first, dst=second, rel_type=rel_type)
+        return None
+    if s.keyword("DETACH") and s.keyword("DELETE") and s.ident() == first.var and s.done():
+        return Statement("delete_node", node=first)
+    return None
+
+
+### Pattern extraction ########################################################
+
+class Lookup:
+    """A node in a MATCH/MERGE pattern and the property keys it is matched on."""
+    def __init__(self, var, label, keys, bound=False):
+        self.var = var
+        self.label = label
+        self.keys = keys
+        self.bound = bound
+
+    def __repr__(self):
+        return "({}:{} {})".format(self.var or "", self.label or "", ",".join(self.keys))
+
+
+class Path:
+    """One comma-separated pattern of a MATCH/OPTIONAL MATCH/MERGE clause."""
+    def __init__(self, clause, nodes, start=0):
+        self.clause = clause
+        self.nodes = nodes
+        self.start = start
+        # True if the path expands from a variable bound by an earlier clause,
+        # directly or through another anchored path of the same clause
+        self.anchored = False
+
+    def __repr__(self):
+        return "{} {}".format(self.clause, "-".join(map(repr, self.nodes)))
+
+
+def isSchemaStatement(text):
+    """Index/constraint DDL or APOC trigger installation."""
+    return bool(_SCHEMA.match(text))
+
+
+def maskStrings(text):
+    """Replace string literal contents with spaces, keeping offsets."""
+    return _STRING.sub(lambda m: m.group(0)[0] + " " * (len(m.group(0)) - 2) + m.group(0)[-1], text)
+
+
+def patternPaths(text):
+    """
+    Paths in the MATCH, OPTIONAL MATCH and MERGE clauses of any Cypher
+    statement. Nodes carry their label and the property keys they are
+    matched on, including `var.key = ...` / `var.key IN ...` predicates from
+    a WHERE clause; nodes whose variable was introduced earlier are marked bound.
+    """
+    masked = maskStrings(text)
+    clauses = [(m.start(), re.sub(r"\s+", " ", m.group(1).upper())) for m in _CLAUSE.finditer(masked)]
+
+    def clauseAt(pos):
+        current, start = None, 0
+        for begin, name in clauses:
+            if begin > pos:
+                break
+            current, start = name, begin
+        return current, start
+
+    paths = []
+    seen = set()
+    previous = None
+    pending = set()
+    for m in _NODE_PATTERN.finditer(masked):
+        var, labels, props = m.group(1), m.group(2), m.group(3)
+        clause, clause_start = clauseAt(m.start())
+        label = labels.replace(":", " ").split()[0] if labels.strip() else None
+        keys = tuple(_MAP_KEY.findall(props)) if props else ()
+        # variables introduced in this clause don't count as bound until it ends
+        if previous is None or clause_start != previous[1]:
+            seen |= pending
+            pending = set()
+        node = Lookup(var, label, keys, bound=bool(var) and var in seen)
+        if var:
+            pending.add(var)
+        between = masked[previous[0]:m.start()] if previous else ""
+        same_path = previous is not None and clause_start == previous[1] and re.fullmatch(
+            r"\s*<?-(\[[^\]]*\])?->?\s*", between)
+        previous = (m.end(), clause_start)
+        if clause not in ("MATCH", "OPTIONAL MATCH", "MERGE"):
+            continue
+        if same_path and paths:
+            paths[-1].nodes.append(node)
+        else:
+            paths.append(Path(clause, [node], clause_start))
+    for path in paths:
+        path.anchored = any(n.bound for n in path.nodes)
+    changed = True
+    while changed:
+        changed = False
+        for path in paths:
+            if path.anchored:
+                continue
+            vars = {n.var for n in path.nodes if n.var}
+            if any(other.anchored and other.start == path.start and vars & {n.var for n in other.nodes}
+                   for other in paths):
+                path.anchored = changed = True
+    for start, name in clauses:
+        if name != "WHERE":
+            continue
+        end = next((b for b, _ in clauses if b > start), len(masked))
+        for m in _WHERE_EQ.finditer(masked, start, end):
+            for path in paths:
+                for node in path.nodes:
+                    if node.var == m.group(1) and not node.bound and m.group(2) not in node.keys:
+                        node.keys = node.keys + (m.group(2),)
+    return paths
@@ -0,0 +1,374 @@
+"""
+Semantic diff of two versions of a changelog, written as a delta changelog.
+
+Each statement is reduced to the fact it asserts:
+- a CREATEd entity, identified by the label and KEY_PROPS values (a model's
+  node or property by (model, handle), a tag by (key, value), ...) and
+  compared on its other properties, minus the ones that change with every
+  generation (VOLATILE_PROPS);
+- a MERGEd entity (terms), identified by its whole property map;
+- an edge, identified by its type and the identities of its endpoints;
+- anything else (mappings, hand-written statements), identified by its text
+  with whitespace collapsed and _commit values masked.
+When several entities of one changelog share a label and key values (e.g.
+the `id` property of every node), they are identified by their whole map.
+
+The delta holds one changeSet per difference, in an order that keeps every
+MATCH satisfiable, each with a rollback that undoes it:
+
+  removed edges    MATCH (a)-[r0:T]->(b) DELETE r0
+  changed entities MATCH (n0:label {key}) SET n0.prop = new, ...
+  added entities   the new CREATE/MERGE statement
+  added edges      MATCH (a), (b) MERGE (a)-[r0:T]->(b)
+  added other      the new statement, with its changeSet attributes
+  removed entities MATCH (n0:label {key}) DETACH DELETE n0
+
+The database holds other models and generations too, so the {key} a delta
+statement matches on is scoped: the first of rewrite_rollbacks.ROLLBACK_KEYS
+(a declared nanoid or the index keys, each with
+_commit) that no other entity
+the same changelog creates shares. The database state decides which
+version's values are matched: the old ones before the changes, the new
+_commit (and the old nanoid, which SET leaves alone) after them. A
+difference that has no such key (no nanoid or _commit, shared keys, an
+endpoint the changelogs don't create) is left out of the delta and listed
+in the summary as unresolved, as are removed MERGEd entities (shared
+terms) and removed statements of other kinds.
+
+Both files are read with iterparse, a changeSet at a time, in several
+passes. Only tables of fact keys, digests and scoped keys are held in
+memory, and the property maps of changed entities.
+
+  python scripts/diff_changelogs.py changelogs/mappings/DSS/dss_map_changelog_8adf31e.xml \\
+      changelogs/mappings/DSS/dss_map_changelog.xml --output delta.xml --author NWM --summary delta.txt
+
+--preview numbers the delta changeSets from changelog.ini without
+advancing the counter, for a delta that is only reviewed.
+"""
+import os
+import re
+import hashlib
+import argparse
+from collections import Counter, defaultdict
+
+from changelog import Changeset, ChangesetIds, iterChangesets, writeChangelog
+from cypher import Entity, Statement, formatMap, formatStatement, formatValue, parseStatement
+from rewrite_rollbacks import ROLLBACK_KEYS, createdNodes
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "changelogs", "changelog.ini")
+
+KEY_PROPS = {
+    "node": ("model", "handle"),
+    "relationship": ("model", "handle"),
+    "property": ("model", "handle"),
+    "value_set": ("_id",),
+    "tag": ("key", "value"),
+    "concept": ("nanoid",),
+    "term": ("value", "origin_name"),
+    "origin": ("name",),
+    "model": ("handle",),
+}
+VOLATILE_PROPS = ("_commit", "nanoid")
+
+_COMMIT_VALUE = re.compile(r"(\b_commit\s*[:=]\s*)(['\"]).*?\2")
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="diff two changelogs and write the delta as a changelog")
+    parser.add_argument("old", help="changelog as deployed")
+    parser.add_argument("new", help="regenerated changelog")
+    parser.add_argument("--output", help="write the delta changelog here")
+    parser.add_argument("--author", help="author of the delta changeSets (required with --output)")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="changelog.ini holding the changeset_id counter")
+    parser.add_argument("--summary", help="write the summary here instead of stdout")
+    parser.add_argument("--preview", action="store_true",
+                        help="write the delta without advancing the changeset_id counter in --config")
+    return parser.parse_args()
+
+
+def _stable(props):
+    return {k: props[k] for k in sorted(props) if k not in VOLATILE_PROPS}
+
+
+def _digest(text):
+    return hashlib.md5(text.encode("utf-8")).digest()
+
+
+def keyValues(entity):
+    keys = KEY_PROPS.get(entity.label)
+    if not keys or not all(k in entity.props for k in keys):
+        return None
+    return (entity.label,) + tuple(entity.props[k] for k in keys)
+
+
+def normalizeText(text):
+    return _COMMIT_VALUE.sub(r"\1?", re.sub(r"\s+", " ", text.strip()))
+
+
+def scopedCounts(file_name):
+    """How many entities the changelog creates with each label and ROLLBACK_KEYS values."""
+    counts = Counter()
+    for entity in createdNodes(iterChangesets(file_name)):
+        for keys in ROLLBACK_KEYS:
+            if all(k in entity.props for k in keys):
+                counts[(entity.label, keys, tuple(entity.props[k] for k in keys))] += 1
+    return counts
+
+
+def scopedMatch(entity, counts, props=None):
+    """The first ROLLBACK_KEYS map of entity that counts shows to be unique, or None."""
+    props = entity.props if props is None else props
+    for keys in ROLLBACK_KEYS:
+        if all(k in props for k in keys) and counts[(entity.label, keys, tuple(props[k] for k in keys))] == 1:
+            return {k: props[k] for k in keys}
+    return None
+
+
+class Facts:
+    """Reduces the statements of a changelog to (fact key, digest, statement) triples."""
+    def __init__(self, ambiguous=frozenset()):
+        self.ambiguous = ambiguous
+
+    def match(self, entity):
+        """The map an entity is matched on: its key values, or its stable map if those are ambiguous."""
+        kv = keyValues(entity)
+        if kv is None or kv in self.ambiguous:
+            return _stable(entity.props)
+        return {k: entity.props[k] for k in KEY_PROPS[entity.label]}
+
+    def identity(self, entity):
+        return (entity.label, formatMap(self.match(entity)))
+
+    def statement(self, text):
+        stmt = parseStatement(text)
+        if stmt is not None and stmt.kind == "create_node":
+            return ("create",) + self.identity(stmt.node), _digest(formatMap(_stable(stmt.node.props))), stmt
+        if stmt is not None and stmt.kind == "merge_node":
+            return ("merge", stmt.node.label, formatMap(_stable(stmt.node.props))), b"", stmt
+        if stmt is not None and stmt.kind == "merge_edge":
+            return ("edge", stmt.rel_type, self.identity(stmt.src), self.identity(stmt.dst)), b"", stmt
+        return ("other", _digest(normalizeText(text))), b"", stmt
+
+    def iterFacts(self, file_name):
+        for changeset in iterChangesets(file_name):
+            for text in changeset.cypher:
+                key, digest, stmt = self.statement(text)
+                yield key, digest, stmt, text, changeset
+
+
+def keyCounts(file_name):
+    counts = Counter()
+    for changeset in iterChangesets(file_name):
+        for text in changeset.cypher:
+            stmt = parseStatement(text)
+            if stmt is not None and stmt.kind == "create_node":
+                counts[keyValues(stmt.node)] += 1
+    return counts
+
+
+class Delta:
+    def __init__(self):
+        self.old_match = {}
+        self.removed_edges = []
+        self.changed = []
+        self.added = []
+        self.added_edges = []
+        self.added_other = []
+        self.removed = []
+        self.unresolved = []
+        self.summary = defaultdict(Counter)
+
+
+def diffChangelogs(old, new):
+    """Compare two versions of a changelog; returns a Delta."""
+    old_keys, new_keys = keyCounts(old), keyCounts(new)
+    ambiguous = frozenset(k for k in set(old_keys) | set(new_keys)
+                          if k is not None and (old_keys[k] > 1 or new_keys[k] > 1))
+    facts = Facts(ambiguous)
+
+    old_scoped, new_scoped = scopedCounts(old), scopedCounts(new)
+
+    delta = Delta()
+    old_count, old_digest = Counter(), {}
+    for key, digest, stmt, _, _ in facts.iterFacts(old):
+        old_count[key] += 1
+        old_digest[key] = digest
+        if key[0] == "create":
+            # how a node of the deployed version is matched; None once its identity repeats
+            delta.old_match[key] = scopedMatch(stmt.node, old_scoped) if old_count[key] == 1 else None
+
+    new_count, changed = Counter(), {}
+    for key, digest, stmt, text, changeset in facts.iterFacts(new):
+        new_count[key] += 1
+        kind = key[0]
+        if new_count[key] > old_count[key]:
+            delta.summary[kind]["added"] += 1
+            if kind in ("create", "merge"):
+                delta.added.append((stmt, text, changeset))
+            elif kind == "edge":
+                delta.added_edges.append((stmt, text, changeset))
+            else:
+                delta.added_other.append((stmt, text, changeset))
+        elif kind == "create" and old_count[key] == 1 and old_digest[key] != digest:
+            changed[key] = stmt.node
+
+    old_seen = Counter()
+    for key, _, stmt, text, changeset in facts.iterFacts(old):
+        old_seen[key] += 1
+        kind = key[0]
+        if key in changed:
+            delta.summary[kind]["changed"] += 1
+            delta.changed.append((stmt.node, changed[key]))
+        elif old_seen[key] > new_count[key]:
+            delta.summary[kind]["removed"] += 1
+            if kind == "create":
+                delta.removed.append((stmt, text, changeset))
+            elif kind == "edge":
+                delta.removed_edges.append((stmt, text, changeset))
+            else:
+                delta.unresolved.append(("removed {} statement".format(kind), text))
+    delta.facts = facts
+    delta.changed_keys = set(changed)
+    delta.new_scoped = new_scoped
+    resolveMatches(delta)
+    return delta
+
+
+def resolveMatches(delta):
+    """
+    Give every entity a delta statement matches its scoped map, before or
+    after the changes, and move differences with an entity that has none
+    to delta.unresolved.
+    """
+    facts = delta.facts
+
+    def before(entity):
+        return delta.old_match.get(("create",) + facts.identity(entity))
+
+    def after(entity):
+        key = ("create",) + facts.identity(entity)
+        old_match = delta.old_match.get(key)
+        if key in delta.changed_keys:
+            if old_match and "nanoid" in old_match:
+                # the SET moved the entity to the new _commit
+                return dict(old_match, **{k: entity.props[k] for k in ("_commit",) if k in old_match})
+            return scopedMatch(entity, delta.new_scoped, {k: v for k, v in entity.props.items() if k != "nanoid"})
+        if key in delta.old_match:
+            return old_match
+        return scopedMatch(entity, delta.new_scoped)
+
+    def keep(items, reason, resolve):
+        kept = []
+        for item in items:
+            resolved = resolve(item)
+            if resolved is None:
+                delta.unresolved.append((reason, item[1]))
+            else:
+                kept.append(item[:2] + resolved)
+        return kept
+
+    def endpoints(match):
+        def resolve(item):
+            src, dst = match(item[0].src), match(item[0].dst)
+            return (src, dst) if src is not None and dst is not None else None
+        return resolve
+
+    delta.removed_edges = keep(delta.removed_edges, "removed edge without a unique scoped match", endpoints(before))
+    delta.added_edges = keep(delta.added_edges, "added edge without a unique scoped match", endpoints(after))
+    delta.removed = keep(delta.removed, "removed entity without a unique scoped match",
+                         lambda item: (before(item[0].node),) if before(item[0].node) is not None else None)
+    changed = []
+    for old_node, new_node in delta.changed:
+        old_match, new_match = before(old_node), after(new_node)
+        if old_match is None or new_match is None:
+            delta.unresolved.append(("changed entity without a unique scoped match",
+                                     "{} {}".format(new_node.label, formatMap(facts.match(new_node)))))
+        else:
+            changed.append((old_node, new_node, old_match, new_match))
+    delta.changed = changed
+
+
+### Delta changeSets ##########################################################
+
+def _matched(entity, match, var):
+    return Entity(var, entity.label, match)
+
+
+def setStatement(entity, match, props, old_props):
+    keys = [k for k in props if old_props.get(k) != props[k]] + [k for k in old_props if k not in props]
+    return "MATCH (n0:{} {}) SET {}".format(entity.label, formatMap(match), ", ".join("n0.{} = {}".format(k, formatValue(props.get(k))) for k in keys))
+
+
+def deltaChangesets(delta, next_id, author):
+    for stmt, _, src, dst in delta.removed_edges:
+        edge = Statement("delete_edge", src=_matched(stmt.src, src, "n0"), dst=_matched(stmt.dst, dst, "n1"),
+                         rel_type=stmt.rel_type)
+        restore = Statement("merge_edge", src=edge.src, dst=edge.dst, rel_type=stmt.rel_type)
+        yield Changeset(next_id(), author, [formatStatement(edge)], [formatStatement(restore)])
+    for old, new, old_match, new_match in delta.changed:
+        old_props = {k: v for k, v in old.props.items() if k != "nanoid"}
+        new_props = {k: v for k, v in new.props.items() if k != "nanoid"}
+        yield Changeset(next_id(), author, [setStatement(new, old_match, new_props, old_props)],
+                        [setStatement(old, new_match, old_props, new_props)])
+    for stmt, text, changeset in delta.added:
+        yield Changeset(next_id(), author, [text], changeset.rollback or ["empty"])
+    for stmt, _, src, dst in delta.added_edges:
+        edge = Statement("merge_edge", src=_matched(stmt.src, src, "n0"), dst=_matched(stmt.dst, dst, "n1"),
+                         rel_type=stmt.rel_type)
+        undo = Statement("delete_edge", src=edge.src, dst=edge.dst, rel_type=stmt.rel_type)
+        yield Changeset(next_id(), author, [formatStatement(edge)], [formatStatement(undo)])
+    for stmt, text, changeset in delta.added_other:
+        yield Changeset(next_id(), author, [text], changeset.rollback or ["empty"], changeset.attrs)
+    for stmt, text, match in delta.removed:
+        node = Statement("delete_node", node=_matched(stmt.node, match, "n0"))
+        yield Changeset(next_id(), author, [formatStatement(node)], [text])
+
+
+def _describe(facts, entity):
+    return "{} {}".format(entity.label, formatMap(facts.match(entity)))
+
+
+def summaryLines(delta, old, new):
+    facts = delta.facts
+    lines = ["{} -> {}".format(old, new)]
+    for kind, label in (("create", "entities"), ("merge", "merged entities"), ("edge", "edges"),
+                        ("other", "other statements")):
+        c = delta.summary[kind]
+        lines.append("  {:17} +{} ~{} -{}".format(label, c["added"], c["changed"], c["removed"]))
+    for stmt, _, _ in delta.added:
+        lines.append("+ " + _describe(facts, stmt.node))
+    for old_node, new_node, _, _ in delta.changed:
+        keys = sorted(k for k in set(old_node.props) | set(new_node.props)
+                      if k not in VOLATILE_PROPS and old_node.props.get(k) != new_node.props.get(k))
+        lines.append("~ {}: {}".format(_describe(facts, new_node), ", ".join(keys)))
+    for stmt, _, _ in delta.removed:
+        lines.append("- " + _describe(facts, stmt.node))
+    for stmt, _, _, _ in delta.added_edges:
+        lines.append("+ {} -[{}]-> {}".format(_describe(facts, stmt.src), stmt.rel_type, _describe(facts, stmt.dst)))
+    for stmt, _, _, _ in delta.removed_edges:
+        lines.append("- {} -[{}]-> {}".format(_describe(facts, stmt.src), stmt.rel_type, _describe(facts, stmt.dst)))
+    for _, text, _ in delta.added_other:
+        lines.append("+ " + normalizeText(text)[:200])
+    for reason, text in delta.unresolved:
+        lines.append("! {}, not in the delta: {}".format(reason, normalizeText(text)[:200]))
+    return lines
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    if args.output and not args.author:
+        raise SystemExit("--author is required with --output")
+    delta = diffChangelogs(args.old, args.new)
+    summary = "\n".join(summaryLines(delta, args.old, args.new)) + "\n"
+    if args.summary:
+        with open(args.summary, "w") as fp:
+            fp.write(summary)
+    else:
+        print(summary, end="")
+    if args.output:
+        ids = ChangesetIds(args.config)
+        count = writeChangelog(args.output, deltaChangesets(delta, ids, args.author))
+        if not args.preview:
+            ids.save()
+        print("{} delta changeSets written to {}{}".format(
+            count, args.output, " (preview, {} not advanced)".format(args.config) if args.preview else ""))
@@ -0,0 +1,97 @@
+"""
+EXPLAIN every statement of a changelog against a local Neo4j and report the
+plan of each changeSet: scans, index seeks and the planner's estimated rows
+summed over all operators (the closest thing to a plan cost EXPLAIN exposes).
+
+Nothing is executed. Plans depend on the schema, so load the setup and index
+changelogs first (--setup); estimates are only meaningful once the models
+are loaded too.
+
+  python scripts/explain_changelog.py /tmp/dss_rewritten.xml \
+    --baseline changelogs/mappings/DSS/dss_map_changelog.xml \
+    --setup changelogs/mdb_setup_changelog.xml --setup changelogs/mdb_index_changelog_1.xml
+
+Exits 1 if any statement of the changelogs (not the baseline) plans an
+AllNodesScan, so it can gate a rewrite in CI.
+"""
+import json
+import argparse
+from collections import Counter
+
+from changelog import iterChangesets
+from neo4j_db import applySetup, explainStatement, getDriver, planOperators
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="EXPLAIN changelog statements and report per-changeSet plan costs")
+    parser.add_argument("changelogs", nargs="+", help="changelogs to explain")
+    parser.add_argument("--baseline", help="changelog with the same changeSet ids to compare against")
+    parser.add_argument("--setup", action="append", default=[],
+                        help="schema changelog applied (without history) before explaining (repeatable)")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    parser.add_argument("--uri")
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    return parser.parse_args()
+
+
+def planSummary(plan):
+    operators = planOperators(plan)
+    counts = Counter(op for op, _ in operators)
+    return {
+        "operators": len(operators),
+        "all_nodes_scans": counts["AllNodesScan"],
+        "label_scans": counts["NodeByLabelScan"],
+        "index_seeks": sum(n for op, n in counts.items() if "IndexSeek" in op),
+        "estimated_rows": sum(float(args.get("EstimatedRows", 0)) for _, args in operators),
+    }
+
+
+def explainChangelog(session, file_name):
+    """{changeSet id: summary} with the summaries of its statements added up."""
+    report = {}
+    for changeset in iterChangesets(file_name):
+        entry = dict.fromkeys(("operators", "all_nodes_scans", "label_scans", "index_seeks", "estimated_rows"), 0)
+        for stmt in changeset.cypher:
+            for key, value in planSummary(explainStatement(session, stmt)).items():
+                entry[key] += value
+        report[changeset.id] = entry
+    return report
+
+
+def printReport(reports, baseline=None):
+    for file_name, report in reports.items():
+        print(file_name)
+        print("  {:>10} {:>10} {:>10} {:>10} {:>14} {:>14}".format(
+            "changeSet", "allnodes", "labelscan", "seeks", "est. rows", "baseline rows"))
+        for cs_id, entry in report.items():
+            before = baseline.get(cs_id, {}).get("estimated_rows") if baseline else None
+            print("  {:>10} {:>10} {:>10} {:>10} {:>14.0f} {:>14}".format(
+                cs_id, entry["all_nodes_scans"], entry["label_scans"], entry["index_seeks"],
+                entry["estimated_rows"], "" if before is None else "{:.0f}".format(before)))
+        total = sum(e["estimated_rows"] for e in report.values())
+        scans = sum(1 for e in report.values() if e["all_nodes_scans"])
+        print("  {} changeSets, {} with an AllNodesScan, estimated rows {:.0f}".format(len(report), scans, total))
+        if baseline:
+            print("  baseline: {} with an AllNodesScan, estimated rows {:.0f}".format(
+                sum(1 for e in baseline.values() if e["all_nodes_scans"]),
+                sum(e["estimated_rows"] for e in baseline.values())))
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    driver = getDriver(args.uri, args.user, args.password)
+    try:
+        with driver.session() as session:
+            for setup in args.setup:
+                applySetup(session, iterChangesets(setup))
+            reports = {f: explainChangelog(session, f) for f in args.changelogs}
+            baseline = explainChangelog(session, args.baseline) if args.baseline else None
+    finally:
+        driver.close()
+    printReport(reports, baseline)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump({"changelogs": reports, "baseline": baseline}, fp, indent=2)
+    if any(e["all_nodes_scans"] for r in reports.values() for e in r.values()):
+        raise SystemExit(1)
@@ -0,0 +1,191 @@
+"""
+Export a read-only per-model snapshot of the MDB as an SQLite file, for STS
+to answer its hot read endpoints without a round trip to Neo4j (see
+devops/dockerfiles/sts/app/sts_snapshot.py).
+
+One file per model, <output_dir>/<model>.sqlite, holding the model's node,
+property, value_set and term entities with exactly the properties Neo4j
+returns for them, and the has_property / has_value_set / has_term edges
+between them:
+
+  entity(id, label, handle, nanoid, props)   props as JSON, indexed on (label, handle) and nanoid
+  edge(src, type, dst)                       keyed (src, type, dst)
+  meta(key, value)                           model, mdb_version, source, exported
+
+By default the snapshot is read from a loaded database, and stamped with the
+MDB version STS computes from the Liquibase history; STS only serves a
+snapshot whose version matches the deployed one. --from-changelogs resolves
+the changelogs offline instead (as bulk_import.py does), with nanoids only
+where the changelogs carry them. Offline, the version is not known:
+--mdb-version stamps the version of the deployment the changelogs
+reproduce (the "version" of GET /cache/metrics on that tier's STS). STS
+serves a snapshot without a version only with STS_SNAPSHOT_UNVERSIONED=1.
+
+  python scripts/export_snapshots.py /tmp/snapshots --model ICDC --model CTDC
+  python scripts/export_snapshots.py /tmp/snapshots --from-changelogs changelogs --mdb-version 9876-2024-05-01T12:00:00Z
+"""
+import os
+import json
+import sqlite3
+import argparse
+from datetime import datetime, timezone
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE entity (id INTEGER PRIMARY KEY, label TEXT NOT NULL, handle TEXT, nanoid TEXT, props TEXT NOT NULL);
+CREATE TABLE edge (src INTEGER NOT NULL, type TEXT NOT NULL, dst INTEGER NOT NULL, PRIMARY KEY (src, type, dst)) WITHOUT ROWID;
+"""
+INDEXES = """
+CREATE INDEX entity_handle ON entity (label, handle);
+CREATE INDEX entity_nanoid ON entity (nanoid);
+"""
+SNAPSHOT_LABELS = ("node", "property", "value_set", "term")
+SNAPSHOT_EDGES = (("node", "has_property", "property"),
+                  ("property", "has_value_set", "value_set"),
+                  ("value_set", "has_term", "term"))
+
+# must match VERSION_QUERY in devops/dockerfiles/sts/app/sts_cache.py
+VERSION_QUERY = """
+MATCH (c:__LiquibaseChangeSet)-[r:IN_CHANGELOG]->()
+RETURN count(c) AS changesets, toString(max(r.dateExecuted)) AS last_executed
+"""
+MODELS = "MATCH (n:node) RETURN DISTINCT n.model AS model ORDER BY model"
+ENTITIES = {
+    "node": "MATCH (n:node {model: $model}) RETURN id(n) AS id, properties(n) AS props",
+    "property": """
+MATCH (:node {model: $model})-[:has_property]->(p:property)
+RETURN DISTINCT id(p) AS id, properties(p) AS props""",
+    "value_set": """
+MATCH (:node {model: $model})-[:has_property]->(:property)-[:has_value_set]->(vs:value_set)
+RETURN DISTINCT id(vs) AS id, properties(vs) AS props""",
+    "term": """
+MATCH (:node {model: $model})-[:has_property]->(:property)-[:has_value_set]->(:value_set)-[:has_term]->(t:term)
+RETURN DISTINCT id(t) AS id, properties(t) AS props""",
+}
+EDGES = {
+    "has_property": """
+MATCH (a:node {model: $model})-[:has_property]->(b:property)
+RETURN DISTINCT id(a) AS src, id(b) AS dst""",
+    "has_value_set": """
+MATCH (:node {model: $model})-[:has_property]->(a:property)-[:has_value_set]->(b:value_set)
+RETURN DISTINCT id(a) AS src, id(b) AS dst""",
+    "has_term": """
+MATCH (:node {model: $model})-[:has_property]->(:property)-[:has_value_set]->(a:value_set)-[:has_term]->(b:term)
+RETURN DISTINCT id(a) AS src, id(b) AS dst""",
+}
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="export per-model SQLite snapshots for STS")
+    parser.add_argument("output_dir", help="directory for the <model>.sqlite files")
+    parser.add_argument("--model", action="append", help="model to export (repeatable; default: all models)")
+    parser.add_argument("--from-changelogs", metavar="DIR",
+                        help="resolve the changelogs under DIR offline instead of reading the database")
+    parser.add_argument("--mdb-version", help="with --from-changelogs, the MDB version to stamp the snapshots with")
+    return parser.parse_args()
+
+
+### Writing ###################################################################
+
+def writeSnapshot(file_name, model, entities, edges, version=None, source="neo4j"):
+    """
+    Write one snapshot. entities yields (key, label, props) and edges
+    (src key, type, dst key); keys are any hashable id of the source graph.
+    The file is written next to file_name and moved into place, so a
+    running STS never opens a half-written snapshot.
+    """
+    tmp_name = file_name + ".tmp"
+    if os.path.exists(tmp_name):
+        os.remove(tmp_name)
+    conn = sqlite3.connect(tmp_name)
+    try:
+        conn.executescript(SCHEMA)
+        ids = {}
+        rows = []
+        for key, label, props in entities:
+            ids[key] = len(ids) + 1
+            rows.append((ids[key], label, props.get("handle"), props.get("nanoid"),
+                         json.dumps(props, sort_keys=True)))
+        conn.executemany("INSERT INTO entity VALUES (?, ?, ?, ?, ?)", rows)
+        conn.executemany("INSERT OR IGNORE INTO edge VALUES (?, ?, ?)", (
+            (ids[src], rel_type, ids[dst]) for src, rel_type, dst in edges if src in ids and dst in ids))
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("model", model), ("mdb_version", version), ("source", source),
+            ("exported", datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"))])
+        conn.executescript(INDEXES)
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp_name, file_name)
+    return len(rows)
+
+
+### Sources ###################################################################
+
+def databaseSnapshot(session, model):
+    """(entities, edges) for model from a loaded database."""
+    entities = [(r["id"], label, dict(r["props"]))
+                for label in SNAPSHOT_LABELS for r in session.run(ENTITIES[label], model=model)]
+    edges = [(r["src"], rel_type, r["dst"])
+             for rel_type, query in EDGES.items() for r in session.run(query, model=model)]
+    return entities, edges
+
+
+def databaseVersion(session):
+    record = session.run(VERSION_QUERY).single()
+    return "{}-{}".format(record["changesets"], record["last_executed"])
+
+
+def changelogSnapshots(graph, models=None):
+    """{model: (entities, edges)} from a bulk_import.Graph resolved from the changelogs."""
+    out = {}
+    edges_from = {}
+    for (src, rel_type, dst) in graph.rels:
+        edges_from.setdefault(src, []).append((rel_type, dst))
+    for node_id, label in enumerate(graph.labels):
+        if label != "node":
+            continue
+        model = graph.props[node_id].get("model")
+        if models and model not in models:
+            continue
+        entities, edges = out.setdefault(model, ({}, set()))
+        frontier = [node_id]
+        while frontier:
+            src = frontier.pop()
+            entities[src] = (src, graph.labels[src], graph.props[src])
+            for want_src, rel_type, want_dst in SNAPSHOT_EDGES:
+                if graph.labels[src] != want_src:
+                    continue
+                for rt, dst in edges_from.get(src, ()):
+                    if rt == rel_type and graph.labels[dst] == want_dst:
+                        edges.add((src, rel_type, dst))
+                        if dst not in entities:
+                            frontier.append(dst)
+    return {model: (sorted(entities.values(), key=lambda e: (SNAPSHOT_LABELS.index(e[1]), e[0])), sorted(edges))
+            for model, (entities, edges) in out.items()}
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.from_changelogs:
+        from bulk_import import Graph, resolveChangelogs
+        from changelog import changelogFiles
+        graph = Graph()
+        resolveChangelogs(changelogFiles(args.from_changelogs), graph)
+        for model, (entities, edges) in sorted(changelogSnapshots(graph, args.model).items()):
+            file_name = os.path.join(args.output_dir, "{}.sqlite".format(model))
+            print("{}: {} entities -> {} (version {})".format(
+                model, writeSnapshot(file_name, model, entities, edges, args.mdb_version, source="changelogs"),
+                file_name, args.mdb_version))
+    else:
+        from neo4j_db import getDriver
+        with getDriver() as driver, driver.session() as session:
+            version = databaseVersion(session)
+            models = args.model or [r["model"] for r in session.run(MODELS)]
+            for model in models:
+                entities, edges = databaseSnapshot(session, model)
+                file_name = os.path.join(args.output_dir, "{}.sqlite".format(model))
+                print("{}: {} entities -> {} (version {})".format(
+                    model, writeSnapshot(file_name, model, entities, edges, version), file_name, version))
@@ -0,0 +1,187 @@
+"""
+Recommend indexes from the lookups changelogs actually perform.
+
+Every cypher statement and rollback is scanned for the node patterns its
+MATCH/OPTIONAL MATCH/MERGE clauses look up (cypher.patternPaths). A path
+that does not expand from an already-bound variable needs an anchor: an
+indexed label + property predicate, otherwise the planner falls back to a
+label scan (labelled node) or an all-nodes scan (no label).
+
+Existing range indexes and uniqueness constraints are read from the schema
+statements in the changelogs themselves (mdb_setup_changelog.xml and any
+earlier index changelog). For each path without a covering index the
+advisor picks the best indexable predicate (PREFERRED_KEYS), writes one
+`create index if not exists` changeSet per recommendation, and reports per
+changelog which statements still scan once those indexes exist.
+
+  python scripts/index_advisor.py changelogs --output changelogs/mdb_index_changelog_1.xml --author bento-mdb
+"""
+import os
+import re
+import json
+import argparse
+from collections import Counter, defaultdict
+
+from changelog import Changeset, ChangesetIds, changelogFiles, iterChangesets, writeChangelog
+from cypher import isSchemaStatement, patternPaths
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "changelogs", "changelog.ini")
+
+# Index key sets in order of preference when several fit a predicate. Neo4j 4.4
+# composite indexes only serve lookups that constrain every indexed property.
+PREFERRED_KEYS = [
+    ("nanoid",),
+    ("model", "handle"),
+    ("_id",),
+    ("key", "value"),
+    ("value", "origin_name"),
+    ("handle",),
+    ("name",),
+    ("value",),
+    ("_commit",),
+]
+
+INDEX_RE = re.compile(r"^\s*create\s+(?:range\s+|btree\s+)?index\b.*?\bfor\s*\(\s*(\w+)\s*:\s*(\w+)\s*\)\s*on\s*\(([^)]*)\)", re.I | re.S)
+CONSTRAINT_RE = re.compile(r"^\s*create\s+constraint\b.*?\b(?:for|on)\s*\(\s*(\w+)\s*:\s*(\w+)\s*\)\s*(?:require|assert)\s*\(?([^)]*?)\)?\s+is\s+(?:unique|node\s+key)", re.I | re.S)
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="recommend indexes for the lookups in MDB changelogs")
+    parser.add_argument("changelog_dir", help="directory holding the changelogs (e.g. changelogs)")
+    parser.add_argument("--extra", action="append", default=[], help="additional changelog to analyze (repeatable)")
+    parser.add_argument("--output", help="write recommended indexes as a changelog to this file")
+    parser.add_argument("--author", help="author of generated changeSets (required with --output)")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="changelog.ini holding the changeset_id counter")
+    parser.add_argument("--report", help="write the per-changelog scan report as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="list every statement that still scans")
+    return parser.parse_args()
+
+
+def schemaIndex(statement):
+    """(label, props) of a range index or uniqueness constraint, else None."""
+    m = INDEX_RE.match(statement) or CONSTRAINT_RE.match(statement)
+    if not m:
+        return None
+    var, label, props = m.groups()
+    keys = tuple(p.strip()[len(var) + 1:] for p in props.split(",") if p.strip().startswith(var + "."))
+    return (label, keys) if keys else None
+
+
+def covers(indexes, label, keys):
+    return label is not None and any(l == label and set(props) <= set(keys) for l, props in indexes)
+
+
+def chooseIndex(label, keys):
+    for preferred in PREFERRED_KEYS:
+        if set(preferred) <= set(keys):
+            return (label, preferred)
+    return (label, (keys[0],))
+
+
+def pathAccess(path, indexes):
+    """'expand', 'seek', 'label_scan' or 'all_nodes_scan' for one path."""
+    if path.anchored:
+        return "expand"
+    if any(covers(indexes, n.label, n.keys) for n in path.nodes if not n.bound):
+        return "seek"
+    if any(n.label for n in path.nodes):
+        return "label_scan"
+    return "all_nodes_scan"
+
+
+def iterStatements(files):
+    """(changelog, changeSet id, 'cypher'|'rollback', statement) for every statement."""
+    for file_name in files:
+        for changeset in iterChangesets(file_name):
+            for stmt in changeset.cypher:
+                yield file_name, changeset.id, "cypher", stmt
+            for stmt in changeset.rollback:
+                if stmt and stmt != "empty":
+                    yield file_name, changeset.id, "rollback", stmt
+
+
+def analyze(files):
+    existing = []
+    statements = []
+    for file_name, cs_id, part, stmt in iterStatements(files):
+        if isSchemaStatement(stmt):
+            index = schemaIndex(stmt)
+            if index and index not in existing:
+                existing.append(index)
+            continue
+        paths = patternPaths(stmt)
+        if paths:
+            statements.append((file_name, cs_id, part, paths))
+
+    predicates = Counter()
+    recommended = Counter()
+    for file_name, cs_id, part, paths in statements:
+        for path in paths:
+            for node in path.nodes:
+                if not node.bound and node.label and node.keys:
+                    predicates[(node.label, tuple(sorted(node.keys)))] += 1
+            if pathAccess(path, existing) not in ("label_scan", "all_nodes_scan"):
+                continue
+            candidates = [n for n in path.nodes if n.label and n.keys and not n.bound]
+            if candidates:
+                best = min((chooseIndex(n.label, n.keys) for n in candidates),
+                           key=lambda ix: next((i for i, p in enumerate(PREFERRED_KEYS) if p == ix[1]), len(PREFERRED_KEYS)))
+                recommended[best] += 1
+
+    indexes = existing + [ix for ix in recommended if ix not in existing]
+    report = defaultdict(lambda: {"statements": 0, "scans_before": 0, "scans_after": 0, "still_scanning": []})
+    for file_name, cs_id, part, paths in statements:
+        entry = report[file_name]
+        entry["statements"] += 1
+        before = [pathAccess(p, existing) for p in paths]
+        after = [pathAccess(p, indexes) for p in paths]
+        if any(a in ("label_scan", "all_nodes_scan") for a in before):
+            entry["scans_before"] += 1
+        scanning = [(repr(p), a) for p, a in zip(paths, after) if a in ("label_scan", "all_nodes_scan")]
+        if scanning:
+            entry["scans_after"] += 1
+            entry["still_scanning"].append({"changeset": cs_id, "part": part, "paths": scanning})
+    return existing, predicates, recommended, dict(report)
+
+
+def indexChangesets(recommended, existing, next_id, author):
+    for (label, keys), _ in recommended.most_common():
+        if (label, keys) in existing:
+            continue
+        yield Changeset(next_id(), author, [
+            "create index if not exists for (n:{}) on ({})".format(label, ", ".join("n." + k for k in keys))])
+
+
+def printReport(existing, predicates, recommended, report, verbose=False):
+    print("existing indexes: " + ", ".join("{}({})".format(l, ",".join(k)) for l, k in existing))
+    print("\nmost used predicates:")
+    for (label, keys), n in predicates.most_common(15):
+        print("  {:>6}  {}({})".format(n, label, ",".join(keys)))
+    print("\nrecommended indexes (paths served):")
+    for (label, keys), n in recommended.most_common():
+        print("  {:>6}  {}({})".format(n, label, ",".join(keys)))
+    print("\n{:60} {:>10} {:>12} {:>12}".format("changelog", "statements", "scans before", "scans after"))
+    for file_name, entry in report.items():
+        print("{:60} {:>10} {:>12} {:>12}".format(
+            file_name[-60:], entry["statements"], entry["scans_before"], entry["scans_after"]))
+        if verbose:
+            for item in entry["still_scanning"]:
+                for path, access in item["paths"]:
+                    print("    {} {}: {} {}".format(item["changeset"], item["part"], access, path))
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    files = changelogFiles(args.changelog_dir) + args.extra
+    existing, predicates, recommended, report = analyze(files)
+    printReport(existing, predicates, recommended, report, args.verbose)
+    if args.output and not args.author:
+        raise SystemExit("--author is required with --output")
+    if args.output and recommended:
+        ids = ChangesetIds(args.config)
+        count = writeChangelog(args.output, indexChangesets(recommended, existing, ids, args.author))
+        ids.save()
+        print("\n{} index changeSets written to {}".format(count, args.output))
+    if args.report:
+        with open(args.report, "w") as fp:
+            json.dump(report, fp, indent=2)
@@ -0,0 +1,305 @@
+"""
+Prefect flow for an MDB update: discover -> validate -> dry-run -> apply -> verify.
+
+The steps of the SOP (mdb-sop.md), driven by the changelog tools in this
+directory:
+
+  discover  changelogs under changelog_dir in load order, and their
+            dependency graph (changelog_dag.py)
+  validate  every changelog parses, changeSets have an id and author and no
+            id repeats within a changelog; mapping changelogs are linted
+            (rewrite_mapping_changelog.py) and lint findings reported
+  dry-run   the changeSets that would run against the target database,
+            with their EXPLAIN plans (the updateSQL step)
+  apply     pending changeSets, one task per changelog; a changelog starts
+            when the changelogs it depends on are done, so independent
+            ones run concurrently (up to `workers`)
+  verify    every changeSet is recorded in the Liquibase history; node and
+            relationship counts of the resulting graph
+  liquibase-validate
+            with --liquibase, `liquibase validate` on every changelog
+
+With bulk_load the add-nanoid-property trigger is paused while changelogs
+are applied, and a backfill-nanoids step (bulk_load.py) gives the new nodes
+their nanoids in one batched pass before verify.
+
+Dry-run and apply tasks retry transient bolt failures (connection loss,
+deadlocks, leader switches) with exponential backoff. Retrying an apply
+task is safe: changeSets that committed before the failure are in the
+history and are skipped. Each step publishes a table artifact with its
+duration and the rows it touched (update counters for apply, the
+planner's estimated rows for dry-run).
+
+The flow applies changeSets with the Python executor (neo4j_db.py), not
+with Liquibase. The history it writes has a null checkSum and
+liquibaseVersion 'bento-mdb'. A null checkSum is the state
+`liquibase clear-checksums` leaves, and Liquibase fills it in on its
+next run, so Liquibase can take over a tier the flow updated.
+--liquibase gives the Liquibase command line for the target database, and
+the flow then runs `validate` on every changelog after verify, so a
+history Liquibase would reject fails the flow instead of the next
+Liquibase update. Without it the flow warns that the history is
+unvalidated.
+
+The connection comes from NEO4J_MDB_URI, NEO4J_MDB_USER and NEO4J_MDB_PASS,
+defaulting to the local container from scripts/docker-compose.yml:
+
+  pip install -r scripts/requirements-flow.txt
+  docker compose -f scripts/docker-compose.yml up -d
+  python scripts/mdb_update_flow.py changelogs --dry-run-only
+  python scripts/mdb_update_flow.py changelogs --workers 4
+  python scripts/mdb_update_flow.py changelogs --workers 4 --bulk
+  python scripts/mdb_update_flow.py changelogs --liquibase "liquibase --url jdbc:neo4j:bolt://localhost:7687 --username neo4j --password neo4j1"
+"""
+import time
+import shlex
+import argparse
+import subprocess
+import threading
+from collections import Counter
+from contextlib import nullcontext
+
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+from prefect import flow, get_run_logger, task
+from prefect.artifacts import create_table_artifact
+from prefect.cache_policies import NONE
+from prefect.tasks import exponential_backoff
+
+from bench_changelog_load import graphSummary
+from bulk_load import triggerPaused, verifyNanoids
+from changelog import changelogFiles, iterChangesets
+from changelog_dag import buildDag
+from explain_changelog import planSummary
+from neo4j_db import (ChangelogHistory, applyChangelog, changelogPath, explainStatement, getDriver,
+                      pendingChangesets, ranChangesets)
+from rewrite_mapping_changelog import lint, modelLabels
+
+TRANSIENT_ERRORS = (ServiceUnavailable, SessionExpired, TransientError)
+RETRIES = 4
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="run the MDB update flow locally")
+    parser.add_argument("changelog_dir", help="directory holding the changelogs (e.g. changelogs)")
+    parser.add_argument("--extra", action="append", default=[], help="additional changelog, loaded last (repeatable)")
+    parser.add_argument("--search-path", default=".",
+                        help="Liquibase search path; history records changelog paths relative to it (default: .)")
+    parser.add_argument("--workers", type=int, default=4, help="changelogs applied at once (default 4)")
+    parser.add_argument("--dry-run-only", action="store_true", help="stop after the dry run")
+    parser.add_argument("--bulk", action="store_true",
+                        help="pause the nanoid trigger while applying, then backfill and verify nanoids")
+    parser.add_argument("--liquibase", help="Liquibase command line for the target database; "
+                                            "runs `validate` on every changelog after the update")
+    return parser.parse_args()
+
+
+def isTransient(error):
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def retryTransient(task, task_run, state):
+    """Retry only bolt failures that are worth retrying."""
+    try:
+        state.result()
+    except Exception as e:
+        return isTransient(e)
+    return False
+
+
+def rowsTouched(counters):
+    return sum(v for k, v in counters.items() if not k.startswith("contains"))
+
+
+### Steps #####################################################################
+
+def discoverChangelogs(changelog_dir, extra=()):
+    """(files in load order, {file: sorted changelogs it waits for})."""
+    files = changelogFiles(changelog_dir) + list(extra)
+    dag = buildDag(files)
+    return files, {f: sorted(deps) for f, deps in dag.items()}
+
+
+def checkChangelogs(files):
+    """(errors, lint warnings) for files."""
+    errors, warnings = [], []
+    for file_name in files:
+        seen = set()
+        try:
+            for changeset in iterChangesets(file_name):
+                if not changeset.id or not changeset.author:
+                    errors.append("{}: changeSet without id or author".format(file_name))
+                if (changeset.id, changeset.author) in seen:
+                    errors.append("{}: duplicate changeSet {}::{}".format(file_name, changeset.id, changeset.author))
+                seen.add((changeset.id, changeset.author))
+        except Exception as e:
+            errors.append("{}: {}".format(file_name, e))
+    mappings = [f for f in files if "/mappings/" in f]
+    if mappings:
+        labels = modelLabels([f for f in files if "/models/" in f])
+        for file_name in mappings:
+            warnings.extend(lint(file_name, labels))
+    return errors, warnings
+
+
+def liquibaseCommand(liquibase, file_name, search_path, command):
+    return shlex.split(liquibase) + ["--search-path", search_path,
+                                     "--changelog-file", changelogPath(file_name, search_path), command]
+
+
+### Tasks #####################################################################
+
+@task(name="discover-changelogs")
+def discover(changelog_dir, extra=()):
+    files, dag = discoverChangelogs(changelog_dir, extra)
+    get_run_logger().info("%d changelogs, %d with dependencies", len(files), sum(1 for d in dag.values() if d))
+    return files, dag
+
+
+@task(name="validate-changelogs")
+def validate(files):
+    errors, warnings = checkChangelogs(files)
+    logger = get_run_logger()
+    for msg in warnings:
+        logger.warning(msg)
+    if errors:
+        raise ValueError("invalid changelogs:\n" + "\n".join(errors))
+    return warnings
+
+
+@task(name="dry-run-changelog", retries=RETRIES, retry_delay_seconds=exponential_backoff(backoff_factor=5),
+      retry_condition_fn=retryTransient, cache_policy=NONE)
+def dryRun(driver, file_name, search_path, slots):
+    start = time.perf_counter()
+    plans = Counter()
+    pending = 0
+    with slots, driver.session() as session:
+        ran = ranChangesets(session)
+        for changeset, _, _ in pendingChangesets(iterChangesets(file_name), ran, changelogPath(file_name, search_path)):
+            pending += 1
+            for stmt in changeset.cypher:
+                plans.update(planSummary(explainStatement(session, stmt)))
+    return {
+        "step": "dry-run", "changelog": file_name, "changesets": pending,
+        "seconds": round(time.perf_counter() - start, 3),
+        "rows": int(plans["estimated_rows"]), "all_nodes_scans": plans["all_nodes_scans"],
+    }
+
+
+@task(name="apply-changelog", retries=RETRIES, retry_delay_seconds=exponential_backoff(backoff_factor=5),
+      retry_condition_fn=retryTransient, cache_policy=NONE)
+def apply(driver, file_name, search_path, history, slots):
+    start = time.perf_counter()
+    with slots, driver.session() as session:
+        results = applyChangelog(session, iterChangesets(file_name),
+                                 changelog=changelogPath(file_name, search_path), history=history)
+    return {
+        "step": "apply", "changelog": file_name, "changesets": len(results),
+        "seconds": round(time.perf_counter() - start, 3),
+        "rows": sum(rowsTouched(counters) for _, _, counters in results),
+    }
+
+
+@task(name="backfill-nanoids", retries=RETRIES, retry_delay_seconds=exponential_backoff(backoff_factor=5),
+      retry_condition_fn=retryTransient, cache_policy=NONE)
+def backfillNanoids(driver):
+    start = time.perf_counter()
+    with driver.session() as session:
+        report = verifyNanoids(session)
+    if report["missing"] or report["duplicates"]:
+        raise ValueError("nanoids missing {} or duplicated {}".format(report["missing"], report["duplicates"][:5]))
+    return {
+        "step": "backfill-nanoids", "changelog": "", "changesets": 0,
+        "seconds": round(time.perf_counter() - start, 3),
+        "rows": sum(report["filled"].values()) + report["redrawn"],
+    }
+
+
+@task(name="verify-load", retries=RETRIES, retry_delay_seconds=exponential_backoff(backoff_factor=5),
+      retry_condition_fn=retryTransient, cache_policy=NONE)
+def verify(driver, files, search_path):
+    with driver.session() as session:
+        ran = ranChangesets(session)
+        summary = graphSummary(session)
+    missing = []
+    for file_name in files:
+        path = changelogPath(file_name, search_path)
+        missing.extend((path, cs.id) for cs in iterChangesets(file_name) if (path, cs.id, cs.author) not in ran)
+    if missing:
+        raise ValueError("{} changeSets not recorded in history, e.g. {}".format(len(missing), missing[:5]))
+    return summary
+
+
+@task(name="liquibase-validate")
+def liquibaseValidate(liquibase, files, search_path):
+    """Liquibase's own check of the history the Python executor wrote."""
+    start = time.perf_counter()
+    failed = []
+    for file_name in files:
+        run = subprocess.run(liquibaseCommand(liquibase, file_name, search_path, "validate"),
+                             capture_output=True, text=True)
+        if run.returncode:
+            failed.append("{}: {}".format(file_name, (run.stderr or run.stdout).strip()[-500:]))
+    if failed:
+        raise ValueError("liquibase validate failed:\n" + "\n".join(failed))
+    return {
+        "step": "liquibase-validate", "changelog": "", "changesets": 0,
+        "seconds": round(time.perf_counter() - start, 3), "rows": 0,
+    }
+
+
+def publish(key, rows, description):
+    create_table_artifact(key=key, table=rows, description=description)
+
+
+### Flow ######################################################################
+
+@flow(name="mdb-update")
+def mdbUpdate(changelog_dir="changelogs", extra=(), search_path=".", workers=4, dry_run_only=False, bulk_load=False,
+              liquibase=None):
+    logger = get_run_logger()
+    files, dag = discover(changelog_dir, extra)
+    warnings = validate(files)
+    # tasks waiting on upstream changelogs hold a runner thread but not a slot
+    slots = threading.BoundedSemaphore(workers)
+    driver = getDriver(max_connection_pool_size=workers + 1)
+    try:
+        dry = [f.result() for f in [dryRun.submit(driver, f, search_path, slots) for f in files]]
+        publish("mdb-dry-run", dry, "changeSets pending per changelog, with estimated rows from EXPLAIN")
+        if any(r["all_nodes_scans"] for r in dry):
+            logger.warning("pending statements plan AllNodesScans: %s",
+                           [r["changelog"] for r in dry if r["all_nodes_scans"]])
+        if dry_run_only or not any(r["changesets"] for r in dry):
+            return {"dry_run": dry, "lint": warnings}
+
+        with driver.session() as session:
+            history = ChangelogHistory(session)
+        futures = {}
+        with triggerPaused(driver) if bulk_load else nullcontext():
+            for file_name in files:
+                futures[file_name] = apply.submit(driver, file_name, search_path, history, slots,
+                                                  wait_for=[futures[d] for d in dag[file_name]])
+            applied = [futures[f].result() for f in files]
+        publish("mdb-apply", applied, "changeSets applied, seconds and update counters per changelog")
+        steps = [("dry-run", dry), ("apply", applied)]
+        if bulk_load:
+            steps.append(("backfill-nanoids", [backfillNanoids(driver)]))
+
+        summary = verify(driver, files, search_path)
+        if liquibase:
+            steps.append(("liquibase-validate", [liquibaseValidate(liquibase, files, search_path)]))
+        else:
+            logger.warning("history written with null checkSums; not validated by Liquibase (pass liquibase)")
+        publish("mdb-verify", [{"entity": k, "count": v} for k, v in summary.items()],
+                "node and relationship counts after the update")
+        publish("mdb-steps", [
+            {"step": step, "changelogs": len(rows), "changesets": sum(r["changesets"] for r in rows),
+             "seconds": round(sum(r["seconds"] for r in rows), 3), "rows": sum(r["rows"] for r in rows)}
+            for step, rows in steps], "duration and rows touched per step")
+        return {"dry_run": dry, "apply": applied, "graph": summary, "lint": warnings}
+    finally:
+        driver.close()
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    mdbUpdate(args.changelog_dir, args.extra, args.search_path, args.workers, args.dry_run_only, args.bulk, args.liquibase)
@@ -0,0 +1,51 @@
+"""
+Nanoids for MDB entities.
+
+The add-nanoid-property trigger (mdb_setup_changelog.xml, changeSet 15)
+gives every new node of NANOID_LABELS a random 6-character nanoid, so the
+same entity gets a different nanoid on every tier. deterministicNanoid
+derives it from the entity instead: a hash of its label and identifying
+properties, encoded in the trigger's alphabet. The identifying properties
+include _commit, because each model version loads its own nodes and a
+rollback keyed on the nanoid must not reach another version's node; only
+the nanoid itself and desc (IGNORED_PROPS) are left out.
+"""
+import hashlib
+
+from cypher import formatMap
+
+# Labels and alphabet from the add-nanoid-property trigger in mdb_setup_changelog.xml
+NANOID_LABELS = {"node", "relationship", "property", "value_set", "concept", "predicate", "term", "origin", "model", "tag"}
+NANOID_ALPHABET = "abcdefghijkmnopqrstuvwxyzABCDEFGHJKMNPQRSTUVWXYZ0123456789"
+NANOID_LENGTH = 6
+TRIGGER_NAME = "add-nanoid-property"
+
+IGNORED_PROPS = ("nanoid", "desc")
+
+
+def identity(label, props):
+    return label + formatMap({k: props[k] for k in sorted(props) if k not in IGNORED_PROPS})
+
+
+def deterministicNanoid(label, props, taken=None):
+    """
+    Nanoid for an entity. If taken (a set of nanoids already in use) is
+    given, collisions are resolved by rehashing with a counter and the
+    result is added to taken.
+    """
+    seed = identity(label, props)
+    salt = 0
+    while True:
+        digest = hashlib.sha256((seed if not salt else "{}#{}".format(seed, salt)).encode("utf-8")).digest()
+        number = int.from_bytes(digest, "big")
+        chars = []
+        for _ in range(NANOID_LENGTH):
+            number, index = divmod(number, len(NANOID_ALPHABET))
+            chars.append(NANOID_ALPHABET[index])
+        nanoid = "".join(chars)
+        if taken is None:
+            return nanoid
+        if nanoid not in taken:
+            taken.add(nanoid)
+            return nanoid
+        salt += 1
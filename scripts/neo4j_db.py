@@ -0,0 +1,223 @@
+"""
+Neo4j connection and changeSet execution shared by the changelog tools.
+
+Connection settings use the same environment variables as the STS container
+(NEO4J_MDB_URI, NEO4J_MDB_USER, NEO4J_MDB_PASS) so the tools can point at a
+tier or at the local container from scripts/docker-compose.yml.
+
+applyChangeset runs a changeSet the way liquibase-neo4j does: all of its
+statements in one transaction, followed by a __LiquibaseChangeSet history
+node linked to the __LiquibaseChangeLog node. The checkSum is left null;
+Liquibase fills null checksums in on its next run instead of failing
+validation, so history written here is picked up by later `update`s.
+Each history node also gets a contentChecksum (changelog.contentChecksum),
+which applyChangelog uses to decide whether a runOnChange changeSet changed.
+
+Tools that empty the database (clearDatabase) get their URI from
+scratchUri instead: --uri or the local container, never NEO4J_MDB_URI, and
+a host other than localhost only when the caller names it again.
+"""
+import os
+import time
+import uuid
+import threading
+from urllib.parse import urlparse
+
+from neo4j import GraphDatabase
+from neo4j.exceptions import ClientError
+
+from changelog import contentChecksum
+
+LOCAL_URI = "bolt://localhost:7687"
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+HISTORY_CHANGELOG = """
+MERGE (log:__LiquibaseChangeLog)
+  ON CREATE SET log.dateCreated = datetime()
+  ON MATCH SET log.dateUpdated = datetime()
+"""
+
+HISTORY_CHANGESET = """
+MATCH (log:__LiquibaseChangeLog)
+MERGE (cs:__LiquibaseChangeSet {id: $id, author: $author, changeLog: $changelog})
+SET cs.checkSum = $checksum, cs.contentChecksum = $content_checksum, cs.execType = $exec_type,
+    cs.description = $description, cs.comments = '', cs.deploymentId = $deployment_id,
+    cs.liquibaseVersion = 'bento-mdb'
+MERGE (cs)-[r:IN_CHANGELOG]->(log)
+SET r.dateExecuted = datetime(), r.orderExecuted = $order
+"""
+
+HISTORY_COUNT = "MATCH (:__LiquibaseChangeSet)-[r:IN_CHANGELOG]->() RETURN count(r) AS n"
+
+HISTORY_KEYS = """
+MATCH (cs:__LiquibaseChangeSet)
+RETURN cs.changeLog AS changelog, cs.id AS id, cs.author AS author, cs.contentChecksum AS content_checksum
+"""
+
+
+def getDriver(uri=None, user=None, password=None, **config):
+    uri = uri or os.environ.get("NEO4J_MDB_URI") or "bolt://localhost:7687"
+    user = user or os.environ.get("NEO4J_MDB_USER") or "neo4j"
+    password = password or os.environ.get("NEO4J_MDB_PASS") or "neo4j1"
+    return GraphDatabase.driver(uri, auth=(user, password), **config)
+
+
+def scratchUri(uri=None, wipe_host=None):
+    """
+    The URI for a tool that empties the database: uri, or the local
+    container. NEO4J_MDB_URI is ignored, since it may point at a tier. Raises
+    ValueError for a host that is not local unless wipe_host names it.
+    """
+    uri = uri or LOCAL_URI
+    host = urlparse(uri).hostname
+    if host not in LOCAL_HOSTS and host != wipe_host:
+        raise ValueError("{} is not a local database; pass --i-know-this-wipes {} to empty it".format(uri, host))
+    return uri
+
+
+def addScratchArgs(parser):
+    """--uri/--user/--password for a tool that empties the database (see scratchUri)."""
+    parser.add_argument("--uri", help="database to empty and load (default {})".format(LOCAL_URI))
+    parser.add_argument("--i-know-this-wipes", metavar="HOST", dest="wipe_host",
+                        help="allow a --uri on this host other than localhost; everything in it is deleted")
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+
+
+def changelogPath(file_name, changelog_root=None):
+    """The changeLog path Liquibase records: relative to the search path."""
+    if changelog_root:
+        return os.path.relpath(file_name, changelog_root)
+    return file_name
+
+
+class ChangelogHistory:
+    """
+    Track orderExecuted and deploymentId across one run, like Liquibase.
+    One instance can be shared by sessions in several threads.
+    """
+    def __init__(self, session):
+        self.deployment_id = uuid.uuid4().hex[:10]
+        session.run(HISTORY_CHANGELOG).consume()
+        self.order = session.run(HISTORY_COUNT).single()["n"]
+        self.lock = threading.Lock()
+
+    def nextOrder(self):
+        with self.lock:
+            self.order += 1
+            return self.order
+
+
+def ranChangesets(session):
+    """
+    {(changelog, id, author): content checksum} for changeSets already
+    recorded in the database. The checksum is None for changeSets Liquibase ran.
+    """
+    return {(r["changelog"], r["id"], r["author"]): r["content_checksum"] for r in session.run(HISTORY_KEYS)}
+
+
+def applyChangeset(session, changeset, history=None, changelog=None, checksum=None, exec_type="EXECUTED"):
+    """
+    Execute one changeSet in a single write transaction. Returns
+    (seconds, counters) where counters sums the update counters of its statements.
+    """
+    counters = {}
+    order = history.nextOrder() if history is not None else None
+
+    def work(tx):
+        for stmt in changeset.cypher:
+            summary = tx.run(stmt).consume()
+            for key, value in vars(summary.counters).items():
+                if isinstance(value, int) and not isinstance(value, bool) and value:
+                    counters[key] = counters.get(key, 0) + value
+        if history is not None:
+            tx.run(HISTORY_CHANGESET,
+                id=changeset.id,
+                author=changeset.author,
+                changelog=changelog or changeset.changelog,
+                checksum=checksum,
+                content_checksum=contentChecksum(changeset),
+                exec_type=exec_type,
+                description="cypher",
+                deployment_id=history.deployment_id,
+                order=order,
+            ).consume()
+
+    start = time.perf_counter()
+    session.execute_write(work)
+    return time.perf_counter() - start, counters
+
+
+def pendingChangesets(changesets, ran, changelog=None):
+    """
+    Yield (changeset, changelog path, execType) for changeSets that would
+    run: not in ran (see ranChangesets), runAlways, or runOnChange with a
+    different content checksum than when they last ran.
+    """
+    for changeset in changesets:
+        path = changelog or changeset.changelog
+        key = (path, changeset.id, changeset.author)
+        if key not in ran:
+            yield changeset, path, "EXECUTED"
+        elif changeset.run_always or changeset.run_on_change and ran[key] != contentChecksum(changeset):
+            yield changeset, path, "RERAN"
+
+
+def applyChangelog(session, changesets, changelog=None, record_history=True, skip_ran=True, history=None):
+    """
+    Apply the pending changeSets in order (all of them with skip_ran=False).
+    Pass history to share one deployment across several calls. Returns a
+    list of (changeset, seconds, counters).
+    """
+    if not record_history:
+        history = None
+    elif history is None:
+        history = ChangelogHistory(session)
+    ran = ranChangesets(session) if skip_ran else {}
+    results = []
+    for changeset, path, exec_type in pendingChangesets(changesets, ran, changelog):
+        seconds, counters = applyChangeset(session, changeset, history, path, exec_type=exec_type)
+        results.append((changeset, seconds, counters))
+    return results
+
+
+def clearDatabase(session, batch_size=10000):
+    """Remove every node (MDB content and Liquibase history). Connect with scratchUri."""
+    while True:
+        deleted = session.run(
+            "MATCH (n) WITH n LIMIT $limit DETACH DELETE n RETURN count(*) AS n",
+            limit=batch_size).single()["n"]
+        if not deleted:
+            break
+
+
+def applySetup(session, changesets):
+    """
+    Apply schema changeSets (mdb_setup_changelog.xml) to a scratch database
+    without history. Index/constraint statements that already exist or that
+    the server edition rejects are reported and skipped.
+    """
+    for changeset in changesets:
+        try:
+            applyChangeset(session, changeset)
+        except ClientError as e:
+            if ".Schema." not in (e.code or ""):
+                raise
+            print("setup changeSet {} skipped: {}".format(changeset.id, e.code))
+
+
+def explainStatement(session, statement):
+    """The plan Neo4j would run statement with (EXPLAIN; nothing is executed)."""
+    return session.run("EXPLAIN " + statement).consume().plan
+
+
+def planOperators(plan):
+    """Flatten a plan tree into (operator, arguments) pairs, root first."""
+    if not plan:
+        return []
+    args = plan.get("args") or plan.get("arguments") or {}
+    # 4.x/5.x operator names carry a runtime suffix, e.g. AllNodesScan@neo4j
+    operators = [(plan["operatorType"].split("@")[0], args)]
+    for child in plan.get("children", []):
+        operators.extend(planOperators(child))
+    return operators
@@ -0,0 +1,143 @@
+"""
+Apply a set of changelogs concurrently where their dependency graph allows.
+
+changelog_dag.buildDag works out which changelogs share entities; a
+changelog starts as soon as every earlier changelog it depends on has
+finished, with at most --workers running at once, each in its own session
+from one driver pool. ChangeSets within a changelog run in order, with the
+same per-changeSet transaction, runAlways/runOnChange handling and
+__LiquibaseChangeSet history as neo4j_db.applyChangelog, under one
+deploymentId for the whole load. Changelog paths are recorded relative to
+--search-path, as Liquibase does, so a later `liquibase update` skips
+what was loaded here.
+
+If a changelog fails, the changelogs that depend on it are skipped and
+the rest still run.
+
+With --bulk the add-nanoid-property trigger is paused for the load and one
+batched backfill-and-verify pass (bulk_load.py) gives the new nodes their
+nanoids afterwards.
+
+  python scripts/parallel_load.py changelogs --workers 4 --search-path . --output load.json
+  python scripts/parallel_load.py changelogs --plan      # print the schedule only
+  python scripts/parallel_load.py changelogs --bulk      # trigger paused, nanoids backfilled after
+"""
+import json
+import time
+import argparse
+import traceback
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from bulk_load import printReport as printNanoidReport, triggerPaused, verifyNanoids
+from changelog import changelogFiles, iterChangesets
+from changelog_dag import buildDag, levels
+from neo4j_db import ChangelogHistory, applyChangelog, changelogPath, getDriver
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="load MDB changelogs concurrently along their dependency graph")
+    parser.add_argument("changelog_dir", help="directory holding the changelogs (e.g. changelogs)")
+    parser.add_argument("--extra", action="append", default=[], help="additional changelog, loaded last (repeatable)")
+    parser.add_argument("--workers", type=int, default=4, help="changelogs applied at once (default 4)")
+    parser.add_argument("--search-path", default=".",
+                        help="Liquibase search path; history records changelog paths relative to it (default: .)")
+    parser.add_argument("--plan", action="store_true", help="print the dependency levels and exit")
+    parser.add_argument("--bulk", action="store_true",
+                        help="pause the nanoid trigger during the load, then backfill and verify nanoids")
+    parser.add_argument("--output", help="write per-changelog timings as JSON to this file")
+    parser.add_argument("--uri")
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    return parser.parse_args()
+
+
+def loadChangelog(driver, file_name, history, search_path, start):
+    began = time.perf_counter()
+    with driver.session() as session:
+        results = applyChangelog(session, iterChangesets(file_name),
+                                 changelog=changelogPath(file_name, search_path), history=history)
+    finished = time.perf_counter()
+    return {
+        "changesets": len(results),
+        "started": began - start,
+        "seconds": finished - began,
+        "transaction_seconds": sum(r[1] for r in results),
+    }
+
+
+def runDag(driver, dag, workers=4, search_path="."):
+    """Apply the changelogs of dag; returns ({changelog: status and timing}, wall clock seconds)."""
+    start = time.perf_counter()
+    with driver.session() as session:
+        history = ChangelogHistory(session)
+    report = {}
+    waiting = dict(dag)
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while waiting or running:
+            for file_name, deps in list(waiting.items()):
+                failed = [d for d in deps if report.get(d, {}).get("status") in ("failed", "skipped")]
+                if failed:
+                    report[file_name] = {"status": "skipped", "after": failed}
+                    del waiting[file_name]
+                elif all(report.get(d, {}).get("status") == "done" for d in deps) and len(running) < workers:
+                    running[pool.submit(loadChangelog, driver, file_name, history, search_path, start)] = file_name
+                    del waiting[file_name]
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_name = running.pop(future)
+                try:
+                    report[file_name] = dict(future.result(), status="done")
+                except Exception:
+                    report[file_name] = {"status": "failed", "error": traceback.format_exc(limit=1)}
+    return report, time.perf_counter() - start
+
+
+def printReport(report, total):
+    print("{:60} {:>8} {:>10} {:>9} {:>9}".format("changelog", "status", "changeSets", "start s", "seconds"))
+    for file_name, entry in sorted(report.items(), key=lambda e: e[1].get("started", float("inf"))):
+        print("{:60} {:>8} {:>10} {:>9} {:>9}".format(
+            file_name[-60:], entry["status"], entry.get("changesets", ""),
+            "{:.1f}".format(entry["started"]) if "started" in entry else "",
+            "{:.1f}".format(entry["seconds"]) if "seconds" in entry else ""))
+        if entry["status"] == "failed":
+            print("    " + entry["error"].strip().replace("\n", "\n    "))
+    serial = sum(e.get("seconds", 0) for e in report.values())
+    print("wall clock {:.1f}s, sum of changelog times {:.1f}s ({:.1f}x)".format(
+        total, serial, serial / total if total else 0))
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    files = changelogFiles(args.changelog_dir) + args.extra
+    dag = buildDag(files)
+    if args.plan:
+        for depth, group in enumerate(levels(dag)):
+            print("level {}:".format(depth))
+            for file_name in group:
+                print("  " + file_name)
+        raise SystemExit(0)
+    driver = getDriver(args.uri, args.user, args.password, max_connection_pool_size=args.workers + 1)
+    nanoids = None
+    try:
+        with triggerPaused(driver) if args.bulk else nullcontext():
+            report, total = runDag(driver, dag, args.workers, args.search_path)
+        if args.bulk:
+            with driver.session() as session:
+                nanoids = verifyNanoids(session)
+    finally:
+        driver.close()
+    printReport(report, total)
+    if nanoids is not None:
+        printNanoidReport(nanoids)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump({"workers": args.workers, "seconds": total, "changelogs": report, "nanoids": nanoids},
+                      fp, indent=2)
+    if any(e["status"] != "done" for e in report.values()):
+        raise SystemExit(1)
+    if nanoids and (nanoids["missing"] or nanoids["duplicates"]):
+        raise SystemExit(1)
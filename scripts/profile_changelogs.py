@@ -0,0 +1,268 @@
+"""
+Profile a Liquibase update changeSet by changeSet and report the hotspots.
+
+Wraps the update command (everything after --), then reads the deployment
+it wrote from the Liquibase history: liquibase-neo4j stamps each
+changeSet's IN_CHANGELOG relationship with dateExecuted and orderExecuted,
+so a changeSet's wall time is the gap to the changeSet executed before it
+(the first one is timed from the start of the command). Without a command,
+the latest deployment in the history is profiled, or --deployment.
+
+A sample of the executed changeSets -- the --slowest slowest plus a
+--sample fraction of the rest -- is run again under PROFILE in a
+transaction that is rolled back, for the db hits of each statement and
+whether its plan scans all nodes. This happens after the update, so
+MERGEs match what the update created; db hits show how a statement finds
+its nodes, not what it wrote.
+
+Times and db hits are aggregated by changelog, by statement shape (CREATE
+node, MERGE rel, mapping MERGE, ...; label-less lookups are marked) and by
+label, ranked by total time, and written as JSON with --output.
+
+  python scripts/profile_changelogs.py changelogs --output profile.json -- \
+    liquibase --changelog-file changelogs/mappings/DSS/dss_map_changelog.xml update
+  python scripts/profile_changelogs.py changelogs --deployment 9176541234 --sample 0.1
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+from collections import defaultdict
+
+from changelog import changelogFiles, iterChangesets
+from cypher import _NODE_PATTERN, isSchemaStatement, maskStrings, parseStatement
+from rewrite_mapping_changelog import anonymousEndpoints
+
+LATEST_DEPLOYMENT = """
+MATCH (cs:__LiquibaseChangeSet)-[r:IN_CHANGELOG]->()
+RETURN cs.deploymentId AS deployment ORDER BY r.orderExecuted DESC LIMIT 1
+"""
+DEPLOYMENT = """
+MATCH (cs:__LiquibaseChangeSet {deploymentId: $deployment})-[r:IN_CHANGELOG]->()
+RETURN cs.changeLog AS changelog, cs.id AS id, cs.author AS author, r.orderExecuted AS order,
+       r.dateExecuted.epochMillis AS executed
+ORDER BY r.orderExecuted
+"""
+SHAPES = {
+    "create_node": "CREATE node",
+    "merge_node": "MERGE node",
+    "merge_edge": "MERGE rel",
+    "delete_node": "DELETE node",
+    "delete_edge": "DELETE rel",
+}
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="per-changeSet profile of a Liquibase update")
+    parser.add_argument("changelog_dir", help="directory holding the changelogs (e.g. changelogs)")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="-- update command to run and profile")
+    parser.add_argument("--search-path", default=".",
+                        help="Liquibase search path the history records changelog paths relative to (default: .)")
+    parser.add_argument("--deployment", help="profile this deployment id instead of the latest")
+    parser.add_argument("--slowest", type=int, default=20, help="slowest changeSets to PROFILE (default 20)")
+    parser.add_argument("--sample", type=float, default=0.02,
+                        help="fraction of the other changeSets to PROFILE (default 0.02)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the PROFILE sample")
+    parser.add_argument("--top", type=int, default=15, help="rows per ranking (default 15)")
+    parser.add_argument("--output", help="write the profile as JSON to this file")
+    parser.add_argument("--uri")
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    args = parser.parse_args()
+    if args.command and args.command[0] == "--":
+        args.command = args.command[1:]
+    return args
+
+
+### Classifying ###############################################################
+
+def statementShape(text):
+    """Shape of a statement: a recognized changelog shape, mapping MERGE, schema or other."""
+    if isSchemaStatement(text):
+        return "schema"
+    stmt = parseStatement(text)
+    if stmt is not None:
+        return SHAPES.get(stmt.kind, stmt.kind)
+    shape = "mapping MERGE" if text.lstrip().upper().startswith("WITH") else "other"
+    if anonymousEndpoints(text):
+        shape += " (label-less MATCH)"
+    return shape
+
+
+def statementLabels(text):
+    """Labels of the node patterns in a statement, in order, or ["(none)"]."""
+    stmt = parseStatement(text)
+    if stmt is not None and stmt.kind != "empty":
+        if stmt.node is not None:
+            return [stmt.node.label]
+        return [":" + stmt.rel_type]
+    labels = []
+    for m in _NODE_PATTERN.finditer(maskStrings(text)):
+        for label in m.group(2).replace(" ", "").split(":"):
+            if label and label not in labels:
+                labels.append(label)
+    return labels or ["(none)"]
+
+
+### Profiling #################################################################
+
+def deploymentTimes(session, deployment, started_ms=None):
+    """[(changelog, id, author, seconds)] in execution order for one deployment."""
+    rows = list(session.run(DEPLOYMENT, deployment=deployment))
+    if started_ms is not None and rows and rows[-1]["executed"] < started_ms:
+        return []  # the latest deployment predates the command: it executed nothing
+    times = []
+    previous = started_ms
+    for r in rows:
+        # clocks of this host and the server may differ by a little
+        seconds = max(0.0, (r["executed"] - previous) / 1000) if previous is not None else None
+        times.append((r["changelog"], r["id"], r["author"], seconds))
+        previous = r["executed"]
+    return times
+
+
+def profileDbHits(profile):
+    """db hits summed over a PROFILE plan tree."""
+    if not profile:
+        return 0
+    return (profile.get("dbHits") or 0) + sum(profileDbHits(c) for c in profile.get("children", []))
+
+
+def profileStatement(session, statement):
+    """(db hits, operators) of statement under PROFILE, rolled back."""
+    from neo4j_db import planOperators
+    tx = session.begin_transaction()
+    try:
+        profile = tx.run("PROFILE " + statement).consume().profile
+    finally:
+        tx.rollback()
+    return profileDbHits(profile), [op for op, _ in planOperators(profile)]
+
+
+def pickSample(entries, slowest, fraction, seed=0):
+    """Indexes of entries to PROFILE: the slowest ones plus a random fraction of the rest."""
+    timed = sorted((i for i, e in enumerate(entries) if e["seconds"] is not None),
+                   key=lambda i: entries[i]["seconds"], reverse=True)
+    picked = set(timed[:slowest])
+    rng = random.Random(seed)
+    picked.update(i for i in range(len(entries)) if i not in picked and rng.random() < fraction)
+    return sorted(picked)
+
+
+def profileDeployment(session, times, changesets, slowest=20, fraction=0.02, seed=0):
+    """Per-changeSet entries with shape, labels, seconds and, for the sample, db hits."""
+    entries = []
+    for changelog, cs_id, author, seconds in times:
+        changeset = changesets.get((changelog, cs_id, author))
+        stmts = [s for s in (changeset.cypher if changeset else []) if s and s != "empty"]
+        entries.append({
+            "changelog": changelog, "id": cs_id, "author": author, "seconds": seconds,
+            "shape": statementShape(stmts[0]) if stmts else "unknown",
+            "labels": statementLabels(stmts[0]) if stmts else ["(none)"],
+            "db_hits": None, "all_nodes_scan": None,
+        })
+    for i in pickSample(entries, slowest, fraction, seed):
+        entry = entries[i]
+        changeset = changesets.get((entry["changelog"], entry["id"], entry["author"]))
+        if changeset is None or entry["shape"] == "schema":
+            continue
+        entry["db_hits"], entry["all_nodes_scan"] = 0, False
+        for stmt in changeset.cypher:
+            if not stmt or stmt == "empty":
+                continue
+            hits, operators = profileStatement(session, stmt)
+            entry["db_hits"] += hits
+            entry["all_nodes_scan"] = entry["all_nodes_scan"] or "AllNodesScan" in operators
+    return entries
+
+
+### Reporting #################################################################
+
+def aggregate(entries, key):
+    """{group: totals} over entries, grouped by key(entry) (a list of groups per entry)."""
+    groups = defaultdict(lambda: {"changesets": 0, "seconds": 0.0, "max_seconds": 0.0,
+                                  "profiled": 0, "db_hits": 0, "all_nodes_scans": 0})
+    for entry in entries:
+        for group in key(entry):
+            g = groups[group]
+            g["changesets"] += 1
+            g["seconds"] += entry["seconds"] or 0
+            g["max_seconds"] = max(g["max_seconds"], entry["seconds"] or 0)
+            if entry["db_hits"] is not None:
+                g["profiled"] += 1
+                g["db_hits"] += entry["db_hits"]
+                g["all_nodes_scans"] += int(entry["all_nodes_scan"])
+    for g in groups.values():
+        g["seconds"] = round(g["seconds"], 3)
+        g["mean_ms"] = round(1000 * g["seconds"] / g["changesets"], 1)
+        g["db_hits_per_changeset"] = round(g["db_hits"] / g["profiled"]) if g["profiled"] else None
+    return dict(sorted(groups.items(), key=lambda kv: kv[1]["seconds"], reverse=True))
+
+
+def buildReport(deployment, entries):
+    return {
+        "deployment": deployment,
+        "changesets": len(entries),
+        "seconds": round(sum(e["seconds"] or 0 for e in entries), 3),
+        "by_changelog": aggregate(entries, lambda e: [e["changelog"]]),
+        "by_shape": aggregate(entries, lambda e: [e["shape"]]),
+        "by_label": aggregate(entries, lambda e: e["labels"]),
+        "entries": entries,
+    }
+
+
+def printReport(report, top=15):
+    print("deployment {}: {} changeSets, {:.1f}s".format(report["deployment"], report["changesets"], report["seconds"]))
+    print("\nslowest changeSets")
+    print("{:>9} {:>12} {:40} {:25} {}".format("ms", "db hits", "changelog", "shape", "id"))
+    slowest = sorted(report["entries"], key=lambda e: e["seconds"] or 0, reverse=True)[:top]
+    for e in slowest:
+        print("{:>9.1f} {:>12} {:40} {:25} {}{}".format(
+            1000 * (e["seconds"] or 0), "-" if e["db_hits"] is None else e["db_hits"], e["changelog"][-40:],
+            e["shape"][:25], e["id"], "  AllNodesScan" if e["all_nodes_scan"] else ""))
+    for title, key in (("changelog", "by_changelog"), ("shape", "by_shape"), ("label", "by_label")):
+        print("\nby {}".format(title))
+        print("{:40} {:>10} {:>10} {:>9} {:>9} {:>14}".format(
+            title, "changeSets", "seconds", "mean ms", "max ms", "db hits/cs"))
+        for group, g in list(report[key].items())[:top]:
+            print("{:40} {:>10} {:>10.2f} {:>9} {:>9.0f} {:>14}".format(
+                group[-40:], g["changesets"], g["seconds"], g["mean_ms"], 1000 * g["max_seconds"],
+                "-" if g["db_hits_per_changeset"] is None else g["db_hits_per_changeset"]))
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    from neo4j_db import changelogPath, getDriver
+    started_ms = None
+    if args.command:
+        started_ms = int(time.time() * 1000)
+        status = subprocess.run(args.command).returncode
+        if status:
+            print("update command exited {}; profiling what it executed".format(status), file=sys.stderr)
+    changesets = {}
+    for file_name in changelogFiles(args.changelog_dir):
+        path = changelogPath(file_name, args.search_path)
+        for changeset in iterChangesets(file_name):
+            changesets[(path, changeset.id, changeset.author)] = changeset
+    driver = getDriver(args.uri, args.user, args.password)
+    try:
+        with driver.session() as session:
+            deployment = args.deployment
+            if deployment is None:
+                record = session.run(LATEST_DEPLOYMENT).single()
+                deployment = record and record["deployment"]
+            if deployment is None:
+                raise SystemExit("no deployment in the Liquibase history")
+            times = deploymentTimes(session, deployment, started_ms)
+            if not times:
+                raise SystemExit("the update executed no changeSets")
+            entries = profileDeployment(session, times, changesets, args.slowest, args.sample, args.seed)
+    finally:
+        driver.close()
+    report = buildReport(deployment, entries)
+    printReport(report, args.top)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
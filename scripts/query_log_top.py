@@ -0,0 +1,156 @@
+"""
+Aggregate slow queries into statement shapes and print the top ones.
+
+Reads either of
+  - the "slow_query" JSON lines of the Neo4j metrics container
+    (devops/dockerfiles/sts/app/neo4j_metrics.py, [neo4j] metrics in
+    devops/awscdk), as exported from CloudWatch or from docker compose logs;
+    anything before the JSON on a line (a log prefix) is ignored;
+  - a Neo4j Enterprise query.log ([neo4j] metrics sets its threshold and
+    parameter logging), including queries that span several lines.
+A statement's shape is its text with string and number literals replaced
+by ? and whitespace collapsed, so the same query with literal values
+inlined counts once; queries with parameters already share a shape.
+Shapes are ranked by --sort (default total time), with count, total,
+p95 and max ms, wait and planning ms where the source has them, and
+page faults with the page cache hit ratio.
+
+  python scripts/query_log_top.py metrics.log --top 20
+  docker compose -f scripts/docker-compose.yml logs --no-log-prefix neo4j-metrics | python scripts/query_log_top.py -
+"""
+import re
+import sys
+import json
+import argparse
+
+from bolt_latency import percentile
+from cypher import _STRING
+
+SORTS = ("total_ms", "p95_ms", "max_ms", "count", "page_faults")
+# 2024-05-01 12:00:00.123+0000 INFO  id:12 - 1523 ms: (planning: 10, cpu: 1400, waiting: 0) - 120 page hits, 30 page faults - ...
+_QUERY_LOG = re.compile(
+    r"^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\S*\s+\w+\s+(?:id:\d+ - )?(?P<elapsed>\d+) ms: "
+    r"(?:\(planning: (?P<planning>\d+)(?:, cpu: (?P<cpu>\d+))?, waiting: (?P<wait>\d+)\) - )?"
+    r"(?:(?P<bytes>\d+) B - )?(?:(?P<hits>\d+) page hits, (?P<faults>\d+) page faults - )?(?P<rest>.*)$", re.S)
+_TIMESTAMP = re.compile(r"^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d")
+_NUMBER = re.compile(r"(?<![\w$`.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_LIST = re.compile(r"\[\s*\?(?:\s*,\s*\?)*\s*\]")
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="top slow statement shapes from the Neo4j metrics container or query.log")
+    parser.add_argument("files", nargs="+", help="log files; - for stdin")
+    parser.add_argument("--top", type=int, default=10, help="shapes to show (default 10)")
+    parser.add_argument("--sort", choices=SORTS, default="total_ms")
+    parser.add_argument("--min-ms", type=int, default=0, help="leave out queries faster than this")
+    parser.add_argument("--width", type=int, default=100, help="characters of each shape to print (default 100)")
+    parser.add_argument("--output", help="write all shapes as JSON to this file")
+    return parser.parse_args()
+
+
+### Parsing ###################################################################
+
+def queryLogRecord(entry):
+    """A record from one query.log entry, or None for other lines (e.g. Query started)."""
+    m = _QUERY_LOG.match(entry)
+    if not m or "Query started:" in m.group("rest"):
+        return None
+    # <session>\t<database> - <user> - <query> - <parameters> - runtime=<runtime> - <metadata>
+    parts = m.group("rest").split(" - ")
+    runtime = [i for i, p in enumerate(parts) if p.startswith("runtime=")]
+    end = runtime[-1] - 1 if runtime else len(parts) - 2
+    if end <= 2:
+        return None
+    number = lambda name: int(m.group(name)) if m.group(name) is not None else None
+    return {"query": " - ".join(parts[2:end]), "elapsed_ms": int(m.group("elapsed")),
+            "planning_ms": number("planning"), "cpu_ms": number("cpu"), "wait_ms": number("wait"),
+            "page_hits": number("hits"), "page_faults": number("faults")}
+
+
+def readRecords(lines):
+    """Slow query records from metrics container JSON lines and query.log entries, in any mix."""
+    entry = None
+    for line in lines:
+        line = line.rstrip("\n")
+        start = line.find("{")
+        record = None
+        if start >= 0 and '"slow_query"' in line:
+            try:
+                record = json.loads(line[start:])
+            except ValueError:
+                pass
+        if isinstance(record, dict) and record.get("type") == "slow_query":
+            yield record
+        elif _TIMESTAMP.match(line):
+            if entry is not None:
+                yield from filter(None, [queryLogRecord(entry)])
+            entry = line
+        elif entry is not None:
+            # a query.log query continues on the next lines
+            entry += "\n" + line
+    if entry is not None:
+        yield from filter(None, [queryLogRecord(entry)])
+
+
+### Shapes ####################################################################
+
+def statementShape(query):
+    """The query with string and number literals as ? and whitespace collapsed."""
+    shape = _STRING.sub("?", query)
+    shape = _NUMBER.sub("?", shape)
+    shape = _LIST.sub("[?]", shape)
+    return re.sub(r"\s+", " ", shape).strip()
+
+
+def total(records, field):
+    values = [r.get(field) for r in records if r.get(field) is not None]
+    return sum(values) if values else None
+
+
+def summarizeShape(shape, records):
+    elapsed = [r["elapsed_ms"] for r in records]
+    hits, faults = total(records, "page_hits"), total(records, "page_faults")
+    return {
+        "shape": shape, "count": len(records), "total_ms": sum(elapsed),
+        "p95_ms": percentile(elapsed, 95), "max_ms": max(elapsed),
+        "wait_ms": total(records, "wait_ms"), "planning_ms": total(records, "planning_ms"),
+        "page_faults": faults,
+        "page_hit_ratio": round(hits / (hits + faults), 4) if hits is not None and faults is not None and hits + faults else None,
+    }
+
+
+def topShapes(records, sort="total_ms", min_ms=0):
+    """All shapes, slowest by sort first."""
+    shapes = {}
+    for r in records:
+        if r.get("query") and (r.get("elapsed_ms") or 0) >= min_ms:
+            shapes.setdefault(statementShape(r["query"]), []).append(r)
+    summaries = [summarizeShape(shape, rs) for shape, rs in shapes.items()]
+    return sorted(summaries, key=lambda s: s[sort] or 0, reverse=True)
+
+
+def printReport(shapes, width):
+    print("{:>6} {:>10} {:>8} {:>8} {:>8} {:>8} {:>8} {:>6}  {}".format(
+        "count", "total ms", "p95 ms", "max ms", "wait ms", "plan ms", "faults", "hit %", "shape"))
+    blank = lambda v: "" if v is None else v
+    for s in shapes:
+        print("{:>6} {:>10} {:>8} {:>8} {:>8} {:>8} {:>8} {:>6}  {}".format(
+            s["count"], s["total_ms"], s["p95_ms"], s["max_ms"], blank(s["wait_ms"]), blank(s["planning_ms"]),
+            blank(s["page_faults"]), "" if s["page_hit_ratio"] is None else round(100 * s["page_hit_ratio"], 1),
+            s["shape"][:width]))
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    records = []
+    for path in args.files:
+        if path == "-":
+            records.extend(readRecords(sys.stdin))
+        else:
+            with open(path) as fp:
+                records.extend(readRecords(fp))
+    shapes = topShapes(records, args.sort, args.min_ms)
+    printReport(shapes[:args.top], args.width)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(shapes, fp, indent=2)
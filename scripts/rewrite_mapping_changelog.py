@@ -0,0 +1,309 @@
+"""
+Rewrite mapping changelog statements so every lookup can use an index.
+
+bento-meta writes the parent of a mapped property without a label:
+
+  MATCH (n2 {handle:'administrative',model:'DSS'})-[:has_property]->(n0:property {...})
+
+This pass
+- labels anonymous endpoints. Candidate labels come from the relationship
+  ends in docs/metamodel.yaml (REL_ENDS) and are narrowed to the label the
+  model changelogs create for that (model, handle). Endpoints whose model is
+  not in this repository keep a label predicate in WHERE instead
+  (`WHERE (n2:node OR n2:relationship)`);
+- hoists string literals into a leading `WITH {...} AS p` map and renumbers
+  variables, so every changeSet generated from the same template has the
+  same statement text. liquibase-neo4j cannot bind query parameters; with
+  the literals in one map, Neo4j's literal extraction plans the template
+  once instead of once per changeSet.
+
+Rewritten statements change the changeSet checksums; tiers that already ran
+the changelog need `liquibase clear-checksums` before the next update.
+
+  python scripts/rewrite_mapping_changelog.py changelogs/mappings/DSS/dss_map_changelog.xml --in-place
+  python scripts/rewrite_mapping_changelog.py changelogs/mappings/*/*.xml --lint
+"""
+import os
+import re
+import glob
+import argparse
+from collections import defaultdict
+
+from changelog import Changeset, iterChangesets, readChangelogId, writeChangelog
+from cypher import _CLAUSE, _NODE_PATTERN, _STRING, CypherParseError, _Scanner, formatMap, isSchemaStatement, maskStrings, parseStatement
+
+DEFAULT_MODELS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "changelogs", "models", "*", "*.xml")
+
+# Relationship ends from docs/metamodel.yaml: type -> (source labels, destination labels)
+REL_ENDS = {
+    "has_concept": ({"node", "property", "relationship", "value_set", "predicate"}, {"concept"}),
+    "has_origin": ({"term", "value_set"}, {"origin"}),
+    "has_model": ({"node", "relationship", "property"}, {"model"}),
+    "has_src": ({"relationship"}, {"node"}),
+    "has_dst": ({"relationship"}, {"node"}),
+    "has_property": ({"node", "relationship"}, {"property"}),
+    "has_value_set": ({"property"}, {"value_set"}),
+    "has_term": ({"value_set"}, {"term"}),
+    "has_tag": ({"node", "relationship", "property", "concept", "term", "value_set", "origin", "model"}, {"tag"}),
+    "represents": ({"term"}, {"concept"}),
+    "has_subject": ({"predicate"}, {"concept"}),
+    "has_object": ({"predicate"}, {"concept"}),
+}
+
+PARAMS = "p"
+_VARIABLE = re.compile(r"(?<![\w.$])([nr])(\d+)\b")
+_PROP_VALUE = re.compile(r"(\w+)\s*:\s*('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|" + PARAMS + r"\.\w+)")
+_REL_AFTER = re.compile(r"\s*(<)?-\[\s*\w*\s*:\s*(\w+)[^\]]*\]-(>)?")
+_REL_BEFORE = re.compile(r"(<)?-\[\s*\w*\s*:\s*(\w+)[^\]]*\]-(>)?\s*$")
+_LITERAL_KEY = re.compile(r"(?:(\w+)\s*:|\.(\w+)\s*(?:=|<>|IN\b))\s*$", re.I)
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="label anonymous lookups and parameterize mapping changelogs")
+    parser.add_argument("changelogs", nargs="+", help="changelogs to rewrite or lint")
+    parser.add_argument("--output", help="write the rewritten changelog here (single input only)")
+    parser.add_argument("--in-place", action="store_true", help="rewrite the input changelogs in place")
+    parser.add_argument("--lint", action="store_true",
+                        help="report statements the rewrite would change and exit 1 if there are any")
+    parser.add_argument("--models", action="append",
+                        help="model changelog(s) used to resolve labels (glob, repeatable; default changelogs/models/*/*.xml)")
+    parser.add_argument("--no-parameterize", action="store_true", help="only add labels")
+    return parser.parse_args()
+
+
+def modelLabels(files):
+    """{(model, handle): set of labels} for entities the model changelogs create."""
+    labels = defaultdict(set)
+    for file_name in files:
+        for changeset in iterChangesets(file_name):
+            for stmt in changeset.cypher:
+                parsed = parseStatement(stmt)
+                if parsed is None or parsed.kind not in ("create_node", "merge_node"):
+                    continue
+                props = parsed.node.props
+                if "handle" in props and "model" in props:
+                    labels[(props["model"], props["handle"])].add(parsed.node.label)
+    return labels
+
+
+def _clauses(masked):
+    """[(start, end, name)] for each clause of a masked statement."""
+    found = [(m.start(), re.sub(r"\s+", " ", m.group(1).upper())) for m in _CLAUSE.finditer(masked)]
+    return [(start, found[i + 1][0] if i + 1 < len(found) else len(masked), name)
+            for i, (start, name) in enumerate(found)]
+
+
+def _propValues(props_text, params):
+    """Literal values of a node property map, resolving p.x references through params."""
+    values = {}
+    for key, value in _PROP_VALUE.findall(props_text or ""):
+        if value.startswith(PARAMS + "."):
+            values[key] = params.get(value[len(PARAMS) + 1:])
+        else:
+            values[key] = _Scanner(value).string()
+    return values
+
+
+def candidateLabels(masked, m):
+    """Labels the metamodel allows for the node pattern m, from its adjacent relationships."""
+    candidates = None
+    ends = []
+    after = _REL_AFTER.match(masked, m.end())
+    if after:
+        ends.append((after.group(2), after.group(1), after.group(3)))
+    before = _REL_BEFORE.search(masked, 0, m.start())
+    if before:
+        # seen from the node, an arrow into it makes it the destination
+        ends.append((before.group(2), before.group(3), before.group(1)))
+    for rel_type, incoming, outgoing in ends:
+        if rel_type not in REL_ENDS:
+            continue
+        src, dst = REL_ENDS[rel_type]
+        allowed = dst if incoming and not outgoing else src if outgoing and not incoming else src | dst
+        candidates = allowed if candidates is None else candidates & allowed
+    return candidates or set()
+
+
+def anonymousEndpoints(text):
+    """
+    Unlabeled, previously unbound node patterns with a property map in a
+    MATCH/OPTIONAL MATCH/MERGE clause, as (match, clause) pairs. Nodes already
+    constrained by a label predicate in their clause's WHERE are left out.
+    """
+    masked = maskStrings(text)
+    clauses = _clauses(masked)
+    found, seen = [], set()
+    for m in _NODE_PATTERN.finditer(masked):
+        var, labels, props = m.group(1), m.group(2), m.group(3)
+        clause = next((c for c in clauses if c[0] <= m.start() < c[1]), None)
+        bound = var in seen
+        if var:
+            seen.add(var)
+        if clause is None or clause[2] not in ("MATCH", "OPTIONAL MATCH", "MERGE"):
+            continue
+        if labels.strip() or not props or bound:
+            continue
+        where = _where(clauses, clause)
+        if var and where and re.search(r"\b{}:\w+".format(var), masked[where[0]:where[1]]):
+            continue
+        found.append((m, clause))
+    return found
+
+
+def _where(clauses, clause):
+    return next((c for c in clauses if c[0] == clause[1] and c[2] == "WHERE"), None)
+
+
+def labelEndpoints(text, model_labels, params=None):
+    """
+    Add labels to anonymous endpoints. Returns (text, labelled, unresolved)
+    where unresolved counts endpoints given a WHERE label predicate instead.
+    """
+    masked = maskStrings(text)
+    clauses = _clauses(masked)
+    edits = []
+    predicates = defaultdict(list)
+    labelled = unresolved = 0
+    for m, clause in anonymousEndpoints(text):
+        var = m.group(1)
+        candidates = candidateLabels(masked, m)
+        props = _propValues(text[m.start(3):m.end(3)], params or {})
+        known = model_labels.get((props.get("model"), props.get("handle")), set())
+        resolved = candidates & known if candidates else known
+        if len(resolved) != 1 and len(candidates) == 1:
+            resolved = candidates
+        if len(resolved) == 1:
+            at = m.end(1) if var else m.start() + 1
+            edits.append((at, at, ":" + next(iter(resolved))))
+            labelled += 1
+        elif var and candidates:
+            predicates[clause].append("({})".format(" OR ".join("{}:{}".format(var, l) for l in sorted(candidates))))
+            unresolved += 1
+    for clause, preds in predicates.items():
+        condition = " AND ".join(preds)
+        where = _where(clauses, clause)
+        if where:
+            start = where[0] + len("WHERE")
+            edits.append((start, where[1], " {} AND ({}) ".format(condition, text[start:where[1]].strip())))
+        else:
+            at = clause[1]
+            edits.append((at, at, "WHERE {} ".format(condition) if at < len(text) else " WHERE " + condition))
+    for start, end, new in sorted(edits, reverse=True):
+        text = text[:start] + new + text[end:]
+    return text.strip(), labelled, unresolved
+
+
+def paramValues(text):
+    """The leading `WITH {...} AS p` map of a parameterized statement, else None."""
+    s = _Scanner(text)
+    try:
+        if s.keyword("WITH") and s.peek("{"):
+            params = s.map()
+            if s.keyword("AS") and s.ident() == PARAMS:
+                return params
+    except CypherParseError:
+        pass
+    return None
+
+
+def parameterize(text):
+    """
+    Hoist string literals into a leading `WITH {...} AS p` map and renumber
+    n/r variables in order of appearance. Returns text unchanged if it is
+    already parameterized or has no string literals.
+    """
+    if paramValues(text) is not None or re.search(r"(?<![\w.$]){}\b".format(PARAMS), maskStrings(text)):
+        return text
+    literals = list(_STRING.finditer(text))
+    if not literals:
+        return text
+    masked = maskStrings(text)
+    params, counts, parts, last = {}, defaultdict(int), [], 0
+    for lit in literals:
+        key = _LITERAL_KEY.search(masked, 0, lit.start())
+        base = (key.group(1) or key.group(2)) if key else "v"
+        name = "{}{}".format(base, counts[base])
+        counts[base] += 1
+        params[name] = _Scanner(lit.group(0)).string()
+        parts.append(text[last:lit.start()] + "{}.{}".format(PARAMS, name))
+        last = lit.end()
+    body = "".join(parts) + text[last:]
+    numbers = {}
+
+    def renumber(m):
+        if m.group(0) not in numbers:
+            numbers[m.group(0)] = "{}{}".format(m.group(1), sum(1 for v in numbers if v[0] == m.group(1)))
+        return numbers[m.group(0)]
+
+    def carry(m):
+        # keep p in scope across WITH clauses (but not STARTS WITH / ENDS WITH)
+        if re.search(r"\b(STARTS|ENDS)\s*$", body[:m.start()], re.I):
+            return m.group(0)
+        return m.group(0) + PARAMS + ", "
+    body = _VARIABLE.sub(renumber, body)
+    body = re.sub(r"\bWITH\s+(DISTINCT\s+)?(?!\*)", carry, body, flags=re.I)
+    return "WITH {} AS {} {}".format(formatMap(params), PARAMS, body.strip())
+
+
+def rewriteStatement(text, model_labels, parameterize_literals=True):
+    """(new text, labelled, unresolved) for one statement."""
+    if not text or text == "empty" or isSchemaStatement(text):
+        return text, 0, 0
+    text, labelled, unresolved = labelEndpoints(text, model_labels, paramValues(text))
+    if parameterize_literals:
+        text = parameterize(text)
+    return text, labelled, unresolved
+
+
+def rewriteChangesets(changesets, model_labels, parameterize_literals=True, stats=None):
+    stats = stats if stats is not None else defaultdict(int)
+    for changeset in changesets:
+        cypher, rollback = [], []
+        for source, target in ((changeset.cypher, cypher), (changeset.rollback, rollback)):
+            for stmt in source:
+                new, labelled, unresolved = rewriteStatement(stmt, model_labels, parameterize_literals)
+                stats["labelled"] += labelled
+                stats["unresolved"] += unresolved
+                if new != stmt:
+                    stats["statements"] += 1
+                target.append(new)
+        yield Changeset(changeset.id, changeset.author, cypher, rollback, changeset.attrs, changeset.changelog)
+
+
+def lint(file_name, model_labels, parameterize_literals=True):
+    """Messages for every statement the rewrite would change."""
+    messages = []
+    for changeset in iterChangesets(file_name):
+        for stmt in changeset.cypher + changeset.rollback:
+            if not stmt or stmt == "empty" or isSchemaStatement(stmt):
+                continue
+            anonymous = anonymousEndpoints(stmt)
+            if anonymous:
+                messages.append("{}: changeSet {}: label-less lookup {}".format(
+                    file_name, changeset.id, ", ".join(m.group(0) for m, _ in anonymous)))
+            if parameterize_literals and parameterize(stmt) != stmt:
+                messages.append("{}: changeSet {}: literals not parameterized".format(file_name, changeset.id))
+    return messages
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    if args.output and len(args.changelogs) > 1:
+        raise SystemExit("--output takes a single input changelog")
+    model_files = [f for pattern in (args.models or [DEFAULT_MODELS]) for f in sorted(glob.glob(pattern))]
+    model_labels = modelLabels(model_files)
+    parameterize_literals = not args.no_parameterize
+    if args.lint:
+        messages = [msg for f in args.changelogs for msg in lint(f, model_labels, parameterize_literals)]
+        for msg in messages:
+            print(msg)
+        print("{} problem(s) in {} changelog(s)".format(len(messages), len(args.changelogs)))
+        raise SystemExit(1 if messages else 0)
+    if not (args.output or args.in_place):
+        raise SystemExit("one of --output, --in-place or --lint is required")
+    for file_name in args.changelogs:
+        stats = defaultdict(int)
+        changesets = list(rewriteChangesets(iterChangesets(file_name), model_labels, parameterize_literals, stats))
+        writeChangelog(args.output or file_name, changesets, readChangelogId(file_name))
+        print("{}: {} statements rewritten, {} endpoints labelled, {} left with a WHERE label predicate".format(
+            file_name, stats["statements"], stats["labelled"], stats["unresolved"]))
@@ -0,0 +1,177 @@
+"""
+Rewrite generated rollbacks to match on index keys.
+
+bento-meta's rollbacks re-match a created node on its whole property map,
+desc included:
+
+  MATCH (n0:node {handle:'program',model:'ICDC',desc:'Within the ...',_commit:'dc6d5b0...'}) DETACH DELETE n0
+
+Here the map is cut down to the first of ROLLBACK_KEYS the node has, as
+long as no other node the changelog creates with that label has the same
+values for them:
+
+  MATCH (n0:node {model:'ICDC',handle:'program',_commit:'dc6d5b0...'}) DETACH DELETE n0
+
+Endpoints of edge rollbacks are cut down the same way when they are nodes
+the changelog creates. Other rollbacks are left as they are. Liquibase
+leaves rollbacks out of a changeSet's checksum, so deployed changelogs can
+be rewritten, and rewritten again: a rollback already cut down to a nanoid
+is matched back to the node created with it.
+
+With --by-commit, the nodes a changelog CREATEs are instead removed in one
+batched delete per label and _commit (apoc.periodic.iterate, --batch-size
+nodes per transaction). That delete becomes the rollback of the changelog's
+first changeSet, which Liquibase rolls back last. The per-node rollbacks it
+replaces, and the edge rollbacks between those nodes, become `empty`.
+Rolling back the whole changelog then takes one pass per label instead of
+one statement per node. Use it only for changelogs that are rolled back as a
+whole, e.g. a model load. A partial rollback (rollbackCount) would remove
+the history of the rolled-back changeSets but leave their nodes.
+
+  python scripts/rewrite_rollbacks.py changelogs/models/ICDC/icdc_changelog_dc6d5b0.xml --in-place
+  python scripts/rewrite_rollbacks.py changelogs/models/ICDC/icdc_changelog_dc6d5b0.xml --by-commit --output /tmp/icdc.xml
+"""
+import argparse
+from collections import Counter, defaultdict
+
+from changelog import Changeset, iterChangesets, readChangelogId, writeChangelog
+from cypher import Entity, Statement, formatStatement, formatString, parseStatement
+
+# Key sets served by the indexes in mdb_setup_changelog.xml and the
+# mdb_index_changelog_*.xml changelogs, each with _commit so another version
+# of the model is never matched, even by a nanoid it shares.
+ROLLBACK_KEYS = [
+    ("nanoid", "_commit"),
+    ("model", "handle", "_commit"),
+    ("key", "value", "_commit"),
+    ("_id", "_commit"),
+]
+
+BATCH_DELETE = "CALL apoc.periodic.iterate(\"MATCH (n:{label}) WHERE n._commit = {commit} RETURN n\", " \
+               "\"DETACH DELETE n\", {{batchSize: {batch_size}}})"
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="rewrite changelog rollbacks to match on index keys")
+    parser.add_argument("changelog", help="changelog to rewrite")
+    parser.add_argument("--by-commit", action="store_true",
+                        help="roll back created nodes with one batched delete per label and _commit")
+    parser.add_argument("--batch-size", type=int, default=1000, help="nodes per transaction with --by-commit")
+    parser.add_argument("--output", help="write the rewritten changelog here")
+    parser.add_argument("--in-place", action="store_true", help="rewrite the changelog in place")
+    return parser.parse_args()
+
+
+def _project(props, keys):
+    return tuple(props[k] for k in keys)
+
+
+def createdNodes(changesets):
+    """Entities of the changelog's CREATE statements, in order."""
+    for changeset in changesets:
+        for stmt in changeset.cypher:
+            parsed = parseStatement(stmt)
+            if parsed is not None and parsed.kind == "create_node":
+                yield parsed.node
+
+
+class RollbackKeys:
+    """
+    Chooses the rollback key of each created node: the first key set of
+    ROLLBACK_KEYS the node has whose values no other created node of the
+    same label shares.
+    """
+    def __init__(self, created):
+        self.keys = {}
+        self.by_nanoid = {}
+        counts = Counter()
+        created = list(created)
+        for entity in created:
+            if "nanoid" in entity.props:
+                key = (entity.label, entity.props["nanoid"])
+                # a nanoid created twice can't be matched back to one node
+                self.by_nanoid[key] = None if key in self.by_nanoid else entity
+        for entity in created:
+            for keys in ROLLBACK_KEYS:
+                if all(k in entity.props for k in keys):
+                    counts[(entity.label, keys, _project(entity.props, keys))] += 1
+        for entity in created:
+            for keys in ROLLBACK_KEYS:
+                if all(k in entity.props for k in keys) and \
+                        counts[(entity.label, keys, _project(entity.props, keys))] == 1:
+                    self.keys[entity.key()] = keys
+                    break
+
+    def keyed(self, entity):
+        created = self.by_nanoid.get((entity.label, entity.props.get("nanoid")))
+        if set(entity.props) == {"nanoid"} and created is not None:
+            entity = Entity(entity.var, entity.label, created.props)
+        keys = self.keys.get(entity.key())
+        if keys is None:
+            return entity
+        return Entity(entity.var, entity.label, {k: entity.props[k] for k in keys})
+
+    def rollback(self, text):
+        stmt = parseStatement(text)
+        if stmt is None:
+            return text
+        if stmt.kind == "delete_node":
+            keyed = Statement("delete_node", node=self.keyed(stmt.node))
+        elif stmt.kind == "delete_edge":
+            keyed = Statement("delete_edge", src=self.keyed(stmt.src), dst=self.keyed(stmt.dst),
+                              rel_type=stmt.rel_type)
+        else:
+            return text
+        new = formatStatement(keyed)
+        return new if new != formatStatement(stmt) else text
+
+
+def commitDeletes(created, batch_size=1000):
+    """One batched DETACH DELETE per (label, _commit) of the created nodes, and the keys it covers."""
+    groups = defaultdict(set)
+    for entity in created:
+        if "_commit" in entity.props:
+            groups[(entity.label, entity.props["_commit"])].add(entity.key())
+    statements = [BATCH_DELETE.format(label=label, commit=formatString(commit), batch_size=batch_size)
+                  for label, commit in sorted(groups)]
+    covered = set().union(*groups.values()) if groups else set()
+    return statements, covered
+
+
+def rewriteRollbacks(changesets, by_commit=False, batch_size=1000, stats=None):
+    stats = stats if stats is not None else {}
+    changesets = list(changesets)
+    created = list(createdNodes(changesets))
+    keys = RollbackKeys(created)
+    batched, covered = commitDeletes(created, batch_size) if by_commit else ([], set())
+    # also recognize rollbacks that were already keyed
+    covered |= {keys.keyed(e).key() for e in created if e.key() in covered}
+    for i, changeset in enumerate(changesets):
+        rollback = []
+        for text in changeset.rollback:
+            stmt = parseStatement(text)
+            if stmt is not None and (stmt.kind == "delete_node" and stmt.node.key() in covered or
+                                     stmt.kind == "delete_edge" and stmt.src.key() in covered and
+                                     stmt.dst.key() in covered):
+                stats["batched"] = stats.get("batched", 0) + 1
+                rollback.append("empty")
+                continue
+            new = keys.rollback(text)
+            if new != text:
+                stats["keyed"] = stats.get("keyed", 0) + 1
+            rollback.append(new)
+        if i == 0 and batched:
+            rollback = [r for r in rollback if r != "empty" and r not in batched] + batched
+        yield Changeset(changeset.id, changeset.author, changeset.cypher, rollback, changeset.attrs,
+                        changeset.changelog)
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    if not (args.output or args.in_place):
+        raise SystemExit("one of --output or --in-place is required")
+    stats = {}
+    rewritten = list(rewriteRollbacks(iterChangesets(args.changelog), args.by_commit, args.batch_size, stats))
+    writeChangelog(args.output or args.changelog, rewritten, readChangelogId(args.changelog))
+    print("{}: {} rollbacks keyed on index keys, {} replaced by batched deletes".format(
+        args.changelog, stats.get("keyed", 0), stats.get("batched", 0)))
@@ -0,0 +1,125 @@
+"""
+Switch runAlways changeSets to runOnChange.
+
+A runAlways changeSet is executed on every `liquibase update`. A
+runOnChange changeSet is executed once and then only when its checksum
+changes, so an update runs only the mappings that were added or edited.
+Liquibase's checksum covers the statements, not the changeSet attributes, so
+tiers that already ran the changelog don't re-run anything after the switch.
+
+Only changeSets that can run twice may be switched. Pass the JSON report of
+verify_idempotency.py; changeSets it lists as idempotent are converted, the
+rest stay runAlways:
+
+  python scripts/verify_idempotency.py changelogs/mappings/DSS/dss_map_changelog.xml ... --output idempotency.json
+  python scripts/run_on_change.py changelogs/mappings/DSS/dss_map_changelog.xml --verified idempotency.json --in-place
+
+A runOnChange mapping is not re-run when a model changelog reloads the
+nodes it MATCHes (a model rolled back and loaded again), so the reloaded
+model would lose its mappings. After such a reload, and before the next
+update, --rerun-after-reload removes the history of the runOnChange
+changeSets that mention the model, and the next update runs them again:
+
+  python scripts/run_on_change.py changelogs/mappings/DSS/dss_map_changelog.xml --rerun-after-reload DSS
+"""
+import os
+import json
+import argparse
+
+from changelog import Changeset, iterChangesets, readChangelogId, writeChangelog
+from changelog_dag import _MODEL_REF
+
+FORGET_HISTORY = """
+UNWIND $changesets AS c
+MATCH (cs:__LiquibaseChangeSet {id: c.id, author: c.author})
+WHERE cs.changeLog ENDS WITH $file_name
+DETACH DELETE cs
+RETURN count(*) AS forgotten
+"""
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="convert runAlways changeSets to runOnChange")
+    parser.add_argument("changelog", help="changelog to convert")
+    parser.add_argument("--verified", help="verify_idempotency.py JSON report; only its idempotent changeSets are converted")
+    parser.add_argument("--include-unverified", action="store_true",
+                        help="also convert changeSets the report lists as unverified")
+    parser.add_argument("--all", action="store_true", help="convert every runAlways changeSet without a report")
+    parser.add_argument("--output", help="write the converted changelog here")
+    parser.add_argument("--in-place", action="store_true", help="rewrite the changelog in place")
+    parser.add_argument("--rerun-after-reload", action="append", metavar="MODEL",
+                        help="instead of converting, remove the history of the runOnChange changeSets that "
+                             "mention MODEL, so the next update runs them again (repeatable)")
+    return parser.parse_args()
+
+
+def convertChangesets(changesets, ids=None, stats=None):
+    """
+    Yield changeSets with runAlways="true" replaced by runOnChange="true"
+    (in the same attribute position), for every changeSet or only those in ids.
+    """
+    stats = stats if stats is not None else {}
+    for changeset in changesets:
+        if not changeset.run_always or (ids is not None and changeset.id not in ids):
+            if changeset.run_always:
+                stats["kept"] = stats.get("kept", 0) + 1
+            yield changeset
+            continue
+        attrs = {}
+        for key, value in changeset.attrs.items():
+            if key == "runAlways":
+                attrs["runOnChange"] = "true"
+            elif key != "runOnChange":
+                attrs[key] = value
+        stats["converted"] = stats.get("converted", 0) + 1
+        yield Changeset(changeset.id, changeset.author, changeset.cypher, changeset.rollback, attrs, changeset.changelog)
+
+
+def verifiedIds(report, include_unverified=False):
+    ids = set(report["idempotent"])
+    if include_unverified:
+        ids |= set(report["unverified"])
+    return ids - set(report["not_idempotent"])
+
+
+def rerunChangesets(changesets, models):
+    """runOnChange changeSets whose statements mention any of models."""
+    models = set(models)
+    return [cs for cs in changesets
+            if cs.run_on_change and any(m.group(2) in models for stmt in cs.cypher for m in _MODEL_REF.finditer(stmt))]
+
+
+def forgetHistory(session, file_name, changesets):
+    """Remove the history of changesets from file_name; returns how many history nodes were removed."""
+    return session.run(FORGET_HISTORY, file_name=os.path.basename(file_name),
+                       changesets=[{"id": cs.id, "author": cs.author} for cs in changesets]).single()["forgotten"]
+
+
+def rerunAfterReload(file_name, models):
+    from neo4j_db import getDriver
+    rerun = rerunChangesets(iterChangesets(file_name), models)
+    with getDriver() as driver, driver.session() as session:
+        forgotten = forgetHistory(session, file_name, rerun)
+    print("{}: {} runOnChange changeSets mention {}; history removed for {}, the next update runs them".format(
+        file_name, len(rerun), ", ".join(sorted(models)), forgotten))
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    if args.rerun_after_reload:
+        rerunAfterReload(args.changelog, args.rerun_after_reload)
+        raise SystemExit(0)
+    if not (args.verified or args.all):
+        raise SystemExit("pass --verified <verify_idempotency.py report> (or --all to skip verification)")
+    if not (args.output or args.in_place):
+        raise SystemExit("one of --output or --in-place is required")
+    ids = None
+    if args.verified:
+        with open(args.verified) as fp:
+            ids = verifiedIds(json.load(fp), args.include_unverified)
+    changesets = list(iterChangesets(args.changelog))
+    stats = {}
+    converted = list(convertChangesets(changesets, ids, stats))
+    writeChangelog(args.output or args.changelog, converted, readChangelogId(args.changelog))
+    print("{}: {} changeSets converted to runOnChange, {} left runAlways".format(
+        args.changelog, stats.get("converted", 0), stats.get("kept", 0)))
@@ -0,0 +1,217 @@
+"""
+Benchmark the MDB full-text indexes (termValue, tagKeyValue and the
+handle indexes; see changelogs/mdb_index_changelog_3.xml) with
+representative term and handle searches, reporting latency and recall.
+
+Queries are drawn, with a fixed --seed, from the values and handles in
+the database:
+
+  word    one word of a term value or handle, e.g. checksum
+  prefix  the first letters of a word with a trailing wildcard, e.g. carc*
+  phrase  a whole term value as a quoted phrase, e.g. "Not Reported"
+
+Whether an entity is relevant to a query is decided in Python, on words
+split at anything that is not a letter or digit and case-folded, so the
+answer does not depend on the index analyzer: recall@k is the share of the
+relevant entities (at most k) among the first k hits, precision@k the
+share of hits that are relevant. A snake_case handle like
+data_file_checksum_type is one token to the standard analyzer, so a search
+for checksum misses it; that shows up as low recall.
+
+Run it before and after a change to the indexes, giving the first run's
+output as --baseline to the second, which then reuses its queries and
+prints the differences:
+
+  python scripts/search_benchmark.py --output before.json
+  liquibase ... --changelog-file changelogs/mdb_index_changelog_3.xml update
+  python scripts/search_benchmark.py --baseline before.json --output after.json
+
+Wait for the new indexes to come ONLINE (SHOW INDEXES) before the second run.
+"""
+import re
+import sys
+import json
+import time
+import random
+import argparse
+
+from bolt_latency import percentile
+
+# index: (label, properties) as created in mdb_index_changelog_3.xml
+SEARCH_INDEXES = {
+    "termValue": ("term", ("value",)),
+    "tagKeyValue": ("tag", ("key", "value")),
+    "nodeHandle": ("node", ("handle",)),
+    "edgeHandle": ("relationship", ("handle",)),
+    "propHandle": ("property", ("handle",)),
+}
+KINDS = ("word", "prefix", "phrase")
+LUCENE_SPECIAL = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+SEARCH = ("CALL db.index.fulltext.queryNodes($index, $query) YIELD node "
+          "RETURN id(node) AS id LIMIT $k")
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="benchmark latency and recall of the MDB full-text indexes")
+    parser.add_argument("--uri", help="bolt URI (default NEO4J_MDB_URI or bolt://localhost:7687)")
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    parser.add_argument("--indexes", nargs="+", choices=sorted(SEARCH_INDEXES), default=sorted(SEARCH_INDEXES))
+    parser.add_argument("--per-index", type=int, default=30, help="queries of each kind per index (default 30)")
+    parser.add_argument("-k", type=int, default=20, help="hits read per query (default 20)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per query (default 3)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", help="results of an earlier run; reuse its queries and compare")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    return parser.parse_args()
+
+
+### Queries ###################################################################
+
+def words(text):
+    return re.findall(r"[a-z0-9]+", str(text).casefold())
+
+
+def luceneEscape(text):
+    return LUCENE_SPECIAL.sub(r"\\\1", text)
+
+
+def luceneQuery(kind, text):
+    if kind == "prefix":
+        return luceneEscape(text) + "*"
+    if kind == "phrase":
+        return '"{}"'.format(" ".join(words(text)))
+    return luceneEscape(text)
+
+
+def makeQueries(entities, per_index, seed):
+    """[(kind, text)] sampled from {id: [property values]} of one index."""
+    rng = random.Random(seed)
+    values = sorted({v for vals in entities.values() for v in vals if v is not None}, key=str)
+    vocabulary = sorted({w for v in values for w in words(v) if len(w) >= 3 and not w.isdigit()})
+    long_words = [w for w in vocabulary if len(w) >= 6]
+    phrases = [v for v in values if 2 <= len(words(v)) <= 5]
+    queries = [("word", w) for w in rng.sample(vocabulary, min(per_index, len(vocabulary)))]
+    queries += [("prefix", w[:4]) for w in rng.sample(long_words, min(per_index, len(long_words)))]
+    queries += [("phrase", v) for v in rng.sample(phrases, min(per_index, len(phrases)))]
+    return queries
+
+
+def isRelevant(kind, text, values):
+    tokens = [w for v in values if v is not None for w in words(v)]
+    if kind == "prefix":
+        return any(w.startswith(text.casefold()) for w in tokens)
+    wanted = words(text)
+    for v in values:
+        got = words(v) if v is not None else []
+        if any(got[i:i + len(wanted)] == wanted for i in range(len(got) - len(wanted) + 1)):
+            return True
+    return False
+
+
+def scoreHits(hits, relevant, k):
+    """(recall@k, precision@k) of the hit ids against the relevant ids."""
+    top = hits[:k]
+    found = len(set(top) & relevant)
+    recall = found / min(k, len(relevant)) if relevant else None
+    precision = found / len(top) if top else (None if not relevant else 0.0)
+    return recall, precision
+
+
+### Running ###################################################################
+
+def fetchEntities(session, label, props):
+    cypher = "MATCH (n:{}) RETURN id(n) AS id, [{}] AS vals".format(
+        label, ", ".join("n.{}".format(p) for p in props))
+    return {r["id"]: r["vals"] for r in session.run(cypher)}
+
+
+def runQuery(session, index, query, k, repeat):
+    """(hit ids, [latency ms]) of repeat runs of one full-text query."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        hits = [r["id"] for r in session.run(SEARCH, index=index, query=query, k=k)]
+        samples.append(1000 * (time.perf_counter() - start))
+    return hits, samples
+
+
+def mean(xs):
+    xs = [x for x in xs if x is not None]
+    return round(sum(xs) / len(xs), 3) if xs else None
+
+
+def summarizeIndex(rows):
+    """Latency and quality per query kind from the per-query rows of one index."""
+    out = {}
+    for kind in KINDS:
+        mine = [r for r in rows if r["kind"] == kind]
+        if not mine:
+            continue
+        latencies = [ms for r in mine for ms in r["ms"]]
+        out[kind] = {"queries": len(mine),
+                     "p50_ms": round(percentile(latencies, 50), 3) if latencies else None,
+                     "p95_ms": round(percentile(latencies, 95), 3) if latencies else None,
+                     "recall": mean(r["recall"] for r in mine), "precision": mean(r["precision"] for r in mine),
+                     "errors": sum(1 for r in mine if r.get("error"))}
+    return out
+
+
+def benchmark(session, indexes, k, repeat, per_index, seed, queries=None):
+    results = {}
+    for index in indexes:
+        label, props = SEARCH_INDEXES[index]
+        entities = fetchEntities(session, label, props)
+        index_queries = queries[index] if queries else makeQueries(entities, per_index, seed)
+        rows = []
+        for kind, text in index_queries:
+            relevant = {i for i, vals in entities.items() if isRelevant(kind, text, vals)}
+            row = {"kind": kind, "text": text, "relevant": len(relevant)}
+            try:
+                hits, row["ms"] = runQuery(session, index, luceneQuery(kind, text), k, repeat)
+                row["recall"], row["precision"] = scoreHits(hits, relevant, k)
+            except Exception as e:  # e.g. the index does not exist or is still populating
+                row.update(ms=[], recall=0.0 if relevant else None, precision=None, error=str(e).splitlines()[0])
+            rows.append(row)
+        results[index] = {"entities": len(entities), "summary": summarizeIndex(rows), "queries": rows}
+    return results
+
+
+### Reporting #################################################################
+
+def printReport(results, baseline=None):
+    print("{:14} {:7} {:>7} {:>9} {:>9} {:>8} {:>9} {:>6}".format(
+        "index", "kind", "queries", "p50 ms", "p95 ms", "recall", "precision", "errors"))
+    for index, result in results.items():
+        for kind, s in result["summary"].items():
+            print("{:14} {:7} {:>7} {:>9} {:>9} {:>8} {:>9} {:>6}".format(
+                index, kind, s["queries"], s["p50_ms"], s["p95_ms"], fmt(s["recall"]), fmt(s["precision"]),
+                s["errors"]))
+            before = ((baseline or {}).get(index) or {}).get("summary", {}).get(kind)
+            if before:
+                print("{:14} {:7} {:>7} {:>9} {:>9} {:>8} {:>9} {:>6}".format(
+                    "", "before", "", before["p50_ms"], before["p95_ms"], fmt(before["recall"]),
+                    fmt(before["precision"]), before["errors"]))
+
+
+def fmt(x):
+    return "-" if x is None else "{:.2f}".format(x)
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    baseline = queries = None
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        queries = {index: [(q["kind"], q["text"]) for q in baseline[index]["queries"]]
+                   for index in args.indexes if index in baseline}
+        if set(queries) != set(args.indexes):
+            sys.exit("{} has no queries for {}".format(args.baseline, sorted(set(args.indexes) - set(queries))))
+    from neo4j_db import getDriver
+    with getDriver(args.uri, args.user, args.password) as driver, driver.session() as session:
+        results = benchmark(session, args.indexes, args.k, args.repeat, args.per_index, args.seed, queries)
+    printReport(results, baseline)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2)
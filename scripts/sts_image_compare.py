@@ -0,0 +1,160 @@
+"""
+Compare STS images built from devops/dockerfiles/sts at several git refs
+("." is the working tree): image size, pull time and time to first request.
+
+For each ref the STS directory is exported with git archive and built. The
+image is pushed to a local registry (registry:2 on --registry-port, started
+if needed), then for each of --repeat rounds it is
+  1. removed locally and pulled back from the registry, timed;
+  2. started against the local Neo4j of docker-compose.yml, timing from
+     docker run until GET /v1/models first answers 200.
+Pulling from a local registry leaves out network bandwidth, so the times
+show what is left: layer count, decompression and extraction. The
+compressed size is what a Fargate task downloads from ECR.
+
+  docker compose -f scripts/docker-compose.yml up -d neo4j
+  python scripts/parallel_load.py changelogs --bulk
+  python scripts/sts_image_compare.py 008d5c4 . --output sts-images.json
+
+008d5c4 is the last commit with the single-stage Alpine image.
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+STS_DIR = "devops/dockerfiles/sts"
+REGISTRY = "mdb-registry"
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="compare STS images: size, pull time and time to first request")
+    parser.add_argument("refs", nargs="+", help="git refs to build the STS image at; . for the working tree")
+    parser.add_argument("--repeat", type=int, default=3, help="pulls and starts per image (default 3)")
+    parser.add_argument("--registry-port", type=int, default=5001)
+    parser.add_argument("--network", default="scripts_default", help="docker network of the compose Neo4j")
+    parser.add_argument("--neo4j-uri", default="bolt://neo4j:7687", help="Neo4j URI from inside --network")
+    parser.add_argument("--port", type=int, default=5050, help="host port for the STS container (default 5050)")
+    parser.add_argument("--timeout", type=int, default=180, help="seconds to wait for the first request")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    return parser.parse_args()
+
+
+def docker(*args, **kwargs):
+    return subprocess.run(["docker"] + list(args), check=True, capture_output=True, text=True, **kwargs).stdout.strip()
+
+
+### Images ####################################################################
+
+def buildImage(ref, tag):
+    """Build the STS image at ref (or the working tree for .) as tag; returns build seconds."""
+    start = time.monotonic()
+    if ref == ".":
+        docker("build", "-t", tag, os.path.join(ROOT, STS_DIR))
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            archive = subprocess.run(["git", "-C", ROOT, "archive", ref, STS_DIR], check=True, capture_output=True)
+            subprocess.run(["tar", "-x", "-C", tmp], input=archive.stdout, check=True)
+            docker("build", "-t", tag, os.path.join(tmp, STS_DIR))
+    return time.monotonic() - start
+
+
+def startRegistry(port):
+    if not docker("ps", "-q", "-f", "name=" + REGISTRY):
+        subprocess.run(["docker", "rm", "-f", REGISTRY], capture_output=True)
+        docker("run", "-d", "--name", REGISTRY, "-p", "{}:5000".format(port), "registry:2")
+
+
+def compressedSize(tag):
+    """Bytes of the image's compressed layers, from the registry manifest."""
+    manifest = json.loads(docker("manifest", "inspect", "--insecure", tag))
+    return sum(layer["size"] for layer in manifest["layers"])
+
+
+def timedPull(tag):
+    subprocess.run(["docker", "rmi", "-f", tag], capture_output=True)
+    start = time.monotonic()
+    docker("pull", tag)
+    return time.monotonic() - start
+
+
+def waitForFirstRequest(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=5) as resp:
+                if resp.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("no answer from {} after {}s".format(url, timeout))
+
+
+def timedStart(tag, args):
+    name = "mdb-sts-compare"
+    subprocess.run(["docker", "rm", "-f", name], capture_output=True)
+    start = time.monotonic()
+    docker("run", "-d", "--name", name, "--network", args.network, "-p", "{}:5000".format(args.port),
+           "-e", "NEO4J_MDB_URI=" + args.neo4j_uri, "-e", "NEO4J_MDB_USER=neo4j", "-e", "NEO4J_MDB_PASS=neo4j1", tag)
+    try:
+        waitForFirstRequest("http://localhost:{}/v1/models".format(args.port), args.timeout)
+        return time.monotonic() - start
+    except RuntimeError as e:
+        print("{}: {}; last log lines:\n{}".format(tag, e, "\n".join(
+            subprocess.run(["docker", "logs", "--tail", "5", name], capture_output=True, text=True).stderr.splitlines())))
+        return None
+    finally:
+        subprocess.run(["docker", "rm", "-f", name], capture_output=True)
+
+
+def summarizeImage(size, compressed, layers, pulls, starts):
+    """Sizes in MB and median seconds; first_request_s is None if the image never answered."""
+    answered = [s for s in starts if s is not None]
+    return {
+        "size_mb": round(size / 1e6, 1), "compressed_mb": round(compressed / 1e6, 1), "layers": layers,
+        "pull_s": round(statistics.median(pulls), 2),
+        "first_request_s": round(statistics.median(answered), 2) if answered else None,
+        "failed_starts": len(starts) - len(answered),
+    }
+
+
+def compareImage(ref, args):
+    tag = "localhost:{}/mdb-sts-compare:{}".format(args.registry_port, "worktree" if ref == "." else ref)
+    build_s = buildImage(ref, tag)
+    docker("push", tag)
+    size = int(docker("image", "inspect", "-f", "{{.Size}}", tag))
+    layers = len(json.loads(docker("image", "inspect", "-f", "{{json .RootFS.Layers}}", tag)))
+    pulls, starts = [], []
+    for _ in range(args.repeat):
+        pulls.append(timedPull(tag))
+        starts.append(timedStart(tag, args))
+    result = summarizeImage(size, compressedSize(tag), layers, pulls, starts)
+    result["build_s"] = round(build_s, 1)
+    return result
+
+
+def printReport(results):
+    print("{:12} {:>8} {:>14} {:>7} {:>8} {:>16}".format(
+        "ref", "size MB", "compressed MB", "layers", "pull s", "first request s"))
+    for ref, r in results.items():
+        print("{:12} {:>8} {:>14} {:>7} {:>8} {:>16}".format(
+            ref, r["size_mb"], r["compressed_mb"], r["layers"], r["pull_s"],
+            "failed" if r["first_request_s"] is None else r["first_request_s"]))
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    startRegistry(args.registry_port)
+    results = {ref: compareImage(ref, args) for ref in args.refs}
+    printReport(results)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2)
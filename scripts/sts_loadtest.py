@@ -0,0 +1,114 @@
+"""
+Load-test the STS container under each gunicorn worker profile.
+
+For every profile the sts service of scripts/docker-compose.yml is rebuilt
+from devops/dockerfiles/sts and restarted with STS_WORKER_PROFILE set,
+limited to --cpus CPUs like an ECS task. Once it answers, locust
+(sts_locustfile.py) drives it headless with --users closed-loop users for
+--duration, and the aggregated p50/p95/p99 latency, requests per second
+and failures are read from locust's CSV stats.
+
+Load the changelogs into the local Neo4j first:
+
+  pip install -r scripts/requirements-loadtest.txt
+  docker compose -f scripts/docker-compose.yml up -d neo4j
+  python scripts/parallel_load.py changelogs --bulk
+  python scripts/sts_loadtest.py --profiles sync gthread gevent --users 50 --duration 60s --output sts-load.json
+"""
+import os
+import csv
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import urllib.error
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+COMPOSE_FILE = os.path.join(HERE, "docker-compose.yml")
+LOCUSTFILE = os.path.join(HERE, "sts_locustfile.py")
+PROFILES = ("sync", "gthread", "gevent")
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="compare STS worker profiles under load")
+    parser.add_argument("--profiles", nargs="+", choices=PROFILES, default=list(PROFILES))
+    parser.add_argument("--host", default="http://localhost:5000", help="STS URL (default http://localhost:5000)")
+    parser.add_argument("--cpus", default="1", help="CPUs for the STS container (default 1)")
+    parser.add_argument("--users", type=int, default=50, help="concurrent locust users (default 50)")
+    parser.add_argument("--spawn-rate", type=int, default=10)
+    parser.add_argument("--duration", default="60s", help="locust run time per profile (default 60s)")
+    parser.add_argument("--no-build", action="store_true", help="reuse the built STS image")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    return parser.parse_args()
+
+
+def startSts(profile, cpus, build=True):
+    env = dict(os.environ, STS_WORKER_PROFILE=profile, STS_CPUS=cpus)
+    cmd = ["docker", "compose", "-f", COMPOSE_FILE, "up", "-d", "--force-recreate"]
+    if build:
+        cmd.append("--build")
+    subprocess.run(cmd + ["sts"], env=env, check=True)
+
+
+def waitForSts(host, timeout=120):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(host + "/v1/models", timeout=5) as resp:
+                if resp.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("STS at {} not ready after {}s".format(host, timeout))
+        time.sleep(2)
+
+
+def runLocust(host, users, spawn_rate, duration, prefix):
+    subprocess.run([
+        "locust", "-f", LOCUSTFILE, "--host", host, "--headless", "--only-summary",
+        "-u", str(users), "-r", str(spawn_rate), "-t", duration, "--csv", prefix,
+    ], check=True)
+    return summarizeStats(prefix + "_stats.csv")
+
+
+def summarizeStats(stats_csv):
+    """Aggregated figures from a locust <prefix>_stats.csv."""
+    with open(stats_csv, newline="") as fp:
+        rows = list(csv.DictReader(fp))
+    total = next(r for r in rows if r["Name"] == "Aggregated")
+    return {
+        "requests": int(total["Request Count"]),
+        "failures": int(total["Failure Count"]),
+        "rps": round(float(total["Requests/s"]), 1),
+        "p50_ms": float(total["50%"]),
+        "p95_ms": float(total["95%"]),
+        "p99_ms": float(total["99%"]),
+        "paths": {r["Name"]: {"requests": int(r["Request Count"]), "p95_ms": float(r["95%"])}
+                  for r in rows if r["Name"] != "Aggregated"},
+    }
+
+
+def printReport(results):
+    print("{:10} {:>9} {:>9} {:>9} {:>9} {:>9}".format("profile", "req/s", "p50 ms", "p95 ms", "p99 ms", "failures"))
+    for profile, r in results.items():
+        print("{:10} {:>9} {:>9.0f} {:>9.0f} {:>9.0f} {:>9}".format(
+            profile, r["rps"], r["p50_ms"], r["p95_ms"], r["p99_ms"], r["failures"]))
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, profile in enumerate(args.profiles):
+            startSts(profile, args.cpus, build=not args.no_build and i == 0)
+            waitForSts(args.host)
+            results[profile] = runLocust(args.host, args.users, args.spawn_rate, args.duration,
+                                         os.path.join(tmp, profile))
+    printReport(results)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump({"users": args.users, "duration": args.duration, "cpus": args.cpus, "profiles": results},
+                      fp, indent=2)
@@ -0,0 +1,36 @@
+"""
+Locust user for the STS API: a fixed, weighted mix of the lookups the STS
+UI and its API clients make, against the ICDC model loaded from
+changelogs/ (see sts_loadtest.py).
+
+  locust -f scripts/sts_locustfile.py --host http://localhost:5000 --headless -u 50 -t 60s
+"""
+import random
+
+from locust import FastHttpUser, constant, task
+
+# (weight, path)
+QUERY_MIX = [
+    (1, "/v1/models"),
+    (2, "/v1/model/ICDC/nodes"),
+    (2, "/v1/model/ICDC/node/demographic"),
+    (3, "/v1/model/ICDC/node/demographic/properties"),
+    (3, "/v1/model/ICDC/node/demographic/property/breed"),
+    (4, "/v1/model/ICDC/node/demographic/property/breed/terms"),
+    (4, "/v1/model/ICDC/node/demographic/property/sex/terms"),
+    (1, "/v1/tags"),
+    (1, "/v1/tag/Template/Yes"),
+    (2, "/v1/id/enJQPH"),
+]
+WEIGHTS = [w for w, _ in QUERY_MIX]
+PATHS = [p for _, p in QUERY_MIX]
+
+
+class StsUser(FastHttpUser):
+    # closed loop: each user sends its next request as soon as the last returns
+    wait_time = constant(0)
+
+    @task
+    def lookup(self):
+        path = random.choices(PATHS, WEIGHTS)[0]
+        self.client.get(path, name=path)
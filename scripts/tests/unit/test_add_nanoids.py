@@ -0,0 +1,62 @@
+from add_nanoids import NanoidWriter
+from changelog import Changeset
+from cypher import formatStatement, parseStatement
+from nanoid import NANOID_ALPHABET, deterministicNanoid
+
+
+def test_deterministic_nanoid():
+    props = {"handle": "case", "model": "ICDC", "_commit": "abc", "desc": "A case"}
+    nanoid = deterministicNanoid("node", props)
+    assert len(nanoid) == 6 and set(nanoid) <= set(NANOID_ALPHABET)
+    # desc doesn't identify the entity; a new model version (_commit) is a new entity
+    assert deterministicNanoid("node", dict(props, desc="")) == nanoid
+    assert deterministicNanoid("node", dict(props, _commit="def")) != nanoid
+    assert deterministicNanoid("property", props) != nanoid
+    taken = {nanoid}
+    salted = deterministicNanoid("node", props, taken)
+    assert salted != nanoid and taken == {nanoid, salted}
+
+
+def test_format_statement_roundtrip():
+    for text in [
+        "CREATE (n0:node {handle:'case',model:'ICDC'})",
+        "MERGE (n0:term {value:'Yes',origin_name:'NCIt'}) ON CREATE SET n0._commit = 'abc'",
+        "MATCH (n0:node {handle:'case',model:'ICDC'}) DETACH DELETE n0",
+        "MATCH (n0:node {handle:'case'}), (n1:property {handle:'id'}) MERGE (n0)-[r0:has_property]->(n1)",
+        "MATCH (n0:node {handle:'case'})-[r0:has_property]->(n1:property {handle:'id'}) DELETE r0",
+    ]:
+        assert formatStatement(parseStatement(text)) == text
+
+
+def test_nanoid_writer():
+    node = "(n0:node {handle:'case',model:'ICDC',_commit:'c1'})"
+    prop = "(n1:property {handle:'id',model:'ICDC',nanoid:'abc123'})"
+    writer = NanoidWriter()
+    cs = list(writer.changesets([
+        Changeset("1", "a", ["CREATE " + node], ["MATCH {} DETACH DELETE n0".format(node)]),
+        Changeset("2", "a", ["MERGE (n0:term {value:'Yes',origin_name:'NCIt'})"], ["empty"]),
+        Changeset("3", "a", ["MATCH {}, {} MERGE (n0)-[r0:has_property]->(n1)".format(node, prop)],
+                  ["MATCH {}-[r0:has_property]->{} DELETE r0".format(node, prop)]),
+        Changeset("4", "a", ["CREATE (n0:tag {key:'k',value:'v'})"]),
+    ]))
+    nanoid = deterministicNanoid("node", {"handle": "case", "model": "ICDC", "_commit": "c1"})
+    assert cs[0].cypher == ["CREATE (n0:node {handle:'case',model:'ICDC',_commit:'c1',nanoid:'%s'})" % nanoid]
+    assert cs[0].rollback == ["MATCH (n0:node {nanoid:'%s',_commit:'c1'}) DETACH DELETE n0" % nanoid]
+    # MERGE keeps matching on the original map; the nanoid is only set on create
+    term = deterministicNanoid("term", {"value": "Yes", "origin_name": "NCIt"})
+    assert cs[1].cypher == ["MERGE (n0:term {value:'Yes',origin_name:'NCIt'}) ON CREATE SET n0.nanoid = '%s'" % term]
+    assert cs[2].cypher == ["MATCH {}, {} MERGE (n0)-[r0:has_property]->(n1)".format(node, prop)]
+    assert cs[2].rollback == [
+        "MATCH (n0:node {nanoid:'%s',_commit:'c1'})-[r0:has_property]->(n1:property {nanoid:'abc123'}) DELETE r0"
+        % nanoid]
+    assert writer.stats == {"created": 2, "merged": 1, "rollbacks": 2}
+
+
+def test_model_versions_get_their_own_nanoids():
+    v1, v2 = ("CREATE (n0:node {handle:'case',model:'ICDC',_commit:'%s'})" % c for c in ("c1", "c2"))
+    writer = NanoidWriter()
+    first = list(writer.changesets([Changeset("1", "a", [v1], ["MATCH {} DETACH DELETE n0".format(v1[7:])])]))
+    second = list(writer.changesets([Changeset("1", "a", [v2], ["MATCH {} DETACH DELETE n0".format(v2[7:])])]))
+    assert first[0].cypher != second[0].cypher
+    assert first[0].rollback[0].endswith("_commit:'c1'}) DETACH DELETE n0")
+    assert second[0].rollback[0].endswith("_commit:'c2'}) DETACH DELETE n0")
@@ -0,0 +1,18 @@
+from benchmark_suite import compareResults, summarizeLoads
+
+
+def test_summarize_and_compare():
+    loads = [{"a.xml": {"changesets": 10, "seconds": s}, "b.xml": {"changesets": 30, "seconds": 2 * s}}
+             for s in (1.0, 3.0, 2.0)]
+    changelogs, load = summarizeLoads(loads)
+    assert changelogs["a.xml"] == {"changesets": 10, "seconds": 2.0, "changesets_per_second": 5.0}
+    assert load == {"changesets": 40, "seconds": 6.0, "changesets_per_second": 6.7}
+
+    baseline = {"changelogs": changelogs, "load": load, "sts": {"rps": 100.0, "p95_ms": 50.0, "failures": 0}}
+    results = {"changelogs": dict(changelogs, **{"b.xml": dict(changelogs["b.xml"], seconds=6.0)}),
+               "load": load, "sts": {"rps": 70.0, "p95_ms": 55.0, "failures": 0}}
+    regressed = {row[0] for row in compareResults(results, baseline) if row[-1]}
+    # b.xml 50% slower and 30% fewer requests per second; p95 +10% is within tolerance
+    assert regressed == {"sts/rps", "changelogs/b.xml/seconds"}
+    # metrics missing from either side (e.g. a --skip-sts run) are not compared
+    assert all(not row[0].startswith("sts") for row in compareResults(dict(results, sts=None), baseline))
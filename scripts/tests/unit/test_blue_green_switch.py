@@ -0,0 +1,38 @@
+from blue_green_switch import colorTargetGroups, listenerColors, loadProblems, unhealthyTargets, versionProblems
+
+
+def test_reads_colors_from_the_nlb():
+    groups = colorTargetGroups([
+        {"TargetGroupName": "mdb-prod-blue", "TargetGroupArn": "arn:tg/blue"},
+        {"TargetGroupName": "mdb-prod-green", "TargetGroupArn": "arn:tg/green"},
+        {"TargetGroupName": "other", "TargetGroupArn": "arn:tg/other"},
+    ], "mdb-prod")
+    assert groups == {"blue": "arn:tg/blue", "green": "arn:tg/green"}
+    listeners = listenerColors([
+        {"Port": 7687, "ListenerArn": "arn:l/live", "DefaultActions": [{"Type": "forward", "TargetGroupArn": "arn:tg/green"}]},
+        {"Port": 7688, "ListenerArn": "arn:l/standby", "DefaultActions": [{"Type": "forward", "TargetGroupArn": "arn:tg/blue"}]},
+        {"Port": 7474, "ListenerArn": "arn:l/http", "DefaultActions": [{"Type": "forward", "TargetGroupArn": "arn:tg/other"}]},
+    ], groups, (7687, 7688))
+    assert listeners == {7687: ("arn:l/live", "green"), 7688: ("arn:l/standby", "blue")}
+
+
+def test_verification_gate():
+    assert unhealthyTargets([]) == ["no registered targets"]
+    assert unhealthyTargets([
+        {"Target": {"Id": "10.0.1.5"}, "TargetHealth": {"State": "healthy"}},
+        {"Target": {"Id": "10.0.1.6"}, "TargetHealth": {"State": "initial", "Reason": "Elb.RegistrationInProgress"}},
+    ]) == ["10.0.1.6 is initial (Elb.RegistrationInProgress)"]
+    live, standby = (1200, "1200-2026-09-01T00:00:00Z"), (1250, "1250-2026-10-01T00:00:00Z")
+    assert versionProblems(live, standby) == []
+    assert versionProblems(live, standby, expect="1250-2026-10-01T00:00:00Z") == []
+    assert len(versionProblems(standby, live)) == 1
+    assert versionProblems(standby, live, allow_older=True) == []
+    assert len(versionProblems(live, (0, "0-None"), expect="1250-x")) == 3
+
+
+def test_verify_load_gate():
+    report = {"ok": True, "missing": 0, "mismatched": 0, "extra": 0, "counts": {"entities": [], "relationships": []}}
+    assert loadProblems(report) == []
+    report = dict(report, ok=False, missing=3, counts={"entities": [{"group": ["ICDC", "node", "-"]}], "relationships": []})
+    assert loadProblems(report) == ["verify_load: 3 entities missing, 0 mismatched, 0 extra",
+                                    "verify_load: entities counts differ from the changelogs in 1 groups"]
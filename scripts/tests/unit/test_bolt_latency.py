@@ -0,0 +1,9 @@
+from bolt_latency import percentile, summarize
+
+
+def test_percentiles():
+    samples = [float(i) for i in range(100, 0, -1)]
+    assert (percentile(samples, 50), percentile(samples, 95), percentile(samples, 99)) == (50.0, 95.0, 99.0)
+    assert percentile([3.0], 99) == 3.0 and percentile([], 50) is None
+    assert summarize([1.0, 2.0, 4.0], 12.345) == {
+        "queries": 3, "connect_ms": 12.35, "p50_ms": 2.0, "p95_ms": 4.0, "p99_ms": 4.0, "max_ms": 4.0}
@@ -0,0 +1,37 @@
+from bulk_import import Graph, classify, writeImportFiles
+from changelog import Changeset
+from cypher import parseStatement
+
+
+def test_merge_semantics_match_cypher():
+    graph = Graph()
+    graph.apply(parseStatement("CREATE (n0:value_set {_id:'a',handle:'VS'})"))
+    graph.apply(parseStatement("MERGE (n0:term {value:'Yes',origin_name:'X',origin_id:'1'}) ON CREATE SET n0._commit = 'c1'"))
+    # matches the existing term on a subset of its properties; ON CREATE SET not applied
+    graph.apply(parseStatement("MERGE (n0:term {value:'Yes',origin_name:'X'}) ON CREATE SET n0._commit = 'c2'"))
+    assert graph.labels == ["value_set", "term"]
+    assert graph.props[1]["_commit"] == "c1"
+    edge = "MATCH (n0:value_set {_id:'a',handle:'VS'}), (n1:term {value:'Yes',origin_name:'X'}) MERGE (n0)-[r0:has_term]->(n1)"
+    graph.apply(parseStatement(edge))
+    graph.apply(parseStatement(edge))
+    assert list(graph.rels) == [(0, "has_term", 1)]
+    assert graph.addNanoids() == 2
+    assert graph.props[0]["nanoid"] != graph.props[1]["nanoid"]
+
+
+def test_classify():
+    assert classify(Changeset("1", "a", ["create index if not exists for (n:node) on (n.nanoid)"])) == "schema"
+    assert classify(Changeset("2", "a", ["CREATE (n0:tag {key:'k',value:'v'})"])) == "import"
+    assert classify(Changeset("3", "a", ["MATCH (n {handle:'x'}) RETURN n"])) == "defer"
+    assert classify(Changeset("4", "a", ["CREATE (n0:tag {key:'k',value:'v'})"], attrs={"runAlways": "true"})) == "defer"
+
+
+def test_csv_quoting(tmp_path):
+    graph = Graph()
+    graph.create("node", {"handle": "a", "desc": 'say "hi"\nbye'})
+    graph.create("node", {"handle": "b"})
+    nodes, rels = writeImportFiles(graph, [("x.xml", Changeset("7", "NWM"))], str(tmp_path))
+    text = open(nodes[0]).read()
+    assert text.splitlines()[0] == ":ID,desc:string,handle:string,:LABEL"
+    assert '"say ""hi""\nbye"' in text
+    assert 'n1,,"b",node' in text
@@ -0,0 +1,35 @@
+from changelog import Changeset, writeChangelog
+from changelog_dag import EVERYTHING, buildDag, changelogResources, levels
+
+
+def write(tmp_path, name, statements):
+    path = str(tmp_path / name)
+    writeChangelog(path, [Changeset(str(i), "NWM", [s]) for i, s in enumerate(statements)])
+    return path
+
+
+def test_dependencies_follow_shared_entities(tmp_path):
+    setup = write(tmp_path, "setup.xml", ["create index if not exists for (n:node) on (n.model, n.handle)"])
+    models = write(tmp_path, "models.xml", ["MERGE (n0:model {handle:'A'})", "MERGE (n0:model {handle:'B'})"])
+    a = write(tmp_path, "a.xml", [
+        "CREATE (n0:node {handle:'case',model:'A'})",
+        "MERGE (n0:term {value:'Yes',origin_name:'NCIt'}) ON CREATE SET n0._commit = 'x'"])
+    b = write(tmp_path, "b.xml", ["CREATE (n0:node {handle:'case',model:'B'})"])
+    c = write(tmp_path, "c.xml", [
+        "MATCH (n0:value_set {_id:'v'}), (n1:term {value:'Yes',origin_name:'NCIt'}) MERGE (n0)-[r0:has_term]->(n1)"])
+    mapping = write(tmp_path, "map.xml", [
+        "WITH {handle0:'case',model0:'A',model1:'B'} AS p MATCH (n0:node {handle:p.handle0,model:p.model0}) RETURN n0"])
+    files = [setup, models, a, b, c, mapping]
+    dag = buildDag(files)
+    assert dag[models] == {setup}
+    assert dag[a] == dag[b] == {setup, models}
+    assert dag[c] == {setup, a}
+    assert dag[mapping] == {setup, models, a, b}
+    assert levels(dag) == [[setup], [models], [a, b], [c, mapping]]
+
+
+def test_opaque_statement_without_model_is_a_barrier(tmp_path):
+    opaque = write(tmp_path, "opaque.xml", ["MATCH (n) SET n.x = 1"])
+    assert EVERYTHING in changelogResources(opaque)[0]
+    other = write(tmp_path, "other.xml", ["CREATE (n0:node {handle:'x',model:'Z'})"])
+    assert buildDag([other, opaque]) == {other: set(), opaque: {other}}
@@ -0,0 +1,86 @@
+import itertools
+
+from changelog import Changeset, iterChangesets, writeChangelog
+from compact_changelog import compactChangesets
+from cypher import parseStatement, _Scanner
+
+NODE = "(n0:node {handle:'case',model:'ICDC',desc:'The patient\\'s case',_commit:'abc'})"
+PROP = "(n0:property {handle:'age',model:'ICDC',_commit:'abc',nanoid:'XyZ123'})"
+
+SOURCE = [
+    Changeset("1", "NWM", ["CREATE " + NODE], ["MATCH " + NODE + " DETACH DELETE n0"]),
+    Changeset("2", "NWM", ["CREATE " + PROP], ["MATCH " + PROP + " DETACH DELETE n0"]),
+    Changeset("3", "NWM",
+        ["MATCH " + NODE + ", " + PROP.replace("n0", "n1") + " MERGE (n0)-[r0:has_property]->(n1)"],
+        ["MATCH " + NODE + "-[r0:has_property]->" + PROP.replace("n0", "n1") + " DELETE r0"]),
+    Changeset("4", "NWM", ["MERGE (n0:term {value:'Yes',origin_name:'ICDC'}) ON CREATE SET n0._commit = 'abc'"], ["empty"]),
+    Changeset("5", "NWM", ["CREATE (n0:property {handle:'sex',model:'ICDC',_commit:'abc',nanoid:'AbC456'})"],
+        ["MATCH (n0:property {handle:'sex',model:'ICDC',_commit:'abc',nanoid:'AbC456'}) DETACH DELETE n0"]),
+]
+
+
+def unwindRows(stmt):
+    s = _Scanner(stmt)
+    assert s.keyword("UNWIND")
+    return s.value()
+
+
+def test_parse_statement_shapes():
+    create = parseStatement("CREATE " + NODE)
+    assert create.kind == "create_node"
+    assert create.node.props["desc"] == "The patient's case"
+    edge = parseStatement(SOURCE[2].cypher[0])
+    assert (edge.kind, edge.src.label, edge.rel_type, edge.dst.label) == ("merge_edge", "node", "has_property", "property")
+    merge = parseStatement(SOURCE[3].cypher[0])
+    assert merge.kind == "merge_node" and merge.on_create == {"_commit": "abc"}
+    assert parseStatement(SOURCE[2].rollback[0]).kind == "delete_edge"
+    assert parseStatement("MATCH (n2 {handle:'x'})-[:has_property]->(n0:property) RETURN n0") is None
+
+
+def test_compact_groups_nodes_before_edges():
+    ids = itertools.count(100)
+    out = list(compactChangesets(SOURCE, lambda: str(next(ids))))
+    assert [c.id for c in out] == ["100", "101", "102", "103"]
+    kinds = [parseStatement(c.cypher[0]) for c in out]
+    assert all(k is None for k in kinds)  # UNWIND batches are not single-entity shapes
+    assert "CREATE (n:node" in out[0].cypher[0]
+    assert "CREATE (n:property" in out[1].cypher[0]
+    assert unwindRows(out[1].cypher[0]) == [
+        {"handle": "age", "model": "ICDC", "_commit": "abc", "nanoid": "XyZ123"},
+        {"handle": "sex", "model": "ICDC", "_commit": "abc", "nanoid": "AbC456"}]
+    assert "MERGE (n:term" in out[2].cypher[0] and out[2].rollback == ["empty"]
+    assert out[3].cypher[0].endswith("MERGE (a)-[:has_property]->(b)")
+    assert out[3].rollback[0].endswith("DELETE e")
+    # rollbacks match on index keys, not on the whole map with desc
+    assert unwindRows(out[0].rollback[0]) == [{"model": "ICDC", "handle": "case", "_commit": "abc"}]
+    assert unwindRows(out[1].rollback[0]) == [{"nanoid": "XyZ123", "_commit": "abc"}, {"nanoid": "AbC456", "_commit": "abc"}]
+    assert "MATCH (n:property {nanoid:r.nanoid,_commit:r._commit}) DETACH DELETE n" in out[1].rollback[0]
+    assert unwindRows(out[3].rollback[0]) == [
+        {"a": {"model": "ICDC", "handle": "case", "_commit": "abc"}, "b": {"nanoid": "XyZ123", "_commit": "abc"}}]
+
+
+def test_rollback_keeps_the_map_without_unique_keys():
+    # two creates share (model, handle) and neither has _commit or a nanoid
+    twins = [Changeset(str(i), "NWM", ["CREATE (n0:node {handle:'x',model:'M',desc:'%s'})" % d],
+                       ["MATCH (n0:node {handle:'x',model:'M',desc:'%s'}) DETACH DELETE n0" % d]) for i, d in ((1, "a"), (2, "b"))]
+    ids = itertools.count(1)
+    [out] = compactChangesets(twins, lambda: str(next(ids)))
+    assert unwindRows(out.rollback[0]) == unwindRows(out.cypher[0])
+
+
+def test_compact_batches_and_passthrough():
+    opaque = Changeset("9", "NWM", ["MATCH (n) RETURN count(n)"])
+    ids = itertools.count(1)
+    out = list(compactChangesets(SOURCE[:2] + [opaque] + SOURCE[4:], lambda: str(next(ids)), batch_size=1))
+    assert [c.id for c in out] == ["1", "2", "9", "3"]
+    assert out[2] is opaque
+
+
+def test_roundtrip_through_xml(tmp_path):
+    path = str(tmp_path / "changelog.xml")
+    ids = itertools.count(1)
+    writeChangelog(path, compactChangesets(SOURCE, lambda: str(next(ids))))
+    back = list(iterChangesets(path))
+    assert len(back) == 4
+    assert unwindRows(back[0].cypher[0])[0]["desc"] == "The patient's case"
+    assert back[3].cypher[0].count("->") == 1
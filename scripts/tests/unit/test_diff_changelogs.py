@@ -0,0 +1,92 @@
+import os
+import sys
+import subprocess
+
+from changelog import Changeset, writeChangelog
+from diff_changelogs import deltaChangesets, diffChangelogs, summaryLines
+
+CASE = "(n0:node {handle:'case',model:'ICDC',desc:'A case',_commit:'c1'})"
+VISIT = "(n0:node {handle:'visit',model:'ICDC',_commit:'c1'})"
+ID = "(n0:property {handle:'id',model:'ICDC',_commit:'c1',nanoid:'aaaaaa',value_domain:'string'})"
+
+
+def changelog(tmp_path, name, statements):
+    path = str(tmp_path / name)
+    writeChangelog(path, [Changeset(str(i), "a", [s], ["empty"]) for i, s in enumerate(statements)])
+    return path
+
+
+def test_delta(tmp_path):
+    old = changelog(tmp_path, "old.xml", [
+        "CREATE " + CASE, "CREATE " + VISIT, "CREATE " + ID,
+        "MATCH {}, {} MERGE (n0)-[r0:has_property]->(n1)".format(CASE, ID.replace("n0", "n1")),
+        "MATCH {}, {} MERGE (n0)-[r0:of_case]->(n1)".format(VISIT, CASE.replace("n0", "n1")),
+    ])
+    # new generation: new _commit and nanoids everywhere, case.desc edited, visit dropped, sample added
+    new = changelog(tmp_path, "new.xml", [
+        s.replace("'c1'", "'c2'").replace("aaaaaa", "bbbbbb") for s in [
+            "CREATE " + CASE.replace("A case", "A canine case"), "CREATE " + ID,
+            "CREATE (n0:node {handle:'sample',model:'ICDC',_commit:'c1'})",
+            "MATCH {}, {} MERGE (n0)-[r0:has_property]->(n1)".format(CASE, ID.replace("n0", "n1")),
+        ]])
+    delta = diffChangelogs(old, new)
+    ids = iter(range(100, 200))
+    cs = list(deltaChangesets(delta, lambda: str(next(ids)), "NWM"))
+    # matched on the keys with the _commit the database holds at that point
+    assert [c.cypher[0] for c in cs] == [
+        "MATCH (n0:node {model:'ICDC',handle:'visit',_commit:'c1'})-[r0:of_case]->"
+        "(n1:node {model:'ICDC',handle:'case',_commit:'c1'}) DELETE r0",
+        "MATCH (n0:node {model:'ICDC',handle:'case',_commit:'c1'}) SET n0.desc = 'A canine case', n0._commit = 'c2'",
+        "CREATE (n0:node {handle:'sample',model:'ICDC',_commit:'c2'})",
+        "MATCH (n0:node {model:'ICDC',handle:'visit',_commit:'c1'}) DETACH DELETE n0",
+    ]
+    assert cs[1].rollback == [
+        "MATCH (n0:node {model:'ICDC',handle:'case',_commit:'c2'}) SET n0.desc = 'A case', n0._commit = 'c1'"]
+    assert cs[3].rollback == ["CREATE " + VISIT]
+    assert cs[0].id == "100" and cs[0].author == "NWM"
+    lines = summaryLines(delta, old, new)
+    assert "  entities          +1 ~1 -1" in lines
+    assert "~ node {model:'ICDC',handle:'case'}: desc" in lines
+
+
+def test_identical_changelogs(tmp_path):
+    old = changelog(tmp_path, "old.xml", ["CREATE " + CASE, "MATCH (n {handle:'case'}) SET n.x = 1"])
+    new = changelog(tmp_path, "new.xml", ["CREATE " + CASE.replace("'c1'", "'c2'"), "MATCH (n {handle:'case'})  SET n.x = 1"])
+    delta = diffChangelogs(old, new)
+    assert list(deltaChangesets(delta, iter(range(10)).__next__, "a")) == []
+
+
+def test_duplicate_identities_are_unresolved(tmp_path):
+    # two tags with the same key, value and _commit, one of them with a nanoid
+    twin = "CREATE (n0:tag {key:'k',value:'v',_commit:'c1',note:'%s'})"
+    term = "(n1:term {value:'Yes',origin_name:'NCIt'})"
+    old = changelog(tmp_path, "old.xml", [
+        twin % "a", twin % "b", "CREATE (n0:tag {key:'k',value:'v',_commit:'c1',note:'c',nanoid:'tgC123'})",
+        "CREATE " + CASE, "MERGE " + term.replace("n1", "n0"),
+        "MATCH {}, {} MERGE (n0)-[r0:has_tag]->(n1)".format(CASE, term)])
+    new = changelog(tmp_path, "new.xml", ["CREATE " + CASE])
+    delta = diffChangelogs(old, new)
+    cs = list(deltaChangesets(delta, iter(range(10)).__next__, "a"))
+    # only the tag with a nanoid is deleted; the twins would match each other and every model's k:v tag
+    assert [c.cypher[0] for c in cs] == ["MATCH (n0:tag {nanoid:'tgC123',_commit:'c1'}) DETACH DELETE n0"]
+    # the twins, the shared term and its edge stay for the reviewer
+    assert sorted(reason for reason, _ in delta.unresolved) == [
+        "removed edge without a unique scoped match", "removed entity without a unique scoped match",
+        "removed entity without a unique scoped match", "removed merge statement"]
+    lines = summaryLines(delta, old, new)
+    assert any(line.startswith("! removed entity without a unique scoped match, not in the delta: CREATE (n0:tag")
+               for line in lines)
+
+
+def test_preview_keeps_the_counter(tmp_path):
+    old = changelog(tmp_path, "old.xml", ["CREATE " + CASE])
+    new = changelog(tmp_path, "new.xml", ["CREATE " + CASE, "CREATE " + VISIT])
+    config = tmp_path / "changelog.ini"
+    config.write_text("[changelog]\nchangeset_id = 7")
+    script = os.path.join(os.path.dirname(__file__), "..", "..", "diff_changelogs.py")
+    args = [sys.executable, script, old, new, "--output", str(tmp_path / "delta.xml"), "--author", "a",
+            "--config", str(config), "--summary", str(tmp_path / "delta.txt")]
+    subprocess.run(args + ["--preview"], check=True, capture_output=True)
+    assert config.read_text() == "[changelog]\nchangeset_id = 7"
+    subprocess.run(args, check=True, capture_output=True)
+    assert config.read_text() == "[changelog]\nchangeset_id = 8"
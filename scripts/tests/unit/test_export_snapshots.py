@@ -0,0 +1,34 @@
+import json
+import sqlite3
+
+from bulk_import import Graph
+from cypher import parseStatement
+from export_snapshots import changelogSnapshots, writeSnapshot
+
+
+def test_changelog_snapshot(tmp_path):
+    graph = Graph()
+    for stmt in [
+        "CREATE (n0:node {handle:'case',model:'ICDC'})",
+        "CREATE (n0:node {handle:'case',model:'CTDC'})",
+        "CREATE (n0:property {handle:'sex',model:'ICDC'})",
+        "CREATE (n0:value_set {_id:'vs1'})",
+        "CREATE (n0:term {value:'Male',origin_name:'ICDC'})",
+        "MATCH (n0:node {handle:'case',model:'ICDC'}), (n1:property {handle:'sex'}) MERGE (n0)-[r0:has_property]->(n1)",
+        "MATCH (n0:property {handle:'sex'}), (n1:value_set {_id:'vs1'}) MERGE (n0)-[r0:has_value_set]->(n1)",
+        "MATCH (n0:value_set {_id:'vs1'}), (n1:term {value:'Male'}) MERGE (n0)-[r0:has_term]->(n1)",
+    ]:
+        graph.apply(parseStatement(stmt))
+    snapshots = changelogSnapshots(graph)
+    assert sorted(snapshots) == ["CTDC", "ICDC"]
+    entities, edges = snapshots["ICDC"]
+    assert [e[1] for e in entities] == ["node", "property", "value_set", "term"]
+    assert len(edges) == 3
+
+    file_name = str(tmp_path / "ICDC.sqlite")
+    assert writeSnapshot(file_name, "ICDC", entities, edges, source="changelogs") == 4
+    conn = sqlite3.connect(file_name)
+    meta = dict(conn.execute("SELECT key, value FROM meta"))
+    assert meta["model"] == "ICDC" and meta["mdb_version"] is None
+    assert json.loads(conn.execute("SELECT props FROM entity WHERE label = 'property' AND handle = 'sex'").fetchone()[0]) == {
+        "handle": "sex", "model": "ICDC"}
@@ -0,0 +1,30 @@
+from cypher import patternPaths
+from index_advisor import chooseIndex, pathAccess, schemaIndex
+
+MAPPING = ("MATCH (n2 {handle:'admin',model:'DSS'})-[:has_property]->(n0:property {handle:'md5',model:'DSS'}) "
+           "OPTIONAL MATCH (n0)-[r1:has_concept]->(n4:concept), (n4)-[r2:has_tag]->(n6:tag {key:'mapping_source',value:'DSS'}) "
+           "WITH n0, n4 FOREACH (_ IN CASE WHEN n4 IS NULL THEN [1] ELSE [] END | CREATE (n8:concept {_commit:'x'}))")
+
+
+def test_pattern_paths():
+    paths = patternPaths(MAPPING)
+    assert [p.clause for p in paths] == ["MATCH", "OPTIONAL MATCH", "OPTIONAL MATCH"]
+    assert [(n.label, n.keys) for n in paths[0].nodes] == [(None, ("handle", "model")), ("property", ("handle", "model"))]
+    assert [p.anchored for p in paths] == [False, True, True]
+    where = patternPaths("MATCH (n:node) WHERE n._commit = 'abc' DETACH DELETE n")
+    assert where[0].nodes[0].keys == ("_commit",)
+
+
+def test_schema_index():
+    assert schemaIndex("create index if not exists for (n:tag) on (n.key, n.value)") == ("tag", ("key", "value"))
+    assert schemaIndex("CREATE CONSTRAINT node_unique_attrs IF NOT EXISTS FOR (n:node) REQUIRE (n.model, n.handle) IS UNIQUE") == (
+        "node", ("model", "handle"))
+    assert schemaIndex("create fulltext index termValue for (t:term) on each [t.value]") is None
+
+
+def test_access_and_choice():
+    path = patternPaths(MAPPING)[0]
+    assert pathAccess(path, []) == "label_scan"
+    assert pathAccess(path, [("property", ("model", "handle"))]) == "seek"
+    assert pathAccess(patternPaths("MATCH (n {handle:'x'}) RETURN n")[0], []) == "all_nodes_scan"
+    assert chooseIndex("term", ("handle", "value", "origin_id", "origin_name")) == ("term", ("value", "origin_name"))
@@ -0,0 +1,79 @@
+import pytest
+
+pytest.importorskip("prefect")
+pytest.importorskip("neo4j")
+
+from neo4j.exceptions import ClientError, ServiceUnavailable, SessionExpired, TransientError
+
+from changelog import Changeset, writeChangelog
+from mdb_update_flow import checkChangelogs, discoverChangelogs, isTransient, liquibaseCommand, retryTransient
+
+
+def write(root, name, changesets):
+    path = root / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    writeChangelog(str(path), changesets)
+    return str(path)
+
+
+def test_discover_orders_and_links_changelogs(tmp_path):
+    terms = write(tmp_path, "terms/t.xml", [Changeset("5", "NWM", ["MERGE (n0:term {value:'Yes',origin_name:'X'})"])])
+    mapping = write(tmp_path, "mappings/A/a_map.xml", [Changeset("4", "NWM", [
+        "WITH {handle0:'case',model0:'A'} AS p MATCH (n0:node {handle:p.handle0,model:p.model0}) RETURN n0"])])
+    b = write(tmp_path, "models/B/b.xml", [Changeset("3", "NWM", ["CREATE (n0:node {handle:'case',model:'B'})"])])
+    a = write(tmp_path, "models/A/a.xml", [Changeset("2", "NWM", ["CREATE (n0:node {handle:'case',model:'A'})"])])
+    setup = write(tmp_path, "mdb_setup_changelog.xml", [Changeset("1", "NWM", [
+        "create index if not exists for (n:node) on (n.model, n.handle)"])])
+    extra = write(tmp_path, "extra.xml", [Changeset("6", "NWM", ["CREATE (n0:node {handle:'x',model:'B'})"])])
+    files, dag = discoverChangelogs(str(tmp_path), [extra])
+    assert files == [setup, a, b, mapping, terms, extra]
+    assert dag[a] == dag[b] == [setup]
+    assert dag[mapping] == sorted([setup, a])
+    assert dag[extra] == sorted([setup, b])
+
+
+def test_check_reports_bad_changesets(tmp_path):
+    good = write(tmp_path, "models/A/a.xml", [Changeset("1", "NWM", ["CREATE (n0:node {handle:'a',model:'A'})"])])
+    bad = write(tmp_path, "models/B/b.xml", [
+        Changeset("2", "NWM", ["CREATE (n0:node {handle:'a',model:'B'})"]),
+        Changeset("2", "NWM", ["CREATE (n0:node {handle:'b',model:'B'})"]),
+        Changeset("3", "", ["CREATE (n0:node {handle:'c',model:'B'})"])])
+    broken = tmp_path / "models" / "C" / "c.xml"
+    broken.parent.mkdir(parents=True)
+    broken.write_text("<databaseChangeLog>")
+    errors, warnings = checkChangelogs([good, bad, str(broken)])
+    assert errors[:2] == [bad + ": duplicate changeSet 2::NWM", bad + ": changeSet without id or author"]
+    assert len(errors) == 3 and errors[2].startswith(str(broken))
+    assert warnings == []
+
+
+def test_check_lints_mappings(tmp_path):
+    mapping = write(tmp_path, "mappings/A/a_map.xml", [Changeset("1", "NWM", [
+        "MATCH (n2 {handle:'case',model:'A'})-[:has_property]->(n0:property {handle:'age',model:'A'}) RETURN n0"])])
+    errors, warnings = checkChangelogs([mapping])
+    assert errors == [] and warnings and all(w.startswith(mapping) for w in warnings)
+
+
+class State:
+    def __init__(self, error=None):
+        self.error = error
+
+    def result(self):
+        if self.error:
+            raise self.error
+        return "ok"
+
+
+def test_only_transient_errors_are_retried():
+    for error in (ServiceUnavailable("gone"), SessionExpired("expired"), TransientError("deadlock")):
+        assert isTransient(error) and retryTransient(None, None, State(error))
+    for error in (ClientError("syntax"), ValueError("invalid changelogs")):
+        assert not retryTransient(None, None, State(error))
+    assert not retryTransient(None, None, State())
+
+
+def test_liquibase_command_uses_history_paths():
+    cmd = liquibaseCommand("liquibase --url 'jdbc:neo4j:bolt://localhost:7687'", "changelogs/terms/t.xml",
+                           "changelogs", "validate")
+    assert cmd == ["liquibase", "--url", "jdbc:neo4j:bolt://localhost:7687", "--search-path", "changelogs",
+                   "--changelog-file", "terms/t.xml", "validate"]
@@ -0,0 +1,16 @@
+import pytest
+
+pytest.importorskip("neo4j")
+
+from neo4j_db import scratchUri
+
+
+def test_scratch_uri_ignores_the_environment(monkeypatch):
+    monkeypatch.setenv("NEO4J_MDB_URI", "bolt://mdb-prod.example.org:7687")
+    assert scratchUri() == "bolt://localhost:7687"
+    assert scratchUri("neo4j://127.0.0.1:7688") == "neo4j://127.0.0.1:7688"
+    with pytest.raises(ValueError, match="--i-know-this-wipes mdb-prod.example.org"):
+        scratchUri("bolt://mdb-prod.example.org:7687")
+    with pytest.raises(ValueError):
+        scratchUri("bolt://mdb-prod.example.org:7687", "mdb-dev.example.org")
+    assert scratchUri("bolt://mdb-dev.example.org", "mdb-dev.example.org") == "bolt://mdb-dev.example.org"
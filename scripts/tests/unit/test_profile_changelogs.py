@@ -0,0 +1,25 @@
+from profile_changelogs import aggregate, pickSample, profileDbHits, statementLabels, statementShape
+
+MAPPING = ("WITH {handle0:'a',model0:'DSS'} AS p MATCH (n0 {handle:p.handle0,model:p.model0})"
+           "-[:has_property]->(n1:property {handle:'x'}) MERGE (n1)-[r0:has_concept]->(n2:concept)")
+
+
+def test_shapes_and_labels():
+    assert statementShape("CREATE (n0:node {handle:'case',model:'ICDC'})") == "CREATE node"
+    assert statementShape("MATCH (n0:node {handle:'a'}), (n1:property {handle:'b'}) "
+                          "MERGE (n0)-[r0:has_property]->(n1)") == "MERGE rel"
+    assert statementShape(MAPPING) == "mapping MERGE (label-less MATCH)"
+    assert statementShape("create index if not exists for (n:node) on (n.nanoid)") == "schema"
+    assert statementLabels("CREATE (n0:term {value:'x'})") == ["term"]
+    assert statementLabels(MAPPING) == ["property", "concept"]
+
+
+def test_sample_and_aggregate():
+    entries = [{"changelog": "a.xml", "seconds": s, "shape": "CREATE node", "labels": ["node"],
+                "db_hits": None, "all_nodes_scan": None} for s in (0.1, 0.5, None, 0.2)]
+    assert pickSample(entries, slowest=2, fraction=0) == [1, 3]
+    entries[1].update(db_hits=40, all_nodes_scan=True)
+    g = aggregate(entries, lambda e: e["labels"])["node"]
+    assert (g["changesets"], g["seconds"], g["profiled"], g["db_hits_per_changeset"], g["all_nodes_scans"]) == (
+        4, 0.8, 1, 40, 1)
+    assert profileDbHits({"dbHits": 3, "children": [{"dbHits": 4, "children": [{"dbHits": 5}]}]}) == 12
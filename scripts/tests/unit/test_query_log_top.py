@@ -0,0 +1,31 @@
+from query_log_top import readRecords, statementShape, topShapes
+
+QUERY_LOG = """\
+2024-05-01 12:00:00.123+0000 INFO  id:12 - 1500 ms: (planning: 10, cpu: 1400, waiting: 3) - 120 page hits, 30 page faults - bolt-session\tbolt\tneo4j-python/5.28.6\t\tclient/172.18.0.1:55555\tserver/172.18.0.2:7687>\tneo4j - neo4j - MATCH (n:node {model: 'ICDC'})
+RETURN n LIMIT 10 - {} - runtime=pipelined - {}
+2024-05-01 12:00:01.123+0000 INFO  id:13 - 2000 ms: (planning: 5, cpu: 1900, waiting: 0) - 100 page hits, 0 page faults - bolt-session\tbolt\tneo4j-python/5.28.6\t\tclient/172.18.0.1:55555\tserver/172.18.0.2:7687>\tneo4j - neo4j - MATCH (n:node {model: "CDS"}) RETURN n LIMIT 25 - {} - runtime=pipelined - {}
+""".splitlines(keepends=True)
+METRICS_LOG = [
+    'mdb-neo4j-metrics  | {"type": "metrics", "page_cache_hit_ratio": 0.9}\n',
+    '{"type": "slow_query", "query": "MATCH (t:term) WHERE t.value IN [\'a\', \'b\'] RETURN t", "elapsed_ms": 1200, '
+    '"page_hits": 5, "page_faults": 5, "wait_ms": 0, "statuses": ["running"]}\n',
+]
+
+
+def test_literals_share_a_shape():
+    assert statementShape("MATCH (n:node {model: 'ICDC'})\n  RETURN n.handle LIMIT 10") == \
+        "MATCH (n:node {model: ?}) RETURN n.handle LIMIT ?"
+    assert statementShape("MATCH (n) WHERE n.x IN [1, 2.5, -3] AND n.y = $p1 RETURN n") == \
+        "MATCH (n) WHERE n.x IN [?] AND n.y = $p1 RETURN n"
+
+
+def test_query_log_and_sampled_queries_ranked_by_total():
+    records = list(readRecords(QUERY_LOG + METRICS_LOG))
+    assert len(records) == 3
+    shapes = topShapes(records)
+    assert [(s["shape"], s["count"], s["total_ms"], s["max_ms"]) for s in shapes] == [
+        ("MATCH (n:node {model: ?}) RETURN n LIMIT ?", 2, 3500, 2000),
+        ("MATCH (t:term) WHERE t.value IN [?] RETURN t", 1, 1200, 1200)]
+    assert shapes[0]["planning_ms"] == 15 and shapes[0]["page_hit_ratio"] == 0.88
+    assert shapes[1]["planning_ms"] is None and shapes[1]["page_hit_ratio"] == 0.5
+    assert [s["count"] for s in topShapes(records, min_ms=1600)] == [1]
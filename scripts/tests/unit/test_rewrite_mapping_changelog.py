@@ -0,0 +1,42 @@
+from cypher import patternPaths
+from rewrite_mapping_changelog import anonymousEndpoints, labelEndpoints, paramValues, parameterize, rewriteStatement
+
+MAPPING = ("MATCH (n2 {handle:'admin',model:'DSS'})-[:has_property]->(n0:property {handle:'md5',model:'DSS'}), "
+           "(n3 {handle:'CONST',model:'C2M2'})-[:has_property]->(n1:property {handle:'sha',model:'C2M2'}) "
+           "OPTIONAL MATCH (n0)-[r1:has_concept]->(n4:concept), (n4)-[r2:has_tag]->(n6:tag {key:'mapping_source',value:'DSS'}) "
+           "WITH n0, n1, n4 FOREACH (_ IN CASE WHEN n4 IS NULL THEN [1] ELSE [] END | CREATE (n8:concept {_commit:'x'}))")
+
+LABELS = {("DSS", "admin"): {"node"}}
+
+
+def test_label_endpoints():
+    text, labelled, unresolved = labelEndpoints(MAPPING, LABELS)
+    assert (labelled, unresolved) == (1, 1)
+    assert text.startswith("MATCH (n2:node {handle:'admin',model:'DSS'})")
+    assert "(n1:property {handle:'sha',model:'C2M2'}) WHERE (n3:node OR n3:relationship) OPTIONAL MATCH" in text
+    assert anonymousEndpoints(text) == []
+    existing = labelEndpoints("MATCH (n {handle:'x',model:'Y'})-[:has_src]->(m:node) WHERE m.handle = 'a' OR m.handle = 'b' RETURN n", {})
+    assert existing[0] == "MATCH (n:relationship {handle:'x',model:'Y'})-[:has_src]->(m:node) WHERE m.handle = 'a' OR m.handle = 'b' RETURN n"
+    where = labelEndpoints("MATCH (n {handle:'x',model:'Y'})-[:has_property]->(m) WHERE m.a = 1 OR m.b = 2 RETURN n", {})
+    assert where[0] == "MATCH (n {handle:'x',model:'Y'})-[:has_property]->(m) WHERE (n:node OR n:relationship) AND (m.a = 1 OR m.b = 2) RETURN n"
+
+
+def test_parameterize():
+    text, _, _ = labelEndpoints(MAPPING, LABELS)
+    out = parameterize(text)
+    params = paramValues(out)
+    assert params["handle0"] == "admin" and params["model2"] == "C2M2" and params["_commit0"] == "x"
+    assert "MATCH (n0:node {handle:p.handle0,model:p.model0})-[:has_property]->(n1:property" in out
+    assert "WITH p, n1, n3, n4 FOREACH" in out
+    assert "'" not in out[out.index(" AS p "):]
+    assert parameterize("MATCH (n:node) WHERE n.handle STARTS WITH 'a' WITH n RETURN n").endswith(
+        "STARTS WITH p.v0 WITH p, n RETURN n")
+
+
+def test_rewrite_is_idempotent_and_keeps_lookups():
+    once = rewriteStatement(MAPPING, LABELS)[0]
+    assert rewriteStatement(once, LABELS) == (once, 0, 0)
+    assert rewriteStatement(once, {}) == (once, 0, 0)
+    paths = patternPaths(once)
+    assert [(n.label, n.keys) for n in paths[0].nodes] == [("node", ("handle", "model")), ("property", ("handle", "model"))]
+    assert rewriteStatement("empty", LABELS) == ("empty", 0, 0)
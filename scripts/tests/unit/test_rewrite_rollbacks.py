@@ -0,0 +1,54 @@
+from changelog import Changeset
+from rewrite_rollbacks import rewriteRollbacks
+
+NODE = "(n0:node {handle:'case',model:'ICDC',desc:'A case',_commit:'c1'})"
+PROP = "(n1:property {handle:'id',model:'ICDC',desc:'Id',_commit:'c1'})"
+PROP2 = "(n0:property {handle:'id',model:'ICDC',desc:'Other id',_commit:'c1'})"
+TERM = "(n1:term {value:'Yes',origin_name:'NCIt'})"
+SOURCE = [
+    Changeset("1", "a", ["CREATE " + NODE], ["MATCH {} DETACH DELETE n0".format(NODE)]),
+    Changeset("2", "a", ["CREATE " + PROP.replace("n1", "n0")], ["MATCH {} DETACH DELETE n0".format(PROP.replace("n1", "n0"))]),
+    Changeset("3", "a", ["CREATE " + PROP2], ["MATCH {} DETACH DELETE n0".format(PROP2)]),
+    Changeset("4", "a", ["MATCH {}, {} MERGE (n0)-[r0:has_property]->(n1)".format(NODE, PROP)],
+              ["MATCH {}-[r0:has_property]->{} DELETE r0".format(NODE, PROP)]),
+    Changeset("5", "a", ["MATCH {}, {} MERGE (n0)-[r0:has_term]->(n1)".format(NODE, TERM)],
+              ["MATCH {}-[r0:has_term]->{} DELETE r0".format(NODE, TERM)]),
+]
+
+
+def test_rollbacks_keyed_on_unique_index_keys():
+    stats = {}
+    out = list(rewriteRollbacks(SOURCE, stats=stats))
+    assert out[0].rollback == ["MATCH (n0:node {model:'ICDC',handle:'case',_commit:'c1'}) DETACH DELETE n0"]
+    # two created properties share (model, handle, _commit): keep the full map
+    assert out[1].rollback == SOURCE[1].rollback and out[2].rollback == SOURCE[2].rollback
+    assert out[4].rollback == [
+        "MATCH (n0:node {model:'ICDC',handle:'case',_commit:'c1'})-[r0:has_term]->" + TERM + " DELETE r0"]
+    assert out[0].cypher == SOURCE[0].cypher
+    assert stats == {"keyed": 3}
+    assert [cs.rollback for cs in rewriteRollbacks(out)] == [cs.rollback for cs in out]
+
+
+def test_nanoid_rollbacks_keep_the_commit():
+    tag = "(n0:tag {key:'k',value:'v',_commit:'c2',nanoid:'tgA123'})"
+    source = [Changeset("1", "a", ["CREATE " + tag], ["MATCH {} DETACH DELETE n0".format(tag)])]
+    keyed = ["MATCH (n0:tag {nanoid:'tgA123',_commit:'c2'}) DETACH DELETE n0"]
+    assert list(rewriteRollbacks(source))[0].rollback == keyed
+    # a rollback already cut down to the nanoid alone gets its _commit back
+    source[0].rollback[:] = ["MATCH (n0:tag {nanoid:'tgA123'}) DETACH DELETE n0"]
+    assert list(rewriteRollbacks(source))[0].rollback == keyed
+
+
+def test_rollbacks_by_commit():
+    out = list(rewriteRollbacks(SOURCE, by_commit=True, batch_size=500))
+    assert out[0].rollback == [
+        "CALL apoc.periodic.iterate(\"MATCH (n:node) WHERE n._commit = 'c1' RETURN n\", "
+        "\"DETACH DELETE n\", {batchSize: 500})",
+        "CALL apoc.periodic.iterate(\"MATCH (n:property) WHERE n._commit = 'c1' RETURN n\", "
+        "\"DETACH DELETE n\", {batchSize: 500})",
+    ]
+    assert out[1].rollback == out[2].rollback == out[3].rollback == ["empty"]
+    # the term was not created here, so its edge still needs its own rollback
+    assert out[4].rollback[0].startswith("MATCH (n0:node {model:'ICDC',handle:'case',_commit:'c1'})-[r0:has_term]")
+    assert [cs.rollback for cs in rewriteRollbacks(out, by_commit=True, batch_size=500)] == \
+        [cs.rollback for cs in out]
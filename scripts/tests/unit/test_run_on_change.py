@@ -0,0 +1,43 @@
+from changelog import Changeset, contentChecksum
+from run_on_change import convertChangesets, rerunChangesets, verifiedIds
+
+MAPPING = "WITH {handle0:'a'} AS p MATCH (n0:node {handle:p.handle0}) RETURN n0"
+
+
+def test_convert_keeps_attribute_position():
+    changesets = [
+        Changeset("1", "NWM", [MAPPING], attrs={"runAlways": "true", "context": "dev"}),
+        Changeset("2", "NWM", [MAPPING], attrs={"runAlways": "true"}),
+        Changeset("3", "NWM", [MAPPING]),
+    ]
+    stats = {}
+    out = list(convertChangesets(changesets, ids={"1"}, stats=stats))
+    assert list(out[0].attrs.items()) == [("runOnChange", "true"), ("context", "dev")]
+    assert out[0].run_on_change and not out[0].run_always
+    assert out[1] is changesets[1] and out[2] is changesets[2]
+    assert stats == {"converted": 1, "kept": 1}
+
+
+def test_verified_ids():
+    report = {"idempotent": ["1", "2"], "not_idempotent": {"3": {"nodes_created": 1}}, "unverified": ["4"]}
+    assert verifiedIds(report) == {"1", "2"}
+    assert verifiedIds(report, include_unverified=True) == {"1", "2", "4"}
+
+
+def test_content_checksum_ignores_attributes_and_whitespace():
+    a = Changeset("1", "NWM", [MAPPING], ["empty"], attrs={"runAlways": "true"})
+    b = Changeset("1", "NWM", ["  " + MAPPING.replace(" ", "\n  ")], ["empty"], attrs={"runOnChange": "true"})
+    assert contentChecksum(a) == contentChecksum(b)
+    assert contentChecksum(a) != contentChecksum(Changeset("1", "NWM", [MAPPING.replace("'a'", "'b'")], ["empty"]))
+    assert contentChecksum(a) != contentChecksum(Changeset("1", "NWM", [MAPPING], []))
+
+
+def test_rerun_after_reload_picks_runonchange_mappings_of_the_model():
+    dss = "WITH {handle0:'a',model0:'DSS',handle2:'b',model2:'C2M2'} AS p MATCH (n0:node {handle:p.handle0}) RETURN n0"
+    changesets = [
+        Changeset("1", "NWM", [dss], attrs={"runOnChange": "true"}),
+        Changeset("2", "NWM", [dss], attrs={"runAlways": "true"}),
+        Changeset("3", "NWM", [MAPPING], attrs={"runOnChange": "true"}),
+    ]
+    assert [cs.id for cs in rerunChangesets(changesets, ["C2M2"])] == ["1"]
+    assert rerunChangesets(changesets, ["ICDC"]) == []
@@ -0,0 +1,20 @@
+from search_benchmark import isRelevant, luceneQuery, makeQueries, scoreHits
+
+
+def test_relevance_ignores_the_analyzer():
+    assert isRelevant("word", "checksum", ["data_file_checksum_type"])
+    assert isRelevant("prefix", "carc", ["Carcinoma, NOS"])
+    assert isRelevant("phrase", "Not Reported", ["not reported"])
+    assert not isRelevant("phrase", "Not Reported", ["Reported, not verified"])
+    assert luceneQuery("word", "C83.32") == "C83.32" and luceneQuery("prefix", "icd-") == "icd\\-*"
+    assert luceneQuery("phrase", "Not Reported") == '"not reported"'
+    assert scoreHits([1, 2, 3], {2, 9}, 2) == (0.5, 0.5)
+    assert scoreHits([], set(), 2) == (None, None)
+
+
+def test_queries_are_reproducible():
+    entities = {i: [v] for i, v in enumerate(
+        ["Adenocarcinoma", "Not Reported", "Unknown", "file_checksum", "Carcinoma in situ"])}
+    queries = makeQueries(entities, 2, seed=7)
+    assert queries == makeQueries(entities, 2, seed=7)
+    assert {kind for kind, _ in queries} == {"word", "prefix", "phrase"}
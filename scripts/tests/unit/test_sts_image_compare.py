@@ -0,0 +1,8 @@
+from sts_image_compare import summarizeImage
+
+
+def test_medians_and_failed_starts():
+    assert summarizeImage(412_345_678, 98_765_432, 9, [4.0, 3.0, 5.0], [2.5, None, 1.5]) == {
+        "size_mb": 412.3, "compressed_mb": 98.8, "layers": 9, "pull_s": 4.0,
+        "first_request_s": 2.0, "failed_starts": 1}
+    assert summarizeImage(1, 1, 1, [1.0], [None])["first_request_s"] is None
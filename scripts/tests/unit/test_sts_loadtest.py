@@ -0,0 +1,19 @@
+from sts_loadtest import summarizeStats
+
+HEADER = ("Type,Name,Request Count,Failure Count,Median Response Time,Average Response Time,Min Response Time,"
+          "Max Response Time,Average Content Size,Requests/s,Failures/s,50%,66%,75%,80%,90%,95%,98%,99%,99.9%,99.99%,100%")
+
+
+def test_summarize_stats(tmp_path):
+    stats = tmp_path / "gthread_stats.csv"
+    stats.write_text("\n".join([
+        HEADER,
+        "GET,/v1/models,100,0,12,14.2,5,80,512,10.0,0.0,12,13,15,16,20,30,40,50,80,80,80",
+        "GET,/v1/tags,300,2,20,22.0,6,200,2048,30.0,0.2,20,22,24,25,40,60,90,120,200,200,200",
+        ",Aggregated,400,2,18,20.1,5,200,1664,40.04,0.2,18,20,22,24,35,55,85,110,200,200,200",
+    ]) + "\n")
+    summary = summarizeStats(str(stats))
+    assert summary["requests"] == 400 and summary["failures"] == 2
+    assert summary["rps"] == 40.0
+    assert (summary["p50_ms"], summary["p95_ms"], summary["p99_ms"]) == (18.0, 55.0, 110.0)
+    assert summary["paths"]["/v1/tags"] == {"requests": 300, "p95_ms": 60.0}
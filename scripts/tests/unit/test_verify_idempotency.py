@@ -0,0 +1,16 @@
+import os
+
+from changelog import iterChangesets
+from verify_idempotency import staticVerdict
+
+DSS = os.path.join(os.path.dirname(__file__), "..", "..", "..", "changelogs", "mappings", "DSS", "dss_map_changelog.xml")
+
+
+def test_guarded_mappings_are_idempotent_only_with_matching_tags():
+    statement = next(iter(iterChangesets(DSS))).cypher[0]
+    assert staticVerdict(statement) == "idempotent"
+    # the created tag no longer matches what the guards look for
+    assert staticVerdict(statement.replace("value2:'DSS'", "value2:'other'", 1)) == "not_idempotent"
+    # an unguarded write is not recognized
+    assert staticVerdict(statement.replace("WITH p, n1, n3, n4, n6", "CREATE (x:tag) WITH p, n1, n3, n4, n6")) == "unverified"
+    assert staticVerdict("CREATE (n0:node {handle:'a'})") == "unverified"
@@ -0,0 +1,48 @@
+from changelog import Changeset, writeChangelog
+from verify_load import compareCounts, expectedCounts, reconcileEntities, resolveExpected
+
+NODE = "(n0:node {handle:'case',model:'ICDC',_commit:'abc'})"
+PROP = "(n1:property {handle:'age',model:'ICDC',nanoid:'XyZ123',_commit:'abc'})"
+GONE = "(n0:property {handle:'sex',model:'ICDC',nanoid:'AbC456',_commit:'abc'})"
+
+
+def test_resolves_the_expected_graph(tmp_path):
+    path = str(tmp_path / "icdc_changelog.xml")
+    writeChangelog(path, [
+        Changeset("1", "NWM", ["CREATE " + NODE]),
+        Changeset("2", "NWM", ["CREATE " + PROP.replace("n1", "n0")]),
+        Changeset("3", "NWM", ["CREATE " + GONE]),
+        Changeset("4", "NWM", ["MATCH " + NODE + ", " + PROP + " MERGE (n0)-[r0:has_property]->(n1)"]),
+        Changeset("5", "NWM", ["MATCH " + NODE + ", " + GONE.replace("n0", "n1") + " MERGE (n0)-[r0:has_property]->(n1)"]),
+        Changeset("6", "NWM", ["MATCH " + GONE + " DETACH DELETE n0"]),
+        Changeset("7", "NWM", ["WITH {h:'case'} AS p MATCH (n0:node {handle:p.h}) MERGE (n0)-[:has_tag]->(t:tag {key:'k'})"]),
+    ])
+    graph, unresolved, touched = resolveExpected([path])
+    nodes, rels = expectedCounts(graph)
+    assert nodes == {("ICDC", "node", "abc"): 1, ("ICDC", "property", "abc"): 1}
+    assert rels == {("ICDC", "node", "has_property", "property"): 1}
+    assert unresolved == [(path, "7")]
+    # extra tags are not held against the load while a changeSet that makes them is unverified
+    assert touched == {"tag", "has_tag"}
+
+
+def test_reconciles_entities_and_counts():
+    expected = [("node", {"handle": "case", "model": "ICDC", "desc": "A case"}),
+                ("property", {"handle": "age", "model": "ICDC", "nanoid": "XyZ123"}),
+                ("property", {"handle": "sex", "model": "ICDC", "nanoid": "AbC456"})]
+    candidates = {
+        # the trigger's nanoid is not held against the node; its desc is
+        ("node", ("ICDC", "case")): [{"handle": "case", "model": "ICDC", "desc": "old", "nanoid": "t1"}],
+        ("property", ("ICDC", "age")): [{"handle": "age", "model": "ICDC", "nanoid": "XyZ123"}],
+        ("property", ("ICDC", "sex")): [{"handle": "sex", "model": "ICDC", "nanoid": "other"}],
+    }
+    missing, mismatched, claimed = reconcileEntities(expected, candidates)
+    assert mismatched == [{"label": "node", "key": ["ICDC", "case"], "differs": ["desc"]}]
+    assert [m["key"] for m in missing] == [["ICDC", "sex"]]
+    assert claimed == {("node", "t1"), ("property", "XyZ123")}
+
+    expected_counts = {("ICDC", "node", "abc"): 2, ("-", "term", "abc"): 5}
+    actual = {("ICDC", "node", "abc"): 1, ("-", "term", "abc"): 7, ("ICDC", "tag", "-"): 1, ("GDC", "node", "x"): 3}
+    rows = compareCounts(expected_counts, actual, lambda g: g in expected_counts or g[0] == "ICDC", tolerated={"term"})
+    assert rows == [{"group": ["ICDC", "node", "abc"], "expected": 2, "actual": 1},
+                    {"group": ["ICDC", "tag", "-"], "expected": 0, "actual": 1}]
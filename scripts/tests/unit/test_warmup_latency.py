@@ -0,0 +1,12 @@
+from warmup_latency import summarizeStart
+
+
+def test_first_query_apart_from_repeats():
+    runs = [{"model nodes": 850.04, "term search": 120.0},
+            {"model nodes": 12.0, "term search": 3.0},
+            {"model nodes": 10.0, "term search": 5.0},
+            {"model nodes": 30.0, "term search": 4.0}]
+    assert summarizeStart(41.26, runs) == {"ready_s": 41.3, "queries": {
+        "model nodes": {"first_ms": 850.0, "repeat_ms": 12.0},
+        "term search": {"first_ms": 120.0, "repeat_ms": 4.0}}}
+    assert summarizeStart(1, runs[:1])["queries"]["term search"]["repeat_ms"] is None
@@ -0,0 +1,213 @@
+"""
+Check that a changelog can safely run more than once, before its changeSets
+are switched from runAlways to runOnChange (see run_on_change.py).
+
+The changelog is loaded into an emptied scratch database (after --setup and
+--prereq changelogs), the graph is snapshotted, every changeSet is applied a
+second time regardless of history, and the graph is snapshotted again. The
+snapshots compare labels, properties and relationships by content;
+nanoids are left out because the trigger assigns them asynchronously.
+
+Each changeSet ends up in one of three lists:
+- idempotent: changed the graph on the first run and not on the second;
+- not_idempotent: created or deleted nodes, relationships or labels on the second run;
+- unverified: changed nothing on the first run either, usually because the
+  entities it matches were not loaded (add the model changelogs with --prereq).
+
+  python scripts/verify_idempotency.py changelogs/mappings/DSS/dss_map_changelog.xml \
+    --setup changelogs/mdb_setup_changelog.xml --prereq changelogs/models/DSS/dss_changelog_0.0.1.xml \
+    --output idempotency.json
+
+Exits 1 if the graph changed on the second run. This empties the target
+database, so it connects to --uri or the local container, never to
+NEO4J_MDB_URI; a --uri on another host also needs --i-know-this-wipes <host>.
+
+--static checks the changelog without a database instead. It recognizes
+bento-meta's guarded mapping statement: MATCH the two properties, OPTIONAL
+MATCH the concept each one has with a given tag, and write only inside
+FOREACH guards on which of those concepts is missing (MERGE the missing
+has_concept, or CREATE a tagged concept for both). Such a statement writes
+nothing on a second run if the tag it creates is the tag both guards look
+for. Statements of that shape whose tags differ are not idempotent, and
+any other statement is unverified:
+
+  python scripts/verify_idempotency.py changelogs/mappings/DSS/dss_map_changelog.xml --static --output idempotency.json
+"""
+import re
+import json
+import argparse
+from collections import Counter
+
+from changelog import iterChangesets
+from cypher import CypherParseError, maskStrings, parseMap
+
+VOLATILE_PROPS = ("nanoid",)
+GRAPH_CHANGES = ("nodes_created", "nodes_deleted", "relationships_created", "relationships_deleted",
+                 "labels_added", "labels_removed")
+
+NODES = """
+MATCH (n) WHERE none(l IN labels(n) WHERE l STARTS WITH '__Liquibase')
+RETURN id(n) AS id, labels(n) AS labels, properties(n) AS props
+"""
+
+RELS = """
+MATCH (a)-[r]->(b) WHERE none(l IN labels(a) WHERE l STARTS WITH '__Liquibase')
+RETURN id(a) AS src, type(r) AS type, id(b) AS dst, properties(r) AS props
+"""
+
+_CONCEPT = r"OPTIONAL MATCH \((?P<{0}>n\d+)\)-\[\w+:has_concept\]->\((?P<c{0}>n\d+):concept\), " \
+           r"\((?P=c{0})\)-\[\w+:has_tag\]->\(\w+:tag \{{key:p\.(?P<key_{0}>\w+),value:p\.(?P<value_{0}>\w+)\}}\) "
+_GUARD = r"FOREACH\s+\(_ IN CASE WHEN (?P=ca) IS {} AND (?P=cb) IS {}\s+THEN \[1\] ELSE \[\] END \| "
+_GUARDED_MAPPING = re.compile(
+    r"^WITH (?P<params>\{.*?\}) AS p (?P<match>MATCH .*?) " + _CONCEPT.format("a") + _CONCEPT.format("b") +
+    r"WITH p, (?P=a), (?P=b), (?P=ca), (?P=cb) " +
+    _GUARD.format("NOT NULL", "NULL") + r"MERGE \((?P=b)\)-\[\w+:has_concept\]->\((?P=ca)\) \) " +
+    _GUARD.format("NULL", "NOT NULL") + r"MERGE \((?P=a)\)-\[\w+:has_concept\]->\((?P=cb)\) \) " +
+    _GUARD.format("NULL", "NULL") +
+    r"CREATE \((?P<c>n\d+):concept \{[^{}]*\}\)-\[\w+:has_tag\]->\(\w+:tag \{key:p\.(?P<key_c>\w+),value:p\.(?P<value_c>\w+)[^{}]*\}\) "
+    r"CREATE \((?P=a)\)-\[\w+:has_concept[^\]]*\]->\((?P=c)\) CREATE \((?P=b)\)-\[\w+:has_concept[^\]]*\]->\((?P=c)\) \)$",
+    re.S)
+_WRITE = re.compile(r"\b(CREATE|MERGE|SET|DELETE|REMOVE|CALL)\b", re.I)
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="verify a changelog leaves the graph unchanged when run twice")
+    parser.add_argument("changelog", help="changelog to verify")
+    parser.add_argument("--setup", action="append", default=[],
+                        help="schema changelog applied first, without history (repeatable)")
+    parser.add_argument("--prereq", action="append", default=[],
+                        help="changelog loaded before the one being verified (repeatable)")
+    parser.add_argument("--static", action="store_true", help="check the statements without a database")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    parser.add_argument("--uri", help="database to empty and load (default bolt://localhost:7687)")
+    parser.add_argument("--i-know-this-wipes", metavar="HOST", dest="wipe_host",
+                        help="allow a --uri on this host other than localhost; everything in it is deleted")
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    return parser.parse_args()
+
+
+def _freeze(props):
+    return tuple(sorted((k, tuple(v) if isinstance(v, list) else v)
+                        for k, v in props.items() if k not in VOLATILE_PROPS))
+
+
+def graphSnapshot(session):
+    """(node multiset, relationship multiset), both keyed by content rather than internal ids."""
+    keys = {}
+    nodes = Counter()
+    for r in session.run(NODES):
+        keys[r["id"]] = (tuple(sorted(r["labels"])), _freeze(r["props"]))
+        nodes[keys[r["id"]]] += 1
+    rels = Counter((keys.get(r["src"]), r["type"], keys.get(r["dst"]), _freeze(r["props"])) for r in session.run(RELS))
+    return nodes, rels
+
+
+def diffSnapshots(before, after, examples=5):
+    diff = {}
+    for name, b, a in (("nodes", before[0], after[0]), ("relationships", before[1], after[1])):
+        added, removed = a - b, b - a
+        diff[name] = {
+            "added": sum(added.values()),
+            "removed": sum(removed.values()),
+            "examples": [repr(k) for k in list(added)[:examples]] + [repr(k) for k in list(removed)[:examples]],
+        }
+    return diff
+
+
+def verifyChangelog(session, file_name, setup=(), prereqs=()):
+    from neo4j_db import applyChangelog, applySetup, clearDatabase
+    clearDatabase(session)
+    for schema in setup:
+        applySetup(session, iterChangesets(schema))
+    for prereq in prereqs:
+        applyChangelog(session, iterChangesets(prereq))
+    first = applyChangelog(session, iterChangesets(file_name))
+    before = graphSnapshot(session)
+    second = applyChangelog(session, iterChangesets(file_name), record_history=False, skip_ran=False)
+    after = graphSnapshot(session)
+    clearDatabase(session)
+
+    report = {"changelog": file_name, "idempotent": [], "not_idempotent": {}, "unverified": []}
+    effect = {cs.id: counters for cs, _, counters in first}
+    for cs, _, counters in second:
+        changes = {k: v for k, v in counters.items() if k in GRAPH_CHANGES}
+        if changes:
+            report["not_idempotent"][cs.id] = changes
+        elif not any(k in GRAPH_CHANGES or k == "properties_set" for k in effect.get(cs.id, {})):
+            report["unverified"].append(cs.id)
+        else:
+            report["idempotent"].append(cs.id)
+    report["diff"] = diffSnapshots(before, after)
+    report["graph_unchanged"] = before == after
+    return report
+
+
+### Static check ##############################################################
+
+def staticVerdict(statement):
+    """idempotent, not_idempotent or unverified, for one guarded mapping statement (see --static)."""
+    m = _GUARDED_MAPPING.match(statement.strip())
+    if not m or _WRITE.search(maskStrings(m.group("match"))):
+        return "unverified"
+    try:
+        params = parseMap(m.group("params"))
+    except CypherParseError:
+        return "unverified"
+    tags = {(params.get(m.group("key_" + side)), params.get(m.group("value_" + side))) for side in "abc"}
+    return "idempotent" if len(tags) == 1 else "not_idempotent"
+
+
+def verifyStatic(file_name):
+    report = {"changelog": file_name, "method": "static", "idempotent": [], "not_idempotent": {}, "unverified": []}
+    for cs in iterChangesets(file_name):
+        verdicts = {staticVerdict(stmt) for stmt in cs.cypher} or {"unverified"}
+        if "not_idempotent" in verdicts:
+            report["not_idempotent"][cs.id] = {"reason": "the created tag differs from a tag its guards match"}
+        elif verdicts == {"idempotent"}:
+            report["idempotent"].append(cs.id)
+        else:
+            report["unverified"].append(cs.id)
+    return report
+
+
+def printReport(report):
+    print(report["changelog"])
+    static = report.get("method") == "static"
+    print("  idempotent: {}  not idempotent: {}  unverified ({}): {}".format(
+        len(report["idempotent"]), len(report["not_idempotent"]),
+        "not a guarded mapping" if static else "no effect on first run", len(report["unverified"])))
+    for cs_id, changes in report["not_idempotent"].items():
+        print("    {}: {}".format(cs_id, changes.get("reason") or ", ".join("{} {}".format(v, k) for k, v in changes.items())))
+    if static:
+        return
+    for name, diff in report["diff"].items():
+        if diff["added"] or diff["removed"]:
+            print("  {}: +{} -{}".format(name, diff["added"], diff["removed"]))
+            for example in diff["examples"]:
+                print("    " + example)
+    print("  graph unchanged by second run: {}".format(report["graph_unchanged"]))
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    if args.static:
+        report = verifyStatic(args.changelog)
+    else:
+        from neo4j_db import getDriver, scratchUri
+        try:
+            uri = scratchUri(args.uri, args.wipe_host)
+        except ValueError as e:
+            raise SystemExit(e)
+        driver = getDriver(uri, args.user, args.password)
+        try:
+            with driver.session() as session:
+                report = verifyChangelog(session, args.changelog, args.setup, args.prereq)
+        finally:
+            driver.close()
+    printReport(report)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+    if not report.get("graph_unchanged", True) or report["not_idempotent"]:
+        raise SystemExit(1)
@@ -0,0 +1,307 @@
+"""
+Reconcile a loaded MDB against the changelogs it was loaded from.
+
+The changelogs (directories are expanded in load order) are streamed and
+their statements resolved offline into the graph they should have produced,
+as bulk_import.py resolves them, with deletes applied too. That graph is
+then compared with the database in a handful of batched queries:
+
+- entity counts per model, label and _commit, and relationship counts per
+  model, source label, type and target label (one aggregate query each);
+- every expected entity is looked up by its label's indexed key (KEY_PROPS)
+  with UNWIND batches of --batch keys, and reported missing when no entity
+  with its key (or declared nanoid) exists, or mismatched when one does but
+  a property differs;
+- model-scoped entities (node, property, relationship) of the models in the
+  changelogs that no changelog accounts for are reported as extra.
+
+Nanoids the changelogs do not declare are ignored: the trigger or a bulk
+import assigns them. ChangeSets that cannot be resolved offline (the WITH
+... MATCH mapping statements) are counted as unresolved, and extra entities
+or relationships with a label or type they MERGE or CREATE are not held
+against the load. Reconciling a single diff changelog needs the changelogs it builds on
+in front of it.
+
+  python scripts/verify_load.py changelogs --output verify.json
+  python scripts/verify_load.py changelogs/models/create_model_node_changelog.xml changelogs/models/mCODE
+
+Exits 1 when anything is missing, mismatched or extra, so it can gate a
+release switch (see blue_green_switch.py).
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from collections import Counter, defaultdict
+
+from bulk_import import Graph, _hashable
+from changelog import changelogFiles, iterChangesets
+from cypher import _NODE_PATTERN, isSchemaStatement, maskStrings, parseStatement
+
+# indexed properties each label is looked up by (see mdb_setup_changelog.xml, mdb_index_changelog_*.xml)
+KEY_PROPS = {
+    "node": ("model", "handle"),
+    "property": ("model", "handle"),
+    "relationship": ("nanoid",),
+    "value_set": ("_id",),
+    "term": ("value", "origin_name"),
+    "concept": ("nanoid",),
+    "tag": ("key", "value"),
+    "origin": ("name",),
+    "model": ("handle",),
+}
+MODEL_LABELS = ("node", "property", "relationship")
+RESOLVED = ("create_node", "merge_node", "merge_edge", "delete_node", "delete_edge", "empty")
+_REL_TYPE = re.compile(r"\[\s*\w*\s*:\s*(\w+)")
+_CLAUSE = re.compile(r"\b(MATCH|OPTIONAL|MERGE|CREATE|WITH|WHERE|RETURN|UNWIND|SET|DELETE|DETACH|ON|CALL)\b", re.I)
+
+NODE_COUNTS = """
+MATCH (n) WHERE none(l IN labels(n) WHERE l STARTS WITH '__Liquibase')
+RETURN coalesce(n.model, '-') AS model, head(labels(n)) AS label, coalesce(n._commit, '-') AS commit, count(*) AS n
+"""
+REL_COUNTS = """
+MATCH (a)-[r]->(b) WHERE none(l IN labels(a) WHERE l STARTS WITH '__Liquibase')
+RETURN coalesce(a.model, '-') AS model, head(labels(a)) AS src, type(r) AS type, head(labels(b)) AS dst, count(*) AS n
+"""
+LOOKUP = "UNWIND $keys AS key MATCH (n:{label}) WHERE {where} RETURN key, properties(n) AS props"
+MODEL_ENTITIES = "MATCH (n:{label}) WHERE n.model IN $models RETURN properties(n) AS props"
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="reconcile a loaded MDB against its changelogs")
+    parser.add_argument("paths", nargs="+", help="changelog directories (expanded in load order) or files")
+    parser.add_argument("--batch", type=int, default=5000, help="keys per lookup query (default 5000)")
+    parser.add_argument("--examples", type=int, default=10, help="examples listed per problem (default 10)")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    parser.add_argument("--uri")
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    return parser.parse_args()
+
+
+### Expected graph ############################################################
+
+class ExpectedGraph(Graph):
+    """bulk_import.Graph with DETACH DELETE and relationship DELETE applied."""
+    def __init__(self):
+        super().__init__()
+        self.deleted = set()
+
+    def find(self, entity):
+        return [i for i in super().find(entity) if i not in self.deleted]
+
+    def apply(self, stmt):
+        if stmt.kind == "empty":
+            return
+        if stmt.kind == "delete_node":
+            gone = set(self.find(stmt.node))
+            self.deleted |= gone
+            self.rels = {k: v for k, v in self.rels.items() if k[0] not in gone and k[2] not in gone}
+        elif stmt.kind == "delete_edge":
+            for src in self.find(stmt.src):
+                for dst in self.find(stmt.dst):
+                    self.rels.pop((src, stmt.rel_type, dst), None)
+        else:
+            super().apply(stmt)
+
+    def entities(self):
+        return ((i, label, self.props[i]) for i, label in enumerate(self.labels) if i not in self.deleted)
+
+
+def expandPaths(paths):
+    files = []
+    for path in paths:
+        for file_name in (changelogFiles(path) if os.path.isdir(path) else [path]):
+            if file_name not in files:
+                files.append(file_name)
+    return files
+
+
+def resolveExpected(files):
+    """(ExpectedGraph, unresolved [(changelog, id)], labels and types the unresolved create)"""
+    graph = ExpectedGraph()
+    unresolved, touched = [], set()
+    for file_name in files:
+        for changeset in iterChangesets(file_name):
+            cypher = [s for s in changeset.cypher if not isSchemaStatement(s)]
+            stmts = [parseStatement(s) for s in cypher]
+            if all(s is not None and s.kind in RESOLVED for s in stmts):
+                for stmt in stmts:
+                    graph.apply(stmt)
+                continue
+            unresolved.append((file_name, changeset.id))
+            for text in cypher:
+                touched |= createdLabels(text)
+    return graph, unresolved, touched
+
+
+def createdLabels(text):
+    """Labels and relationship types in the MERGE and CREATE clauses of a statement."""
+    parts = _CLAUSE.split(maskStrings(text))
+    out = set()
+    for clause, body in zip(parts[1::2], parts[2::2]):
+        if clause.upper() in ("MERGE", "CREATE"):
+            out.update(l for m in _NODE_PATTERN.finditer(body) for l in m.group(2).replace(" ", "").split(":") if l)
+            out.update(_REL_TYPE.findall(body))
+    return out
+
+
+def expectedCounts(graph):
+    nodes = Counter((props.get("model") or "-", label, props.get("_commit") or "-")
+                    for _, label, props in graph.entities())
+    rels = Counter((graph.props[src].get("model") or "-", graph.labels[src], rel_type, graph.labels[dst])
+                   for src, rel_type, dst in graph.rels)
+    return nodes, rels
+
+
+### Comparing #################################################################
+
+def compareCounts(expected, actual, in_scope, tolerated=()):
+    """Groups whose counts differ: [{group, expected, actual}] for groups in_scope(group)."""
+    rows = []
+    for group in sorted(set(expected) | set(actual), key=str):
+        if not in_scope(group):
+            continue
+        e, a = expected.get(group, 0), actual.get(group, 0)
+        if e == a or (a > e and tolerated and any(part in tolerated for part in group[1:])):
+            continue
+        rows.append({"group": list(group), "expected": e, "actual": a})
+    return rows
+
+
+def lookupKey(label, props):
+    """The KEY_PROPS values of props, or None if the label has none or a value is missing."""
+    keys = KEY_PROPS.get(label)
+    if not keys or any(props.get(k) is None for k in keys):
+        return None
+    return tuple(_hashable(props[k]) for k in keys)
+
+
+def _differences(expected, actual):
+    return sorted(k for k, v in expected.items() if _hashable(actual.get(k)) != _hashable(v))
+
+
+def reconcileEntities(expected, candidates):
+    """
+    expected: [(label, props)]; candidates: {(label, key): [db props]}.
+    Returns (missing, mismatched, claimed) where claimed holds the
+    (label, nanoid or key) of the database entities accounted for.
+    """
+    missing, mismatched, claimed = [], [], set()
+    for label, props in expected:
+        key = lookupKey(label, props)
+        found = candidates.get((label, key), [])
+        if "nanoid" in props:
+            found = [c for c in found if c.get("nanoid") == props["nanoid"]]
+        exact = [c for c in found if not _differences(props, c)]
+        for c in exact or found[:1]:
+            claimed.add((label, c.get("nanoid") or key))
+        if exact:
+            continue
+        if found:
+            mismatched.append({"label": label, "key": list(key), "differs": _differences(props, found[0])})
+        else:
+            missing.append({"label": label, "key": list(key), "props": props})
+    return missing, mismatched, claimed
+
+
+def fetchCandidates(session, label, keys, batch=5000):
+    """{(label, key): [props]} of the database entities with the given keys, in batches."""
+    props_names = KEY_PROPS[label]
+    where = " AND ".join("n.{} = key[{}]".format(p, i) for i, p in enumerate(props_names))
+    query = LOOKUP.format(label=label, where=where)
+    keys = sorted(keys, key=str)
+    out = defaultdict(list)
+    for start in range(0, len(keys), batch):
+        for r in session.run(query, keys=[list(k) for k in keys[start:start + batch]]):
+            out[(label, tuple(_hashable(v) for v in r["key"]))].append(dict(r["props"]))
+    return out
+
+
+def verifyLoad(session, files, batch=5000, examples=10):
+    timings = {}
+    start = time.perf_counter()
+    graph, unresolved, touched = resolveExpected(files)
+    expected_nodes, expected_rels = expectedCounts(graph)
+    models = sorted({props["model"] for _, label, props in graph.entities() if label in MODEL_LABELS})
+    timings["resolve"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual_nodes = Counter({(r["model"], r["label"], r["commit"]): r["n"] for r in session.run(NODE_COUNTS)})
+    actual_rels = Counter({(r["model"], r["src"], r["type"], r["dst"]): r["n"] for r in session.run(REL_COUNTS)})
+    expected_groups = set(expected_nodes) | set(expected_rels)
+
+    def in_scope(group):
+        return group in expected_groups or group[0] in models
+    counts = {"entities": compareCounts(expected_nodes, actual_nodes, in_scope, touched),
+              "relationships": compareCounts(expected_rels, actual_rels, in_scope, touched)}
+    timings["counts"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = [(label, props) for _, label, props in graph.entities() if lookupKey(label, props) is not None]
+    candidates = {}
+    for label in KEY_PROPS:
+        keys = {lookupKey(l, p) for l, p in expected if l == label}
+        if keys:
+            candidates.update(fetchCandidates(session, label, keys, batch))
+    missing, mismatched, claimed = reconcileEntities(expected, candidates)
+    extra = []
+    for label in MODEL_LABELS:
+        if label in touched or not models:
+            continue
+        for r in session.run(MODEL_ENTITIES.format(label=label), models=models):
+            props = dict(r["props"])
+            if (label, props.get("nanoid")) not in claimed and (label, lookupKey(label, props)) not in claimed:
+                extra.append({"label": label, "key": list(lookupKey(label, props) or ()), "nanoid": props.get("nanoid")})
+    timings["entities"] = time.perf_counter() - start
+
+    return {
+        "changelogs": files,
+        "models": models,
+        "expected": {"entities": sum(expected_nodes.values()), "relationships": sum(expected_rels.values()),
+                     "keyed": len(expected)},
+        "unresolved_changesets": len(unresolved),
+        "unresolved_examples": [list(u) for u in unresolved[:examples]],
+        "missing": len(missing), "mismatched": len(mismatched), "extra": len(extra),
+        "examples": {"missing": missing[:examples], "mismatched": mismatched[:examples], "extra": extra[:examples]},
+        "counts": counts,
+        "timings": {k: round(v, 3) for k, v in timings.items()},
+        "ok": not (missing or mismatched or extra or counts["entities"] or counts["relationships"]),
+    }
+
+
+def printReport(report):
+    print("{} changelogs, models {}".format(len(report["changelogs"]), ", ".join(report["models"]) or "-"))
+    print("expected {entities} entities ({keyed} keyed), {relationships} relationships".format(**report["expected"]))
+    if report["unresolved_changesets"]:
+        print("unresolved offline (not verified): {} changeSets".format(report["unresolved_changesets"]))
+    print("missing {}, mismatched {}, extra {}".format(report["missing"], report["mismatched"], report["extra"]))
+    for kind, rows in report["examples"].items():
+        for row in rows:
+            print("  {} {} {}{}".format(kind, row["label"], tuple(row["key"]),
+                                        " differs in " + ", ".join(row["differs"]) if "differs" in row else ""))
+    for kind, rows in report["counts"].items():
+        for row in rows:
+            print("  {} count {}: expected {}, found {}".format(kind, "/".join(row["group"]), row["expected"], row["actual"]))
+    print("timings: " + ", ".join("{} {:.2f}s".format(k, v) for k, v in report["timings"].items()))
+    print("OK" if report["ok"] else "FAILED")
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    from neo4j_db import getDriver
+    files = expandPaths(args.paths)
+    driver = getDriver(args.uri, args.user, args.password)
+    try:
+        with driver.session() as session:
+            report = verifyLoad(session, files, args.batch, args.examples)
+    finally:
+        driver.close()
+    printReport(report)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+    if not report["ok"]:
+        sys.exit(1)
@@ -0,0 +1,137 @@
+"""
+Show the latency of the first queries after Neo4j starts, with and without
+the warmup entry point of the CDK neo4j service ([neo4j] warmup, see
+devops/awscdk/mdb/mdb_app/services/neo4j_warmup.sh).
+
+The neo4j and neo4j-warmup services of docker-compose.yml share one data
+volume. Load it once, then for each mode the script starts Neo4j afresh:
+
+  cold    the neo4j service, ready as soon as bolt accepts connections
+          (what the NLB's TCP health check used to wait for)
+  warmup  the neo4j-warmup service, ready once its health check passes
+          (what the container and NLB health checks wait for with warmup)
+
+As soon as a mode is ready, it times the STS-like QUERIES in order on a
+new connection, and then --repeat more times. The report has the seconds
+to ready, the first run of each query and the median of the repeats.
+Restarting Neo4j empties its page cache, but the store files may still be
+in the OS file cache. --drop-caches empties that cache before each start
+(with a privileged container; Linux or Docker Desktop), so the first
+queries read from disk as on a new Fargate task.
+
+  docker compose -f scripts/docker-compose.yml up -d neo4j
+  python scripts/parallel_load.py changelogs --bulk
+  python scripts/warmup_latency.py --drop-caches --output warmup.json
+"""
+import os
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+COMPOSE_FILE = os.path.join(HERE, "docker-compose.yml")
+SERVICES = {"cold": "neo4j", "warmup": "neo4j-warmup"}
+# what STS asks for a model, its properties' terms and a term search
+QUERIES = {
+    "model nodes": "MATCH (n:node {model: $model})-[:has_property]->(p:property) RETURN n.handle, count(p)",
+    "property terms": "MATCH (p:property {model: $model})-[:has_value_set]->(:value_set)-[:has_term]->(t:term) "
+                      "RETURN p.handle, count(t)",
+    "term search": "CALL db.index.fulltext.queryNodes('termValue', 'carcinoma') YIELD node RETURN count(node)",
+}
+DROP_CACHES = ["docker", "run", "--rm", "--privileged", "alpine", "sh", "-c", "sync; echo 3 > /proc/sys/vm/drop_caches"]
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(description="time the first queries after a cold and a warmed-up Neo4j start")
+    parser.add_argument("--modes", nargs="+", choices=sorted(SERVICES), default=["cold", "warmup"])
+    parser.add_argument("--model", default="ICDC", help="model the queries ask for (default ICDC)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of the queries after the first (default 5)")
+    parser.add_argument("--timeout", type=int, default=900, help="seconds to wait for ready (default 900)")
+    parser.add_argument("--drop-caches", action="store_true", help="empty the OS page cache before each start")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    return parser.parse_args()
+
+
+### Running ###################################################################
+
+def startNeo4j(mode, drop_caches=False):
+    """Stop both services and start the one for mode; returns the start time."""
+    subprocess.run(["docker", "compose", "-f", COMPOSE_FILE, "stop"] + list(SERVICES.values()), check=True)
+    if drop_caches:
+        subprocess.run(DROP_CACHES, check=True)
+    started = time.monotonic()
+    subprocess.run(["docker", "compose", "-f", COMPOSE_FILE, "up", "-d", "--force-recreate", SERVICES[mode]],
+                   check=True)
+    return started
+
+
+def containerHealth(service):
+    out = subprocess.run(["docker", "inspect", "-f", "{{.State.Health.Status}}", "mdb-" + service],
+                         capture_output=True, text=True)
+    return out.stdout.strip()
+
+
+def waitReady(mode, driver, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if mode == "warmup":
+                if containerHealth(SERVICES[mode]) == "healthy":
+                    return
+            else:
+                driver.verify_connectivity()
+                return
+        except Exception:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("{} not ready after {}s".format(SERVICES[mode], timeout))
+        time.sleep(1)
+
+
+def timeQueries(session, model):
+    times = {}
+    for name, cypher in QUERIES.items():
+        start = time.perf_counter()
+        session.run(cypher, model=model).consume()
+        times[name] = 1000 * (time.perf_counter() - start)
+    return times
+
+
+def summarizeStart(ready_s, runs):
+    """Seconds to ready, and per query the first run's ms and the median ms of the rest."""
+    return {
+        "ready_s": round(ready_s, 1),
+        "queries": {name: {"first_ms": round(runs[0][name], 1),
+                           "repeat_ms": round(statistics.median(r[name] for r in runs[1:]), 1) if runs[1:] else None}
+                    for name in runs[0]},
+    }
+
+
+def measure(mode, model, repeat, timeout, drop_caches=False):
+    from neo4j_db import getDriver
+    started = startNeo4j(mode, drop_caches)
+    with getDriver() as driver:
+        waitReady(mode, driver, timeout)
+        ready_s = time.monotonic() - started
+        with driver.session() as session:
+            runs = [timeQueries(session, model) for _ in range(1 + repeat)]
+    return summarizeStart(ready_s, runs)
+
+
+def printReport(results):
+    print("{:8} {:>8} {:16} {:>10} {:>10}".format("mode", "ready s", "query", "first ms", "repeat ms"))
+    for mode, r in results.items():
+        for i, (name, q) in enumerate(r["queries"].items()):
+            print("{:8} {:>8} {:16} {:>10} {:>10}".format(
+                mode if i == 0 else "", r["ready_s"] if i == 0 else "", name, q["first_ms"], q["repeat_ms"]))
+
+
+if __name__ == "__main__":
+    args = getArgs()
+    results = {mode: measure(mode, args.model, args.repeat, args.timeout, args.drop_caches) for mode in args.modes}
+    printReport(results)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2)